@@ -1,8 +1,11 @@
 
-from gevent import monkey
-monkey.patch_all()
-
 import os
+
+# The asyncio pipeline runs its own event loop thread and must not share it with gevent
+if os.getenv('PROCESSING_MODE') != 'asyncio':
+    from gevent import monkey
+    monkey.patch_all()
+
 import certifi
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
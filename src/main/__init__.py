@@ -1,15 +1,32 @@
+# Imported first so the startup clock covers the imports below
+from .utils.startup import startup_timer
+
+from functools import partial
+
 from flask import Flask
 from flask_cors import CORS
 
 from .config.Configuration import Configuration
+from .controllers.MetricsController import metrics_bp
 from .controllers.UploadDocumentController import upload_document_bp
+from .controllers.ProcessDocumentBatchController import process_document_batch_bp
 from .controllers.ProcessDocumentController import process_document_bp
+from .controllers.ProcessDocumentControllerAsync import process_document_bp as process_document_async_bp
+from .controllers.ProcessDocumentControllerAsync import abandon_job, complete_job, fail_job, resume_job
+from .controllers.StatsController import stats_bp
+from .security.OIDC import configure_oidc
 from .services import services
 from .utils.request_utls import get_request_session
+from .utils.telemetry import configure_telemetry, telemetry
+
+startup_timer.mark('imports')
 
-config: Configuration = Configuration()
 
 def create_app():
+    # The one Configuration of the process; everything else reads it from app.config
+    with startup_timer.phase('config'):
+        config: Configuration = Configuration()
+
     app: Flask = Flask(__name__)
     app.config.from_object(config)
     app.config.update({
@@ -18,12 +35,104 @@ def create_app():
 
     # Initialize extensions
     CORS(app)
+    configure_oidc(config.oidc_certs_url)
+    configure_telemetry(config.telemetry)
+
+    services.init_storage_service(
+        app.config['CONFIGURATION'].bucket_name,
+        app.config['CONFIGURATION'].download_spool_threshold_bytes,
+        app.config['CONFIGURATION'].download_chunk_size_bytes,
+        app.config['CONFIGURATION'].download_max_workers,
+        app.config['CONFIGURATION'].download_timeout_seconds,
+        app.config['CONFIGURATION'].upload_chunk_size_bytes,
+        app.config['CONFIGURATION'].upload_composite_threshold_bytes,
+        app.config['CONFIGURATION'].upload_composite_part_size_bytes,
+        app.config['CONFIGURATION'].upload_max_workers,
+        app.config['CONFIGURATION'].signed_urls
+    )
+    if config.result_cache_enabled:
+        services.init_result_cache(
+            config.result_cache_max_entries,
+            config.result_cache_ttl_seconds,
+            config.result_cache_gcs_enabled,
+            config.result_cache_gcs_prefix,
+            config.result_cache_max_bytes
+        )
+    services.init_result_validator(config.result_schema_validation)
+    if config.duplicate_detection.get('enabled', False):
+        services.init_duplicate_detector(config.duplicate_detection)
+    if config.image_preprocessing.get('enabled', False):
+        services.init_image_preprocessor(config.image_preprocessing)
+    if config.text_layer.get('enabled', False):
+        services.init_text_layer_extractor(config.text_layer)
+    if config.document_packing.get('enabled', False):
+        services.init_document_packer(config.document_packing)
+    for provider, limits in config.rate_limits.items():
+        services.init_rate_governor(provider, limits, config.rate_limit_shared_dir)
+    services.init_anthropic_client(
+        app.config['CONFIGURATION'].anthropic_api_key,
+        app.config['CONFIGURATION'].anthropic_base_url,
+        app.config['CONFIGURATION'].anthropic_prompt_caching,
+        config.streaming_enabled,
+        config.streaming_max_attempts
+    )
+    services.init_gemini_client(
+        app.config['CONFIGURATION'].gemini_api_key,
+        app.config['CONFIGURATION'].gemini_base_url,
+        config.streaming_enabled,
+        config.streaming_max_attempts
+    )
+    services.init_provider_router(config.routing)
+    services.init_callback_dispatcher(config.callbacks, on_delivered=complete_job, on_dead_lettered=fail_job)
 
-    services.init_storage_service(app.config['CONFIGURATION'].bucket_name)
-    services.init_anthropic_client(app.config['CONFIGURATION'].anthropic_api_key)
-    services.init_gemini_client(app.config['CONFIGURATION'].gemini_api_key)
+    if config.batch_enabled:
+        services.init_batch_processor(
+            partial(services.callback_dispatcher.send, audience=config.document_store_api),
+            config.batch_max_requests_per_batch,
+            config.batch_poll_interval_seconds,
+            config.callback_embed_parsed_data,
+            config.batch_store
+        )
+    startup_timer.mark('services')
 
+    app.register_blueprint(metrics_bp, url_prefix='/metrics')
     app.register_blueprint(upload_document_bp, url_prefix='/api/v1/upload')
-    app.register_blueprint(process_document_bp, url_prefix='/api/v1/process')
+    app.register_blueprint(process_document_batch_bp, url_prefix='/api/v1/process/batch')
+    app.register_blueprint(stats_bp, url_prefix='/api/v1/process')
+    if config.processing_mode == 'asyncio':
+        services.init_async_pipeline(
+            config.processing_max_in_flight,
+            config.processing_max_queue_depth,
+            config.processing_retry_after_seconds
+        )
+        app.register_blueprint(process_document_async_bp, url_prefix='/api/v1/process')
+    elif config.processing_mode == 'async':
+        services.init_job_scheduler(
+            config.processing_workers,
+            config.processing_max_queue_depth,
+            config.processing_retry_after_seconds
+        )
+        app.register_blueprint(process_document_async_bp, url_prefix='/api/v1/process')
+    else:
+        app.register_blueprint(process_document_bp, url_prefix='/api/v1/process')
+
+    # Jobs only outlive a request in the async modes, so only they are made durable
+    if config.processing_mode in ('async', 'asyncio') and config.job_store_enabled:
+        if config.job_store_path is None:
+            raise ValueError("jobs.store.enabled needs jobs.store.path on persistent storage")
+        services.init_job_store(config.job_store_path)
+        services.init_job_recovery(
+            partial(resume_job, config=config),
+            partial(abandon_job, config=config),
+            config.job_recovery
+        )
+    startup_timer.mark('workers')
 
+    for phase, seconds in startup_timer.finish().items():
+        telemetry.register_gauge(
+            "startup_phase_seconds",
+            "Time each phase of this worker's startup took",
+            lambda seconds=seconds: seconds,
+            phase=phase
+        )
     return app
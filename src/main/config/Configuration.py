@@ -1,14 +1,20 @@
 import os
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from deepmerge import always_merger
 import yaml
 
 from .constants.EnvConstants import EnvConstants
 from ..logs.logger import setup_logger
-from ..utils.request_utls import access_secret_version
+from ..utils.request_utls import access_secrets
 
 logger = setup_logger(__name__)
 
+# Secret Manager secret holding each API key that is not set in the environment
+API_KEY_SECRETS = {
+    EnvConstants.ANTHROPIC_API_KEY: "anthropic_api_key",
+    EnvConstants.GEMINI_API_KEY: "gemini_api_key"
+}
+
 def load_yaml_file(path: str) -> Dict:
     with open(path, 'r') as file:
         return yaml.safe_load(file) or {}
@@ -29,14 +35,13 @@ def load_config() -> Dict:
 class Configuration(object):
     def __init__(self):
         self._config = load_config()
-        self.anthropic_api_key = access_secret_version(
-            self._config['gcp']['project-number'],
-            "anthropic_api_key"
-        )
-        self.gemini_api_key = access_secret_version(
-            self._config['gcp']['project-number'],
-            "gemini_api_key"
-        )
+        # Keys in the environment (local runs, the offline benchmarks) take precedence over Secret Manager;
+        # the others are read concurrently over one client
+        keys = {secret_id: os.getenv(env.value) for env, secret_id in API_KEY_SECRETS.items()}
+        missing = [secret_id for secret_id, value in keys.items() if not value]
+        keys.update(access_secrets(self._config['gcp']['project-number'], missing))
+        self.anthropic_api_key = keys["anthropic_api_key"]
+        self.gemini_api_key = keys["gemini_api_key"]
 
     @property
     def env(self):
@@ -46,7 +51,197 @@ class Configuration(object):
     def bucket_name(self):
         return self._config['storage']['bucket']
 
+    @property
+    def download_spool_threshold_bytes(self) -> int:
+        return self._get('storage.download.spool-threshold-bytes', 8 * 1024 * 1024)
+
+    @property
+    def download_chunk_size_bytes(self) -> int:
+        return self._get('storage.download.chunk-size-bytes', 8 * 1024 * 1024)
+
+    @property
+    def download_max_workers(self) -> int:
+        return self._get('storage.download.max-workers', 8)
+
+    @property
+    def download_timeout_seconds(self) -> Tuple[float, float]:
+        return (
+            self._get('storage.download.connect-timeout-seconds', 10.0),
+            self._get('storage.download.read-timeout-seconds', 60.0)
+        )
+
+    @property
+    def upload_chunk_size_bytes(self) -> int:
+        return self._get('storage.upload.chunk-size-bytes', 8 * 1024 * 1024)
+
+    @property
+    def upload_composite_threshold_bytes(self) -> int:
+        return self._get('storage.upload.composite-threshold-bytes', 64 * 1024 * 1024)
+
+    @property
+    def upload_composite_part_size_bytes(self) -> int:
+        return self._get('storage.upload.composite-part-size-bytes', 32 * 1024 * 1024)
+
+    @property
+    def upload_max_workers(self) -> int:
+        return self._get('storage.upload.max-workers', 4)
+
+    @property
+    def signed_urls(self) -> Dict:
+        return self._get('storage.signed-urls', {})
+
     @property
     def document_store_api(self):
         return self._config['document-store']['url']
 
+    def _get(self, path: str, default=None):
+        """
+        Look up a dotted path (e.g. 'cache.result.enabled') in the merged config
+        """
+        value = self._config
+        for key in path.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return value
+
+    @property
+    def result_cache_enabled(self) -> bool:
+        return self._get('cache.result.enabled', False)
+
+    @property
+    def result_cache_max_entries(self) -> int:
+        return self._get('cache.result.max-entries', 512)
+
+    @property
+    def result_cache_max_bytes(self) -> int:
+        return self._get('cache.result.max-bytes', 64 * 1024 * 1024)
+
+    @property
+    def result_cache_ttl_seconds(self) -> int:
+        return self._get('cache.result.ttl-seconds', 86400)
+
+    @property
+    def result_cache_gcs_enabled(self) -> bool:
+        return self._get('cache.result.gcs.enabled', False)
+
+    @property
+    def result_cache_gcs_prefix(self) -> str:
+        return self._get('cache.result.gcs.prefix', 'cache/parse-results')
+
+    @property
+    def processing_mode(self) -> str:
+        # The environment wins so that app.py can decide on gevent patching before config is loaded
+        return os.getenv(EnvConstants.PROCESSING_MODE.value) or self._get('processing.mode', 'sync')
+
+    @property
+    def processing_workers(self) -> int:
+        return self._get('processing.workers', 4)
+
+    @property
+    def processing_max_in_flight(self) -> int:
+        return self._get('processing.max-in-flight', 200)
+
+    @property
+    def processing_max_queue_depth(self) -> int:
+        return self._get('processing.max-queue-depth', 100)
+
+    @property
+    def processing_retry_after_seconds(self) -> int:
+        return self._get('processing.retry-after-seconds', 30)
+
+    @property
+    def callbacks(self) -> Dict:
+        return self._get('callbacks', {})
+
+    @property
+    def callback_embed_parsed_data(self) -> bool:
+        return self._get('callbacks.embed-parsed-data', False)
+
+    @property
+    def result_schema_validation(self) -> str:
+        return self._get('results.schema-validation', 'warn')
+
+    @property
+    def job_store_enabled(self) -> bool:
+        return self._get('jobs.store.enabled', False)
+
+    @property
+    def job_store_path(self) -> Optional[str]:
+        return self._get('jobs.store.path', None) or None
+
+    @property
+    def job_recovery(self) -> Dict:
+        return self._get('jobs.recovery', {})
+
+    @property
+    def rate_limits(self) -> Dict[str, Dict]:
+        return self._get('rate-limits', {})
+
+    @property
+    def rate_limit_shared_dir(self) -> Optional[str]:
+        return self._get('rate-limit-sharing.directory', None) or None
+
+    @property
+    def image_preprocessing(self) -> Dict:
+        return self._get('preprocessing.images', {})
+
+    @property
+    def text_layer(self) -> Dict:
+        return self._get('preprocessing.text-layer', {})
+
+    @property
+    def duplicate_detection(self) -> Dict:
+        return self._get('duplicates', {})
+
+    @property
+    def document_packing(self) -> Dict:
+        return self._get('packing', {})
+
+    @property
+    def anthropic_base_url(self) -> Optional[str]:
+        return self._get('anthropic.base-url')
+
+    @property
+    def anthropic_prompt_caching(self) -> bool:
+        return self._get('anthropic.prompt-caching', False)
+
+    @property
+    def gemini_base_url(self) -> Optional[str]:
+        return self._get('gemini.base-url')
+
+    @property
+    def oidc_certs_url(self) -> Optional[str]:
+        return self._get('security.oidc.certs-url')
+
+    @property
+    def routing(self) -> Dict:
+        return self._get('routing', {})
+
+    @property
+    def streaming_enabled(self) -> bool:
+        return self._get('streaming.enabled', False)
+
+    @property
+    def streaming_max_attempts(self) -> int:
+        return self._get('streaming.max-attempts', 3)
+
+    @property
+    def telemetry(self) -> Dict:
+        return self._get('telemetry', {})
+
+    @property
+    def batch_enabled(self) -> bool:
+        return self._get('batch.enabled', False)
+
+    @property
+    def batch_max_requests_per_batch(self) -> int:
+        return self._get('batch.max-requests-per-batch', 1000)
+
+    @property
+    def batch_poll_interval_seconds(self) -> int:
+        return self._get('batch.poll-interval-seconds', 60)
+
+    @property
+    def batch_store(self) -> Dict:
+        return self._get('batch.store', {})
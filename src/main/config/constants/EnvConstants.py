@@ -4,4 +4,6 @@ from enum import Enum
 class EnvConstants(Enum):
     ENV = "ENV"
     ANTHROPIC_API_KEY = "ANTHROPIC_API_KEY"
+    GEMINI_API_KEY = "GEMINI_API_KEY"
     OPENAI_API_KEY = "OPENAI_API_KEY"
+    PROCESSING_MODE = "PROCESSING_MODE"
@@ -0,0 +1,17 @@
+from flask import Blueprint, Response, jsonify, request
+
+from ..security.OIDC import verify_oidc_token
+from ..utils.telemetry import PROMETHEUS_CONTENT_TYPE, telemetry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('', methods=['GET'])
+def metrics():
+    if not telemetry.metrics_enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(telemetry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
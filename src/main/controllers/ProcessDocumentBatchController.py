@@ -0,0 +1,53 @@
+from flask import Blueprint, request, jsonify
+
+from ..services import services
+from ..logs.logger import setup_logger
+from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+from ..security.OIDC import verify_oidc_token
+
+process_document_batch_bp = Blueprint('process_document_batch', __name__)
+logger = setup_logger(__name__)
+
+
+@process_document_batch_bp.route('', methods=['POST'])
+def process_batch():
+    logger.info("Received batch processing request")
+
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if services.batch_processor is None:
+        return jsonify({"error": "Batch processing is not enabled"}), 503
+
+    try:
+        data = request.get_json()
+        process_document_requests = [ProcessDocumentRequest.from_dict(document) for document in data['documents']]
+    except Exception as e:
+        logger.error(f"Error parsing batch request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    if not process_document_requests:
+        return jsonify({"error": "No documents in batch request"}), 400
+
+    # Results are delivered to each document's callback_url once the provider batch ends
+    services.batch_processor.enqueue(process_document_requests)
+
+    return jsonify({
+        "message": "Batch accepted for processing",
+        "ids": [process_document_request.id for process_document_request in process_document_requests]
+    }), 202
+
+
+@process_document_batch_bp.route('', methods=['GET'])
+def pending_batches():
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if services.batch_processor is None:
+        return jsonify({"error": "Batch processing is not enabled"}), 503
+    return jsonify({
+        "pending": services.batch_processor.pending_batches(),
+        "queued_documents": services.batch_processor.queued_documents()
+    }), 200
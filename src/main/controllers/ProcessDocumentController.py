@@ -1,13 +1,16 @@
-from io import BytesIO
+from functools import partial
+from typing import BinaryIO
 
 from flask import Blueprint, request, jsonify, current_app
 
-from . import session
 from ..services import services
 from ..logs.logger import setup_logger
+from ..models.dto.response.Invoice import ResultSchemaError
 from ..models.dto.response.ProcessDocumentCallbackRequest import ProcessDocumentCallbackRequest
+from ..models.dto.request.ChunkingOptions import ChunkingOptions, InvalidChunkingOptionsError
 from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
-from ..security.OIDC import verify_oidc_token, get_callback_id_token
+from ..security.OIDC import verify_oidc_token
+from ..utils.telemetry import telemetry
 
 process_document_bp = Blueprint('process_document', __name__)
 logger = setup_logger(__name__)
@@ -39,55 +42,78 @@ def process_files():
             file_type=data['file_type'],
             tenant_id=data['tenant_id'],
             collection_id=data['collection_id'],
-            callback_url=data['callback_url']
+            callback_url=data['callback_url'],
+            chunking=ChunkingOptions.from_dict(data['chunking']) if data.get('chunking') else None
         )
 
-
-        # downloading file
-        file_contents: BytesIO = services.storage_service.download_from_signed_url(process_document_request.url)
-
-        model_function = services.anthropic_client.process_file
-        if ai_type is not None and ai_type == 'GEMINI':
-            logger.info("Processing with Gemini")
-            model_function = services.gemini_client.process_file
-        else:
-            logger.info("Processing with Anthropic")
-
-        response = model_function(
-            file_name=process_document_request.name,
-            file_content=file_contents.getvalue(),
-            prompt=process_document_request.prompt
-        )
-
-        # Map the data to the UploadDocumentTask dataclass
-        processed_document = ProcessDocumentCallbackRequest(
-            id=process_document_request.id,
-            name=process_document_request.name,
-            type=process_document_request.type,
-            parsed_data=response,
-            metadata={},
-            error=None
-        )
-
-        id_token = get_callback_id_token(config.document_store_api)
-
-        # make a call to the callback api
-        callback_response = session.post(
-            process_document_request.callback_url,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {id_token}'
-            },
-            json=processed_document.to_dict()
-        )
-
-        if callback_response.status_code != 200:
-            logger.error(f"Callback failed with status {callback_response.status_code}: {callback_response.text}")
-            return jsonify({"error": "Callback failed"}), 500
-
-        logger.info(f"Callback response: {callback_response.status_code}")
-        return jsonify({"message": "File processed successfully"}), 200
-
+        with telemetry.job(process_document_request.tenant_id, process_document_request.id):
+            # downloading file
+            file_contents: BinaryIO = services.storage_service.download(process_document_request.url)
+
+            # The router starts with the requested provider and fails over when it is unhealthy
+            model_function = partial(services.provider_router.process_file, preferred=ai_type)
+
+            with file_contents:
+                # Large PDFs are split into page ranges when the request asks for chunking
+                process = partial(
+                    services.pdf_chunk_processor.process_file,
+                    model_function,
+                    file_name=process_document_request.name,
+                    file_content=file_contents,
+                    prompt=process_document_request.prompt,
+                    options=process_document_request.chunking
+                )
+                if services.duplicate_detector is None:
+                    response = process()
+                else:
+                    # A near-duplicate of a document the tenant already had parsed reuses its result
+                    response = services.duplicate_detector.process_file(
+                        process_document_request.tenant_id,
+                        process_document_request.id,
+                        process_document_request.name,
+                        file_contents,
+                        process_document_request.prompt,
+                        process
+                    )
+
+            # Parsed once by the model client, checked against the document type's schema
+            error = None
+            try:
+                response = services.result_validator.validate(process_document_request.type, response)
+            except ResultSchemaError as e:
+                # Strict mode: the callback carries the error instead of the result, as in async mode
+                logger.error(f"Result for document {process_document_request.id} does not match its schema: {str(e)}")
+                response, error = None, str(e)
+
+            # Map the data to the UploadDocumentTask dataclass
+            processed_document = ProcessDocumentCallbackRequest(
+                id=process_document_request.id,
+                name=process_document_request.name,
+                type=process_document_request.type,
+                parsed_data=response,
+                metadata={},
+                error=error
+            )
+
+            # make a call to the callback api over the pooled session for its host
+            callback_response = services.callback_dispatcher.post(
+                process_document_request.callback_url,
+                processed_document.to_json(config.callback_embed_parsed_data),
+                config.document_store_api
+            )
+
+            if callback_response.status_code != 200:
+                logger.error(f"Callback failed with status {callback_response.status_code}: {callback_response.text}")
+                return jsonify({"error": "Callback failed"}), 500
+
+            logger.info(f"Callback response: {callback_response.status_code}")
+            if error is not None:
+                return jsonify({"error": error}), 422
+            return jsonify({"message": "File processed successfully"}), 200
+
+    except InvalidChunkingOptionsError as e:
+        logger.warning(f"Rejecting request, {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error parsing JSON: {str(e)}")
         return jsonify({"error": "Invalid JSON"}), 400
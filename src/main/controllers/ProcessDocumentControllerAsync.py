@@ -1,109 +1,222 @@
-from io import BytesIO
 import asyncio
-import threading
-from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from typing import BinaryIO, Dict, Optional, Union
 
-import certifi
-import requests
 from flask import Blueprint, request, jsonify, current_app
 
-from . import session
-from ..utils.request_utls import get_request_session
 from ..services import services
+from ..services.JobScheduler import QueueFullError, SchedulerUnavailableError
+from ..services.JobStore import JobRecord
 from ..logs.logger import setup_logger
 from ..models.dto.response.ProcessDocumentCallbackRequest import ProcessDocumentCallbackRequest
+from ..models.dto.request.ChunkingOptions import ChunkingOptions, InvalidChunkingOptionsError
 from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
-from ..security.OIDC import verify_oidc_token, get_callback_id_token
+from ..models.enum.JobState import JobState
+from ..security.OIDC import verify_oidc_token
+from ..utils.telemetry import telemetry
 
-process_document_bp = Blueprint('process_document', __name__)
+process_document_bp = Blueprint('process_document_async', __name__)
 logger = setup_logger(__name__)
 
-# Create a thread pool for handling background processing
-executor = ThreadPoolExecutor(max_workers=4)  # Adjust based on your CPU cores and memory
 
+def _transition(
+        job_id: str,
+        state: JobState,
+        callback_payload: Optional[Union[Dict, bytes]] = None,
+        error: Optional[str] = None
+):
+    if services.job_store is not None:
+        services.job_store.transition(job_id, state, callback_payload, error)
 
-def process_and_callback(process_document_request, ai_type, config):
-    """Background task to handle file processing and callback"""
-    try:
-        logger.info(f"Processing document in background: {process_document_request.id}")
 
-        # Downloading file
-        file_contents: BytesIO = services.storage_service.download_from_signed_url(process_document_request.url)
+def _callback_request(process_document_request, parsed_data, error) -> ProcessDocumentCallbackRequest:
+    return ProcessDocumentCallbackRequest(
+        id=process_document_request.id,
+        name=process_document_request.name,
+        type=process_document_request.type,
+        parsed_data=parsed_data,
+        metadata={},
+        error=error
+    )
 
-        # Select the appropriate model
-        model_function = services.anthropic_client.process_file
-        if ai_type is not None and ai_type == 'GEMINI':
-            logger.info("Processing with Gemini")
-            model_function = services.gemini_client.process_file
-        else:
-            logger.info("Processing with Anthropic")
 
-        # Process the file with the selected model
-        response = model_function(
+def _process_document(process_document_request, model_function, file_contents) -> str:
+    def process():
+        # Large PDFs are split into page ranges when the request asks for chunking
+        return services.pdf_chunk_processor.process_file(
+            model_function,
             file_name=process_document_request.name,
-            file_content=file_contents.getvalue(),
-            prompt=process_document_request.prompt
+            file_content=file_contents,
+            prompt=process_document_request.prompt,
+            options=process_document_request.chunking
         )
 
-        # Prepare callback data
-        processed_document = ProcessDocumentCallbackRequest(
-            id=process_document_request.id,
-            name=process_document_request.name,
-            type=process_document_request.type,
-            parsed_data=response,
-            metadata={},
-            error=None
-        )
+    if services.duplicate_detector is None:
+        return process()
+    # A near-duplicate of a document the tenant already had parsed reuses its result
+    return services.duplicate_detector.process_file(
+        process_document_request.tenant_id,
+        process_document_request.id,
+        process_document_request.name,
+        file_contents,
+        process_document_request.prompt,
+        process
+    )
 
-        # Get ID token for callback
-        id_token = get_callback_id_token(config.document_store_api)
-        # Create a new session for this thread
-        local_session = get_request_session()
-
-        # Make callback request
-        callback_response = local_session.post(
-            process_document_request.callback_url,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {id_token}'
-            },
-            json=processed_document.to_dict()
+
+async def _process_document_async(process_document_request, model_function, file_contents) -> str:
+    def process():
+        return services.pdf_chunk_processor.process_file_async(
+            model_function,
+            file_name=process_document_request.name,
+            file_content=file_contents,
+            prompt=process_document_request.prompt,
+            options=process_document_request.chunking
         )
 
-        if callback_response.status_code != 200:
-            logger.error(
-                f"Callback failed for {process_document_request.id} with status {callback_response.status_code}: {callback_response.text}")
-        else:
-            logger.info(f"Callback successful for {process_document_request.id}")
+    if services.duplicate_detector is None:
+        return await process()
+    return await services.duplicate_detector.process_file_async(
+        process_document_request.tenant_id,
+        process_document_request.id,
+        process_document_request.name,
+        file_contents,
+        process_document_request.prompt,
+        process
+    )
 
-    except Exception as e:
-        logger.error(f"Error processing document {process_document_request.id}: {str(e)}")
 
-        # Attempt to send error to callback if possible
+def process_and_callback(process_document_request, ai_type, config):
+    """Background task to handle file processing and callback"""
+    with telemetry.job(process_document_request.tenant_id, process_document_request.id):
         try:
-            error_document = ProcessDocumentCallbackRequest(
-                id=process_document_request.id,
-                name=process_document_request.name,
-                type=process_document_request.type,
-                parsed_data=None,
-                metadata={},
-                error=str(e)
-            )
+            logger.info(f"Processing document in background: {process_document_request.id}")
+
+            # Downloading file
+            _transition(process_document_request.id, JobState.DOWNLOADING)
+            file_contents: BinaryIO = services.storage_service.download(process_document_request.url)
+
+            # The router starts with the requested provider and fails over when it is unhealthy
+            model_function = partial(services.provider_router.process_file, preferred=ai_type)
+
+            # Process the file with the selected model
+            _transition(process_document_request.id, JobState.PARSING)
+            with file_contents:
+                response = _process_document(process_document_request, model_function, file_contents)
+
+            # Parsed once here and encoded once below, however the body is delivered
+            response = services.result_validator.validate(process_document_request.type, response)
+            callback = _callback_request(process_document_request, response, None)
+        except Exception as e:
+            logger.error(f"Error processing document {process_document_request.id}: {str(e)}")
+            callback = _callback_request(process_document_request, None, str(e))
+        body = callback.to_json(config.callback_embed_parsed_data)
 
-            id_token = get_callback_id_token(config.document_store_api)
-            error_session = get_request_session()
+        # Keep the result so a restarted worker can re-send the callback without parsing again
+        _transition(process_document_request.id, JobState.CALLBACK_PENDING, body, callback.error)
+        deliver_callback(process_document_request, body, config)
 
-            error_session.post(
-                process_document_request.callback_url,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {id_token}'
-                },
-                json=error_document.to_dict()
+
+def deliver_callback(process_document_request, payload: Union[Dict, bytes], config):
+    # The dispatcher's outbox redelivers failed callbacks and completes the job once one succeeds
+    services.callback_dispatcher.send(
+        process_document_request.callback_url,
+        payload,
+        config.document_store_api,
+        job_id=process_document_request.id
+    )
+
+
+def complete_job(job_id: str):
+    """Called by the callback dispatcher once a job's callback has been delivered"""
+    _transition(job_id, JobState.DONE)
+
+
+def fail_job(job_id: str, error: str):
+    """Called by the callback dispatcher once it has given up on a job's callback"""
+    _transition(job_id, JobState.FAILED, error=f"Callback not delivered: {error}")
+
+
+async def process_and_callback_async(process_document_request, ai_type, config):
+    """Asyncio variant of process_and_callback, run on the async pipeline loop"""
+    with telemetry.job(process_document_request.tenant_id, process_document_request.id):
+        try:
+            logger.info(f"Processing document on async pipeline: {process_document_request.id}")
+
+            # The job store is a local SQLite file, so its writes are cheap but still blocking
+            await asyncio.to_thread(_transition, process_document_request.id, JobState.DOWNLOADING)
+            file_contents: BinaryIO = await services.storage_service.download_async(
+                process_document_request.url,
+                services.async_pipeline.http_client
             )
-        except Exception as callback_error:
-            logger.error(f"Failed to send error callback for {process_document_request.id}: {str(callback_error)}")
+
+            model_function = partial(services.provider_router.process_file_async, preferred=ai_type)
+
+            await asyncio.to_thread(_transition, process_document_request.id, JobState.PARSING)
+            with file_contents:
+                response = await _process_document_async(process_document_request, model_function, file_contents)
+
+            # Parsed once here and encoded once below, however the body is delivered
+            response = services.result_validator.validate(process_document_request.type, response)
+            callback = _callback_request(process_document_request, response, None)
+        except Exception as e:
+            logger.error(f"Error processing document {process_document_request.id}: {str(e)}")
+            callback = _callback_request(process_document_request, None, str(e))
+        body = callback.to_json(config.callback_embed_parsed_data)
+
+        await asyncio.to_thread(
+            _transition, process_document_request.id, JobState.CALLBACK_PENDING, body, callback.error)
+        await deliver_callback_async(process_document_request, body, config)
+
+
+async def deliver_callback_async(process_document_request, payload: Union[Dict, bytes], config):
+    # Queueing writes to the outbox, keep it off the loop
+    await asyncio.to_thread(deliver_callback, process_document_request, payload, config)
+
+
+def submit_job(process_document_request, ai_type, config):
+    """
+    Queue a document on the async pipeline or the job scheduler, whichever this worker runs
+    """
+    if services.async_pipeline is not None:
+        # Run the job as a coroutine on this worker's event loop, tenants taking turns for slots
+        services.async_pipeline.submit(
+            process_document_request.tenant_id,
+            lambda: process_and_callback_async(process_document_request, ai_type, config),
+            f"document {process_document_request.id}"
+        )
+    else:
+        # Queue the processing task on the tenant-fair scheduler
+        services.job_scheduler.submit(
+            process_document_request.tenant_id,
+            process_and_callback,
+            process_document_request,
+            ai_type,
+            config
+        )
+
+
+def resume_job(record: JobRecord, config):
+    """Re-drive a job recovered from the job store after its worker went away"""
+    if record.state == JobState.CALLBACK_PENDING and record.callback_payload is not None:
+        if services.callback_dispatcher.has_pending(record.id):
+            logger.info(f"Callback for job {record.id} is already in the outbox")
+            return
+        deliver_callback(record.request, record.callback_payload, config)
+    else:
+        submit_job(record.request, record.ai_type, config)
+
+
+def abandon_job(record: JobRecord, config):
+    """Tell the document store a job kept failing instead of leaving it waiting forever"""
+    callback = _callback_request(
+        record.request,
+        None,
+        f"Processing abandoned after {record.attempts - 1} attempts"
+    )
+    body = callback.to_json()
+    _transition(record.id, JobState.CALLBACK_PENDING, body, callback.error)
+    deliver_callback(record.request, body, config)
 
 
 @process_document_bp.route('', methods=['POST'])
@@ -134,16 +247,27 @@ def process_files():
             file_type=data['file_type'],
             tenant_id=data['tenant_id'],
             collection_id=data['collection_id'],
-            callback_url=data['callback_url']
+            callback_url=data['callback_url'],
+            chunking=ChunkingOptions.from_dict(data['chunking']) if data.get('chunking') else None
         )
 
-        # Submit the processing task to our thread pool
-        executor.submit(
-            process_and_callback,
-            process_document_request,
-            ai_type,
-            config
-        )
+        # Redelivered requests for a document that is still in progress are acknowledged, not re-run
+        if services.job_store is not None and not services.job_store.accept(process_document_request, ai_type):
+            job = services.job_store.get(process_document_request.id)
+            logger.info(f"Document {process_document_request.id} is already in progress, not queueing it again")
+            return jsonify({
+                "message": "Request already accepted",
+                "id": process_document_request.id,
+                "state": job.state.value if job else None
+            }), 202
+
+        try:
+            submit_job(process_document_request, ai_type, config)
+        except (QueueFullError, SchedulerUnavailableError):
+            # The caller is told to retry, so the job must not linger as accepted
+            if services.job_store is not None:
+                services.job_store.discard(process_document_request.id)
+            raise
 
         # Return immediately with a 202 Accepted status
         return jsonify({
@@ -151,6 +275,33 @@ def process_files():
             "id": process_document_request.id
         }), 202
 
+    except InvalidChunkingOptionsError as e:
+        logger.warning(f"Rejecting request, {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError as e:
+        logger.warning(f"Rejecting request, {str(e)}")
+        return jsonify({"error": str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    except SchedulerUnavailableError as e:
+        logger.warning(f"Rejecting request, {str(e)}")
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error parsing request: {str(e)}")
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
+
+
+@process_document_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = services.job_store.get(job_id) if services.job_store is not None else None
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "id": job.id,
+        "state": job.state.value,
+        "attempts": job.attempts,
+        "error": job.error,
+        "updated_at": job.updated_at
+    }), 200
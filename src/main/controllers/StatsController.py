@@ -0,0 +1,90 @@
+from flask import Blueprint, current_app, jsonify, request
+
+from ..services import ANTHROPIC_PROVIDER, GEMINI_PROVIDER, services
+from ..security.OIDC import token_stats, verify_oidc_token
+
+# Registered under /api/v1/process in every processing mode; services a mode does not run report
+# {"enabled": false}
+stats_bp = Blueprint('stats', __name__)
+
+
+@stats_bp.before_request
+def authenticate():
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+
+def _client_stats(provider: str, read):
+    # A stats call must not construct a model client, and import its SDK, on its own
+    client = services.constructed_client(provider)
+    return read(client) if client is not None else None
+
+
+@stats_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    prompt_cache = _client_stats(ANTHROPIC_PROVIDER, lambda client: client.usage_stats())
+    if services.result_cache is None:
+        return jsonify({"enabled": False, "prompt_cache": prompt_cache}), 200
+    return jsonify({"enabled": True, **services.result_cache.stats(), "prompt_cache": prompt_cache}), 200
+
+
+@stats_bp.route('/stream/stats', methods=['GET'])
+def stream_stats():
+    return jsonify({
+        "enabled": current_app.config['CONFIGURATION'].streaming_enabled,
+        "anthropic": _client_stats(ANTHROPIC_PROVIDER, lambda client: client.stream_stats.stats()),
+        "gemini": _client_stats(GEMINI_PROVIDER, lambda client: client.stream_stats.stats())
+    }), 200
+
+
+@stats_bp.route('/routing/stats', methods=['GET'])
+def routing_stats():
+    return jsonify(services.provider_router.stats()), 200
+
+
+@stats_bp.route('/text-layer/stats', methods=['GET'])
+def text_layer_stats():
+    if services.text_layer_extractor is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **services.text_layer_extractor.stats()}), 200
+
+
+@stats_bp.route('/packing/stats', methods=['GET'])
+def packing_stats():
+    if services.document_packer is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **services.document_packer.stats()}), 200
+
+
+@stats_bp.route('/queue/stats', methods=['GET'])
+def queue_stats():
+    if services.async_pipeline is not None:
+        return jsonify({"enabled": True, **services.async_pipeline.stats()}), 200
+    if services.job_scheduler is not None:
+        return jsonify({"enabled": True, **services.job_scheduler.stats()}), 200
+    return jsonify({"enabled": False}), 200
+
+
+@stats_bp.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    if services.job_recovery is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **services.job_recovery.stats()}), 200
+
+
+@stats_bp.route('/callbacks/stats', methods=['GET'])
+def callback_stats():
+    return jsonify({**services.callback_dispatcher.stats(), "tokens": token_stats()}), 200
+
+
+@stats_bp.route('/results/stats', methods=['GET'])
+def result_stats():
+    return jsonify(services.result_validator.stats()), 200
+
+
+@stats_bp.route('/duplicates/stats', methods=['GET'])
+def duplicate_stats():
+    if services.duplicate_detector is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **services.duplicate_detector.stats()}), 200
@@ -1,24 +1,24 @@
+import shutil
 from io import BytesIO
+from typing import BinaryIO, Mapping, Optional
 
-from flask import Blueprint, request, jsonify
-from google.auth.transport import requests
-import requests as r
-from google.oauth2 import id_token
-from google.oauth2.id_token import fetch_id_token
-from requests.adapters import HTTPAdapter
-from urllib3 import Retry
+from flask import Blueprint, request, jsonify, current_app
 
-from ..config.Configuration import Configuration
 from ..logs.logger import setup_logger
 from ..models.dto.request.UploadDocumentRequest import UploadDocumentRequest
 from ..security.OIDC import verify_oidc_token
-from ..services.StorageService import StorageService
+from ..services import services
+from ..services.StorageService import UploadIntegrityError
+from ..utils.file_utils import READ_CHUNK_SIZE, new_spooled_buffer, stream_size
+from ..utils.telemetry import telemetry
 
 upload_document_bp = Blueprint('upload_document', __name__)
 logger = setup_logger(__name__)
 
-config = Configuration()
-storage_service = StorageService(config.bucket_name)
+# Metadata every upload must carry, as JSON keys, form fields or query parameters
+REQUIRED_FIELDS = (
+    'upload_path', 'file_name', 'collection_id', 'document_id', 'tenant_id', 'user_id', 'file_type', 'callback_url'
+)
 
 
 @upload_document_bp.route('/health', methods=['GET'])
@@ -53,49 +53,83 @@ def upload_pdfs():
         # Create a file-like object
         file = BytesIO(file_bytes)
 
-        # Map the data to the UploadDocumentTask dataclass
-        task = UploadDocumentRequest(
-            uploadPath=data['upload_path'],
-            fileName=data['file_name'],
-            collectionId=data['collection_id'],
-            documentId=data['document_id'],
-            tenantId=data['tenant_id'],
-            userId=data['user_id'],
-            fileType=data['file_type'],
-            fileSize=data['file_size'] or len(file_bytes),
-            file=file,
-            callbackUrl=data['callback_url']
-        )
+        task = _to_task(data, file, data['file_size'] or len(file_bytes))
+        return _upload_and_callback(task)
+    except Exception as e:
+        logger.error(f"Error making callback request: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        logger.info(f"Received upload task for file: {task.fileName}")
-        # Map the data to the UploadDocumentTask dataclass
 
-        logger.info(f"Uploading file: {task.fileName}")
-        storage_service.upload_file(task.fileName, task.uploadPath, task.file)
-        logger.info("File uploaded successfully")
+@upload_document_bp.route('/stream', methods=['POST'])
+def upload_stream():
+    """
+    Upload without base64: either multipart/form-data with the metadata as form fields and the
+    document in a "file" part, or the raw document as the request body with the metadata as
+    query parameters. The body is spooled to disk past the storage spool threshold rather than
+    held in memory, and an optional crc32c field (base64, as GCS reports it) is checked.
+    """
+    logger.info("Received streaming upload request")
 
-        # Get ID token for the callback
-        auth_req = requests.Request()
-        id_token = fetch_id_token(auth_req, config.document_store_api)
+    token = verify_oidc_token(request)
+    if not token:
+        return jsonify({"error": "Unauthorized"}), 401
 
-        logger.info(f"This is the token: {id_token}")
-        session = r.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[500, 502, 503, 504]
-        )
-        session.mount('http://', HTTPAdapter(max_retries=retries))
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+    try:
+        multipart = request.mimetype == 'multipart/form-data'
+        # Werkzeug streams multipart file parts to a temporary file while parsing the form
+        fields = request.form if multipart else request.args
+        missing = [key for key in REQUIRED_FIELDS if not fields.get(key)]
+        if missing:
+            return jsonify({"error": f"Missing fields: {', '.join(missing)}"}), 400
+        file_size = fields.get('file_size')
+        if file_size and not file_size.isdigit():
+            return jsonify({"error": "file_size must be a non-negative integer"}), 400
+
+        if multipart:
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({"error": "Missing file part"}), 400
+            file = upload.stream
+        else:
+            file = new_spooled_buffer(services.storage_service.spool_threshold_bytes)
+            shutil.copyfileobj(request.stream, file, READ_CHUNK_SIZE)
+
+        task = _to_task(fields, file, int(file_size) if file_size else stream_size(file))
+        return _upload_and_callback(task, fields.get('crc32c'))
+    except UploadIntegrityError as e:
+        logger.error(f"Upload failed integrity check: {str(e)}")
+        return jsonify({"error": str(e)}), 422
+    except Exception as e:
+        logger.error(f"Error making callback request: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _to_task(fields: Mapping, file: BinaryIO, file_size: int) -> UploadDocumentRequest:
+    # Map the data to the UploadDocumentTask dataclass
+    return UploadDocumentRequest(
+        uploadPath=fields['upload_path'],
+        fileName=fields['file_name'],
+        collectionId=fields['collection_id'],
+        documentId=fields['document_id'],
+        tenantId=fields['tenant_id'],
+        userId=fields['user_id'],
+        fileType=fields['file_type'],
+        fileSize=file_size,
+        file=file,
+        callbackUrl=fields['callback_url']
+    )
+
+
+def _upload_and_callback(task: UploadDocumentRequest, expected_crc32c: Optional[str] = None):
+    with telemetry.job(task.tenantId, task.documentId):
+        logger.info(f"Uploading file: {task.fileName}")
+        services.storage_service.upload_file(task.fileName, task.uploadPath, task.file, expected_crc32c)
+        logger.info("File uploaded successfully")
 
-        # make a call to the callback api
-        callback_response = session.post(
+        # make a call to the callback api over the pooled session for its host
+        callback_response = services.callback_dispatcher.post(
             task.callbackUrl,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {id_token}'
-            },
-            json={
+            {
                 "tenantId": task.tenantId,
                 "userId": task.userId,
                 "collectionId": task.collectionId,
@@ -103,7 +137,8 @@ def upload_pdfs():
                 "uploadPath": task.uploadPath + "/" + task.fileName,
                 "status": "SUCCESS",
                 "error": None
-            }
+            },
+            current_app.config['CONFIGURATION'].document_store_api
         )
 
         if callback_response.status_code != 200:
@@ -112,6 +147,3 @@ def upload_pdfs():
 
         logger.info(f"Callback response: {callback_response.status_code}")
         return jsonify({"message": "File uploaded successfully"}), 200
-    except Exception as e:
-        logger.error(f"Error making callback request: {str(e)}")
-        return jsonify({"error": str(e)}), 500
@@ -1,3 +0,0 @@
-from ..utils.request_utls import get_request_session
-
-session = get_request_session()
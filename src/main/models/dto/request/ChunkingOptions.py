@@ -0,0 +1,45 @@
+from dataclasses import dataclass, fields
+from typing import Any
+
+# Upper bounds that keep one request from monopolising the provider or the worker
+MAX_PAGES_PER_CHUNK = 500
+MAX_PARALLELISM = 32
+
+
+class InvalidChunkingOptionsError(ValueError):
+    """
+    Raised when a request's chunking options are out of range or of the wrong type
+    """
+    pass
+
+
+@dataclass
+class ChunkingOptions:
+    pages_per_chunk: int = 20
+    max_parallelism: int = 4
+
+    def __post_init__(self):
+        for name, upper in (('pages_per_chunk', MAX_PAGES_PER_CHUNK), ('max_parallelism', MAX_PARALLELISM)):
+            value = getattr(self, name)
+            # bool is an int subclass, but true is not a page count
+            if type(value) is not int or not 1 <= value <= upper:
+                raise InvalidChunkingOptionsError(f"chunking.{name} must be an integer from 1 to {upper}, not {value!r}")
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'ChunkingOptions':
+        """
+        Raises:
+            InvalidChunkingOptionsError: If data is not an object of known, valid options
+        """
+        if not isinstance(data, dict):
+            raise InvalidChunkingOptionsError(f"chunking must be an object, not {type(data).__name__}")
+        unknown = set(data) - {field.name for field in fields(cls)}
+        if unknown:
+            raise InvalidChunkingOptionsError(f"Unknown chunking options: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def to_dict(self):
+        return {
+            "pages_per_chunk": self.pages_per_chunk,
+            "max_parallelism": self.max_parallelism
+        }
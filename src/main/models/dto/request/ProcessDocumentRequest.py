@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from typing import Optional
 
+from .ChunkingOptions import ChunkingOptions
 from ...enum.DocumentType import DocumentType
 
 
@@ -14,6 +16,22 @@ class ProcessDocumentRequest:
     url: str
     name: str
     callback_url: str
+    chunking: Optional[ChunkingOptions] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ProcessDocumentRequest':
+        return cls(
+            id=data['id'],
+            name=data['name'],
+            type=data['type'],
+            url=data['url'],
+            prompt=data['prompt'],
+            file_type=data['file_type'],
+            tenant_id=data['tenant_id'],
+            collection_id=data['collection_id'],
+            callback_url=data['callback_url'],
+            chunking=ChunkingOptions.from_dict(data['chunking']) if data.get('chunking') else None
+        )
 
     def to_dict(self):
         return {
@@ -25,5 +43,6 @@ class ProcessDocumentRequest:
             "file_type": self.file_type,
             "url": self.url,
             "name": self.name,
-            "callback_url": self.callback_url
+            "callback_url": self.callback_url,
+            "chunking": self.chunking.to_dict() if self.chunking else None
         }
\ No newline at end of file
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from io import BytesIO
+from typing import BinaryIO
 
 from werkzeug.datastructures import FileStorage
 
@@ -15,5 +15,5 @@ class UploadDocumentRequest:
     userId: str
     fileType: str
     fileSize: int
-    file: BytesIO
+    file: BinaryIO
     callbackUrl: str
@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Union
+
+# The prompt decides the exact output, so the schema only pins down the fields every invoice
+# extraction shares and leaves any others alone. Exact types, as a JSON parser produces them, so
+# that a bool never passes for a number
+TEXT = frozenset((str, int))
+AMOUNT = frozenset((int, float, str))
+
+Text = Optional[Union[str, int]]
+Amount = Optional[Union[int, float, str]]
+
+
+class ResultSchemaError(ValueError):
+    """
+    Raised when parsed model output does not match the schema of its document type
+    """
+    pass
+
+
+def _get(data: Dict, name: str, types: FrozenSet[type]) -> Any:
+    value = data.get(name)
+    if value is None or type(value) in types:
+        return value
+    expected = ' or '.join(sorted(kind.__name__ for kind in types))
+    raise ResultSchemaError(f"{name} should be {expected} or null, not {type(value).__name__}")
+
+
+def _require_object(value: Any, what: str) -> Dict:
+    if not isinstance(value, dict):
+        raise ResultSchemaError(f"{what} should be an object, not {type(value).__name__}")
+    return value
+
+
+@dataclass(slots=True)
+class InvoiceLineItem:
+    description: Text = None
+    quantity: Amount = None
+    unit_price: Amount = None
+    amount: Amount = None
+
+    @classmethod
+    def from_dict(cls, value: Any) -> 'InvoiceLineItem':
+        data = _require_object(value, 'line item')
+        return cls(
+            description=_get(data, 'description', TEXT),
+            quantity=_get(data, 'quantity', AMOUNT),
+            unit_price=_get(data, 'unit_price', AMOUNT),
+            amount=_get(data, 'amount', AMOUNT)
+        )
+
+
+@dataclass(slots=True)
+class Invoice:
+    invoice_number: Text = None
+    invoice_date: Text = None
+    due_date: Text = None
+    currency: Text = None
+    vendor_name: Text = None
+    customer_name: Text = None
+    subtotal: Amount = None
+    tax: Amount = None
+    total: Amount = None
+    line_items: List[InvoiceLineItem] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, value: Any) -> 'Invoice':
+        """
+        Raises:
+            ResultSchemaError: If a known field has the wrong type
+        """
+        data = _require_object(value, 'result')
+        line_items = data.get('line_items')
+        if line_items is not None and not isinstance(line_items, list):
+            raise ResultSchemaError(f"line_items should be a list or null, not {type(line_items).__name__}")
+
+        items = []
+        for index, item in enumerate(line_items or ()):
+            try:
+                items.append(InvoiceLineItem.from_dict(item))
+            except ResultSchemaError as e:
+                # Only failures pay for locating the item
+                raise ResultSchemaError(f"line_items[{index}]: {str(e)}") from None
+
+        return cls(
+            invoice_number=_get(data, 'invoice_number', TEXT),
+            invoice_date=_get(data, 'invoice_date', TEXT),
+            due_date=_get(data, 'due_date', TEXT),
+            currency=_get(data, 'currency', TEXT),
+            vendor_name=_get(data, 'vendor_name', TEXT),
+            customer_name=_get(data, 'customer_name', TEXT),
+            subtotal=_get(data, 'subtotal', AMOUNT),
+            tax=_get(data, 'tax', AMOUNT),
+            total=_get(data, 'total', AMOUNT),
+            line_items=items
+        )
@@ -2,6 +2,8 @@ from dataclasses import dataclass
 from typing import Dict, Optional
 
 from ...enum.DocumentType import DocumentType
+from ....utils import json_codec
+from ....utils.json_stream import JsonText
 
 
 @dataclass
@@ -22,3 +24,16 @@ class ProcessDocumentCallbackRequest:
             "metadata": self.metadata,
             "error": self.error
         }
+
+    def to_json(self, embed_parsed_data: bool = False) -> bytes:
+        """
+        The callback body, encoded once. With embed_parsed_data the validated model output is
+        spliced in as a nested JSON value instead of a string, so the receiver parses it only once.
+        """
+        if not embed_parsed_data or not isinstance(self.parsed_data, JsonText):
+            return json_codec.dumps(self.to_dict())
+
+        fields = self.to_dict()
+        del fields["parsed_data"]
+        # JsonText has already been validated, so its text can go into the body verbatim
+        return json_codec.dumps(fields)[:-1] + b',"parsed_data":' + self.parsed_data.encode('utf-8') + b'}'
@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class JobState(Enum):
+    ACCEPTED = 'accepted'
+    DOWNLOADING = 'downloading'
+    PARSING = 'parsing'
+    CALLBACK_PENDING = 'callback-pending'
+    DONE = 'done'
+    # The callback was dead-lettered; terminal, so recovery leaves the job alone
+    FAILED = 'failed'
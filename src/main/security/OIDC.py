@@ -1,6 +1,25 @@
-from google.auth.transport import requests
+from typing import Dict, Optional
+
 from google.oauth2 import id_token
-from google.oauth2.id_token import fetch_id_token
+
+from .TokenManager import CachingRequest, TokenManager
+from ..utils.telemetry import telemetry
+
+GOOGLE_OAUTH2_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Shared by every request: the signing certs are fetched once per their max-age
+cert_request = CachingRequest()
+# Outbound ID tokens, cached per audience and refreshed ahead of expiry
+token_manager = TokenManager()
+# Overridden to point inbound verification at a local fake in the offline benchmarks
+certs_url = GOOGLE_OAUTH2_CERTS_URL
+
+
+def configure_oidc(oidc_certs_url: Optional[str]):
+    global certs_url
+    if oidc_certs_url:
+        certs_url = oidc_certs_url
 
 
 def verify_oidc_token(request):
@@ -11,9 +30,11 @@ def verify_oidc_token(request):
 
     token = auth_header.split('Bearer ')[1]
     try:
-        # Verify the token
-        decoded_token = id_token.verify_oauth2_token(
-            token, requests.Request())
+        # Verify the token; the same checks as id_token.verify_oauth2_token, with a configurable certs URL
+        with telemetry.stage('auth_verify'):
+            decoded_token = id_token.verify_token(token, cert_request, certs_url=certs_url)
+        if decoded_token['iss'] not in GOOGLE_ISSUERS:
+            return None
         return decoded_token
     except Exception as e:
         return None
@@ -21,5 +42,11 @@ def verify_oidc_token(request):
 
 def get_callback_id_token(aud: str) -> str:
     # Get ID token for the callback
-    auth_req = requests.Request()
-    return fetch_id_token(auth_req, aud)
+    return token_manager.get_id_token(aud)
+
+
+def token_stats() -> Dict:
+    return {
+        "id_tokens": token_manager.stats(),
+        "cert_cache": {"hits": cert_request.hits, "misses": cert_request.misses}
+    }
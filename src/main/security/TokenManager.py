@@ -0,0 +1,182 @@
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+from google.auth import jwt
+from google.auth import transport
+from google.auth.transport import requests
+from google.oauth2.id_token import fetch_id_token
+
+from ..logs.logger import setup_logger
+from ..utils.request_utls import get_request_session
+from ..utils.telemetry import telemetry
+
+# Refresh ID tokens this long before they expire; Google ID tokens live for an hour
+ID_TOKEN_REFRESH_MARGIN_SECONDS = 300
+# Fallback lifetime for a token whose exp claim cannot be read
+DEFAULT_ID_TOKEN_LIFETIME_SECONDS = 3600
+# Wait this long before retrying a failed background refresh
+REFRESH_RETRY_SECONDS = 30
+
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+def cache_lifetime_seconds(headers: Optional[Mapping[str, str]]) -> float:
+    """
+    How long a response may be reused according to its Cache-Control, Age and Expires headers
+    """
+    if not headers:
+        return 0.0
+
+    cache_control = (headers.get('cache-control') or '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0.0
+
+    match = MAX_AGE_PATTERN.search(cache_control)
+    if match:
+        age = headers.get('age')
+        return max(float(match.group(1)) - (float(age) if age and age.isdigit() else 0.0), 0.0)
+
+    expires = headers.get('expires')
+    if expires:
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+class CachingRequest(transport.Request):
+    """
+    google-auth transport that reuses GET responses for as long as their cache headers allow.
+
+    Token verification fetches Google's signing certs on every call; with this transport the
+    certs are downloaded once per max-age instead of once per inbound request.
+    """
+
+    def __init__(self, request: Optional[transport.Request] = None):
+        self._request = request or requests.Request(session=get_request_session())
+        self._cache: Dict[str, Tuple[float, transport.Response]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        if method != 'GET' or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached is not None and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        response = self._request(url, method=method, headers=headers, timeout=timeout, **kwargs)
+        lifetime = cache_lifetime_seconds(response.headers) if response.status == 200 else 0.0
+        if lifetime > 0:
+            with self._lock:
+                self._cache[url] = (time.monotonic() + lifetime, response)
+        return response
+
+
+class TokenManager:
+    """
+    Caches outbound ID tokens per audience and refreshes them in the background before they expire,
+    so callbacks do not pay a token-endpoint round trip each.
+    """
+
+    def __init__(self, refresh_margin_seconds: float = ID_TOKEN_REFRESH_MARGIN_SECONDS):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.logger = setup_logger(__name__)
+        self._request = requests.Request(session=get_request_session())
+        # audience -> (token, fetched at, expires at), in epoch seconds
+        self._tokens: Dict[str, Tuple[str, float, float]] = {}
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._wake = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self.fetches = 0
+        self.hits = 0
+
+    def _fetch(self, audience: str) -> str:
+        with telemetry.stage('token_fetch'):
+            token = fetch_id_token(self._request, audience)
+        fetched_at = time.time()
+        try:
+            expires_at = float(jwt.decode(token, verify=False)['exp'])
+        except Exception:
+            expires_at = fetched_at + DEFAULT_ID_TOKEN_LIFETIME_SECONDS
+
+        with self._lock:
+            self._tokens[audience] = (token, fetched_at, expires_at)
+            self.fetches += 1
+        self._wake.set()
+        return token
+
+    def _fresh(self, audience: str) -> Optional[str]:
+        with self._lock:
+            cached = self._tokens.get(audience)
+        if cached is not None and cached[2] - time.time() > self.refresh_margin_seconds:
+            return cached[0]
+        return None
+
+    def get_id_token(self, audience: str) -> str:
+        """
+        Return a cached ID token for the audience, fetching one only if none is fresh
+        """
+        token = self._fresh(audience)
+        if token is not None:
+            with self._lock:
+                self.hits += 1
+            return token
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(audience, threading.Lock())
+        # One fetch per audience; concurrent callers wait for it instead of fetching too
+        with fetch_lock:
+            token = self._fresh(audience)
+            if token is None:
+                token = self._fetch(audience)
+
+        self._ensure_refresher()
+        return token
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="id-token-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_at(self, fetched_at: float, expires_at: float) -> float:
+        # Ahead of the point where get_id_token would fetch inline, but never in the first half of
+        # a token's life, so short-lived tokens cannot make the refresher spin
+        return max(expires_at - self.refresh_margin_seconds * 2, fetched_at + (expires_at - fetched_at) / 2)
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.clear()
+            with self._lock:
+                tokens = dict(self._tokens)
+
+            delays = []
+            for audience, (_, fetched_at, expires_at) in tokens.items():
+                delay = self._refresh_at(fetched_at, expires_at) - time.time()
+                if delay <= 0:
+                    try:
+                        # The new expiry is picked up on the next pass, which _fetch wakes
+                        self._fetch(audience)
+                        continue
+                    except Exception as e:
+                        self.logger.warning(f"Background ID token refresh failed for {audience}: {str(e)}")
+                        delay = REFRESH_RETRY_SECONDS
+                delays.append(delay)
+
+            self._wake.wait(min(delays) if delays else None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"audiences": len(self._tokens), "fetches": self.fetches, "hits": self.hits}
@@ -1,36 +1,145 @@
-import base64
+import asyncio
+import contextlib
 import json
+import threading
 import time
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterator, List, Tuple
 
 import anthropic
 import backoff
-from anthropic import Anthropic
-
+from anthropic import Anthropic, AsyncAnthropic
+
+from .DocumentPacker import (
+    DOCUMENT_FOOTER,
+    DocumentPacker,
+    PackedDocument,
+    document_header,
+    estimate_packed_input_tokens
+)
+from .ImagePreprocessor import ImagePreprocessor, PreprocessedImage
+from .RateGovernor import (
+    RateGovernor,
+    estimate_image_input_tokens,
+    estimate_input_tokens,
+    estimate_text_input_tokens,
+    retry_after_seconds
+)
+from .ResultCache import ResultCache, build_cache_key
+from .TextLayerExtractor import TextLayer, TextLayerExtractor, format_text_layer
 from ..config.constants.MimeTypes import MIME_TYPES
 from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, b64encode_stream
+from ..utils import json_codec
+from ..utils.json_stream import IncrementalJsonValidator, InvalidJsonStreamError, JsonText, StreamStats
+from ..utils.telemetry import telemetry
+
+
+def build_prompt_block(prompt: str, cacheable: bool) -> Dict:
+    block = {
+        "type": "text",
+        "text": prompt
+    }
+    if cacheable:
+        # Everything up to and including this block is cached as a reusable prefix
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def order_content(prompt_block: Dict, file_blocks: List[Dict], cacheable: bool) -> List[Dict]:
+    # A cache prefix must come first, so the shared prompt leads when caching is on
+    return [prompt_block] + file_blocks if cacheable else file_blocks + [prompt_block]
+
 
 def build_anthropic_api_pdf_parsing_request(
         pdf: str,
         prompt: str,
-        media_type: str
+        media_type: str,
+        cacheable: bool = False
 ) -> Dict:
+    file_blocks = [
+        {
+            "type": "document",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": pdf
+            }
+        }
+    ]
+    return {
+        "role": "user",
+        "content": order_content(build_prompt_block(prompt, cacheable), file_blocks, cacheable)
+    }
+
+
+def build_anthropic_api_image_parsing_request(
+        images: List[Tuple[str, str]],
+        prompt: str,
+        cacheable: bool = False
+) -> Dict:
+    """
+    Build a request with one image block per (base64 data, media type) pair, in page order
+    """
+    file_blocks = [
+        {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": data
+            }
+        }
+        for data, media_type in images
+    ]
+    return {
+        "role": "user",
+        "content": order_content(build_prompt_block(prompt, cacheable), file_blocks, cacheable)
+    }
+
+
+def build_anthropic_api_text_parsing_request(document_text: str, prompt: str, cacheable: bool = False) -> Dict:
+    """
+    Build a request that carries a document's extracted text instead of the document itself
+    """
+    file_blocks = [
+        {
+            "type": "text",
+            "text": document_text
+        }
+    ]
     return {
         "role": "user",
-        "content": [
+        "content": order_content(build_prompt_block(prompt, cacheable), file_blocks, cacheable)
+    }
+
+
+def build_anthropic_api_packed_parsing_request(
+        documents: List[Tuple[str, List[Tuple[str, str]]]],
+        prompt: str,
+        cacheable: bool = False
+) -> Dict:
+    """
+    Build a request carrying several documents, each as (file name, [(base64 data, media type), ...])
+    between its own delimiters, in order
+    """
+    file_blocks = []
+    for index, (file_name, parts) in enumerate(documents, start=1):
+        file_blocks.append({"type": "text", "text": document_header(index, file_name)})
+        file_blocks.extend(
             {
-                "type": "document",
+                "type": "image" if media_type.startswith('image/') else "document",
                 "source": {
                     "type": "base64",
                     "media_type": media_type,
-                    "data": pdf
+                    "data": data
                 }
-            },
-            {
-                "type": "text",
-                "text": prompt
             }
-        ]
+            for data, media_type in parts
+        )
+        file_blocks.append({"type": "text", "text": DOCUMENT_FOOTER})
+    return {
+        "role": "user",
+        "content": order_content(build_prompt_block(prompt, cacheable), file_blocks, cacheable)
     }
 
 
@@ -44,15 +153,49 @@ class AnthropicClient:
         'image/tiff': ('anthropic-beta', 'images-2024-09-25')
     }
 
-    def __init__(self, api_key: str):
+    PROVIDER = "anthropic"
+
+    def __init__(
+            self,
+            api_key: str,
+            result_cache: Optional[ResultCache] = None,
+            rate_governor: Optional[RateGovernor] = None,
+            image_preprocessor: Optional[ImagePreprocessor] = None,
+            base_url: Optional[str] = None,
+            prompt_caching: bool = False,
+            streaming: bool = False,
+            stream_max_attempts: int = 3,
+            text_layer_extractor: Optional[TextLayerExtractor] = None,
+            document_packer: Optional[DocumentPacker] = None
+    ):
         self.api_key = api_key
         self.logger = setup_logger(__name__)
-        self.client: Anthropic = anthropic.Anthropic(api_key=api_key)
+        # base_url lets the clients talk to a local fake API in tests and benchmarks
+        self.client: Anthropic = anthropic.Anthropic(api_key=api_key, base_url=base_url)
+        self.async_client: AsyncAnthropic = anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url)
+        self.result_cache = result_cache
+        self.rate_governor = rate_governor
+        self.image_preprocessor = image_preprocessor
+        self.text_layer_extractor = text_layer_extractor
+        self.document_packer = document_packer
+        self.prompt_caching = prompt_caching
+        self.streaming = streaming
+        self.stream_max_attempts = stream_max_attempts
+        self.stream_stats = StreamStats()
+        self._usage_lock = threading.Lock()
+        self._usage: Dict[str, int] = {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+        self.ANTHROPIC_MODEL = "claude-3-5-sonnet-20241022"
         self.MAX_TOKENS = 8192
         self.ANTHROPIC_PDF_HEADER_KEY = "anthropic-beta"
         self.ANTHROPIC_PDF_HEADER_VALUE = "pdfs-2024-09-25"
 
-    def _validate_json_response(self, response_text: str, file_name: str) -> str:
+    def _validate_json_response(self, response_text: str, file_name: str) -> JsonText:
         """
         Validate that the response is a valid JSON string
 
@@ -61,15 +204,15 @@ class AnthropicClient:
             file_name: The name of the file being processed (for error reporting)
 
         Returns:
-            The validated response text
+            The validated response text, carrying the parsed value
 
         Raises:
             Exception: If the response is not valid JSON
         """
         try:
             # Attempt to parse the string as JSON
-            json.loads(response_text)
-            return response_text
+            with telemetry.stage('json_validation', self.PROVIDER):
+                return JsonText(response_text, json_codec.loads(response_text))
         except json.JSONDecodeError as e:
             error_msg = f"Invalid JSON response for file {file_name}: {str(e)}"
             self.logger.error(error_msg)
@@ -94,6 +237,24 @@ class AnthropicClient:
         """
         return self.FILE_HEADERS.get(mime_type)
 
+    def _build_request(self, messages: List[Dict], header: tuple) -> Dict:
+        return dict(
+            model=self.ANTHROPIC_MODEL,
+            messages=messages,
+            max_tokens=self.MAX_TOKENS,
+            extra_headers={header[0]: header[1]}
+        )
+
+    def _on_rate_limited(self, e: anthropic.RateLimitError):
+        self.rate_governor.update_from_headers(e.response.headers)
+        self.rate_governor.penalize(retry_after_seconds(e.response.headers))
+
+    def _on_raw_response(self, raw_response, estimated_tokens: int):
+        self.rate_governor.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        self.rate_governor.record_usage(estimated_tokens, response.usage.input_tokens)
+        return response
+
     # Using backoff for retries with exponential backoff
     @backoff.on_exception(
         backoff.expo,
@@ -102,27 +263,152 @@ class AnthropicClient:
         max_time=300,  # Give up after 5 minutes
         jitter=backoff.full_jitter  # Add jitter to prevent thundering herd
     )
-    def _call_anthropic_api(self, messages, header):
+    def _call_anthropic_api(self, messages, header, estimated_tokens: int = 0):
+        request = self._build_request(messages, header)
 
-        return self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            messages=messages,
-            max_tokens=self.MAX_TOKENS,
-            extra_headers={header[0]: header[1]}
-        )
+        if self.rate_governor is None:
+            return self.client.messages.create(**request)
 
-    def process_file(
-            self,
-            file_name: str,
-            file_content: bytes,
-            prompt: str
-    ) -> str:
+        with self.rate_governor.acquire(estimated_tokens):
+            try:
+                raw_response = self.client.messages.with_raw_response.create(**request)
+            except anthropic.RateLimitError as e:
+                self._on_rate_limited(e)
+                raise
+
+        return self._on_raw_response(raw_response, estimated_tokens)
+
+    @backoff.on_exception(
+        backoff.expo,
+        (anthropic.APIError, anthropic.APITimeoutError, anthropic.RateLimitError),
+        max_tries=3,
+        max_time=300,
+        jitter=backoff.full_jitter
+    )
+    async def _call_anthropic_api_async(self, messages, header, estimated_tokens: int = 0):
+        request = self._build_request(messages, header)
+
+        if self.rate_governor is None:
+            return await self.async_client.messages.create(**request)
+
+        async with self.rate_governor.acquire_async(estimated_tokens):
+            try:
+                raw_response = await self.async_client.messages.with_raw_response.create(**request)
+            except anthropic.RateLimitError as e:
+                self._on_rate_limited(e)
+                raise
+
+        return self._on_raw_response(raw_response, estimated_tokens)
+
+    def _slot(self, estimated_tokens: int):
+        if self.rate_governor is None:
+            return contextlib.nullcontext()
+        return self.rate_governor.acquire(estimated_tokens)
+
+    def _async_slot(self, estimated_tokens: int):
+        if self.rate_governor is None:
+            return contextlib.nullcontext()
+        return self.rate_governor.acquire_async(estimated_tokens)
+
+    def _on_stream_start(self, stream):
+        if self.rate_governor is not None:
+            self.rate_governor.update_from_headers(stream.response.headers)
+
+    def _on_stream_end(self, message, estimated_tokens: int):
+        self._record_usage(message.usage)
+        if self.rate_governor is not None:
+            self.rate_governor.record_usage(estimated_tokens, message.usage.input_tokens)
+
+    def _on_chunk(self, validator: IncrementalJsonValidator, text: str, start_time: float):
+        if validator.received == 0 and text:
+            self.stream_stats.record_first_byte(time.time() - start_time)
+        validator.feed(text)
+
+    @backoff.on_exception(
+        backoff.expo,
+        (anthropic.APIError, anthropic.APITimeoutError, anthropic.RateLimitError),
+        max_tries=3,
+        max_time=300,
+        jitter=backoff.full_jitter
+    )
+    def _stream_anthropic_api(self, messages, header, estimated_tokens: int = 0) -> JsonText:
         """
-        Process any supported file format (PDF, JPEG, PNG, TIFF)
+        Stream one completion through the incremental validator.
+
+        Raises:
+            InvalidJsonStreamError: As soon as the output can no longer become valid JSON. Leaving
+                the stream context closes the connection, which stops generation server-side.
         """
+        request = self._build_request(messages, header)
+        validator = IncrementalJsonValidator()
+        start_time = time.time()
+
+        with self._slot(estimated_tokens):
+            try:
+                with self.client.messages.stream(**request) as stream:
+                    self._on_stream_start(stream)
+                    for text in stream.text_stream:
+                        self._on_chunk(validator, text, start_time)
+                    message = stream.get_final_message()
+            except anthropic.RateLimitError as e:
+                if self.rate_governor is not None:
+                    self._on_rate_limited(e)
+                raise
+
+        self._on_stream_end(message, estimated_tokens)
+        with telemetry.stage('json_validation', self.PROVIDER):
+            return validator.finish()
+
+    @backoff.on_exception(
+        backoff.expo,
+        (anthropic.APIError, anthropic.APITimeoutError, anthropic.RateLimitError),
+        max_tries=3,
+        max_time=300,
+        jitter=backoff.full_jitter
+    )
+    async def _stream_anthropic_api_async(self, messages, header, estimated_tokens: int = 0) -> JsonText:
+        request = self._build_request(messages, header)
+        validator = IncrementalJsonValidator()
         start_time = time.time()
-        self.logger.info(f"Starting processing of file: {file_name}")
 
+        async with self._async_slot(estimated_tokens):
+            try:
+                async with self.async_client.messages.stream(**request) as stream:
+                    self._on_stream_start(stream)
+                    async for text in stream.text_stream:
+                        self._on_chunk(validator, text, start_time)
+                    message = await stream.get_final_message()
+            except anthropic.RateLimitError as e:
+                if self.rate_governor is not None:
+                    self._on_rate_limited(e)
+                raise
+
+        self._on_stream_end(message, estimated_tokens)
+        with telemetry.stage('json_validation', self.PROVIDER):
+            return validator.finish()
+
+    def _on_stream_abort(self, file_name: str, attempt: int, e: InvalidJsonStreamError):
+        self.stream_stats.record_abort()
+        self.logger.warning(
+            f"Aborted response stream for {file_name} (attempt {attempt}/{self.stream_max_attempts}): {str(e)}")
+
+    def _stream_json(self, messages, header, file_name: str, estimated_tokens: int) -> JsonText:
+        for attempt in range(1, self.stream_max_attempts + 1):
+            try:
+                return self._stream_anthropic_api(messages, header, estimated_tokens)
+            except InvalidJsonStreamError as e:
+                self._on_stream_abort(file_name, attempt, e)
+        raise Exception(f"Invalid JSON response for file {file_name} after {self.stream_max_attempts} attempts")
+
+    async def _stream_json_async(self, messages, header, file_name: str, estimated_tokens: int) -> JsonText:
+        for attempt in range(1, self.stream_max_attempts + 1):
+            try:
+                return await self._stream_anthropic_api_async(messages, header, estimated_tokens)
+            except InvalidJsonStreamError as e:
+                self._on_stream_abort(file_name, attempt, e)
+        raise Exception(f"Invalid JSON response for file {file_name} after {self.stream_max_attempts} attempts")
+
+    def _resolve_file_type(self, file_name: str) -> Tuple[str, tuple]:
         mime_type = self._get_mime_type(file_name)
         if not mime_type:
             raise ValueError(f"Unsupported file format for file: {file_name}")
@@ -131,44 +417,346 @@ class AnthropicClient:
         if not header:
             raise ValueError(f"No header configuration for MIME type: {mime_type}")
 
-        try:
-            base64_content = base64.b64encode(file_content).decode()
+        return mime_type, header
 
-            if base64_content is None:
-                # TODO: Change to specific exception
-                raise ValueError("Could not encode file content to base64")
+    def _lookup_cache(self, file_content: FileContent, prompt: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns:
+            Tuple of (cache key or None if caching is disabled, cached response or None)
+        """
+        if self.result_cache is None:
+            return None, None
+
+        cache_key = build_cache_key(file_content, prompt, self.PROVIDER, self.ANTHROPIC_MODEL)
+        return cache_key, self.result_cache.get(cache_key)
+
+    def _should_preprocess(self, mime_type: str) -> bool:
+        return self.image_preprocessor is not None and mime_type.startswith('image/')
+
+    def _should_extract_text(self, mime_type: str) -> bool:
+        return self.text_layer_extractor is not None and mime_type == 'application/pdf'
+
+    def _build_messages(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            mime_type: str,
+            images: Optional[List[PreprocessedImage]] = None,
+            text_layer: Optional[TextLayer] = None
+    ) -> Tuple[List[Dict], int]:
+        if text_layer is not None:
+            document_text = format_text_layer(file_name, text_layer)
+            estimated_tokens = estimate_text_input_tokens(document_text, prompt)
+            self.text_layer_extractor.record_savings(
+                file_name, self.PROVIDER, estimate_input_tokens(file_content, mime_type, prompt), estimated_tokens)
+            messages: List[Dict] = [
+                build_anthropic_api_text_parsing_request(document_text, prompt, self.prompt_caching)
+            ]
+            return messages, estimated_tokens
+
+        if images is not None:
+            encoded_images = [(b64encode_stream(image.content), image.mime_type) for image in images]
+            self.logger.info(f"File {file_name} preprocessed into {len(images)} image(s), sending to Anthropic")
+            messages: List[Dict] = [
+                build_anthropic_api_image_parsing_request(encoded_images, prompt, self.prompt_caching)
+            ]
+            return messages, estimate_image_input_tokens(len(images), prompt)
+
+        # Encode incrementally so the raw bytes are never held alongside a second full copy
+        base64_content = b64encode_stream(file_content)
+        self.logger.info(f"File {file_name} encoded, sending to Anthropic")
+
+        messages: List[Dict] = [
+            build_anthropic_api_pdf_parsing_request(base64_content, prompt, mime_type, self.prompt_caching)
+        ]
+        return messages, estimate_input_tokens(file_content, mime_type, prompt)
+
+    def _record_usage(self, usage):
+        with self._usage_lock:
+            self._usage["requests"] += 1
+            for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+                self._usage[field] += getattr(usage, field, None) or 0
+        telemetry.record_tokens(self.PROVIDER, getattr(usage, 'input_tokens', None), getattr(usage, 'output_tokens', None))
+
+    def usage_stats(self) -> Dict:
+        """
+        Token usage totals, including prompt-cache writes and reads, since startup
+        """
+        with self._usage_lock:
+            stats = dict(self._usage)
+        cacheable_input = stats["input_tokens"] + stats["cache_creation_input_tokens"] + stats["cache_read_input_tokens"]
+        stats["cache_read_ratio"] = stats["cache_read_input_tokens"] / cacheable_input if cacheable_input else 0.0
+        return stats
+
+    def _handle_response(self, response, file_name: str, cache_key: Optional[str], start_time: float) -> JsonText:
+        self._record_usage(response.usage)
+        file_response = response.content[0].to_dict()['text']
+
+        if not isinstance(file_response, str):
+            self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is not a string")
+            raise Exception("Invoice response is not a string")
+
+        if file_response is None:
+            self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is None")
+            raise Exception("Invoice response is None")
+
+        # Validate that the response is valid JSON
+        validated_response = self._validate_json_response(file_response, file_name)
+
+        processing_time = time.time() - start_time
+        self.logger.info(f"Processed file {file_name} in {processing_time:.2f} seconds")
+
+        if cache_key is not None:
+            self.result_cache.set(cache_key, validated_response)
+
+        return validated_response
 
-            self.logger.info(f"File {file_name} encoded, sending to Anthropic")
+    def _handle_streamed_response(
+            self,
+            validated_response: JsonText,
+            file_name: str,
+            cache_key: Optional[str],
+            start_time: float
+    ) -> JsonText:
+        processing_time = time.time() - start_time
+        self.logger.info(f"Processed file {file_name} in {processing_time:.2f} seconds (streamed)")
+
+        if cache_key is not None:
+            self.result_cache.set(cache_key, validated_response)
+
+        return validated_response
+
+    def _packed_parts(
+            self,
+            file_content: FileContent,
+            mime_type: str,
+            images: Optional[List[PreprocessedImage]]
+    ) -> Optional[List[Tuple[FileContent, str]]]:
+        """
+        Returns:
+            What a packed request would carry for the document, or None if it cannot be packed
+        """
+        if self.document_packer is None:
+            return None
+        if images is not None:
+            return [(image.content, image.mime_type) for image in images]
+        return [(file_content, mime_type)]
+
+    def _build_packed_messages(self, documents: List[PackedDocument], prompt: str) -> Tuple[List[Dict], int]:
+        encoded = [
+            (document.file_name, [(b64encode_stream(content), mime_type) for content, mime_type in document.parts])
+            for document in documents
+        ]
+        messages: List[Dict] = [build_anthropic_api_packed_parsing_request(encoded, prompt, self.prompt_caching)]
+        return messages, estimate_packed_input_tokens(documents, prompt)
 
-            messages: List[Dict] = [build_anthropic_api_pdf_parsing_request(base64_content, prompt, mime_type)]
-            response = self._call_anthropic_api(messages, header)
+    def _process_packed(self, documents: List[PackedDocument], prompt: str) -> JsonText:
+        """
+        Send several documents of one file type in one request; the response is their JSON array
+        """
+        start_time = time.time()
+        file_names = ', '.join(document.file_name for document in documents)
+        _, header = self._resolve_file_type(documents[0].file_name)
+
+        with telemetry.stage('encode', self.PROVIDER):
+            messages, estimated_tokens = self._build_packed_messages(documents, prompt)
+        if self.streaming:
+            with telemetry.stage('provider_call', self.PROVIDER):
+                validated_response = self._stream_json(messages, header, file_names, estimated_tokens)
+            return self._handle_streamed_response(validated_response, file_names, None, start_time)
+
+        with telemetry.stage('provider_call', self.PROVIDER):
+            response = self._call_anthropic_api(messages, header, estimated_tokens)
+        return self._handle_response(response, file_names, None, start_time)
 
-            # response = self.client.messages.create(
-            #     model="claude-3-5-sonnet-20241022",
-            #     messages=messages,
-            #     max_tokens=self.MAX_TOKENS,
-            #     extra_headers={header[0]: header[1]}
-            # )
+    async def _process_packed_async(self, documents: List[PackedDocument], prompt: str) -> JsonText:
+        start_time = time.time()
+        file_names = ', '.join(document.file_name for document in documents)
+        _, header = self._resolve_file_type(documents[0].file_name)
+
+        with telemetry.stage('encode', self.PROVIDER):
+            messages, estimated_tokens = self._build_packed_messages(documents, prompt)
+        if self.streaming:
+            with telemetry.stage('provider_call', self.PROVIDER):
+                validated_response = await self._stream_json_async(messages, header, file_names, estimated_tokens)
+            return self._handle_streamed_response(validated_response, file_names, None, start_time)
+
+        with telemetry.stage('provider_call', self.PROVIDER):
+            response = await self._call_anthropic_api_async(messages, header, estimated_tokens)
+        return await asyncio.to_thread(self._handle_response, response, file_names, None, start_time)
+
+    def _cache_packed_response(self, validated_response: JsonText, file_name: str, cache_key: Optional[str]) -> JsonText:
+        self.logger.info(f"Processed file {file_name} in a packed request")
+        if cache_key is not None:
+            self.result_cache.set(cache_key, validated_response)
+        return validated_response
+
+    def process_file(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str
+    ) -> str:
+        """
+        Process any supported file format (PDF, JPEG, PNG, TIFF)
+        """
+        start_time = time.time()
+        self.logger.info(f"Starting processing of file: {file_name}")
 
-            file_response = response.content[0].to_dict()['text']
+        mime_type, header = self._resolve_file_type(file_name)
 
-            if not isinstance(file_response, str):
-                self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is not a string")
-                raise Exception("Invoice response is not a string")
+        cache_key, cached_response = self._lookup_cache(file_content, prompt)
+        if cached_response is not None:
+            self.logger.info(f"Returning cached result for file {file_name}")
+            return cached_response
 
-            if file_response is None:
-                self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is None")
-                raise Exception("Invoice response is None")
+        try:
+            images = text_layer = None
+            if self._should_preprocess(mime_type):
+                images = self.image_preprocessor.preprocess(file_name, file_content, mime_type)
+            elif self._should_extract_text(mime_type):
+                with telemetry.stage('text_extraction', self.PROVIDER):
+                    text_layer = self.text_layer_extractor.extract(file_name, file_content)
+
+            # Small documents without a text layer may share a request with others using the same prompt
+            parts = self._packed_parts(file_content, mime_type, images) if text_layer is None else None
+            if parts is not None:
+                with telemetry.stage('packing', self.PROVIDER):
+                    packed_response = self.document_packer.process(
+                        self.PROVIDER, file_name, parts, prompt, mime_type, self._process_packed)
+                if packed_response is not None:
+                    return self._cache_packed_response(packed_response, file_name, cache_key)
+
+            with telemetry.stage('encode', self.PROVIDER):
+                messages, estimated_tokens = self._build_messages(
+                    file_name, file_content, prompt, mime_type, images, text_layer)
+            if self.streaming:
+                with telemetry.stage('provider_call', self.PROVIDER):
+                    validated_response = self._stream_json(messages, header, file_name, estimated_tokens)
+                return self._handle_streamed_response(validated_response, file_name, cache_key, start_time)
+
+            with telemetry.stage('provider_call', self.PROVIDER):
+                response = self._call_anthropic_api(messages, header, estimated_tokens)
+            return self._handle_response(response, file_name, cache_key, start_time)
+        except Exception as e:
+            self.logger.error(f"Error processing file {file_name}: {str(e)}")
+            raise Exception(f"Error processing file {file_name}: {str(e)}")
 
-            # Validate that the response is valid JSON
-            validated_response = self._validate_json_response(file_response, file_name)
+    async def process_file_async(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str
+    ) -> str:
+        """
+        Asyncio variant of process_file, for use on the async processing pipeline
+        """
+        start_time = time.time()
+        self.logger.info(f"Starting processing of file: {file_name}")
 
-            processing_time = time.time() - start_time
-            self.logger.info(f"Processed file {file_name} in {processing_time:.2f} seconds")
+        mime_type, header = self._resolve_file_type(file_name)
 
+        # The cache may hit GCS, so keep it off the event loop
+        cache_key, cached_response = await asyncio.to_thread(self._lookup_cache, file_content, prompt)
+        if cached_response is not None:
+            self.logger.info(f"Returning cached result for file {file_name}")
+            return cached_response
 
-            return validated_response
+        try:
+            images = text_layer = None
+            if self._should_preprocess(mime_type):
+                images = await self.image_preprocessor.preprocess_async(file_name, file_content, mime_type)
+            elif self._should_extract_text(mime_type):
+                with telemetry.stage('text_extraction', self.PROVIDER):
+                    text_layer = await self.text_layer_extractor.extract_async(file_name, file_content)
+
+            parts = self._packed_parts(file_content, mime_type, images) if text_layer is None else None
+            if parts is not None:
+                with telemetry.stage('packing', self.PROVIDER):
+                    packed_response = await self.document_packer.process_async(
+                        self.PROVIDER, file_name, parts, prompt, mime_type, self._process_packed_async)
+                if packed_response is not None:
+                    return await asyncio.to_thread(self._cache_packed_response, packed_response, file_name, cache_key)
+
+            with telemetry.stage('encode', self.PROVIDER):
+                messages, estimated_tokens = self._build_messages(
+                    file_name, file_content, prompt, mime_type, images, text_layer)
+            if self.streaming:
+                with telemetry.stage('provider_call', self.PROVIDER):
+                    validated_response = await self._stream_json_async(messages, header, file_name, estimated_tokens)
+                return await asyncio.to_thread(
+                    self._handle_streamed_response, validated_response, file_name, cache_key, start_time)
+
+            with telemetry.stage('provider_call', self.PROVIDER):
+                response = await self._call_anthropic_api_async(messages, header, estimated_tokens)
+            return await asyncio.to_thread(self._handle_response, response, file_name, cache_key, start_time)
         except Exception as e:
             self.logger.error(f"Error processing file {file_name}: {str(e)}")
             raise Exception(f"Error processing file {file_name}: {str(e)}")
 
+    def build_batch_request(
+            self,
+            custom_id: str,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str
+    ) -> Tuple[Dict, str]:
+        """
+        Build one entry for the Message Batches API
+
+        Returns:
+            Tuple of (batch request entry, anthropic-beta value the entry needs)
+        """
+        mime_type, header = self._resolve_file_type(file_name)
+
+        images = text_layer = None
+        if self._should_preprocess(mime_type):
+            images = self.image_preprocessor.preprocess(file_name, file_content, mime_type)
+        elif self._should_extract_text(mime_type):
+            text_layer = self.text_layer_extractor.extract(file_name, file_content)
+
+        messages, _ = self._build_messages(file_name, file_content, prompt, mime_type, images, text_layer)
+        return {
+            "custom_id": custom_id,
+            "params": {
+                "model": self.ANTHROPIC_MODEL,
+                "max_tokens": self.MAX_TOKENS,
+                "messages": messages
+            }
+        }, header[1]
+
+    def submit_batch(self, requests: List[Dict], betas: List[str]) -> str:
+        """
+        Submit a message batch and return its id
+        """
+        batch = self.client.beta.messages.batches.create(requests=requests, betas=betas)
+        self.logger.info(f"Submitted message batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def get_batch_status(self, batch_id: str) -> str:
+        """
+        Returns:
+            The batch processing_status ('in_progress', 'canceling' or 'ended')
+        """
+        return self.client.beta.messages.batches.retrieve(batch_id).processing_status
+
+    def iter_batch_results(self, batch_id: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Stream the results of an ended batch
+
+        Returns:
+            Iterator of (custom_id, validated JSON response or None, error or None)
+        """
+        for entry in self.client.beta.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type != 'succeeded':
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                yield entry.custom_id, None, f"Batch request {result.type}: {getattr(error, 'message', '')}".strip()
+                continue
+
+            try:
+                text = result.message.content[0].text
+                yield entry.custom_id, self._validate_json_response(text, entry.custom_id), None
+            except Exception as e:
+                yield entry.custom_id, None, str(e)
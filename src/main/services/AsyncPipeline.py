@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from .JobScheduler import QueueFullError, SchedulerUnavailableError
+from ..logs.logger import setup_logger
+
+
+class AsyncPipeline:
+    """
+    One asyncio event loop per worker process, running on a dedicated OS thread.
+
+    Jobs are coroutines, so waiting on downloads, LLM calls and callbacks costs no
+    threads. At most max_in_flight jobs run at once; up to max_queue_depth more may
+    wait for a slot before submissions are rejected. Waiting jobs queue per tenant and
+    free slots go to the tenants in turn, as in JobScheduler, so a large batch from one
+    tenant cannot starve the others.
+    """
+
+    def __init__(self, max_in_flight: int = 200, max_queue_depth: int = 1000, retry_after_seconds: int = 30):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = retry_after_seconds
+        self.logger = setup_logger(__name__)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+        # tenant id -> (coroutine factory, description, future) waiting for a slot
+        self._queues: "OrderedDict[str, Deque[Tuple[Callable[[], Awaitable], str, Future]]]" = OrderedDict()
+        self._queue_depth = 0
+        self._in_flight = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="async-pipeline", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        self.logger.info(f"Async pipeline started, max in-flight {self.max_in_flight}")
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._init_loop_resources())
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.http_client.aclose())
+            self.loop.close()
+
+    async def _init_loop_resources(self):
+        # Loop-bound resources must be created on the loop that will use them
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=self.max_in_flight),
+            transport=httpx.AsyncHTTPTransport(retries=3)
+        )
+
+    def shutdown(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+        self.loop = None
+
+    def submit(self, tenant_id: str, job: Callable[[], Awaitable], description: str = "job") -> Future:
+        """
+        Queue a coroutine factory for the given tenant on the pipeline loop, from any thread
+
+        Raises:
+            SchedulerUnavailableError: If the pipeline loop is not running
+            QueueFullError: If too many jobs are already waiting for a slot
+        """
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            raise SchedulerUnavailableError(self.retry_after_seconds)
+
+        future = Future()
+        with self._lock:
+            if self._queue_depth >= self.max_queue_depth:
+                raise QueueFullError(self._queue_depth, self.retry_after_seconds)
+            tenant_queue = self._queues.get(tenant_id)
+            if tenant_queue is None:
+                tenant_queue = self._queues[tenant_id] = deque()
+            tenant_queue.append((job, description, future))
+            self._queue_depth += 1
+
+        loop.call_soon_threadsafe(self._dispatch)
+        return future
+
+    def _dispatch(self):
+        # Runs on the loop: fill the free slots, one job from each waiting tenant in turn
+        while True:
+            with self._lock:
+                if self._in_flight >= self.max_in_flight or not self._queues:
+                    return
+                tenant_id, tenant_queue = next(iter(self._queues.items()))
+                job, description, future = tenant_queue.popleft()
+                if tenant_queue:
+                    self._queues.move_to_end(tenant_id)
+                else:
+                    del self._queues[tenant_id]
+                self._queue_depth -= 1
+                self._in_flight += 1
+            self.loop.create_task(self._run_job(job, description, future))
+
+    async def _run_job(self, job: Callable[[], Awaitable], description: str, future: Future):
+        try:
+            future.set_result(await job())
+        except Exception as e:
+            self.logger.error(f"Unhandled error in async {description}: {str(e)}")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue_depth,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "max_queue_depth": self.max_queue_depth,
+                "tenants_waiting": len(self._queues)
+            }
@@ -0,0 +1,233 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+from .BatchStore import BatchStore
+from .ResultValidator import ResultValidator
+from .StorageService import StorageService
+from ..logs.logger import setup_logger
+from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+from ..models.dto.response.Invoice import ResultSchemaError
+from ..models.dto.response.ProcessDocumentCallbackRequest import ProcessDocumentCallbackRequest
+from ..utils.file_utils import stream_size
+
+if TYPE_CHECKING:
+    from .AnthropicClient import AnthropicClient
+
+# Stay below the Message Batches API limit of 256 MB per batch request body
+DEFAULT_MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+# Posts a callback payload to a document's callback_url
+CallbackSender = Callable[[str, Union[Dict, bytes]], None]
+
+
+class BatchProcessor:
+    """
+    Submits non-interactive documents as Anthropic message batches.
+
+    Documents and batches are kept in a BatchStore, which every worker polls: a poller thread
+    checks outstanding batches and, once a batch has ended, fans each result out to the
+    callback_url of the document it belongs to. With a shared store, batches and unsubmitted
+    documents outlive the worker that accepted them and are resumed at the next startup.
+    """
+
+    def __init__(
+            self,
+            get_anthropic_client: Callable[[], "AnthropicClient"],
+            storage_service: StorageService,
+            send_callback: CallbackSender,
+            store: BatchStore,
+            max_requests_per_batch: int = 1000,
+            max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+            poll_interval_seconds: int = 60,
+            result_validator: Optional[ResultValidator] = None,
+            embed_parsed_data: bool = False,
+            lease_seconds: float = 600
+    ):
+        # Resolved per use, so the Anthropic SDK is not loaded until a batch is submitted or polled
+        self.get_anthropic_client = get_anthropic_client
+        self.storage_service = storage_service
+        self.send_callback = send_callback
+        self.store = store
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_batch_bytes = max_batch_bytes
+        self.poll_interval_seconds = poll_interval_seconds
+        # Results go through the same schema check and callback encoding as the other modes
+        self.result_validator = result_validator
+        self.embed_parsed_data = embed_parsed_data
+        # How long a submission (renewed per document) or a batch being delivered stays with one worker
+        self.lease_seconds = lease_seconds
+        self.logger = setup_logger(__name__)
+
+        # Submissions download every document first, so they run one at a time off the request thread
+        self._submitter = ThreadPoolExecutor(max_workers=1)
+        self._wake = threading.Event()
+        # The first pass runs at once, picking up what earlier workers left in the store
+        self._wake.set()
+        self._poller = threading.Thread(target=self._poll_loop, name="batch-poller", daemon=True)
+        self._poller.start()
+
+    def enqueue(self, requests: List[ProcessDocumentRequest]) -> Future:
+        """
+        Record the documents and submit them in the background; the future resolves to the ids
+        of the batches submitted
+        """
+        self.store.add_submission(requests)
+        return self._submit_in_background()
+
+    def _submit_in_background(self) -> Future:
+        future = self._submitter.submit(self.submit_queued)
+        future.add_done_callback(self._log_submit_failure)
+        return future
+
+    def _log_submit_failure(self, future: Future):
+        if future.exception() is not None:
+            self.logger.error(f"Failed to submit message batch: {str(future.exception())}")
+
+    def submit_queued(self) -> List[str]:
+        """
+        Download and submit every queued submission that no other worker is working on
+
+        Returns:
+            The ids of the submitted batches
+        """
+        batch_ids = []
+        while True:
+            submission = self.store.claim_submission(self.lease_seconds)
+            if submission is None:
+                return batch_ids
+            batch_ids.extend(self._submit(*submission))
+
+    def _submit(self, submission_id: str, requests: List[Tuple[int, ProcessDocumentRequest]]) -> List[str]:
+        batch_ids = []
+        entries, betas, members, positions, batch_bytes = [], set(), {}, [], 0
+
+        for position, process_document_request in requests:
+            # Positional, because document ids are not guaranteed to match the API's custom_id format
+            custom_id = f"doc-{position}"
+            try:
+                with self.storage_service.download(process_document_request.url) as file_contents:
+                    size = stream_size(file_contents)
+                    entry, beta = self.get_anthropic_client().build_batch_request(
+                        custom_id,
+                        process_document_request.name,
+                        file_contents,
+                        process_document_request.prompt
+                    )
+            except Exception as e:
+                # One bad document should not hold back the rest of the batch
+                self.logger.error(f"Could not prepare {process_document_request.id} for batching: {str(e)}")
+                self._send(process_document_request, None, str(e))
+                self.store.drop_from_submission(submission_id, [position])
+                continue
+            finally:
+                self.store.renew_submission(submission_id, self.lease_seconds)
+
+            # base64 inflates the document by 4/3
+            entry_bytes = size * 4 // 3
+            if entries and (len(entries) >= self.max_requests_per_batch or batch_bytes + entry_bytes > self.max_batch_bytes):
+                batch_ids.append(self._submit_batch(entries, betas, members, submission_id, positions))
+                entries, betas, members, positions, batch_bytes = [], set(), {}, [], 0
+
+            entries.append(entry)
+            betas.add(beta)
+            members[custom_id] = process_document_request
+            positions.append(position)
+            batch_bytes += entry_bytes
+
+        if entries:
+            batch_ids.append(self._submit_batch(entries, betas, members, submission_id, positions))
+        return batch_ids
+
+    def _submit_batch(
+            self,
+            entries: List[Dict],
+            betas: set,
+            members: Dict[str, ProcessDocumentRequest],
+            submission_id: str,
+            positions: List[int]
+    ) -> str:
+        batch_id = self.get_anthropic_client().submit_batch(entries, sorted(betas))
+        self.store.add_batch(batch_id, members, submission_id, positions)
+        return batch_id
+
+    def _poll_loop(self):
+        while True:
+            self._wake.wait(self.poll_interval_seconds)
+            self._wake.clear()
+
+            try:
+                # Includes submissions whose worker went away before submitting them
+                if self.store.queued():
+                    self._submit_in_background()
+                batch_ids = self.store.claim_batches(self.lease_seconds)
+            except Exception as e:
+                self.logger.error(f"Error reading the batch store: {str(e)}")
+                continue
+
+            for batch_id in batch_ids:
+                try:
+                    if self.get_anthropic_client().get_batch_status(batch_id) == 'ended':
+                        self._deliver_results(batch_id)
+                        continue
+                except Exception as e:
+                    self.logger.error(f"Error polling message batch {batch_id}: {str(e)}")
+                # Whichever worker polls next checks it again
+                try:
+                    self.store.release_batch(batch_id, self.poll_interval_seconds)
+                except Exception as e:
+                    self.logger.error(f"Error releasing message batch {batch_id}: {str(e)}")
+
+    def _deliver_results(self, batch_id: str):
+        members = self.store.members(batch_id)
+
+        # Members leave the pending batch as they are answered, and the batch only once all have
+        # been, so a results stream that fails partway is picked up again on the next poll
+        delivered = 0
+        for custom_id, parsed_data, error in self.get_anthropic_client().iter_batch_results(batch_id):
+            process_document_request = members.pop(custom_id, None)
+            if process_document_request is None:
+                # Already answered on an earlier, interrupted pass
+                continue
+            self._send(process_document_request, parsed_data, error)
+            self.store.answer(batch_id, custom_id)
+            delivered += 1
+
+        # Anything the batch did not report on still gets an answer
+        for process_document_request in members.values():
+            self._send(process_document_request, None, f"No result returned in batch {batch_id}")
+        self.store.remove_batch(batch_id)
+
+        self.logger.info(f"Delivered {delivered} results for message batch {batch_id}")
+
+    def _send(self, process_document_request: ProcessDocumentRequest, parsed_data, error):
+        if parsed_data is not None and self.result_validator is not None:
+            try:
+                parsed_data = self.result_validator.validate(process_document_request.type, parsed_data)
+            except ResultSchemaError as e:
+                parsed_data, error = None, str(e)
+
+        processed_document = ProcessDocumentCallbackRequest(
+            id=process_document_request.id,
+            name=process_document_request.name,
+            type=process_document_request.type,
+            parsed_data=parsed_data,
+            metadata={},
+            error=error
+        )
+        try:
+            self.send_callback(process_document_request.callback_url, processed_document.to_json(self.embed_parsed_data))
+        except Exception as e:
+            self.logger.error(f"Failed to send batch callback for {process_document_request.id}: {str(e)}")
+
+    def pending_batches(self) -> Dict[str, int]:
+        return self.store.pending()
+
+    def queued_documents(self) -> int:
+        return self.store.queued()
+
+    def poll_now(self):
+        """
+        Wake the poller immediately instead of waiting for the next interval
+        """
+        self._wake.set()
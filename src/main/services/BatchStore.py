@@ -0,0 +1,391 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+
+# A claimed submission: its id and its documents that are not in a batch yet, with their positions
+Submission = Tuple[str, List[Tuple[int, ProcessDocumentRequest]]]
+
+
+class BatchStore(ABC):
+    """
+    Interface for the documents of batch requests: those waiting to be submitted, and those in a
+    submitted message batch whose results have not been delivered yet.
+
+    Submissions and batches are leased to one process at a time, so every worker can poll and a
+    batch or submission left behind by a dead worker is picked up by another once its lease ends.
+    """
+
+    name: str = "store"
+
+    @abstractmethod
+    def add_submission(self, requests: List[ProcessDocumentRequest]) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_submission(self, lease_seconds: float) -> Optional[Submission]:
+        """
+        Lease the oldest submission that is not leased, None when there is none
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def renew_submission(self, submission_id: str, lease_seconds: float) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def drop_from_submission(self, submission_id: str, positions: List[int]) -> None:
+        """
+        Forget documents that were answered without being batched
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_batch(
+            self,
+            batch_id: str,
+            members: Dict[str, ProcessDocumentRequest],
+            submission_id: str,
+            positions: List[int]
+    ) -> None:
+        """
+        Record a submitted batch and take its documents out of their submission, atomically
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_batches(self, lease_seconds: float) -> List[str]:
+        """
+        Lease every batch that is not leased and return their ids
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_batch(self, batch_id: str, delay_seconds: float) -> None:
+        """
+        Hand a batch back to be claimed again, by any process, after delay_seconds
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def members(self, batch_id: str) -> Dict[str, ProcessDocumentRequest]:
+        """
+        The documents of a batch that have not been answered yet, by custom_id
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def answer(self, batch_id: str, custom_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_batch(self, batch_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def pending(self) -> Dict[str, int]:
+        """
+        Unanswered documents per submitted batch
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def queued(self) -> int:
+        """
+        Documents waiting to be submitted
+        """
+        raise NotImplementedError
+
+
+class InMemoryBatchStore(BatchStore):
+    """
+    Batch store of a single process; batches in flight are lost when it exits
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # submission id -> [leased until, {position: request}]
+        self._submissions: Dict[str, List] = {}
+        # batch id -> [leased until, {custom_id: request}]
+        self._batches: Dict[str, List] = {}
+
+    def add_submission(self, requests: List[ProcessDocumentRequest]) -> str:
+        submission_id = uuid.uuid4().hex
+        with self._lock:
+            self._submissions[submission_id] = [0.0, dict(enumerate(requests))]
+        return submission_id
+
+    def claim_submission(self, lease_seconds: float) -> Optional[Submission]:
+        now = time.monotonic()
+        with self._lock:
+            for submission_id, record in self._submissions.items():
+                if record[0] <= now:
+                    record[0] = now + lease_seconds
+                    return submission_id, sorted(record[1].items())
+        return None
+
+    def renew_submission(self, submission_id: str, lease_seconds: float) -> None:
+        with self._lock:
+            if submission_id in self._submissions:
+                self._submissions[submission_id][0] = time.monotonic() + lease_seconds
+
+    def _take(self, submission_id: str, positions: List[int]):
+        record = self._submissions.get(submission_id)
+        if record is None:
+            return
+        for position in positions:
+            record[1].pop(position, None)
+        if not record[1]:
+            del self._submissions[submission_id]
+
+    def drop_from_submission(self, submission_id: str, positions: List[int]) -> None:
+        with self._lock:
+            self._take(submission_id, positions)
+
+    def add_batch(
+            self,
+            batch_id: str,
+            members: Dict[str, ProcessDocumentRequest],
+            submission_id: str,
+            positions: List[int]
+    ) -> None:
+        with self._lock:
+            self._batches[batch_id] = [0.0, dict(members)]
+            self._take(submission_id, positions)
+
+    def claim_batches(self, lease_seconds: float) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            due = [batch_id for batch_id, record in self._batches.items() if record[0] <= now]
+            for batch_id in due:
+                self._batches[batch_id][0] = now + lease_seconds
+        return due
+
+    def release_batch(self, batch_id: str, delay_seconds: float) -> None:
+        with self._lock:
+            if batch_id in self._batches:
+                self._batches[batch_id][0] = time.monotonic() + delay_seconds
+
+    def members(self, batch_id: str) -> Dict[str, ProcessDocumentRequest]:
+        with self._lock:
+            record = self._batches.get(batch_id)
+            return dict(record[1]) if record is not None else {}
+
+    def answer(self, batch_id: str, custom_id: str) -> None:
+        with self._lock:
+            record = self._batches.get(batch_id)
+            if record is not None:
+                record[1].pop(custom_id, None)
+
+    def remove_batch(self, batch_id: str) -> None:
+        with self._lock:
+            self._batches.pop(batch_id, None)
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return {batch_id: len(record[1]) for batch_id, record in self._batches.items()}
+
+    def queued(self) -> int:
+        with self._lock:
+            return sum(len(record[1]) for record in self._submissions.values())
+
+
+class SQLiteBatchStore(BatchStore):
+    """
+    Batch store in a local SQLite file, shared by the worker processes of one instance, so any
+    worker reports every batch and batches outlive the worker that submitted them
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS batch_submissions (
+                    submission_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    request TEXT NOT NULL,
+                    leased_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (submission_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS batch_submissions_created ON batch_submissions (created_at);
+                CREATE TABLE IF NOT EXISTS batches (
+                    id TEXT PRIMARY KEY,
+                    leased_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS batch_members (
+                    batch_id TEXT NOT NULL REFERENCES batches (id) ON DELETE CASCADE,
+                    custom_id TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, custom_id)
+                );
+            """)
+
+    @staticmethod
+    def _to_request(value: str) -> ProcessDocumentRequest:
+        return ProcessDocumentRequest.from_dict(json.loads(value))
+
+    def add_submission(self, requests: List[ProcessDocumentRequest]) -> str:
+        submission_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT INTO batch_submissions (submission_id, position, request, created_at) VALUES (?, ?, ?, ?)",
+                    [(submission_id, position, json.dumps(request.to_dict()), now) for position, request in enumerate(requests)]
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return submission_id
+
+    def claim_submission(self, lease_seconds: float) -> Optional[Submission]:
+        now = time.time()
+        with self._lock:
+            # Worker processes share the file; IMMEDIATE makes select-and-lease atomic between them
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    """
+                    SELECT submission_id FROM batch_submissions
+                    GROUP BY submission_id HAVING MAX(leased_until) <= ?
+                    ORDER BY MIN(created_at) LIMIT 1
+                    """,
+                    (now,)
+                ).fetchone()
+                rows = []
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE batch_submissions SET leased_until = ? WHERE submission_id = ?",
+                        (now + lease_seconds, row['submission_id'])
+                    )
+                    rows = self._connection.execute(
+                        "SELECT position, request FROM batch_submissions WHERE submission_id = ? ORDER BY position",
+                        (row['submission_id'],)
+                    ).fetchall()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return row['submission_id'], [(entry['position'], self._to_request(entry['request'])) for entry in rows]
+
+    def renew_submission(self, submission_id: str, lease_seconds: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE batch_submissions SET leased_until = ? WHERE submission_id = ?",
+                (time.time() + lease_seconds, submission_id)
+            )
+
+    def drop_from_submission(self, submission_id: str, positions: List[int]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM batch_submissions WHERE submission_id = ? AND position = ?",
+                [(submission_id, position) for position in positions]
+            )
+
+    def add_batch(
+            self,
+            batch_id: str,
+            members: Dict[str, ProcessDocumentRequest],
+            submission_id: str,
+            positions: List[int]
+    ) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("INSERT INTO batches (id, created_at) VALUES (?, ?)", (batch_id, time.time()))
+                self._connection.executemany(
+                    "INSERT INTO batch_members (batch_id, custom_id, request) VALUES (?, ?, ?)",
+                    [(batch_id, custom_id, json.dumps(request.to_dict())) for custom_id, request in members.items()]
+                )
+                self._connection.executemany(
+                    "DELETE FROM batch_submissions WHERE submission_id = ? AND position = ?",
+                    [(submission_id, position) for position in positions]
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def claim_batches(self, lease_seconds: float) -> List[str]:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT id FROM batches WHERE leased_until <= ? ORDER BY created_at", (now,)
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE batches SET leased_until = ? WHERE id = ?",
+                    [(now + lease_seconds, row['id']) for row in rows]
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return [row['id'] for row in rows]
+
+    def release_batch(self, batch_id: str, delay_seconds: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE batches SET leased_until = ? WHERE id = ?", (time.time() + delay_seconds, batch_id)
+            )
+
+    def members(self, batch_id: str) -> Dict[str, ProcessDocumentRequest]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT custom_id, request FROM batch_members WHERE batch_id = ?", (batch_id,)
+            ).fetchall()
+        return {row['custom_id']: self._to_request(row['request']) for row in rows}
+
+    def answer(self, batch_id: str, custom_id: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM batch_members WHERE batch_id = ? AND custom_id = ?", (batch_id, custom_id)
+            )
+
+    def remove_batch(self, batch_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT batches.id AS id, COUNT(batch_members.custom_id) AS members
+                FROM batches LEFT JOIN batch_members ON batch_members.batch_id = batches.id
+                GROUP BY batches.id
+                """
+            ).fetchall()
+        return {row['id']: row['members'] for row in rows}
+
+    def queued(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM batch_submissions").fetchone()[0]
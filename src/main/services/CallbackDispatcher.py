@@ -0,0 +1,471 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from requests import Response, Session
+
+from ..logs.logger import setup_logger
+from ..security.OIDC import get_callback_id_token
+from ..utils import json_codec
+from ..utils.request_utls import get_request_session
+from ..utils.telemetry import telemetry
+
+# Client errors that may succeed later; any other 4xx is dead-lettered straight away
+RETRYABLE_CLIENT_STATUS_CODES = (408, 409, 425, 429)
+
+
+@dataclass
+class OutboxEntry:
+    id: int
+    url: str
+    audience: str
+    # The encoded JSON body, stored and sent as it is
+    body: bytes
+    job_id: Optional[str]
+    attempts: int
+
+
+class CallbackOutbox(ABC):
+    """
+    Interface for the store of callbacks that have not been delivered yet
+    """
+
+    name: str = "outbox"
+
+    @abstractmethod
+    def add(self, url: str, audience: str, body: bytes, job_id: Optional[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_due(self, limit: int, lease_seconds: float) -> List[OutboxEntry]:
+        """
+        Return up to limit entries that are due, hiding them from other claimers for lease_seconds
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, entry_ids: List[int]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reschedule(self, entry_ids: List[int], delay_seconds: float, error: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def dead_letter(self, entry_ids: List[int], error: str) -> None:
+        """
+        Stop retrying entries, keeping them for inspection within the outbox's dead-entry limits
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def has_pending(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def next_due_in(self) -> Optional[float]:
+        """
+        Seconds until the next entry is due, or None if the outbox is empty
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class InMemoryCallbackOutbox(CallbackOutbox):
+    """
+    Outbox that retries within the process but loses undelivered callbacks on restart
+    """
+
+    name = "memory"
+
+    def __init__(self, max_dead_entries: int = 1000):
+        self.max_dead_entries = max_dead_entries
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # id -> (entry, due at, dead)
+        self._entries: Dict[int, List] = {}
+
+    def add(self, url: str, audience: str, body: bytes, job_id: Optional[str]) -> None:
+        with self._lock:
+            self._next_id += 1
+            self._entries[self._next_id] = [OutboxEntry(self._next_id, url, audience, body, job_id, 0), 0.0, False]
+
+    def claim_due(self, limit: int, lease_seconds: float) -> List[OutboxEntry]:
+        now = time.monotonic()
+        with self._lock:
+            due = [record for record in self._entries.values() if not record[2] and record[1] <= now][:limit]
+            for record in due:
+                record[1] = now + lease_seconds
+            return [record[0] for record in due]
+
+    def delete(self, entry_ids: List[int]) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                self._entries.pop(entry_id, None)
+
+    def reschedule(self, entry_ids: List[int], delay_seconds: float, error: str) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                record = self._entries.get(entry_id)
+                if record is not None:
+                    record[0].attempts += 1
+                    record[1] = time.monotonic() + delay_seconds
+
+    def dead_letter(self, entry_ids: List[int], error: str) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                if entry_id in self._entries:
+                    self._entries[entry_id][2] = True
+            # Ids grow with insertion, so the oldest dead entries go first
+            dead = [entry_id for entry_id, record in self._entries.items() if record[2]]
+            for entry_id in dead[:max(len(dead) - self.max_dead_entries, 0)]:
+                del self._entries[entry_id]
+
+    def has_pending(self, job_id: str) -> bool:
+        with self._lock:
+            return any(record[0].job_id == job_id and not record[2] for record in self._entries.values())
+
+    def next_due_in(self) -> Optional[float]:
+        with self._lock:
+            due_times = [record[1] for record in self._entries.values() if not record[2]]
+        return max(min(due_times) - time.monotonic(), 0.0) if due_times else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            dead = sum(1 for record in self._entries.values() if record[2])
+            return {"pending": len(self._entries) - dead, "dead": dead}
+
+
+class SQLiteCallbackOutbox(CallbackOutbox):
+    """
+    Outbox in a local SQLite file, so undelivered callbacks survive worker restarts
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_dead_entries: int = 10000, dead_retention_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_dead_entries = max_dead_entries
+        self.dead_retention_seconds = dead_retention_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    audience TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    job_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    due_at REAL NOT NULL,
+                    dead INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, due_at);
+                CREATE INDEX IF NOT EXISTS outbox_job ON outbox (job_id);
+            """)
+            self._purge_dead()
+
+    def add(self, url: str, audience: str, body: bytes, job_id: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            # Kept as JSON text so the rows stay readable with the sqlite3 shell
+            self._connection.execute(
+                "INSERT INTO outbox (url, audience, payload, job_id, due_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, audience, body.decode('utf-8'), job_id, now, now)
+            )
+
+    def claim_due(self, limit: int, lease_seconds: float) -> List[OutboxEntry]:
+        now = time.time()
+        with self._lock:
+            # Worker processes share the file; IMMEDIATE makes select-and-lease atomic between them
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT * FROM outbox WHERE dead = 0 AND due_at <= ? ORDER BY due_at LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE outbox SET due_at = ? WHERE id = ?",
+                    [(now + lease_seconds, row['id']) for row in rows]
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return [
+            OutboxEntry(row['id'], row['url'], row['audience'], row['payload'].encode('utf-8'), row['job_id'], row['attempts'])
+            for row in rows
+        ]
+
+    def delete(self, entry_ids: List[int]) -> None:
+        with self._lock:
+            self._connection.executemany("DELETE FROM outbox WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def reschedule(self, entry_ids: List[int], delay_seconds: float, error: str) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, due_at = ?, last_error = ? WHERE id = ?",
+                [(time.time() + delay_seconds, error, entry_id) for entry_id in entry_ids]
+            )
+
+    def dead_letter(self, entry_ids: List[int], error: str) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE outbox SET dead = 1, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                [(error, entry_id) for entry_id in entry_ids]
+            )
+            self._purge_dead()
+
+    def _purge_dead(self):
+        # Dead entries are only kept for inspection: the newest max_dead_entries, within the retention
+        self._connection.execute(
+            """
+            DELETE FROM outbox WHERE dead = 1 AND (created_at < ? OR id NOT IN (
+                SELECT id FROM outbox WHERE dead = 1 ORDER BY id DESC LIMIT ?
+            ))
+            """,
+            (time.time() - self.dead_retention_seconds, self.max_dead_entries)
+        )
+
+    def has_pending(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM outbox WHERE job_id = ? AND dead = 0 LIMIT 1", (job_id,)
+            ).fetchone()
+        return row is not None
+
+    def next_due_in(self) -> Optional[float]:
+        with self._lock:
+            row = self._connection.execute("SELECT MIN(due_at) AS due_at FROM outbox WHERE dead = 0").fetchone()
+        if row['due_at'] is None:
+            return None
+        return max(row['due_at'] - time.time(), 0.0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0) AS pending, COALESCE(SUM(dead = 1), 0) AS dead FROM outbox"
+            ).fetchone()
+        return {"pending": row['pending'], "dead": row['dead']}
+
+
+class CallbackDispatcher:
+    """
+    Delivers callbacks over one pooled session per destination host.
+
+    post() sends immediately for request paths that report the callback status to their caller.
+    send() hands the callback to the outbox; a delivery thread posts due entries, optionally
+    coalescing entries for the same URL into one batched POST, and redelivers failures with
+    exponential backoff until max_attempts.
+    """
+
+    def __init__(
+            self,
+            outbox: CallbackOutbox,
+            pool_maxsize: int = 10,
+            delivery_workers: int = 4,
+            max_attempts: int = 8,
+            initial_backoff_seconds: float = 1,
+            max_backoff_seconds: float = 300,
+            batching: bool = False,
+            max_batch_size: int = 50,
+            max_batch_wait_seconds: float = 0.2,
+            batch_path_suffix: str = "/batch",
+            timeout: Tuple[float, float] = (5.0, 30.0),
+            on_delivered: Optional[Callable[[str], None]] = None,
+            on_dead_lettered: Optional[Callable[[str, str], None]] = None,
+            id_token_provider: Callable[[str], str] = get_callback_id_token
+    ):
+        self.outbox = outbox
+        self.pool_maxsize = pool_maxsize
+        self.max_attempts = max_attempts
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.batching = batching
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_seconds = max_batch_wait_seconds
+        self.batch_path_suffix = batch_path_suffix
+        self.timeout = timeout
+        self.on_delivered = on_delivered
+        self.on_dead_lettered = on_dead_lettered
+        self.id_token_provider = id_token_provider
+        self.logger = setup_logger(__name__)
+
+        self._sessions: Dict[str, Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._counters = {"delivered": 0, "failed_attempts": 0, "dead_lettered": 0, "batched_posts": 0}
+        self._counters_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=delivery_workers)
+        self._lease_seconds = timeout[0] + timeout[1] + 30
+        self._thread = threading.Thread(target=self._deliver_loop, name="callback-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _session_for(self, url: str) -> Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = get_request_session(pool_maxsize=self.pool_maxsize)
+                self._sessions[host] = session
+            return session
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._counters_lock:
+            self._counters[counter] += amount
+
+    def post(self, url: str, payload: Union[Dict, bytes], audience: str) -> Response:
+        """
+        POST a callback right away on the pooled session for its host; bytes are sent as the body unchanged
+        """
+        body = payload if isinstance(payload, bytes) else json_codec.dumps(payload)
+        id_token = self.id_token_provider(audience)
+        with telemetry.stage('callback'):
+            return self._session_for(url).post(
+                url,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {id_token}'
+                },
+                data=body,
+                timeout=self.timeout
+            )
+
+    def send(self, url: str, payload: Union[Dict, bytes], audience: str, job_id: Optional[str] = None):
+        """
+        Queue a callback for delivery; it is retried with backoff until it succeeds or is dead-lettered
+        """
+        body = payload if isinstance(payload, bytes) else json_codec.dumps(payload)
+        self.outbox.add(url, audience, body, job_id)
+        self._wake.set()
+
+    def _deliver_loop(self):
+        while True:
+            try:
+                next_due = self.outbox.next_due_in()
+            except Exception as e:
+                self.logger.error(f"Could not read the callback outbox: {str(e)}")
+                next_due = self.initial_backoff_seconds
+
+            if next_due is None or next_due > 0:
+                self._wake.wait(next_due)
+                self._wake.clear()
+                if self.batching:
+                    # Let a burst of results accumulate so they go out together
+                    time.sleep(self.max_batch_wait_seconds)
+
+            try:
+                self._deliver_due()
+            except Exception as e:
+                self.logger.error(f"Callback delivery pass failed: {str(e)}")
+                time.sleep(self.initial_backoff_seconds)
+
+    def _deliver_due(self):
+        entries = self.outbox.claim_due(self.max_batch_size * 4, self._lease_seconds)
+        if not entries:
+            return
+
+        if self.batching:
+            groups: Dict[Tuple[str, str], List[OutboxEntry]] = {}
+            for entry in entries:
+                groups.setdefault((entry.url, entry.audience), []).append(entry)
+            deliveries = [
+                group[start:start + self.max_batch_size]
+                for group in groups.values()
+                for start in range(0, len(group), self.max_batch_size)
+            ]
+        else:
+            deliveries = [[entry] for entry in entries]
+
+        list(self._executor.map(self._deliver, deliveries))
+
+    def _deliver(self, entries: List[OutboxEntry]):
+        first = entries[0]
+        try:
+            if len(entries) == 1:
+                response = self.post(first.url, first.body, first.audience)
+            else:
+                self._count('batched_posts')
+                # The bodies are already encoded, so the batch is assembled without re-encoding them
+                response = self.post(
+                    first.url.rstrip('/') + self.batch_path_suffix,
+                    b'{"results":[' + b','.join(entry.body for entry in entries) + b']}',
+                    first.audience
+                )
+            status, error = response.status_code, f"status {response.status_code}: {response.text[:200]}"
+        except Exception as e:
+            status, error = None, str(e)
+
+        entry_ids = [entry.id for entry in entries]
+        if status is not None and 200 <= status < 300:
+            self.outbox.delete(entry_ids)
+            self._count('delivered', len(entries))
+            self._notify_delivered(entries)
+            return
+
+        self._count('failed_attempts')
+        retryable = status is None or status >= 500 or status in RETRYABLE_CLIENT_STATUS_CODES
+        if not retryable or first.attempts + 1 >= self.max_attempts:
+            self.logger.error(f"Giving up on callback to {first.url} after {first.attempts + 1} attempts: {error}")
+            self.outbox.dead_letter(entry_ids, error)
+            self._count('dead_lettered', len(entries))
+            self._notify_dead_lettered(entries, error)
+            return
+
+        delay = min(self.initial_backoff_seconds * 2 ** first.attempts, self.max_backoff_seconds)
+        delay = random.uniform(delay / 2, delay)
+        self.logger.warning(f"Callback to {first.url} failed ({error}), retrying in {delay:.1f}s")
+        self.outbox.reschedule(entry_ids, delay, error)
+
+    def _notify_delivered(self, entries: List[OutboxEntry]):
+        if self.on_delivered is None:
+            return
+        for entry in entries:
+            if entry.job_id is not None:
+                try:
+                    self.on_delivered(entry.job_id)
+                except Exception as e:
+                    self.logger.error(f"Delivered-callback hook failed for job {entry.job_id}: {str(e)}")
+
+    def _notify_dead_lettered(self, entries: List[OutboxEntry], error: str):
+        if self.on_dead_lettered is None:
+            return
+        for entry in entries:
+            if entry.job_id is not None:
+                try:
+                    self.on_dead_lettered(entry.job_id, error)
+                except Exception as e:
+                    self.logger.error(f"Dead-lettered-callback hook failed for job {entry.job_id}: {str(e)}")
+
+    def has_pending(self, job_id: str) -> bool:
+        return self.outbox.has_pending(job_id)
+
+    def stats(self) -> Dict:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        with self._sessions_lock:
+            hosts = len(self._sessions)
+        return {**counters, "hosts": hosts, "batching": self.batching, "outbox": self.outbox.stats()}
@@ -0,0 +1,289 @@
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .RateGovernor import estimate_input_tokens, estimate_text_input_tokens
+from ..logs.logger import setup_logger
+from ..utils import json_codec
+from ..utils.file_utils import FileContent, read_all, stream_size
+from ..utils.json_stream import JsonText, as_json_text
+from ..utils.telemetry import telemetry
+
+# File types every provider accepts several of in one request
+PACKABLE_MIME_TYPES = ('application/pdf', 'image/jpeg', 'image/png')
+
+DOCUMENT_FOOTER = '</document>'
+
+
+class PackingError(Exception):
+    """
+    Raised when the response to a packed request cannot be split into one result per document
+    """
+    pass
+
+
+@dataclass
+class PackedDocument:
+    file_name: str
+    # (content, MIME type) of what is sent for the document: the file itself, or its preprocessed images
+    parts: List[Tuple[bytes, str]]
+
+    @property
+    def size(self) -> int:
+        return sum(len(content) for content, _ in self.parts)
+
+
+# Sends a pack as one request: (documents, packed prompt) -> validated JSON array
+PackedFunction = Callable[[List[PackedDocument], str], JsonText]
+AsyncPackedFunction = Callable[[List[PackedDocument], str], Awaitable[JsonText]]
+
+
+def document_header(index: int, file_name: str) -> str:
+    return f'<document index="{index}" name="{file_name.replace(chr(34), chr(39))}">'
+
+
+def build_packed_prompt(prompt: str, count: int) -> str:
+    return (
+        f"You are given {count} separate documents, each between <document index=\"n\"> and "
+        f"{DOCUMENT_FOOTER} tags. Apply the following instructions to each document on its own:\n\n"
+        f"{prompt}\n\n"
+        f"Respond with a JSON array of exactly {count} elements in document order, element n being "
+        f"{{\"index\": n, \"result\": <the result for document n>}}, and nothing outside the array."
+    )
+
+
+def split_packed_result(result: Any, count: int) -> List[JsonText]:
+    """
+    Split the JSON array answering a packed request into one result per document, in order
+
+    Raises:
+        PackingError: If the response is not an array of count {"index", "result"} elements
+            whose indexes follow the document order, or a result is missing
+    """
+    parsed = as_json_text(result).parsed
+    if not isinstance(parsed, list):
+        raise PackingError(f"Expected a JSON array of {count} results, not {type(parsed).__name__}")
+    if len(parsed) != count:
+        raise PackingError(f"Expected {count} results, got {len(parsed)}")
+
+    results = []
+    for position, item in enumerate(parsed, start=1):
+        if not isinstance(item, dict):
+            raise PackingError(f"Element {position} should be an object, not {type(item).__name__}")
+        # The echoed index catches a reordered array, which would otherwise swap results
+        if item.get('index') != position or type(item.get('index')) is not int:
+            raise PackingError(f"Element {position} is for document {item.get('index')!r}")
+        if item.get('result') is None:
+            raise PackingError(f"Document {position} in the pack has no result")
+        results.append(JsonText(json_codec.dumps(item['result']).decode('utf-8'), item['result']))
+    return results
+
+
+def estimate_packed_input_tokens(documents: List[PackedDocument], prompt: str) -> int:
+    return sum(
+        estimate_input_tokens(content, mime_type) for document in documents for content, mime_type in document.parts
+    ) + estimate_text_input_tokens('', prompt)
+
+
+@dataclass
+class _Pack:
+    """
+    Documents waiting to share one request; the first to arrive sends it
+    """
+    prompt: str
+    full: Any
+    done: Any
+    documents: List[PackedDocument] = field(default_factory=list)
+    size: int = 0
+    results: Optional[List[Optional[JsonText]]] = None
+
+
+class DocumentPacker:
+    """
+    Packs small documents of one tenant that share a provider, file type and prompt into one
+    model request; documents processed outside a job, with no tenant, are never packed.
+
+    The first document of a pack waits up to max_wait_seconds for others to join, then sends
+    them all with per-document delimiters and splits the JSON array that comes back. A
+    document that ends up alone, or whose pack fails to send or split, gets None and is
+    processed on its own as before.
+    """
+
+    def __init__(
+            self,
+            max_documents: int = 4,
+            max_document_bytes: int = 1048576,
+            max_pack_bytes: int = 4194304,
+            max_wait_seconds: float = 0.05
+    ):
+        self.max_documents = max_documents
+        self.max_document_bytes = max_document_bytes
+        self.max_pack_bytes = max_pack_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self.logger = setup_logger(__name__)
+        self._lock = threading.Lock()
+        self._packs: Dict[Tuple[str, str, str, str], _Pack] = {}
+        self._async_packs: Dict[Tuple[str, str, str, str], _Pack] = {}
+        self._counters = {
+            "packed_requests": 0,
+            "packed_documents": 0,
+            "sent_alone": 0,
+            "request_failures": 0,
+            "split_failures": 0
+        }
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _admit(self, file_name: str, parts: List[Tuple[FileContent, str]], mime_type: str) -> Optional[PackedDocument]:
+        if self.max_documents < 2 or mime_type not in PACKABLE_MIME_TYPES:
+            return None
+        if sum(stream_size(content) for content, _ in parts) > self.max_document_bytes:
+            return None
+        return PackedDocument(file_name, [(read_all(content), part_type) for content, part_type in parts])
+
+    @staticmethod
+    def _key(provider: str, mime_type: str, prompt: str) -> Optional[Tuple[str, str, str, str]]:
+        # Documents of different tenants never share a request
+        tenant_id = telemetry.current_tenant()
+        return (tenant_id, provider, mime_type, prompt) if tenant_id is not None else None
+
+    def _join(self, packs: Dict, key: Tuple, document: PackedDocument, event_type) -> Tuple[_Pack, int]:
+        """
+        Returns:
+            Tuple of (the pack the document joined, its index in the pack; 0 makes it the sender)
+        """
+        with self._lock:
+            pack = packs.get(key)
+            if pack is None:
+                pack = packs[key] = _Pack(key[3], event_type(), event_type())
+            index = len(pack.documents)
+            pack.documents.append(document)
+            pack.size += document.size
+            if len(pack.documents) >= self.max_documents or pack.size >= self.max_pack_bytes:
+                del packs[key]
+                pack.full.set()
+        return pack, index
+
+    def _close(self, packs: Dict, key: Tuple, pack: _Pack) -> List[PackedDocument]:
+        with self._lock:
+            if packs.get(key) is pack:
+                del packs[key]
+            return list(pack.documents)
+
+    def _split(self, pack: _Pack, response: JsonText):
+        try:
+            pack.results = split_packed_result(response, len(pack.documents))
+        except PackingError as e:
+            self._count('split_failures')
+            self.logger.warning(
+                f"Could not split the response for {len(pack.documents)} packed documents, "
+                f"processing them one by one: {str(e)}")
+            return
+        self._count('packed_requests')
+        self._count('packed_documents', len(pack.documents))
+
+    def _on_request_failure(self, documents: List[PackedDocument], e: Exception):
+        self._count('request_failures')
+        self.logger.warning(
+            f"Packed request for {len(documents)} documents failed, processing them one by one: {str(e)}")
+
+    def _release(self, packs: Dict, key: Tuple, pack: _Pack):
+        # Whatever happened to the sender, the other documents must not wait forever
+        documents = self._close(packs, key, pack)
+        if pack.results is None:
+            pack.results = [None] * len(documents)
+        pack.done.set()
+
+    def process(
+            self,
+            provider: str,
+            file_name: str,
+            parts: List[Tuple[FileContent, str]],
+            prompt: str,
+            mime_type: str,
+            send: PackedFunction
+    ) -> Optional[JsonText]:
+        """
+        Returns:
+            The document's result from a packed request, or None to process it on its own
+        """
+        key = self._key(provider, mime_type, prompt)
+        document = self._admit(file_name, parts, mime_type) if key is not None else None
+        if document is None:
+            return None
+
+        pack, index = self._join(self._packs, key, document, threading.Event)
+        if index > 0:
+            pack.done.wait()
+            return pack.results[index]
+
+        try:
+            pack.full.wait(self.max_wait_seconds)
+            documents = self._close(self._packs, key, pack)
+            if len(documents) == 1:
+                self._count('sent_alone')
+                return None
+            try:
+                response = send(documents, build_packed_prompt(pack.prompt, len(documents)))
+            except Exception as e:
+                self._on_request_failure(documents, e)
+                return None
+            self._split(pack, response)
+        finally:
+            self._release(self._packs, key, pack)
+        return pack.results[0]
+
+    async def process_async(
+            self,
+            provider: str,
+            file_name: str,
+            parts: List[Tuple[FileContent, str]],
+            prompt: str,
+            mime_type: str,
+            send: AsyncPackedFunction
+    ) -> Optional[JsonText]:
+        """
+        Asyncio variant of process; packs only form among documents on the same event loop
+        """
+        key = self._key(provider, mime_type, prompt)
+        document = self._admit(file_name, parts, mime_type) if key is not None else None
+        if document is None:
+            return None
+
+        pack, index = self._join(self._async_packs, key, document, asyncio.Event)
+        if index > 0:
+            await pack.done.wait()
+            return pack.results[index]
+
+        try:
+            try:
+                await asyncio.wait_for(pack.full.wait(), self.max_wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+            documents = self._close(self._async_packs, key, pack)
+            if len(documents) == 1:
+                self._count('sent_alone')
+                return None
+            try:
+                response = await send(documents, build_packed_prompt(pack.prompt, len(documents)))
+            except Exception as e:
+                self._on_request_failure(documents, e)
+                return None
+            self._split(pack, response)
+        finally:
+            self._release(self._async_packs, key, pack)
+        return pack.results[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        requests = counters["packed_requests"]
+        return {
+            **counters,
+            "mean_pack_size": counters["packed_documents"] / requests if requests else 0.0,
+            "max_documents": self.max_documents,
+            "max_wait_ms": self.max_wait_seconds * 1000
+        }
@@ -0,0 +1,587 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from PIL import Image, ImageFilter, ImageOps, ImageSequence
+
+try:
+    # Renders every page, vector content included; without it PDF pages are hashed from their
+    # largest embedded image, which covers scans but not digitally generated pages
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+from ..config.constants.MimeTypes import MIME_TYPES
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, read_all
+from ..utils.process_pool import LazyProcessPoolExecutor
+from ..utils.telemetry import telemetry
+
+# 256-bit page hashes: at 64 bits, two invoices on the same template hash alike
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DCT_SIZE = 64
+# Candidates are looked up by exact slices of the 64 lowest-frequency bits
+BAND_HASH_SIZE = 8
+BAND_SLICES = 8
+# Pages are scaled down to this before hashing; the hash only sees 64x64 pixels anyway
+WORKING_LONG_EDGE = 1024
+# Pixels darker than this count as content when trimming the margins off a page
+CONTENT_THRESHOLD = 64
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 128
+MINHASH_BAND_ROWS = 4
+MINHASH_PRIME = (1 << 61) - 1
+MIN_TEXT_WORDS = 20
+WORD_PATTERN = re.compile(r'\w+')
+# Amounts, dates, quantities and identifiers: any token with a digit in it
+KEY_TOKEN_PATTERN = re.compile(r'[\w./,:-]*\d[\w./,:-]*')
+
+# Fixed, so that signatures stay comparable across processes and restarts
+_permutation_random = random.Random(0x5EED)
+MINHASH_PERMUTATION_PARAMS = [
+    (_permutation_random.randrange(1, MINHASH_PRIME), _permutation_random.randrange(0, MINHASH_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_DCT_COSINES = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * DCT_SIZE)) for x in range(DCT_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+
+@dataclass
+class Fingerprint:
+    page_count: int
+    # 256-bit perceptual hash per page, empty when no page could be rendered
+    page_hashes: List[int]
+    # MinHash of the text layer's word shingles, None when there is no usable text layer
+    minhash: Optional[List[int]]
+    # Digest of the text layer's numbers and identifiers, None when there is no usable text layer
+    key_digest: Optional[str] = None
+
+
+@dataclass
+class DuplicateMatch:
+    document_id: str
+    result: str
+    text_similarity: Optional[float]
+    image_similarity: Optional[float]
+    # Whether both documents carry exactly the same numbers and identifiers
+    keys_match: bool = False
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    DCT hash of a page: the sign of its lowest 16x16 frequencies against their median, taken after
+    trimming blank margins so that re-scans with a different crop still agree
+    """
+    page = image.convert('L')
+    page.thumbnail((WORKING_LONG_EDGE, WORKING_LONG_EDGE))
+    # The median filter keeps scanner speckle in the margins from counting as content
+    content = ImageOps.invert(page.filter(ImageFilter.MedianFilter(5))).point(
+        lambda value: 255 if value > CONTENT_THRESHOLD else 0).getbbox()
+    if content:
+        page = page.crop(content)
+    pixels = list(page.resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS).getdata())
+
+    rows = [pixels[y * DCT_SIZE:(y + 1) * DCT_SIZE] for y in range(DCT_SIZE)]
+    row_frequencies = [
+        [sum(value * cosine for value, cosine in zip(row, _DCT_COSINES[u])) for u in range(HASH_SIZE)]
+        for row in rows
+    ]
+    coefficients = [
+        sum(row_frequencies[y][u] * _DCT_COSINES[v][y] for y in range(DCT_SIZE))
+        for v in range(HASH_SIZE)
+        for u in range(HASH_SIZE)
+    ]
+
+    # The DC term only carries overall brightness
+    median = sorted(coefficients[1:])[(HASH_BITS - 1) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def minhash(text: str) -> Optional[List[int]]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < MIN_TEXT_WORDS:
+        return None
+
+    shingles = {' '.join(words[index:index + SHINGLE_WORDS]) for index in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for shingle in shingles
+    ]
+    return [min((a * value + b) % MINHASH_PRIME for value in hashes) for a, b in MINHASH_PERMUTATION_PARAMS]
+
+
+def key_digest(text: str) -> Optional[str]:
+    """
+    Digest of every token that contains a digit, in any order. Two invoices that share pages of
+    boilerplate have near-identical shingles, but never the same number, date and total
+    """
+    if len(WORD_PATTERN.findall(text)) < MIN_TEXT_WORDS:
+        return None
+    tokens = sorted(token.strip('.,:-/').lower() for token in KEY_TOKEN_PATTERN.findall(text))
+    return hashlib.sha256('\n'.join(tokens).encode('utf-8')).hexdigest()
+
+
+def _largest_image(page) -> Optional[Image.Image]:
+    best, best_area = None, 0
+    for embedded in page.images:
+        try:
+            image = embedded.image
+        except Exception:
+            # Filters PIL cannot decode (JBIG2 and the like)
+            continue
+        if image.width * image.height > best_area:
+            best, best_area = image, image.width * image.height
+    return best
+
+
+def _pdf_fingerprint(content: bytes, max_pages: int) -> Fingerprint:
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(content))
+    pages = reader.pages[:max_pages]
+    text = ' '.join((page.extract_text() or '') for page in pages)
+
+    page_hashes = []
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(content)
+        try:
+            for index in range(min(len(document), max_pages)):
+                page = document[index]
+                scale = WORKING_LONG_EDGE / max(page.get_size())
+                page_hashes.append(perceptual_hash(page.render(scale=scale).to_pil()))
+        finally:
+            document.close()
+    else:
+        images = [_largest_image(page) for page in pages]
+        # A page without an image cannot be compared, so only fully imaged documents get hashes
+        if images and all(image is not None for image in images):
+            page_hashes = [perceptual_hash(image) for image in images]
+
+    return Fingerprint(len(reader.pages), page_hashes, minhash(text), key_digest(text))
+
+
+def _image_fingerprint(content: bytes, max_pages: int) -> Fingerprint:
+    with Image.open(BytesIO(content)) as image:
+        frames = [perceptual_hash(frame) for _, frame in zip(range(max_pages), ImageSequence.Iterator(image))]
+        return Fingerprint(getattr(image, 'n_frames', 1), frames, None)
+
+
+def compute_fingerprint(content: bytes, mime_type: str, max_pages: int) -> Fingerprint:
+    """
+    Runs in a worker process, so it only takes and returns picklable values
+    """
+    if mime_type == 'application/pdf':
+        return _pdf_fingerprint(content, max_pages)
+    return _image_fingerprint(content, max_pages)
+
+
+def band_bits(page_hash: int) -> int:
+    """
+    The lowest BAND_HASH_SIZE x BAND_HASH_SIZE frequencies of a page hash, which change least
+    between scans of the same page
+    """
+    value = 0
+    for v in range(BAND_HASH_SIZE):
+        row = page_hash >> (HASH_BITS - (v + 1) * HASH_SIZE)
+        value = (value << BAND_HASH_SIZE) | ((row >> (HASH_SIZE - BAND_HASH_SIZE)) & ((1 << BAND_HASH_SIZE) - 1))
+    return value
+
+
+def text_similarity(left: List[int], right: List[int]) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+def image_similarity(left: List[int], right: List[int]) -> float:
+    # The least similar page decides, so one changed page is enough to tell two documents apart
+    return min(1 - bin(a ^ b).count('1') / HASH_BITS for a, b in zip(left, right))
+
+
+class DuplicateIndex(ABC):
+    """
+    Interface for the fingerprints of processed documents, searched per tenant and prompt
+    """
+
+    @abstractmethod
+    def candidates(self, tenant_id: str, prompt_key: str, page_count: int, bands: List[str]) -> List[Dict]:
+        """
+        Entries sharing at least one band with the document, as dicts with document_id,
+        page_hashes, minhash, key_digest and result
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(
+            self,
+            tenant_id: str,
+            prompt_key: str,
+            document_id: str,
+            fingerprint: Fingerprint,
+            bands: List[str],
+            result: str
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class SQLiteDuplicateIndex(DuplicateIndex):
+    """
+    Fingerprint index in a local SQLite file, shared by the worker processes of one instance.
+
+    Candidates are found through locality-sensitive bands, so a lookup only compares the
+    document with entries that could pass the similarity thresholds.
+    """
+
+    def __init__(self, path: str, max_entries_per_tenant: int = 10000, ttl_seconds: float = 30 * 86400):
+        self.path = path
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant_id TEXT NOT NULL,
+                    prompt_key TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    page_hashes TEXT NOT NULL,
+                    minhash BLOB,
+                    key_digest TEXT,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS fingerprints_tenant ON fingerprints (tenant_id, id);
+                CREATE INDEX IF NOT EXISTS fingerprints_created ON fingerprints (created_at);
+                CREATE TABLE IF NOT EXISTS fingerprint_bands (
+                    tenant_id TEXT NOT NULL,
+                    prompt_key TEXT NOT NULL,
+                    band TEXT NOT NULL,
+                    fingerprint_id INTEGER NOT NULL REFERENCES fingerprints (id) ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS fingerprint_bands_lookup ON fingerprint_bands (tenant_id, prompt_key, band);
+                CREATE INDEX IF NOT EXISTS fingerprint_bands_owner ON fingerprint_bands (fingerprint_id);
+            """)
+            columns = {row['name'] for row in self._connection.execute("PRAGMA table_info(fingerprints)")}
+            if 'key_digest' not in columns:
+                # Indexes written before key digests existed; their entries can never be reused
+                self._connection.execute("ALTER TABLE fingerprints ADD COLUMN key_digest TEXT")
+
+    def candidates(self, tenant_id: str, prompt_key: str, page_count: int, bands: List[str]) -> List[Dict]:
+        if not bands:
+            return []
+        placeholders = ','.join('?' * len(bands))
+        with self._lock:
+            rows = self._connection.execute(
+                f"""
+                SELECT document_id, page_hashes, minhash, key_digest, result FROM fingerprints
+                WHERE page_count = ? AND created_at > ? AND id IN (
+                    SELECT fingerprint_id FROM fingerprint_bands
+                    WHERE tenant_id = ? AND prompt_key = ? AND band IN ({placeholders})
+                )
+                ORDER BY id DESC
+                """,
+                (page_count, time.time() - self.ttl_seconds, tenant_id, prompt_key, *bands)
+            ).fetchall()
+        return [
+            {
+                "document_id": row['document_id'],
+                "page_hashes": json.loads(row['page_hashes']),
+                "minhash": list(struct.unpack(f'<{MINHASH_PERMUTATIONS}Q', row['minhash'])) if row['minhash'] else None,
+                "key_digest": row['key_digest'],
+                "result": row['result']
+            }
+            for row in rows
+        ]
+
+    def add(
+            self,
+            tenant_id: str,
+            prompt_key: str,
+            document_id: str,
+            fingerprint: Fingerprint,
+            bands: List[str],
+            result: str
+    ) -> None:
+        now = time.time()
+        signature = struct.pack(f'<{MINHASH_PERMUTATIONS}Q', *fingerprint.minhash) if fingerprint.minhash else None
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._connection.execute(
+                    """
+                    INSERT INTO fingerprints
+                        (tenant_id, prompt_key, document_id, page_count, page_hashes, minhash, key_digest, result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        tenant_id, prompt_key, document_id, fingerprint.page_count,
+                        json.dumps(fingerprint.page_hashes), signature, fingerprint.key_digest, result, now
+                    )
+                )
+                self._connection.executemany(
+                    "INSERT INTO fingerprint_bands (tenant_id, prompt_key, band, fingerprint_id) VALUES (?, ?, ?, ?)",
+                    [(tenant_id, prompt_key, band, cursor.lastrowid) for band in bands]
+                )
+                # Keep each tenant's newest entries, and nobody's expired ones
+                self._connection.execute(
+                    """
+                    DELETE FROM fingerprints WHERE tenant_id = ? AND id IN (
+                        SELECT id FROM fingerprints WHERE tenant_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (tenant_id, tenant_id, self.max_entries_per_tenant)
+                )
+                self._connection.execute("DELETE FROM fingerprints WHERE created_at <= ?", (now - self.ttl_seconds,))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) AS entries, COUNT(DISTINCT tenant_id) AS tenants FROM fingerprints"
+            ).fetchone()
+        return {"entries": row['entries'], "tenants": row['tenants']}
+
+
+class DuplicateDetector:
+    """
+    Recognises documents a tenant has already had parsed with the same prompt, even when the
+    bytes differ: a re-scan, or a re-export with different metadata.
+
+    Pages are compared by perceptual hash and the text layer by MinHash; every signal both
+    documents have must clear its threshold. In "report" mode, the default, matches are only
+    logged and counted, which helps tune the thresholds. In "reuse" mode the earlier result is
+    returned without a model call, but only when the text layers agree and carry exactly the
+    same numbers and identifiers: page hashes cannot tell apart invoices rendered from one
+    template, and MinHash cannot tell apart invoices that share pages of terms and conditions.
+    The byte-identical case is left to the result cache.
+    """
+
+    def __init__(
+            self,
+            index: DuplicateIndex,
+            action: str = 'report',
+            text_threshold: float = 0.95,
+            image_threshold: float = 0.9,
+            max_pages: int = 10,
+            max_workers: int = 2
+    ):
+        if action not in ('reuse', 'report'):
+            raise ValueError(f"Unsupported duplicate action: {action}")
+
+        self.index = index
+        self.action = action
+        self.text_threshold = text_threshold
+        self.image_threshold = image_threshold
+        self.max_pages = max_pages
+        self.max_workers = max_workers
+        self.logger = setup_logger(__name__)
+        # Worker processes are only forked once a document arrives
+        self.executor = LazyProcessPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+        self.reused = 0
+        self.image_only_matches = 0
+        self.key_mismatches = 0
+        self.unfingerprinted = 0
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+    def _bands(self, fingerprint: Fingerprint) -> List[str]:
+        bands = []
+        if fingerprint.page_hashes:
+            # Scans of one page rarely differ in more than a few low-frequency bits, so they
+            # share at least one slice
+            low = band_bits(fingerprint.page_hashes[0])
+            width = BAND_HASH_SIZE * BAND_HASH_SIZE // BAND_SLICES
+            bands.extend(f"p{index}:{(low >> (index * width)) & ((1 << width) - 1):x}" for index in range(BAND_SLICES))
+        if fingerprint.minhash:
+            for start in range(0, MINHASH_PERMUTATIONS, MINHASH_BAND_ROWS):
+                rows = struct.pack(f'<{MINHASH_BAND_ROWS}Q', *fingerprint.minhash[start:start + MINHASH_BAND_ROWS])
+                bands.append(f"t{start}:{hashlib.blake2b(rows, digest_size=8).hexdigest()}")
+        return bands
+
+    @staticmethod
+    def _usable(fingerprint: Optional[Fingerprint]) -> bool:
+        return fingerprint is not None and bool(fingerprint.page_hashes or fingerprint.minhash)
+
+    def _task_args(self, file_name: str, file_content: FileContent) -> Optional[tuple]:
+        mime_type = MIME_TYPES.get(file_name.lower().split('.')[-1])
+        if mime_type is None:
+            return None
+        return read_all(file_content), mime_type, self.max_pages
+
+    def _compare(self, fingerprint: Fingerprint, candidate: Dict) -> Optional[DuplicateMatch]:
+        text = image = None
+        if fingerprint.minhash and candidate['minhash']:
+            text = text_similarity(fingerprint.minhash, candidate['minhash'])
+            if text < self.text_threshold:
+                return None
+        if fingerprint.page_hashes and len(candidate['page_hashes']) == len(fingerprint.page_hashes):
+            image = image_similarity(fingerprint.page_hashes, candidate['page_hashes'])
+            if image < self.image_threshold:
+                return None
+        if text is None and image is None:
+            return None
+        keys_match = fingerprint.key_digest is not None and fingerprint.key_digest == candidate.get('key_digest')
+        return DuplicateMatch(candidate['document_id'], candidate['result'], text, image, keys_match)
+
+    def _find(self, tenant_id: str, prompt: str, fingerprint: Fingerprint) -> Optional[DuplicateMatch]:
+        with telemetry.stage('duplicate_lookup'):
+            candidates = self.index.candidates(
+                tenant_id, self._prompt_key(prompt), fingerprint.page_count, self._bands(fingerprint))
+        for candidate in candidates:
+            match = self._compare(fingerprint, candidate)
+            if match is not None:
+                return match
+        return None
+
+    def _record(self, tenant_id: str, prompt: str, document_id: str, fingerprint: Fingerprint, result: str):
+        try:
+            self.index.add(
+                tenant_id, self._prompt_key(prompt), document_id, fingerprint, self._bands(fingerprint), result)
+        except Exception as e:
+            self.logger.warning(f"Could not index the fingerprint of document {document_id}: {str(e)}")
+
+    def _on_lookup(self, document_id: str, fingerprint: Optional[Fingerprint], match: Optional[DuplicateMatch]) -> bool:
+        """
+        Count a lookup and decide whether its match is reused
+        """
+        with self._lock:
+            self.lookups += 1
+            if not self._usable(fingerprint):
+                self.unfingerprinted += 1
+            if match is None:
+                return False
+            self.matches += 1
+            # Reusing another document's result needs its text to agree, not just its looks, and
+            # every number in it to be the same
+            reuse = self.action == 'reuse' and match.text_similarity is not None and match.keys_match
+            if reuse:
+                self.reused += 1
+            elif match.text_similarity is None:
+                self.image_only_matches += 1
+            elif not match.keys_match:
+                self.key_mismatches += 1
+
+        self.logger.info(
+            f"Document {document_id} looks like document {match.document_id} "
+            f"(text similarity {match.text_similarity}, image similarity {match.image_similarity}, "
+            f"numbers {'equal' if match.keys_match else 'different'}), "
+            f"{'reusing its result' if reuse else 'processing it anyway'}")
+        return reuse
+
+    def process_file(
+            self,
+            tenant_id: str,
+            document_id: str,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            process: Callable[[], str]
+    ) -> str:
+        """
+        Return the result of an earlier near-duplicate, or process() and index the document
+        """
+        fingerprint = match = None
+        task_args = self._task_args(file_name, file_content)
+        if task_args is not None:
+            try:
+                with telemetry.stage('fingerprint'):
+                    fingerprint = self.executor.submit(compute_fingerprint, *task_args).result()
+                match = self._find(tenant_id, prompt, fingerprint)
+            except Exception as e:
+                # Never lose a job to its fingerprint, it is only an optimisation
+                self.logger.warning(f"Could not fingerprint {file_name}: {str(e)}")
+                fingerprint = None
+
+        if self._on_lookup(document_id, fingerprint, match):
+            return match.result
+
+        result = process()
+        if self._usable(fingerprint):
+            self._record(tenant_id, prompt, document_id, fingerprint, result)
+        return result
+
+    async def process_file_async(
+            self,
+            tenant_id: str,
+            document_id: str,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            process: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Asyncio variant of process_file; the index is a local SQLite file, so it is used off the loop
+        """
+        fingerprint = match = None
+        task_args = self._task_args(file_name, file_content)
+        if task_args is not None:
+            try:
+                with telemetry.stage('fingerprint'):
+                    fingerprint = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, compute_fingerprint, *task_args)
+                match = await asyncio.to_thread(self._find, tenant_id, prompt, fingerprint)
+            except Exception as e:
+                self.logger.warning(f"Could not fingerprint {file_name}: {str(e)}")
+                fingerprint = None
+
+        if self._on_lookup(document_id, fingerprint, match):
+            return match.result
+
+        result = await process()
+        if self._usable(fingerprint):
+            await asyncio.to_thread(self._record, tenant_id, prompt, document_id, fingerprint, result)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {
+                "action": self.action,
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "reused": self.reused,
+                "image_only_matches": self.image_only_matches,
+                "key_mismatches": self.key_mismatches,
+                "unfingerprinted": self.unfingerprinted
+            }
+        return {**counts, "index": self.index.stats()}
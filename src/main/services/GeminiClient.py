@@ -1,20 +1,74 @@
+import asyncio
+import contextlib
 import json
-from typing import Optional
+import time
+from typing import List, Optional, Tuple
 
-import requests
+import backoff
 from google import genai
-from google.genai import types, Client
+from google.genai import errors, types, Client
 
+from .DocumentPacker import (
+    DOCUMENT_FOOTER,
+    DocumentPacker,
+    PackedDocument,
+    document_header,
+    estimate_packed_input_tokens
+)
+from .ImagePreprocessor import ImagePreprocessor, PreprocessedImage
+from .RateGovernor import (
+    RateGovernor,
+    estimate_image_input_tokens,
+    estimate_input_tokens,
+    estimate_text_input_tokens,
+    retry_after_seconds
+)
+from .ResultCache import ResultCache, build_cache_key
+from .TextLayerExtractor import TextLayer, TextLayerExtractor, format_text_layer
 from ..config.constants.MimeTypes import MIME_TYPES
 from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, read_all
+from ..utils import json_codec
+from ..utils.json_stream import IncrementalJsonValidator, InvalidJsonStreamError, JsonText, StreamStats
+from ..utils.telemetry import telemetry
+
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _is_retryable(e: errors.APIError) -> bool:
+    return e.code in RETRYABLE_STATUS_CODES
 
 
 class GeminiClient:
 
-    def __init__(self, api_key: str):
+    PROVIDER = "gemini"
+
+    def __init__(
+            self,
+            api_key: str,
+            result_cache: Optional[ResultCache] = None,
+            rate_governor: Optional[RateGovernor] = None,
+            image_preprocessor: Optional[ImagePreprocessor] = None,
+            base_url: Optional[str] = None,
+            streaming: bool = False,
+            stream_max_attempts: int = 3,
+            text_layer_extractor: Optional[TextLayerExtractor] = None,
+            document_packer: Optional[DocumentPacker] = None
+    ):
         self.api_key = api_key
         self.logger = setup_logger(__name__)
-        self.client: Client = genai.Client(api_key=api_key)
+        # base_url lets the client talk to a local fake API in tests and benchmarks
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client: Client = genai.Client(api_key=api_key, http_options=http_options)
+        self.result_cache = result_cache
+        self.rate_governor = rate_governor
+        self.image_preprocessor = image_preprocessor
+        self.text_layer_extractor = text_layer_extractor
+        self.document_packer = document_packer
+        self.streaming = streaming
+        self.stream_max_attempts = stream_max_attempts
+        self.stream_stats = StreamStats()
         self.GEMINI_MODEL = "gemini-2.0-flash"
 
     def _get_mime_type(self, file_name: str) -> Optional[str]:
@@ -29,7 +83,7 @@ class GeminiClient:
 
         return mime_type
 
-    def _validate_json_response(self, response_text: str, file_name: str) -> str:
+    def _validate_json_response(self, response_text: str, file_name: str) -> JsonText:
         """
         Validate that the response is a valid JSON string
 
@@ -38,25 +92,314 @@ class GeminiClient:
             file_name: The name of the file being processed (for error reporting)
 
         Returns:
-            The validated response text
+            The validated response text, carrying the parsed value
 
         Raises:
             Exception: If the response is not valid JSON
         """
         try:
             # Attempt to parse the string as JSON
-            json.loads(response_text)
-            return response_text
+            with telemetry.stage('json_validation', self.PROVIDER):
+                return JsonText(response_text, json_codec.loads(response_text))
         except json.JSONDecodeError as e:
             error_msg = f"Invalid JSON response for file {file_name}: {str(e)}"
             self.logger.error(error_msg)
             self.logger.debug(f"Response content: {response_text[:200]}...")  # Log first 200 chars
             raise Exception(error_msg)
 
+    def _on_api_error(self, e: errors.APIError):
+        if e.code == 429:
+            headers = getattr(getattr(e, 'response', None), 'headers', None)
+            self.rate_governor.penalize(retry_after_seconds(headers))
+
+    def _record_usage(self, response, estimated_tokens: int):
+        usage = getattr(response, 'usage_metadata', None)
+        input_tokens = getattr(usage, 'prompt_token_count', None)
+        telemetry.record_tokens(self.PROVIDER, input_tokens, getattr(usage, 'candidates_token_count', None))
+        if self.rate_governor is not None:
+            self.rate_governor.record_usage(estimated_tokens, input_tokens)
+
+    # Using backoff for retries with exponential backoff
+    @backoff.on_exception(
+        backoff.expo,
+        errors.APIError,
+        max_tries=3,  # Try up to 3 times
+        max_time=300,  # Give up after 5 minutes
+        giveup=lambda e: not _is_retryable(e),
+        jitter=backoff.full_jitter  # Add jitter to prevent thundering herd
+    )
+    def _call_gemini_api(self, contents: List, estimated_tokens: int = 0):
+        if self.rate_governor is None:
+            response = self.client.models.generate_content(model=self.GEMINI_MODEL, contents=contents)
+            self._record_usage(response, estimated_tokens)
+            return response
+
+        with self.rate_governor.acquire(estimated_tokens):
+            try:
+                response = self.client.models.generate_content(model=self.GEMINI_MODEL, contents=contents)
+            except errors.APIError as e:
+                self._on_api_error(e)
+                raise
+
+        self._record_usage(response, estimated_tokens)
+        return response
+
+    @backoff.on_exception(
+        backoff.expo,
+        errors.APIError,
+        max_tries=3,
+        max_time=300,
+        giveup=lambda e: not _is_retryable(e),
+        jitter=backoff.full_jitter
+    )
+    async def _call_gemini_api_async(self, contents: List, estimated_tokens: int = 0):
+        if self.rate_governor is None:
+            response = await self.client.aio.models.generate_content(model=self.GEMINI_MODEL, contents=contents)
+            self._record_usage(response, estimated_tokens)
+            return response
+
+        async with self.rate_governor.acquire_async(estimated_tokens):
+            try:
+                response = await self.client.aio.models.generate_content(model=self.GEMINI_MODEL, contents=contents)
+            except errors.APIError as e:
+                self._on_api_error(e)
+                raise
+
+        self._record_usage(response, estimated_tokens)
+        return response
+
+    def _slot(self, estimated_tokens: int):
+        if self.rate_governor is None:
+            return contextlib.nullcontext()
+        return self.rate_governor.acquire(estimated_tokens)
+
+    def _async_slot(self, estimated_tokens: int):
+        if self.rate_governor is None:
+            return contextlib.nullcontext()
+        return self.rate_governor.acquire_async(estimated_tokens)
+
+    def _on_chunk(self, validator: IncrementalJsonValidator, chunk, start_time: float):
+        text = chunk.text or ''
+        if validator.received == 0 and text:
+            self.stream_stats.record_first_byte(time.time() - start_time)
+        validator.feed(text)
+
+    @backoff.on_exception(
+        backoff.expo,
+        errors.APIError,
+        max_tries=3,
+        max_time=300,
+        giveup=lambda e: not _is_retryable(e),
+        jitter=backoff.full_jitter
+    )
+    def _stream_gemini_api(self, contents: List, estimated_tokens: int = 0) -> JsonText:
+        """
+        Stream one completion through the incremental validator.
+
+        Raises:
+            InvalidJsonStreamError: As soon as the output can no longer become valid JSON. Closing
+                the stream early drops the connection so no further tokens are generated.
+        """
+        validator = IncrementalJsonValidator()
+        start_time = time.time()
+        chunk = None
+
+        with self._slot(estimated_tokens):
+            try:
+                stream = self.client.models.generate_content_stream(model=self.GEMINI_MODEL, contents=contents)
+                with contextlib.closing(stream):
+                    for chunk in stream:
+                        self._on_chunk(validator, chunk, start_time)
+            except errors.APIError as e:
+                if self.rate_governor is not None:
+                    self._on_api_error(e)
+                raise
+
+        # Usage metadata arrives on the final chunk
+        self._record_usage(chunk, estimated_tokens)
+        with telemetry.stage('json_validation', self.PROVIDER):
+            return validator.finish()
+
+    @backoff.on_exception(
+        backoff.expo,
+        errors.APIError,
+        max_tries=3,
+        max_time=300,
+        giveup=lambda e: not _is_retryable(e),
+        jitter=backoff.full_jitter
+    )
+    async def _stream_gemini_api_async(self, contents: List, estimated_tokens: int = 0) -> JsonText:
+        validator = IncrementalJsonValidator()
+        start_time = time.time()
+        chunk = None
+
+        async with self._async_slot(estimated_tokens):
+            try:
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=self.GEMINI_MODEL,
+                    contents=contents
+                )
+                async with contextlib.aclosing(stream):
+                    async for chunk in stream:
+                        self._on_chunk(validator, chunk, start_time)
+            except errors.APIError as e:
+                if self.rate_governor is not None:
+                    self._on_api_error(e)
+                raise
+
+        self._record_usage(chunk, estimated_tokens)
+        with telemetry.stage('json_validation', self.PROVIDER):
+            return validator.finish()
+
+    def _on_stream_abort(self, file_name: str, attempt: int, e: InvalidJsonStreamError):
+        self.stream_stats.record_abort()
+        self.logger.warning(
+            f"Aborted response stream for {file_name} (attempt {attempt}/{self.stream_max_attempts}): {str(e)}")
+
+    def _stream_json(self, contents: List, file_name: str, estimated_tokens: int) -> JsonText:
+        for attempt in range(1, self.stream_max_attempts + 1):
+            try:
+                return self._stream_gemini_api(contents, estimated_tokens)
+            except InvalidJsonStreamError as e:
+                self._on_stream_abort(file_name, attempt, e)
+        raise Exception(f"Invalid JSON response for file {file_name} after {self.stream_max_attempts} attempts")
+
+    async def _stream_json_async(self, contents: List, file_name: str, estimated_tokens: int) -> JsonText:
+        for attempt in range(1, self.stream_max_attempts + 1):
+            try:
+                return await self._stream_gemini_api_async(contents, estimated_tokens)
+            except InvalidJsonStreamError as e:
+                self._on_stream_abort(file_name, attempt, e)
+        raise Exception(f"Invalid JSON response for file {file_name} after {self.stream_max_attempts} attempts")
+
+    def _lookup_cache(self, file_content: FileContent, prompt: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns:
+            Tuple of (cache key or None if caching is disabled, cached response or None)
+        """
+        if self.result_cache is None:
+            return None, None
+
+        cache_key = build_cache_key(file_content, prompt, self.PROVIDER, self.GEMINI_MODEL)
+        return cache_key, self.result_cache.get(cache_key)
+
+    def _should_preprocess(self, mime_type: str) -> bool:
+        return self.image_preprocessor is not None and mime_type.startswith('image/')
+
+    def _should_extract_text(self, mime_type: str) -> bool:
+        return self.text_layer_extractor is not None and mime_type == 'application/pdf'
+
+    def _build_contents(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            mime_type: str,
+            images: Optional[List[PreprocessedImage]] = None,
+            text_layer: Optional[TextLayer] = None
+    ) -> Tuple[List, int]:
+        if text_layer is not None:
+            document_text = format_text_layer(file_name, text_layer)
+            estimated_tokens = estimate_text_input_tokens(document_text, prompt)
+            self.text_layer_extractor.record_savings(
+                file_name, self.PROVIDER, estimate_input_tokens(file_content, mime_type, prompt), estimated_tokens)
+            return [document_text, prompt], estimated_tokens
+
+        if images is not None:
+            contents = [types.Part.from_bytes(data=image.content, mime_type=image.mime_type) for image in images]
+            return contents + [prompt], estimate_image_input_tokens(len(images), prompt)
+
+        contents = [
+            # The genai SDK only accepts bytes for inline parts
+            types.Part.from_bytes(
+                data=read_all(file_content),
+                mime_type=mime_type,
+            ),
+            prompt
+        ]
+        return contents, estimate_input_tokens(file_content, mime_type, prompt)
+
+    def _handle_response(self, response, file_name: str, cache_key: Optional[str]) -> JsonText:
+        file_response = response.text
+
+        if not isinstance(file_response, str):
+            self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is not a string")
+            raise Exception("Invoice response is not a string")
+
+        if file_response is None:
+            self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is None")
+            raise Exception("Invoice response is None")
+
+        json_response = str(file_response).replace("```json", "").replace("```", "")
+        # Validate that the response is valid JSON
+        validated_response = self._validate_json_response(json_response, file_name)
+
+        if cache_key is not None:
+            self.result_cache.set(cache_key, validated_response)
+
+        return validated_response
+
+    def _cache_response(self, validated_response: JsonText, cache_key: Optional[str]) -> JsonText:
+        if cache_key is not None:
+            self.result_cache.set(cache_key, validated_response)
+        return validated_response
+
+    def _packed_parts(
+            self,
+            file_content: FileContent,
+            mime_type: str,
+            images: Optional[List[PreprocessedImage]]
+    ) -> Optional[List[Tuple[FileContent, str]]]:
+        """
+        Returns:
+            What a packed request would carry for the document, or None if it cannot be packed
+        """
+        if self.document_packer is None:
+            return None
+        if images is not None:
+            return [(image.content, image.mime_type) for image in images]
+        return [(file_content, mime_type)]
+
+    @staticmethod
+    def _build_packed_contents(documents: List[PackedDocument], prompt: str) -> Tuple[List, int]:
+        contents = []
+        for index, document in enumerate(documents, start=1):
+            contents.append(document_header(index, document.file_name))
+            contents.extend(types.Part.from_bytes(data=content, mime_type=mime_type) for content, mime_type in document.parts)
+            contents.append(DOCUMENT_FOOTER)
+        return contents + [prompt], estimate_packed_input_tokens(documents, prompt)
+
+    def _process_packed(self, documents: List[PackedDocument], prompt: str) -> JsonText:
+        """
+        Send several documents of one file type in one request; the response is their JSON array
+        """
+        file_names = ', '.join(document.file_name for document in documents)
+        with telemetry.stage('encode', self.PROVIDER):
+            contents, estimated_tokens = self._build_packed_contents(documents, prompt)
+        if self.streaming:
+            with telemetry.stage('provider_call', self.PROVIDER):
+                return self._stream_json(contents, file_names, estimated_tokens)
+
+        with telemetry.stage('provider_call', self.PROVIDER):
+            response = self._call_gemini_api(contents, estimated_tokens)
+        return self._handle_response(response, file_names, None)
+
+    async def _process_packed_async(self, documents: List[PackedDocument], prompt: str) -> JsonText:
+        file_names = ', '.join(document.file_name for document in documents)
+        with telemetry.stage('encode', self.PROVIDER):
+            contents, estimated_tokens = self._build_packed_contents(documents, prompt)
+        if self.streaming:
+            with telemetry.stage('provider_call', self.PROVIDER):
+                return await self._stream_json_async(contents, file_names, estimated_tokens)
+
+        with telemetry.stage('provider_call', self.PROVIDER):
+            response = await self._call_gemini_api_async(contents, estimated_tokens)
+        return await asyncio.to_thread(self._handle_response, response, file_names, None)
+
     def process_file(
             self,
             file_name: str,
-            file_content: bytes,
+            file_content: FileContent,
             prompt: str
     ) -> str:
         """
@@ -66,31 +409,89 @@ class GeminiClient:
         if not mime_type:
             raise ValueError(f"Unsupported file format for file: {file_name}")
 
+        cache_key, cached_response = self._lookup_cache(file_content, prompt)
+        if cached_response is not None:
+            self.logger.info(f"Returning cached result for file {file_name}")
+            return cached_response
+
+        try:
+            images = text_layer = None
+            if self._should_preprocess(mime_type):
+                images = self.image_preprocessor.preprocess(file_name, file_content, mime_type)
+            elif self._should_extract_text(mime_type):
+                with telemetry.stage('text_extraction', self.PROVIDER):
+                    text_layer = self.text_layer_extractor.extract(file_name, file_content)
+
+            # Small documents without a text layer may share a request with others using the same prompt
+            parts = self._packed_parts(file_content, mime_type, images) if text_layer is None else None
+            if parts is not None:
+                with telemetry.stage('packing', self.PROVIDER):
+                    packed_response = self.document_packer.process(
+                        self.PROVIDER, file_name, parts, prompt, mime_type, self._process_packed)
+                if packed_response is not None:
+                    return self._cache_response(packed_response, cache_key)
+
+            with telemetry.stage('encode', self.PROVIDER):
+                contents, estimated_tokens = self._build_contents(
+                    file_name, file_content, prompt, mime_type, images, text_layer)
+            if self.streaming:
+                with telemetry.stage('provider_call', self.PROVIDER):
+                    validated_response = self._stream_json(contents, file_name, estimated_tokens)
+                return self._cache_response(validated_response, cache_key)
+
+            with telemetry.stage('provider_call', self.PROVIDER):
+                response = self._call_gemini_api(contents, estimated_tokens)
+            return self._handle_response(response, file_name, cache_key)
+        except Exception as e:
+            self.logger.error("Error parsing PDF with name: " + file_name + " " + str(e))
+            raise Exception("Error parsing PDF with name: " + file_name + " " + str(e))
+
+    async def process_file_async(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str
+    ) -> str:
+        """
+        Asyncio variant of process_file, for use on the async processing pipeline
+        """
+        mime_type = self._get_mime_type(file_name)
+        if not mime_type:
+            raise ValueError(f"Unsupported file format for file: {file_name}")
+
+        # The cache may hit GCS, so keep it off the event loop
+        cache_key, cached_response = await asyncio.to_thread(self._lookup_cache, file_content, prompt)
+        if cached_response is not None:
+            self.logger.info(f"Returning cached result for file {file_name}")
+            return cached_response
+
         try:
-            response = self.client.models.generate_content(
-                model=self.GEMINI_MODEL,
-                contents=[
-                    types.Part.from_bytes(
-                        data=file_content,
-                        mime_type=mime_type,
-                    ),
-                    prompt])
-
-            file_response = response.text
-
-            if not isinstance(file_response, str):
-                self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is not a string")
-                raise Exception("Invoice response is not a string")
-
-            if file_response is None:
-                self.logger.error("Error parsing PDF with name: " + file_name + " Invoice response is None")
-                raise Exception("Invoice response is None")
-
-            json_response = str(file_response).replace("```json", "").replace("```", "")
-            # Validate that the response is valid JSON
-            validated_response = self._validate_json_response(json_response, file_name)
-
-            return validated_response
+            images = text_layer = None
+            if self._should_preprocess(mime_type):
+                images = await self.image_preprocessor.preprocess_async(file_name, file_content, mime_type)
+            elif self._should_extract_text(mime_type):
+                with telemetry.stage('text_extraction', self.PROVIDER):
+                    text_layer = await self.text_layer_extractor.extract_async(file_name, file_content)
+
+            parts = self._packed_parts(file_content, mime_type, images) if text_layer is None else None
+            if parts is not None:
+                with telemetry.stage('packing', self.PROVIDER):
+                    packed_response = await self.document_packer.process_async(
+                        self.PROVIDER, file_name, parts, prompt, mime_type, self._process_packed_async)
+                if packed_response is not None:
+                    return await asyncio.to_thread(self._cache_response, packed_response, cache_key)
+
+            with telemetry.stage('encode', self.PROVIDER):
+                contents, estimated_tokens = self._build_contents(
+                    file_name, file_content, prompt, mime_type, images, text_layer)
+            if self.streaming:
+                with telemetry.stage('provider_call', self.PROVIDER):
+                    validated_response = await self._stream_json_async(contents, file_name, estimated_tokens)
+                return await asyncio.to_thread(self._cache_response, validated_response, cache_key)
+
+            with telemetry.stage('provider_call', self.PROVIDER):
+                response = await self._call_gemini_api_async(contents, estimated_tokens)
+            return await asyncio.to_thread(self._handle_response, response, file_name, cache_key)
         except Exception as e:
             self.logger.error("Error parsing PDF with name: " + file_name + " " + str(e))
             raise Exception("Error parsing PDF with name: " + file_name + " " + str(e))
@@ -0,0 +1,174 @@
+import asyncio
+from dataclasses import dataclass
+from io import BytesIO
+from typing import List, Tuple
+
+from PIL import Image, ImageOps, ImageSequence
+
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, read_all
+from ..utils.process_pool import LazyProcessPoolExecutor
+
+OUTPUT_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp'
+}
+
+# Formats every provider accepts as-is, so a larger re-encode can fall back to the original
+PASSTHROUGH_MIME_TYPES = ('image/jpeg', 'image/png')
+
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_ANGLE_STEP = 0.5
+DESKEW_SAMPLE_LONG_EDGE = 800
+
+
+@dataclass
+class PreprocessedImage:
+    content: bytes
+    mime_type: str
+
+
+def _flatten(page: Image.Image, grayscale: bool) -> Image.Image:
+    if page.mode in ('RGBA', 'LA') or (page.mode == 'P' and 'transparency' in page.info):
+        # Composite transparent scans onto white rather than letting alpha turn black
+        page = page.convert('RGBA')
+        background = Image.new('RGBA', page.size, (255, 255, 255, 255))
+        page = Image.alpha_composite(background, page)
+    return page.convert('L' if grayscale else 'RGB')
+
+
+def _skew_angle(page: Image.Image) -> float:
+    """
+    Find the rotation that makes text rows sharpest, using the variance of the row ink profile
+    """
+    sample = page.convert('L')
+    sample.thumbnail((DESKEW_SAMPLE_LONG_EDGE, DESKEW_SAMPLE_LONG_EDGE))
+    # Invert so that ink is bright and rotated-in borders (filled with 0) count as background
+    sample = ImageOps.invert(sample).point(lambda value: 255 if value > 128 else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_ANGLE_STEP)
+    for step in range(-steps, steps + 1):
+        angle = step * DESKEW_ANGLE_STEP
+        rotated = sample.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        profile = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(profile) / len(profile)
+        score = sum((value - mean) ** 2 for value in profile)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess_image(
+        content: bytes,
+        max_long_edge: int,
+        output_format: str,
+        quality: int,
+        grayscale: bool,
+        deskew: bool
+) -> List[Tuple[bytes, str]]:
+    """
+    Downscale, optionally grayscale/deskew and re-encode every frame of an image.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Returns:
+        List of (encoded bytes, MIME type), one entry per frame (multi-page TIFFs yield several)
+    """
+    pages = []
+    with Image.open(BytesIO(content)) as image:
+        for frame in ImageSequence.Iterator(image):
+            page = _flatten(frame, grayscale)
+
+            if deskew:
+                angle = _skew_angle(page)
+                if angle:
+                    fill = 255 if page.mode == 'L' else (255, 255, 255)
+                    page = page.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+            if max(page.size) > max_long_edge:
+                page.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+
+            buffer = BytesIO()
+            page.save(buffer, format=output_format, quality=quality, optimize=True)
+            pages.append((buffer.getvalue(), OUTPUT_MIME_TYPES[output_format]))
+    return pages
+
+
+class ImagePreprocessor:
+    """
+    Shrinks image payloads before they are sent to a model.
+
+    The CPU-bound work runs in a process pool so it does not hold up request workers.
+    """
+
+    def __init__(
+            self,
+            max_long_edge: int = 1568,
+            output_format: str = 'JPEG',
+            quality: int = 85,
+            grayscale: bool = False,
+            deskew: bool = False,
+            max_workers: int = 2
+    ):
+        if output_format not in OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported image output format: {output_format}")
+
+        self.max_long_edge = max_long_edge
+        self.output_format = output_format
+        self.quality = quality
+        self.grayscale = grayscale
+        self.deskew = deskew
+        self.max_workers = max_workers
+        self.logger = setup_logger(__name__)
+        # Worker processes are only forked once an image arrives
+        self.executor = LazyProcessPoolExecutor(max_workers)
+
+    def _task_args(self, content: bytes) -> tuple:
+        return content, self.max_long_edge, self.output_format, self.quality, self.grayscale, self.deskew
+
+    def _finalize(
+            self,
+            file_name: str,
+            original: bytes,
+            mime_type: str,
+            pages: List[Tuple[bytes, str]]
+    ) -> List[PreprocessedImage]:
+        processed_size = sum(len(page) for page, _ in pages)
+
+        if len(pages) == 1 and processed_size >= len(original) and mime_type in PASSTHROUGH_MIME_TYPES:
+            self.logger.info(f"Preprocessing {file_name} did not shrink it ({len(original)} bytes), sending original")
+            return [PreprocessedImage(original, mime_type)]
+
+        self.logger.info(
+            f"Preprocessed {file_name}: {len(original)} -> {processed_size} bytes across {len(pages)} page(s)")
+        return [PreprocessedImage(page, page_mime_type) for page, page_mime_type in pages]
+
+    def _fallback(self, file_name: str, original: bytes, mime_type: str, error: Exception) -> List[PreprocessedImage]:
+        self.logger.warning(f"Could not preprocess {file_name}, sending the original: {str(error)}")
+        return [PreprocessedImage(original, mime_type)]
+
+    def preprocess(self, file_name: str, file_content: FileContent, mime_type: str) -> List[PreprocessedImage]:
+        original = read_all(file_content)
+        try:
+            pages = self.executor.submit(preprocess_image, *self._task_args(original)).result()
+        except Exception as e:
+            return self._fallback(file_name, original, mime_type, e)
+        return self._finalize(file_name, original, mime_type, pages)
+
+    async def preprocess_async(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            mime_type: str
+    ) -> List[PreprocessedImage]:
+        original = read_all(file_content)
+        try:
+            pages = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                preprocess_image,
+                *self._task_args(original)
+            )
+        except Exception as e:
+            return self._fallback(file_name, original, mime_type, e)
+        return self._finalize(file_name, original, mime_type, pages)
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+from ..logs.logger import setup_logger
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the scheduler has reached its maximum queue depth
+    """
+
+    def __init__(self, queue_depth: int, retry_after: int):
+        super().__init__(f"Job queue is full ({queue_depth} jobs pending)")
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class SchedulerUnavailableError(Exception):
+    """
+    Raised when jobs are submitted to a scheduler that is not running
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Job scheduler is not accepting work")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Bounded worker pool with per-tenant round-robin dispatch.
+
+    Each tenant gets its own FIFO queue and workers take one job from each tenant in turn,
+    so a large batch from one tenant cannot starve the others. Submissions beyond
+    max_queue_depth are rejected instead of being buffered in memory.
+    """
+
+    def __init__(self, workers: int = 4, max_queue_depth: int = 100, retry_after_seconds: int = 30):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = retry_after_seconds
+        self.logger = setup_logger(__name__)
+
+        self._queues: "OrderedDict[str, Deque[Tuple[Callable, tuple, dict]]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._queue_depth = 0
+        self._in_flight = 0
+        self._running = False
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(f"Job scheduler started with {self.workers} workers, max queue depth {self.max_queue_depth}")
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def submit(self, tenant_id: str, fn: Callable, *args, **kwargs):
+        """
+        Queue a job for the given tenant
+
+        Raises:
+            SchedulerUnavailableError: If the scheduler is not running
+            QueueFullError: If max_queue_depth jobs are already waiting
+        """
+        with self._condition:
+            if not self._running:
+                raise SchedulerUnavailableError(self.retry_after_seconds)
+
+            if self._queue_depth >= self.max_queue_depth:
+                raise QueueFullError(self._queue_depth, self.retry_after_seconds)
+
+            tenant_queue = self._queues.get(tenant_id)
+            if tenant_queue is None:
+                tenant_queue = deque()
+                self._queues[tenant_id] = tenant_queue
+            tenant_queue.append((fn, args, kwargs))
+            self._queue_depth += 1
+            self._condition.notify()
+
+    def _next_job(self) -> Tuple[Callable, tuple, dict]:
+        # Take from the tenant at the head and rotate it to the back so tenants alternate
+        tenant_id, tenant_queue = next(iter(self._queues.items()))
+        job = tenant_queue.popleft()
+        if tenant_queue:
+            self._queues.move_to_end(tenant_id)
+        else:
+            del self._queues[tenant_id]
+        self._queue_depth -= 1
+        return job
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while self._running and self._queue_depth == 0:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                fn, args, kwargs = self._next_job()
+                self._in_flight += 1
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self.logger.error(f"Unhandled error in scheduled job: {str(e)}")
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "queue_depth": self._queue_depth,
+                "in_flight": self._in_flight,
+                "workers": self.workers,
+                "max_queue_depth": self.max_queue_depth,
+                "tenants_waiting": len(self._queues)
+            }
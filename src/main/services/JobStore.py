@@ -0,0 +1,359 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+from ..logs.logger import setup_logger
+from ..models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+from ..models.enum.JobState import JobState
+
+# States a job never leaves on its own; recovery skips them and a new request may replace them
+FINISHED_STATES = (JobState.DONE.value, JobState.FAILED.value)
+
+
+def _encode_payload(callback_payload: Optional[Union[Dict, bytes]]) -> Optional[str]:
+    # Callback bodies arrive already encoded; storing them as they are avoids a second encode
+    if callback_payload is None:
+        return None
+    if isinstance(callback_payload, bytes):
+        return callback_payload.decode('utf-8')
+    return json.dumps(callback_payload)
+
+
+@dataclass
+class JobRecord:
+    id: str
+    state: JobState
+    request: ProcessDocumentRequest
+    ai_type: Optional[str]
+    attempts: int
+    callback_payload: Optional[Dict]
+    error: Optional[str]
+    updated_at: float
+
+
+class JobStore(ABC):
+    """
+    Interface for durable job state, so accepted documents outlive the worker that accepted them.
+
+    Every job is owned by the process that is running it. Processes heartbeat while alive, and
+    jobs whose owner stops heartbeating can be claimed and re-driven by another process.
+    """
+
+    owner: str
+
+    @abstractmethod
+    def accept(self, request: ProcessDocumentRequest, ai_type: Optional[str]) -> bool:
+        """
+        Record a new job, keyed on the document id
+
+        Returns:
+            False if a job for the same document is already in progress
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def transition(
+            self,
+            job_id: str,
+            state: JobState,
+            callback_payload: Optional[Union[Dict, bytes]] = None,
+            error: Optional[str] = None
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def discard(self, job_id: str) -> None:
+        """
+        Forget a job that was accepted but could not be queued
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self, job_id: str) -> None:
+        """
+        Give up ownership of a claimed job that could not be re-queued, without using up an attempt
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_orphans(self, stale_after_seconds: float) -> List[JobRecord]:
+        """
+        Take ownership of unfinished jobs whose owner has not heartbeated recently
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def purge_finished(self, older_than_seconds: float) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a local SQLite file, shared by the worker processes of one instance.
+
+    Only durable across instance restarts when the file lives on a persistent volume; a
+    managed queue can be plugged in behind the same interface for multi-instance deployments.
+    """
+
+    def __init__(self, path: str, owner: Optional[str] = None):
+        self.path = path
+        self.owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Autocommit mode; multi-statement updates open their own transactions
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    ai_type TEXT,
+                    owner TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    callback_payload TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+                CREATE TABLE IF NOT EXISTS workers (
+                    owner TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL
+                );
+            """)
+        self.heartbeat()
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> JobRecord:
+        return JobRecord(
+            id=row['id'],
+            state=JobState(row['state']),
+            request=ProcessDocumentRequest.from_dict(json.loads(row['request'])),
+            ai_type=row['ai_type'],
+            attempts=row['attempts'],
+            callback_payload=json.loads(row['callback_payload']) if row['callback_payload'] else None,
+            error=row['error'],
+            updated_at=row['updated_at']
+        )
+
+    def accept(self, request: ProcessDocumentRequest, ai_type: Optional[str]) -> bool:
+        now = time.time()
+        with self._lock:
+            # A finished document may be submitted again (e.g. re-parsing); an unfinished one may not
+            cursor = self._connection.execute(
+                """
+                INSERT INTO jobs (id, state, request, ai_type, owner, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    state = excluded.state,
+                    request = excluded.request,
+                    ai_type = excluded.ai_type,
+                    owner = excluded.owner,
+                    attempts = 1,
+                    callback_payload = NULL,
+                    error = NULL,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at
+                WHERE jobs.state IN (?, ?)
+                """,
+                (
+                    request.id, JobState.ACCEPTED.value, json.dumps(request.to_dict()), ai_type, self.owner,
+                    now, now, *FINISHED_STATES
+                )
+            )
+        return cursor.rowcount == 1
+
+    def transition(
+            self,
+            job_id: str,
+            state: JobState,
+            callback_payload: Optional[Union[Dict, bytes]] = None,
+            error: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            self._connection.execute(
+                """
+                UPDATE jobs SET
+                    state = ?,
+                    callback_payload = COALESCE(?, callback_payload),
+                    error = COALESCE(?, error),
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (
+                    state.value,
+                    _encode_payload(callback_payload),
+                    error,
+                    time.time(),
+                    job_id
+                )
+            )
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET owner = '', attempts = attempts - 1 WHERE id = ? AND owner = ?",
+                (job_id, self.owner)
+            )
+
+    def heartbeat(self) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO workers (owner, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT (owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (self.owner, time.time())
+            )
+
+    def claim_orphans(self, stale_after_seconds: float) -> List[JobRecord]:
+        cutoff = time.time() - stale_after_seconds
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes never claim the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+                rows = self._connection.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE state NOT IN (?, ?) AND owner != ? AND owner NOT IN (SELECT owner FROM workers)
+                    """,
+                    (*FINISHED_STATES, self.owner)
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE jobs SET owner = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(self.owner, time.time(), row['id']) for row in rows]
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        records = [self._to_record(row) for row in rows]
+        for record in records:
+            record.attempts += 1
+        return records
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (*FINISHED_STATES, time.time() - older_than_seconds)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._connection.execute("SELECT state, COUNT(*) AS count FROM jobs GROUP BY state").fetchall()
+        return {row['state']: row['count'] for row in rows}
+
+
+class JobRecovery:
+    """
+    Keeps this process's heartbeat fresh and re-drives jobs orphaned by a crashed or recycled worker.
+
+    Jobs that have already been attempted max_attempts times are handed to abandon instead of
+    being retried forever.
+    """
+
+    def __init__(
+            self,
+            job_store: JobStore,
+            resubmit: Callable[[JobRecord], None],
+            abandon: Callable[[JobRecord], None],
+            interval_seconds: float = 30,
+            stale_after_seconds: float = 120,
+            max_attempts: int = 3,
+            retention_seconds: float = 7 * 24 * 3600
+    ):
+        self.job_store = job_store
+        self.resubmit = resubmit
+        self.abandon = abandon
+        self.interval_seconds = interval_seconds
+        self.stale_after_seconds = stale_after_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.logger = setup_logger(__name__)
+        self.recovered = 0
+        self.abandoned = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        purged = self.job_store.purge_finished(self.retention_seconds)
+        if purged:
+            self.logger.info(f"Purged {purged} finished jobs")
+        self._thread = threading.Thread(target=self._run, name="job-recovery", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.job_store.heartbeat()
+                self.recover()
+            except Exception as e:
+                self.logger.error(f"Job recovery pass failed: {str(e)}")
+            if self._stop.wait(self.interval_seconds):
+                return
+
+    def recover(self):
+        for record in self.job_store.claim_orphans(self.stale_after_seconds):
+            try:
+                if record.attempts > self.max_attempts:
+                    self.logger.warning(f"Abandoning job {record.id} after {record.attempts - 1} attempts")
+                    self.abandoned += 1
+                    self.abandon(record)
+                else:
+                    self.logger.info(f"Resuming job {record.id} from state {record.state.value}")
+                    self.recovered += 1
+                    self.resubmit(record)
+            except Exception as e:
+                # Leave it for the next pass, here or in another process
+                self.logger.error(f"Could not resume job {record.id}: {str(e)}")
+                self.job_store.release(record.id)
+
+    def stats(self) -> Dict:
+        return {
+            "owner": self.job_store.owner,
+            "recovered": self.recovered,
+            "abandoned": self.abandoned,
+            "jobs": self.job_store.stats()
+        }
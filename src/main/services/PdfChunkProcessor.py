@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from ..logs.logger import setup_logger
+from ..models.dto.request.ChunkingOptions import ChunkingOptions
+from ..utils.file_utils import FileContent, as_stream
+from ..utils import json_codec
+from ..utils.json_stream import JsonText, as_json_text
+
+# Signature shared by AnthropicClient.process_file and GeminiClient.process_file
+ModelFunction = Callable[..., str]
+AsyncModelFunction = Callable[..., Awaitable[str]]
+
+
+def build_chunk_prompt(prompt: str, first_page: int, last_page: int, total_pages: int) -> str:
+    return (
+        f"{prompt}\n\n"
+        f"This document contains pages {first_page}-{last_page} of a {total_pages}-page document. "
+        f"Extract only what appears on these pages."
+    )
+
+
+def merge_chunk_results(results: List[Any], logger=None) -> Any:
+    """
+    Merge per-chunk JSON results into a single document.
+
+    Lists (e.g. line items) are concatenated in page order, nested objects are merged
+    recursively and scalar header fields take the first non-empty value.
+    """
+    merged = results[0]
+    for result in results[1:]:
+        merged = _merge_values(merged, result, "", logger)
+    return merged
+
+
+def _merge_values(left: Any, right: Any, path: str, logger) -> Any:
+    if isinstance(left, list) and isinstance(right, list):
+        return left + right
+
+    if isinstance(left, dict) and isinstance(right, dict):
+        merged = dict(left)
+        for key, value in right.items():
+            merged[key] = _merge_values(merged[key], value, f"{path}.{key}", logger) if key in merged else value
+        return merged
+
+    if left in (None, "", [], {}):
+        return right
+    if right in (None, "", [], {}):
+        return left
+
+    if left != right and logger is not None:
+        logger.warning(f"Conflicting values for '{path.lstrip('.')}' across chunks, keeping {left!r} over {right!r}")
+    return left
+
+
+class PdfChunkProcessor:
+    """
+    Splits large PDFs into page ranges, sends the ranges to the model concurrently and
+    merges the per-chunk JSON back into a single result.
+
+    Concurrency against the provider is still bounded by the client's rate governor.
+    """
+
+    def __init__(self):
+        self.logger = setup_logger(__name__)
+
+    def split_pdf(self, file_content: FileContent, pages_per_chunk: int) -> Tuple[List[Tuple[int, int, bytes]], int]:
+        """
+        Returns:
+            Tuple of ([(first page, last page, chunk PDF bytes), ...], total pages), pages 1-indexed
+        """
+        # pypdf is only needed once a document is actually chunked, so it is not loaded at startup
+        from pypdf import PdfReader, PdfWriter
+
+        reader = PdfReader(as_stream(file_content))
+        total_pages = len(reader.pages)
+
+        chunks = []
+        for start in range(0, total_pages, pages_per_chunk):
+            end = min(start + pages_per_chunk, total_pages)
+            writer = PdfWriter()
+            for page_index in range(start, end):
+                writer.add_page(reader.pages[page_index])
+            buffer = BytesIO()
+            writer.write(buffer)
+            chunks.append((start + 1, end, buffer.getvalue()))
+
+        return chunks, total_pages
+
+    def _plan(self, file_name: str, file_content: FileContent, prompt: str, options: ChunkingOptions):
+        chunks, total_pages = self.split_pdf(file_content, options.pages_per_chunk)
+        stem, extension = os.path.splitext(file_name)
+        self.logger.info(f"Split {file_name} ({total_pages} pages) into {len(chunks)} chunks")
+        return [
+            (
+                f"{stem}.pages-{first}-{last}{extension}",
+                chunk,
+                build_chunk_prompt(prompt, first, last, total_pages)
+            )
+            for first, last, chunk in chunks
+        ]
+
+    def _merge(self, file_name: str, responses: List[str]) -> JsonText:
+        # Clients return JsonText, so chunks only need parsing when they came back from the cache
+        parsed = [as_json_text(response).parsed for response in responses]
+        merged = merge_chunk_results(parsed, self.logger)
+        self.logger.info(f"Merged {len(responses)} chunk results for {file_name}")
+        return JsonText(json_codec.dumps(merged).decode('utf-8'), merged)
+
+    @staticmethod
+    def _should_chunk(file_name: str, options: ChunkingOptions) -> bool:
+        return options is not None and file_name.lower().endswith('.pdf')
+
+    def process_file(
+            self,
+            model_function: ModelFunction,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            options: ChunkingOptions
+    ) -> str:
+        """
+        Process a PDF in page-range chunks, or in one call if it is not a PDF or fits in one chunk
+        """
+        if not self._should_chunk(file_name, options):
+            return model_function(file_name=file_name, file_content=file_content, prompt=prompt)
+
+        plan = self._plan(file_name, file_content, prompt, options)
+        if len(plan) == 1:
+            return model_function(file_name=file_name, file_content=file_content, prompt=prompt)
+
+        # Each chunk runs in its own copy of the job's context so its stages are attributed to the job
+        contexts = [contextvars.copy_context() for _ in plan]
+        with ThreadPoolExecutor(max_workers=options.max_parallelism) as executor:
+            responses = list(executor.map(
+                lambda context, part: context.run(
+                    model_function, file_name=part[0], file_content=part[1], prompt=part[2]),
+                contexts,
+                plan
+            ))
+        return self._merge(file_name, responses)
+
+    async def process_file_async(
+            self,
+            model_function: AsyncModelFunction,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            options: ChunkingOptions
+    ) -> str:
+        """
+        Asyncio variant of process_file
+        """
+        if not self._should_chunk(file_name, options):
+            return await model_function(file_name=file_name, file_content=file_content, prompt=prompt)
+
+        # Splitting is CPU bound, keep it off the event loop
+        plan = await asyncio.to_thread(self._plan, file_name, file_content, prompt, options)
+        if len(plan) == 1:
+            return await model_function(file_name=file_name, file_content=file_content, prompt=prompt)
+
+        slots = asyncio.Semaphore(options.max_parallelism)
+
+        async def process_part(part):
+            async with slots:
+                return await model_function(file_name=part[0], file_content=part[1], prompt=part[2])
+
+        responses = await asyncio.gather(*(process_part(part) for part in plan))
+        return self._merge(file_name, list(responses))
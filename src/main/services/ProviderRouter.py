@@ -0,0 +1,349 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, read_all
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures so a degraded provider is skipped instead of waited on.
+
+    After open_seconds the breaker turns half-open and lets calls through again; the next
+    outcome either closes it or re-opens it for another period.
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 60):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+            return self._state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+
+class ProviderStats:
+    """
+    Rolling latency and error window for one provider
+    """
+
+    def __init__(self, window_size: int = 100):
+        self._lock = threading.Lock()
+        # (latency seconds, succeeded)
+        self._window: Deque[Tuple[float, bool]] = deque(maxlen=window_size)
+
+    def record(self, latency: float, succeeded: bool):
+        with self._lock:
+            self._window.append((latency, succeeded))
+
+    def latency_quantile(self, quantile: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(latency for latency, succeeded in self._window if succeeded)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(int(len(latencies) * quantile), len(latencies) - 1)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            window = list(self._window)
+        latencies = sorted(latency for latency, succeeded in window if succeeded)
+        errors = sum(1 for _, succeeded in window if not succeeded)
+
+        def quantile(q: float) -> Optional[float]:
+            return latencies[min(int(len(latencies) * q), len(latencies) - 1)] if latencies else None
+
+        return {
+            "samples": len(window),
+            "error_rate": errors / len(window) if window else 0.0,
+            "latency_p50_seconds": quantile(0.5),
+            "latency_p95_seconds": quantile(0.95)
+        }
+
+
+class ProviderRouter:
+    """
+    Sends each document to the preferred healthy provider and fails over to the next one on errors.
+
+    With hedging on, a second provider is started once the first has taken longer than its
+    recent p95 latency, and whichever returns valid JSON first wins.
+    """
+
+    def __init__(
+            self,
+            clients: Dict[str, Callable[[], Any]],
+            order: List[str],
+            failover: bool = True,
+            window_size: int = 100,
+            failure_threshold: int = 5,
+            open_seconds: float = 60,
+            hedging: bool = False,
+            hedge_quantile: float = 0.95,
+            hedge_min_samples: int = 20,
+            hedge_default_delay_seconds: float = 30,
+            hedge_min_delay_seconds: float = 2,
+            hedge_workers: int = 16
+    ):
+        # provider -> callable returning its client, so a client is only built once it is needed
+        self.clients = clients
+        self.order = [name for name in order if name in clients]
+        self.failover = failover
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay_seconds = hedge_default_delay_seconds
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self.logger = setup_logger(__name__)
+        self.breakers = {name: CircuitBreaker(failure_threshold, open_seconds) for name in self.order}
+        self.provider_stats = {name: ProviderStats(window_size) for name in self.order}
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._failovers = 0
+        self._counter_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers) if hedging else None
+
+    def _candidates(self, preferred: Optional[str]) -> List[str]:
+        order = list(self.order)
+        if preferred:
+            preferred = preferred.lower()
+            if preferred in order:
+                order.remove(preferred)
+                order.insert(0, preferred)
+            else:
+                self.logger.warning(f"Unknown provider '{preferred}' requested, using default order")
+
+        if not self.failover:
+            order = order[:1]
+
+        available = [name for name in order if self.breakers[name].allow()]
+        if not available:
+            # Every breaker is open; trying the preferred provider beats failing outright
+            self.logger.warning(f"All provider circuits are open, trying {order[0]}")
+            return order[:1]
+        return available
+
+    def _hedge_delay(self, provider: str) -> float:
+        delay = self.provider_stats[provider].latency_quantile(self.hedge_quantile, self.hedge_min_samples)
+        if delay is None:
+            delay = self.hedge_default_delay_seconds
+        return max(delay, self.hedge_min_delay_seconds)
+
+    def _count(self, counter: str):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _call(self, provider: str, file_name: str, file_content: FileContent, prompt: str) -> str:
+        # Resolved outside the timing: the first call builds the client and imports its SDK
+        client = self.clients[provider]()
+        start_time = time.time()
+        try:
+            response = client.process_file(
+                file_name=file_name,
+                file_content=file_content,
+                prompt=prompt
+            )
+        except ValueError:
+            # Unsupported input fails on every provider, so it is not held against this one
+            raise
+        except Exception:
+            self._record(provider, time.time() - start_time, False)
+            raise
+        self._record(provider, time.time() - start_time, True)
+        return response
+
+    async def _call_async(self, provider: str, file_name: str, file_content: FileContent, prompt: str) -> str:
+        client = self.clients[provider]()
+        start_time = time.time()
+        try:
+            response = await client.process_file_async(
+                file_name=file_name,
+                file_content=file_content,
+                prompt=prompt
+            )
+        except (asyncio.CancelledError, ValueError):
+            # Neither a lost hedge race nor unsupported input says anything about the provider's health
+            raise
+        except Exception:
+            self._record(provider, time.time() - start_time, False)
+            raise
+        self._record(provider, time.time() - start_time, True)
+        return response
+
+    def _record(self, provider: str, latency: float, succeeded: bool):
+        self.provider_stats[provider].record(latency, succeeded)
+        if succeeded:
+            self.breakers[provider].record_success()
+        else:
+            self.breakers[provider].record_failure()
+
+    def process_file(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            preferred: Optional[str] = None
+    ) -> str:
+        """
+        Process a document on the best available provider; same contract as the clients' process_file
+        """
+        candidates = self._candidates(preferred)
+        if self.hedging and len(candidates) > 1:
+            return self._process_hedged(candidates, file_name, file_content, prompt)
+
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(candidates):
+            if index > 0:
+                self._count('_failovers')
+                self.logger.warning(f"Failing over {file_name} to {provider}")
+            try:
+                return self._call(provider, file_name, file_content, prompt)
+            except ValueError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Provider {provider} failed for {file_name}: {str(e)}")
+                last_error = e
+        raise last_error
+
+    def _process_hedged(self, candidates: List[str], file_name: str, file_content: FileContent, prompt: str) -> str:
+        # Both providers may read the document at once, so they get immutable bytes, not a shared stream
+        content = read_all(file_content)
+        primary, remaining = candidates[0], candidates[1:]
+
+        # Hedged calls run on pool threads; carry the job's context so their stages keep its tenant and span
+        futures = {
+            self._executor.submit(contextvars.copy_context().run, self._call, primary, file_name, content, prompt): primary
+        }
+        done, _ = wait(futures, timeout=self._hedge_delay(primary))
+        last_error: Optional[Exception] = None
+
+        while True:
+            for future in done:
+                provider = futures.pop(future)
+                if future.exception() is None:
+                    if provider != primary:
+                        self._count('_hedge_wins')
+                    return future.result()
+                last_error = future.exception()
+                if isinstance(last_error, ValueError):
+                    raise last_error
+                self.logger.error(f"Provider {provider} failed for {file_name}: {str(last_error)}")
+
+            # Start the next provider when the running one is slow or has failed
+            if remaining and (not done or not futures):
+                provider = remaining.pop(0)
+                self._count('_hedges' if futures else '_failovers')
+                self.logger.info(f"Hedging {file_name} on {provider}" if futures else f"Failing over {file_name} to {provider}")
+                future = self._executor.submit(
+                    contextvars.copy_context().run, self._call, provider, file_name, content, prompt)
+                futures[future] = provider
+
+            if not futures:
+                raise last_error
+            timeout = self._hedge_delay(primary) if remaining else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+    async def process_file_async(
+            self,
+            file_name: str,
+            file_content: FileContent,
+            prompt: str,
+            preferred: Optional[str] = None
+    ) -> str:
+        """
+        Asyncio variant of process_file; a losing hedge is cancelled rather than left running
+        """
+        candidates = self._candidates(preferred)
+        if not (self.hedging and len(candidates) > 1):
+            last_error: Optional[Exception] = None
+            for index, provider in enumerate(candidates):
+                if index > 0:
+                    self._count('_failovers')
+                    self.logger.warning(f"Failing over {file_name} to {provider}")
+                try:
+                    return await self._call_async(provider, file_name, file_content, prompt)
+                except ValueError:
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Provider {provider} failed for {file_name}: {str(e)}")
+                    last_error = e
+            raise last_error
+
+        content = read_all(file_content)
+        primary, remaining = candidates[0], candidates[1:]
+        tasks = {asyncio.ensure_future(self._call_async(primary, file_name, content, prompt)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+        last_error = None
+
+        try:
+            while True:
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        if provider != primary:
+                            self._count('_hedge_wins')
+                        return task.result()
+                    last_error = task.exception()
+                    if isinstance(last_error, ValueError):
+                        raise last_error
+                    self.logger.error(f"Provider {provider} failed for {file_name}: {str(last_error)}")
+
+                if remaining and (not done or not tasks):
+                    provider = remaining.pop(0)
+                    self._count('_hedges' if tasks else '_failovers')
+                    self.logger.info(f"Hedging {file_name} on {provider}" if tasks else f"Failing over {file_name} to {provider}")
+                    tasks[asyncio.ensure_future(self._call_async(provider, file_name, content, prompt))] = provider
+
+                if not tasks:
+                    raise last_error
+                timeout = self._hedge_delay(primary) if remaining else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        with self._counter_lock:
+            counters = {"hedges": self._hedges, "hedge_wins": self._hedge_wins, "failovers": self._failovers}
+        return {
+            **counters,
+            "hedging": self.hedging,
+            "providers": {
+                name: {
+                    "circuit": self.breakers[name].state,
+                    "hedge_delay_seconds": self._hedge_delay(name),
+                    **self.provider_stats[name].stats()
+                }
+                for name in self.order
+            }
+        }
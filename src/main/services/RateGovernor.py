@@ -0,0 +1,351 @@
+import asyncio
+import fcntl
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, iter_chunks, stream_size
+
+# Rough per-unit input token costs used to budget a request before it is sent
+TOKENS_PER_PDF_PAGE = 2000
+TOKENS_PER_IMAGE = 1600
+BYTES_PER_TOKEN = 4
+
+SLOT_POLL_INTERVAL_SECONDS = 0.05
+
+PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+PDF_PAGE_MATCH_OVERLAP = 64
+
+
+def count_pdf_pages(file_content: FileContent) -> int:
+    """
+    Count page objects in a PDF by scanning it in chunks, without loading it whole
+    """
+    pages = 0
+    tail = b''
+    for chunk in iter_chunks(file_content):
+        window = tail + chunk
+        # Matches ending before the tail were counted last round, and matches touching the end of
+        # the window are deferred because the next byte may turn '/Page' into '/Pages'
+        pages += sum(
+            1 for match in PDF_PAGE_PATTERN.finditer(window)
+            if len(tail) <= match.end() < len(window)
+        )
+        tail = window[-PDF_PAGE_MATCH_OVERLAP:]
+    pages += sum(1 for match in PDF_PAGE_PATTERN.finditer(tail) if match.end() == len(tail))
+    return pages
+
+
+def estimate_input_tokens(file_content: FileContent, mime_type: str, prompt: str = "") -> int:
+    """
+    Estimate the input tokens a document will cost without calling the provider
+
+    PDFs are costed by page count, images at a flat per-image rate, anything else by size.
+    """
+    prompt_tokens = len(prompt) // BYTES_PER_TOKEN
+
+    if mime_type == 'application/pdf':
+        pages = count_pdf_pages(file_content)
+        if pages:
+            return pages * TOKENS_PER_PDF_PAGE + prompt_tokens
+
+    if mime_type.startswith('image/'):
+        return TOKENS_PER_IMAGE + prompt_tokens
+
+    return stream_size(file_content) // BYTES_PER_TOKEN + prompt_tokens
+
+
+def estimate_image_input_tokens(image_count: int, prompt: str = "") -> int:
+    """
+    Estimate the input tokens for a request made of already-preprocessed images
+    """
+    return image_count * TOKENS_PER_IMAGE + len(prompt) // BYTES_PER_TOKEN
+
+
+def estimate_text_input_tokens(text: str, prompt: str = "") -> int:
+    """
+    Estimate the input tokens for a request that sends a document's text instead of the document
+    """
+    return (len(text) + len(prompt)) // BYTES_PER_TOKEN
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at capacity-per-minute
+    """
+
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = float(capacity_per_minute)
+        self.available = float(capacity_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.capacity / 60.0)
+        self._updated_at = now
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            self._refill()
+            yield
+
+    def level(self) -> float:
+        with self._locked():
+            return self.available
+
+    def try_consume(self, amount: float) -> float:
+        """
+        Consume amount if available
+
+        Returns:
+            0 if the tokens were consumed, otherwise the seconds to wait before retrying
+        """
+        with self._locked():
+            # Never ask for more than a full bucket, or the request could never be admitted
+            amount = min(amount, self.capacity)
+            if self.available >= amount:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) * 60.0 / self.capacity
+
+    def adjust(self, delta: float):
+        """
+        Return (positive) or charge (negative) tokens after the real cost is known
+        """
+        with self._locked():
+            self.available = min(self.capacity, self.available + delta)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]):
+        """
+        Align the bucket with limits reported by the provider
+        """
+        with self._locked():
+            if limit:
+                self.capacity = float(limit)
+            if remaining is not None:
+                self.available = min(self.available, float(remaining), self.capacity)
+
+    def drain_for(self, seconds: float):
+        """
+        Empty the bucket so that it only refills after the given number of seconds
+        """
+        with self._locked():
+            self.available = -seconds * self.capacity / 60.0
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket kept in a file so that every worker process of a server draws on one budget
+
+    Each call reads the level under an exclusive flock, refills it and writes it back. The
+    monotonic clock is system-wide on Linux, so workers agree on how long the bucket has refilled.
+    The first worker to touch the file starts it from a full bucket.
+    """
+
+    STATE = struct.Struct('ddd')
+
+    def __init__(self, path: str, capacity_per_minute: int):
+        super().__init__(capacity_per_minute)
+        self.path = path
+        self._fd: Optional[int] = None
+        self._fd_pid: Optional[int] = None
+
+    def _file(self) -> int:
+        # A descriptor inherited across fork would share its flock with the parent
+        if self._fd_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = os.pread(fd, self.STATE.size, 0)
+                if len(state) == self.STATE.size:
+                    self.capacity, self.available, self._updated_at = self.STATE.unpack(state)
+                self._refill()
+                yield
+                os.pwrite(fd, self.STATE.pack(self.capacity, self.available, self._updated_at), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class RateGovernor:
+    """
+    Admission control for one LLM provider within one server.
+
+    Enforces requests-per-minute and input-tokens-per-minute budgets before dispatch, so callers
+    queue locally instead of all hitting 429 together. With a shared directory the budgets live in
+    bucket files drawn on by every worker process of the server; without one each worker gets the
+    full budgets, which multiplies them by the worker count. The concurrency cap is per worker.
+    """
+
+    def __init__(
+            self,
+            provider: str,
+            max_concurrency: int = 8,
+            requests_per_minute: int = 50,
+            input_tokens_per_minute: int = 40000,
+            shared_directory: Optional[str] = None
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.logger = setup_logger(__name__)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.requests = self._bucket(shared_directory, "requests", requests_per_minute)
+        self.input_tokens = self._bucket(shared_directory, "input-tokens", input_tokens_per_minute)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.throttled_seconds = 0.0
+
+    def _bucket(self, shared_directory: Optional[str], name: str, capacity_per_minute: int) -> TokenBucket:
+        if not shared_directory:
+            return TokenBucket(capacity_per_minute)
+        # Workers share their master's pid, so servers started from the same directory stay apart
+        path = os.path.join(shared_directory, str(os.getppid()), f"{self.provider}-{name}.bucket")
+        return SharedTokenBucket(path, capacity_per_minute)
+
+    def _try_budget(self, estimated_tokens: int) -> float:
+        """
+        Take one request and the estimated tokens from the budgets
+
+        Returns:
+            0 if admitted, otherwise the seconds to wait before trying again
+        """
+        wait = self.requests.try_consume(1)
+        if wait == 0:
+            wait = self.input_tokens.try_consume(estimated_tokens)
+            if wait == 0:
+                return 0.0
+            # Give the request token back while we wait on the token budget
+            self.requests.adjust(1)
+
+        with self._lock:
+            self.throttled_seconds += wait
+        return wait
+
+    @contextmanager
+    def _track_in_flight(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @contextmanager
+    def acquire(self, estimated_tokens: int):
+        """
+        Block until rate budget and a concurrency slot are available for one request
+
+        The budget is waited on first, so a request sleeping on it does not hold a slot.
+        """
+        while (wait := self._try_budget(estimated_tokens)) > 0:
+            time.sleep(wait)
+        self._slots.acquire()
+        try:
+            with self._track_in_flight():
+                yield
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def acquire_async(self, estimated_tokens: int):
+        """
+        Asyncio variant of acquire that waits without blocking the event loop
+        """
+        while (wait := self._try_budget(estimated_tokens)) > 0:
+            await asyncio.sleep(wait)
+        # The slots are shared with threaded callers, so poll rather than block on the semaphore
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_INTERVAL_SECONDS)
+        try:
+            with self._track_in_flight():
+                yield
+        finally:
+            self._slots.release()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        Correct the token budget once the provider reports the real input token count
+        """
+        if actual_tokens is not None:
+            self.input_tokens.adjust(estimated_tokens - actual_tokens)
+
+    def penalize(self, retry_after: Optional[float]):
+        """
+        Pause admissions after the provider rejected a request with a rate limit error
+        """
+        seconds = retry_after if retry_after is not None else 60.0
+        self.logger.warning(f"{self.provider} rate limited, pausing admissions for {seconds:.1f}s")
+        self.requests.drain_for(seconds)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """
+        Self-tune the budgets from the provider's rate-limit response headers
+        """
+        prefix = f"{self.provider}-ratelimit"
+        self.requests.sync(
+            _as_float(headers.get(f"{prefix}-requests-limit")),
+            _as_float(headers.get(f"{prefix}-requests-remaining"))
+        )
+        self.input_tokens.sync(
+            _as_float(headers.get(f"{prefix}-input-tokens-limit")),
+            _as_float(headers.get(f"{prefix}-input-tokens-remaining"))
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "requests_available": self.requests.level(),
+                "input_tokens_available": self.input_tokens.level(),
+                "throttled_seconds": self.throttled_seconds
+            }
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either as delay seconds or as an HTTP-date (RFC 9110)
+    """
+    if not headers:
+        return None
+
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+
+    seconds = _as_float(value)
+    if seconds is not None:
+        return seconds
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # HTTP-dates are always GMT; a "-0000" zone parses as naive
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _as_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
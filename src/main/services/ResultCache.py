@@ -0,0 +1,198 @@
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import storage
+
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, iter_chunks
+
+
+def build_cache_key(file_content: FileContent, prompt: str, provider: str, model: str) -> str:
+    """
+    Build a content-addressed cache key for a parse result
+
+    Args:
+        file_content: The document, as bytes or a seekable binary stream
+        prompt: The extraction prompt sent with the document
+        provider: The LLM provider name (e.g. 'anthropic', 'gemini')
+        model: The model identifier used for the call
+
+    Returns:
+        Hex encoded SHA-256 digest of all inputs
+    """
+    digest = hashlib.sha256()
+    for part in (provider.encode(), model.encode(), prompt.encode()):
+        # Length-prefix each field so that ('ab', 'c') and ('a', 'bc') never collide
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    for chunk in iter_chunks(file_content):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """
+    Interface for a parse-result cache tier
+    """
+
+    name: str = "backend"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with entry count, byte size and TTL eviction.
+
+    Results vary from a few hundred bytes to megabytes, so the entry count alone does not bound
+    the memory a worker spends on the cache; max_bytes caps the UTF-8 size of the cached values.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 86400, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key -> (expires at, value, size in bytes)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            # A result bigger than the whole budget would only evict everything else
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class GCSCacheBackend(CacheBackend):
+    """
+    Cache tier persisted as JSON objects in a GCS bucket, shared across instances
+    """
+
+    name = "gcs"
+
+    def __init__(self, bucket: storage.Bucket, prefix: str = "cache/parse-results", ttl_seconds: int = 86400):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self.ttl_seconds = ttl_seconds
+        self.logger = setup_logger(__name__)
+
+    def _blob_name(self, key: str) -> str:
+        return f"{self.prefix}/{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        blob = self.bucket.blob(self._blob_name(key))
+        try:
+            payload = json.loads(blob.download_as_bytes())
+        except Exception as e:
+            # A missing object raises NotFound, which is the common case for a miss
+            self.logger.debug(f"GCS cache lookup failed for {key}: {str(e)}")
+            return None
+
+        if payload.get('created_at', 0) + self.ttl_seconds < time.time():
+            return None
+
+        return payload.get('value')
+
+    def set(self, key: str, value: str) -> None:
+        blob = self.bucket.blob(self._blob_name(key))
+        try:
+            blob.upload_from_string(
+                json.dumps({'created_at': time.time(), 'value': value}),
+                content_type='application/json'
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not write parse result {key} to GCS cache: {str(e)}")
+
+
+class ResultCache:
+    """
+    Tiered parse-result cache consulted before every LLM call.
+
+    Tiers are checked in order; a hit in a slower tier is written back to the faster ones.
+    """
+
+    def __init__(self, backends: List[CacheBackend]):
+        self.backends = backends
+        self.logger = setup_logger(__name__)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits: Dict[str, int] = {backend.name: 0 for backend in backends}
+
+    def get(self, key: str) -> Optional[str]:
+        for index, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is None:
+                continue
+
+            for faster_backend in self.backends[:index]:
+                faster_backend.set(key, value)
+
+            with self._lock:
+                self.hits += 1
+                self.tier_hits[backend.name] += 1
+            self.logger.info(f"Parse result cache hit in {backend.name} tier for key {key[:12]}")
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        for backend in self.backends:
+            backend.set(key, value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "tier_hits": dict(self.tier_hits)
+            }
@@ -0,0 +1,77 @@
+import threading
+from typing import Any, Dict, Optional
+
+from ..logs.logger import setup_logger
+from ..models.dto.response.Invoice import Invoice, ResultSchemaError
+from ..models.enum.DocumentType import DocumentType
+from ..utils.json_stream import JsonText, as_json_text
+from ..utils.telemetry import telemetry
+
+# Typed models for the document types that have a fixed schema; other types pass unchecked
+SCHEMAS = {
+    DocumentType.INVOICE.value: Invoice
+}
+
+MODES = ('off', 'warn', 'strict')
+
+
+class ResultValidator:
+    """
+    Checks parsed model output against the typed schema of its document type.
+
+    In "warn" mode mismatches are logged and counted, in "strict" mode they fail the job so the
+    callback carries the error instead of the result.
+    """
+
+    def __init__(self, mode: str = 'warn'):
+        if mode not in MODES:
+            raise ValueError(f"Schema validation mode must be one of {MODES}, not {mode!r}")
+        self.logger = setup_logger(__name__)
+        self.mode = mode
+        self.valid = 0
+        self.invalid = 0
+        self.unchecked = 0
+        self._lock = threading.Lock()
+
+    def validate(self, document_type: Any, result: Optional[str]) -> Optional[JsonText]:
+        """
+        Returns:
+            The result as JsonText, parsed at most once on the way
+
+        Raises:
+            ResultSchemaError: In strict mode, if the result does not match its schema
+        """
+        if result is None:
+            return None
+        result = as_json_text(result)
+        if self.mode == 'off':
+            return result
+
+        schema = SCHEMAS.get(document_type.value if isinstance(document_type, DocumentType) else document_type)
+        if schema is None:
+            with self._lock:
+                self.unchecked += 1
+            return result
+
+        try:
+            with telemetry.stage('schema_validation'):
+                schema.from_dict(result.parsed)
+        except ResultSchemaError as e:
+            with self._lock:
+                self.invalid += 1
+            if self.mode == 'strict':
+                raise
+            self.logger.warning(f"Result does not match the {document_type} schema: {str(e)}")
+        else:
+            with self._lock:
+                self.valid += 1
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "valid": self.valid,
+                "invalid": self.invalid,
+                "unchecked": self.unchecked
+            }
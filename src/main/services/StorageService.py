@@ -1,66 +1,267 @@
-from io import BytesIO
-from typing import List, Tuple, Union
+import asyncio
+import base64
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import BinaryIO, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
 
-import requests
+import google_crc32c
+import httpx
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 from werkzeug.utils import secure_filename
 
+from .UrlSigner import UrlSigner
 from ..logs.logger import setup_logger
+from ..utils.file_utils import (
+    DEFAULT_SPOOL_THRESHOLD_BYTES,
+    READ_CHUNK_SIZE,
+    FileContent,
+    as_stream,
+    iter_chunks,
+    new_spooled_buffer,
+    stream_size
+)
+from ..utils.request_utls import get_request_session
+from ..utils.telemetry import telemetry
+
+GCS_HOSTS = ('storage.googleapis.com', 'storage.cloud.google.com')
+
+# GCS composes at most this many source objects per request
+MAX_COMPOSE_SOURCES = 32
+# Resumable upload chunks must be a multiple of 256 KiB
+UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+
+
+class DownloadIntegrityError(Exception):
+    """
+    Raised when a downloaded object does not match the checksum GCS reports for it
+    """
+    pass
+
+
+class UploadIntegrityError(Exception):
+    """
+    Raised when an uploaded object's checksum does not match the bytes that were sent
+    """
+    pass
+
+
+class Crc32cReader:
+    """
+    Read-through wrapper that computes the CRC32C of a stream while it is being uploaded.
+
+    The upload library may seek back to resend a chunk after a transient error, so only bytes
+    past the furthest offset already hashed are added to the checksum.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._checksum = google_crc32c.Checksum()
+        self._hashed_to = 0
+
+    def read(self, size: int = -1) -> bytes:
+        position = self._stream.tell()
+        data = self._stream.read(size)
+        skip = max(self._hashed_to - position, 0)
+        if skip < len(data):
+            self._checksum.update(data[skip:])
+            self._hashed_to = position + len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+    @property
+    def crc32c(self) -> str:
+        """
+        Base64 CRC32C of everything read so far, in the format GCS reports
+        """
+        return base64.b64encode(self._checksum.digest()).decode('ascii')
 
 
 class StorageService:
-    def __init__(self, bucket_name: str):
+    def __init__(
+            self,
+            bucket_name: str,
+            spool_threshold_bytes: int = DEFAULT_SPOOL_THRESHOLD_BYTES,
+            download_chunk_size: int = 8 * 1024 * 1024,
+            download_max_workers: int = 8,
+            download_timeout: Tuple[float, float] = (10.0, 60.0),
+            upload_chunk_size: int = 8 * 1024 * 1024,
+            composite_threshold_bytes: int = 64 * 1024 * 1024,
+            composite_part_size: int = 32 * 1024 * 1024,
+            upload_max_workers: int = 4,
+            signed_url_cache_max_entries: int = 10000,
+            signed_url_min_remaining_seconds: float = 300,
+            signed_url_max_workers: int = 16,
+            signed_url_min_remaining_fraction: float = 0.8
+    ):
         self.storage_client = storage.Client()
         self.bucket = self.storage_client.bucket(bucket_name)
+        self.spool_threshold_bytes = spool_threshold_bytes
+        self.download_chunk_size = download_chunk_size
+        self.download_max_workers = download_max_workers
+        self.download_timeout = download_timeout
         self.logger = setup_logger(__name__)
+        # One pooled, retrying session for every download that is not served from our bucket
+        self.http_session = get_request_session(pool_maxsize=download_max_workers)
+        self._download_executor = ThreadPoolExecutor(max_workers=download_max_workers)
+        self.upload_chunk_size = max(upload_chunk_size // UPLOAD_CHUNK_ALIGNMENT, 1) * UPLOAD_CHUNK_ALIGNMENT
+        self.composite_threshold_bytes = composite_threshold_bytes
+        self.composite_part_size = composite_part_size
+        self.upload_max_workers = upload_max_workers
+        self._upload_executor = ThreadPoolExecutor(max_workers=upload_max_workers)
+        self.url_signer = UrlSigner(
+            self.bucket,
+            self.storage_client._credentials,
+            signed_url_cache_max_entries,
+            signed_url_min_remaining_seconds,
+            signed_url_max_workers,
+            signed_url_min_remaining_fraction
+        )
+
+    def upload_file(self, file_name: str, file_path: str, file: FileContent, expected_crc32c: Optional[str] = None) -> str:
+        """
+        Upload a file to GCS and return its GCS path.
+
+        Files up to composite_threshold_bytes go up as a chunked resumable upload, larger ones as
+        parallel parts composed into the final object. Either way the CRC32C is computed while
+        the data is read and checked against what GCS stored.
+
+        Args:
+            file_name: Name of the file; sanitized before use
+            file_path: Folder to upload into
+            file: The file content, as bytes or a seekable binary stream
+            expected_crc32c: Optional base64 CRC32C supplied by the sender
 
-    def upload_file(self, file_name: str, file_path: str, file: BytesIO) -> str:
-        """Upload files to GCS and return their GCS paths"""
+        Raises:
+            UploadIntegrityError: If the stored object does not match the data sent
+        """
 
         self.logger.info(f"Uploading file {file_name} to {file_path}")
         # Create a safe filename
         secure_file_name = secure_filename(file_name)
         filename = f"{file_path}/{secure_file_name}"
-        blob = self.bucket.blob(filename)
-        # Upload file
-        blob.upload_from_file(file)
+        size = stream_size(file)
+
+        with telemetry.stage('upload'):
+            if size > self.composite_threshold_bytes:
+                blob, crc32c = self._upload_composite(filename, as_stream(file), size)
+            else:
+                blob, crc32c = self._upload_resumable(filename, as_stream(file), size)
 
-        self.logger.info(f"File uploaded to {filename}")
+        if expected_crc32c is not None and expected_crc32c != crc32c:
+            blob.delete()
+            raise UploadIntegrityError(f"CRC32C of {filename} does not match the checksum supplied with it")
+
+        self.logger.info(f"File uploaded to {filename} ({size} bytes)")
         return f"{file_path}/{secure_file_name}"
 
-    def get_download_urls(self, filenames: List[str], expiration: int = 3600) -> List[str]:
-        """Generate signed URLs for downloading files"""
-        urls = []
-        for filename in filenames:
-            blob = self.bucket.blob(filename)
-            url = blob.generate_signed_url(
-                version="v4",
-                expiration=expiration,
-                method="GET"
-            )
-            urls.append(url)
-        return urls
+    def _check_upload(self, blob: storage.Blob, crc32c: str):
+        if blob.crc32c != crc32c:
+            blob.delete()
+            raise UploadIntegrityError(f"CRC32C mismatch after uploading {blob.name}")
 
+    def _upload_resumable(self, filename: str, stream: BinaryIO, size: int) -> Tuple[storage.Blob, str]:
+        # With chunk_size set the client uses a resumable session and retries failed chunks
+        # instead of restarting the whole upload
+        blob = self.bucket.blob(filename, chunk_size=self.upload_chunk_size)
+        reader = Crc32cReader(stream)
+        blob.upload_from_file(reader, size=size, checksum=None, retry=DEFAULT_RETRY)
+        self._check_upload(blob, reader.crc32c)
+        return blob, reader.crc32c
 
-    def download_from_signed_url(self, signed_url: str) -> BytesIO:
+    def _upload_composite(self, filename: str, stream: BinaryIO, size: int) -> Tuple[storage.Blob, str]:
+        """
+        Upload parts in parallel and compose them, reading the source once in order so the
+        whole-object CRC32C is computed on the way through
         """
-        Downloads a file from a signed URL and returns it as a BytesIO object.
+        prefix = f"_uploads/{uuid.uuid4().hex}"
+        checksum = google_crc32c.Checksum()
+        # Bounds how many parts are held in memory at once
+        slots = threading.Semaphore(self.upload_max_workers * 2)
+        parts: List[storage.Blob] = []
+        futures = []
+
+        def upload_part(part: storage.Blob, data: bytes):
+            try:
+                part.upload_from_string(data, checksum='crc32c', retry=DEFAULT_RETRY)
+            finally:
+                slots.release()
+
+        temporary: List[storage.Blob] = []
+        try:
+            for index in range((size + self.composite_part_size - 1) // self.composite_part_size):
+                slots.acquire()
+                data = stream.read(self.composite_part_size)
+                checksum.update(data)
+                part = self.bucket.blob(f"{prefix}/part-{index:05d}")
+                parts.append(part)
+                futures.append(self._upload_executor.submit(upload_part, part, data))
+
+            # result() re-raises the first failed part
+            for future in futures:
+                future.result()
+
+            blob = self._compose(filename, prefix, parts, temporary)
+        finally:
+            for future in futures:
+                future.cancel()
+            # A part still uploading would otherwise be recreated after its delete
+            wait(futures)
+            # Parts are scratch objects; a failed delete is left to the bucket lifecycle rules
+            self.bucket.delete_blobs(parts + temporary, on_error=lambda blob: None)
+
+        crc32c = base64.b64encode(checksum.digest()).decode('ascii')
+        self._check_upload(blob, crc32c)
+        self.logger.info(f"Composed {filename} from {len(parts)} parts")
+        return blob, crc32c
+
+    def _compose(self, filename: str, prefix: str, sources: List[storage.Blob], temporary: List[storage.Blob]) -> storage.Blob:
+        level = 0
+        # Compose in rounds of up to 32 sources until one round can produce the final object
+        while len(sources) > MAX_COMPOSE_SOURCES:
+            level += 1
+            intermediates = []
+            for index in range(0, len(sources), MAX_COMPOSE_SOURCES):
+                intermediate = self.bucket.blob(f"{prefix}/compose-{level}-{index // MAX_COMPOSE_SOURCES:05d}")
+                intermediate.compose(sources[index:index + MAX_COMPOSE_SOURCES], retry=DEFAULT_RETRY)
+                temporary.append(intermediate)
+                intermediates.append(intermediate)
+            sources = intermediates
+
+        blob = self.bucket.blob(filename)
+        blob.compose(sources, retry=DEFAULT_RETRY)
+        return blob
+
+    def get_download_urls(self, filenames: List[str], expiration: int = 3600) -> List[str]:
+        """Generate signed URLs for downloading files, reusing ones issued earlier that are not close to expiry"""
+        return self.url_signer.sign(filenames, expiration)
+
+    def download_from_signed_url(self, signed_url: str) -> BinaryIO:
+        """
+        Downloads a file from a signed URL into a buffer that spills to disk above
+        spool_threshold_bytes.
 
         Args:
             signed_url: The signed URL to download from
 
         Returns:
-            Tuple of (BytesIO object or error message, HTTP status code)
+            Seekable binary file positioned at the start; close it to release the temp file
         """
         # Stream the response to handle large files efficiently
-        response = requests.get(signed_url, stream=True)
+        response = self.http_session.get(signed_url, stream=True, timeout=self.download_timeout)
         response.raise_for_status()  # Raises an HTTPError for bad responses (4xx, 5xx)
 
-        # Create a BytesIO object to store the file data
-        file_data = BytesIO()
+        file_data = new_spooled_buffer(self.spool_threshold_bytes)
 
         # Stream the file in chunks to avoid memory issues
-        for chunk in response.iter_content(chunk_size=8192):
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
             if chunk:
                 file_data.write(chunk)
 
@@ -69,3 +270,122 @@ class StorageService:
 
         return file_data
 
+    async def download_from_signed_url_async(self, signed_url: str, http_client: httpx.AsyncClient) -> BinaryIO:
+        """
+        Asyncio variant of download_from_signed_url.
+
+        Args:
+            signed_url: The signed URL to download from
+            http_client: Shared client owned by the event loop the download runs on
+
+        Returns:
+            Seekable binary file positioned at the start; close it to release the temp file
+        """
+        file_data = new_spooled_buffer(self.spool_threshold_bytes)
+
+        async with http_client.stream("GET", signed_url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size=READ_CHUNK_SIZE):
+                file_data.write(chunk)
+
+        file_data.seek(0)
+        return file_data
+
+    def get_bucket_object_name(self, url: str) -> Optional[str]:
+        """
+        Return the object name if url (gs://, path-style or virtual-hosted GCS URL) points
+        into this service's bucket, otherwise None
+        """
+        parsed = urlparse(url)
+        path = unquote(parsed.path).lstrip('/')
+
+        if parsed.scheme == 'gs':
+            bucket_name, object_name = parsed.netloc, path
+        elif parsed.scheme == 'https' and parsed.netloc in GCS_HOSTS:
+            bucket_name, _, object_name = path.partition('/')
+        elif parsed.scheme == 'https' and parsed.netloc.endswith('.' + GCS_HOSTS[0]):
+            bucket_name, object_name = parsed.netloc[:-len('.' + GCS_HOSTS[0])], path
+        else:
+            return None
+
+        if bucket_name != self.bucket.name or not object_name:
+            return None
+        return object_name
+
+    def download(self, url: str) -> BinaryIO:
+        """
+        Download a document, reading through the GCS client when it lives in our bucket
+        and falling back to an HTTP download otherwise.
+
+        Returns:
+            Seekable binary file positioned at the start; close it to release the temp file
+        """
+        object_name = self.get_bucket_object_name(url)
+        with telemetry.stage('download'):
+            if object_name is not None:
+                return self.download_blob(object_name)
+            return self.download_from_signed_url(url)
+
+    async def download_async(self, url: str, http_client: httpx.AsyncClient) -> BinaryIO:
+        """
+        Asyncio variant of download
+        """
+        object_name = self.get_bucket_object_name(url)
+        with telemetry.stage('download'):
+            if object_name is not None:
+                # The GCS client is blocking, so run the ranged download on a worker thread
+                return await asyncio.to_thread(self.download_blob, object_name)
+            return await self.download_from_signed_url_async(url, http_client)
+
+    def download_blob(self, object_name: str) -> BinaryIO:
+        """
+        Download an object from the bucket with ranged, parallel chunk reads and verify
+        its CRC32C against the object metadata.
+
+        Args:
+            object_name: Name of the object in this service's bucket
+
+        Returns:
+            Seekable binary file positioned at the start; close it to release the temp file
+        """
+        blob = self.bucket.get_blob(object_name)
+        if blob is None:
+            raise FileNotFoundError(f"Object {object_name} not found in bucket {self.bucket.name}")
+
+        file_data = new_spooled_buffer(self.spool_threshold_bytes)
+
+        if blob.size <= self.download_chunk_size or blob.content_encoding == 'gzip':
+            # Small objects, and gzip-encoded ones that can't be range-read, go in one request
+            blob.download_to_file(file_data, checksum=None, timeout=self.download_timeout)
+        else:
+            self._download_ranges(blob, file_data)
+
+        self._verify_crc32c(blob, file_data)
+        file_data.seek(0)
+        self.logger.info(f"Downloaded {object_name} ({blob.size} bytes) directly from GCS")
+        return file_data
+
+    def _download_ranges(self, blob: storage.Blob, file_data: BinaryIO):
+        write_lock = threading.Lock()
+
+        def download_range(start: int):
+            end = min(start + self.download_chunk_size, blob.size) - 1
+            chunk = blob.download_as_bytes(start=start, end=end, checksum=None, timeout=self.download_timeout)
+            with write_lock:
+                file_data.seek(start)
+                file_data.write(chunk)
+
+        # list() drains the iterator so that the first failed range is re-raised here
+        list(self._download_executor.map(download_range, range(0, blob.size, self.download_chunk_size)))
+
+    def _verify_crc32c(self, blob: storage.Blob, file_data: BinaryIO):
+        # GCS checksums gzip-encoded objects as stored, but serves them decompressed
+        if not blob.crc32c or blob.content_encoding == 'gzip':
+            return
+
+        checksum = google_crc32c.Checksum()
+        for chunk in iter_chunks(file_data):
+            checksum.update(chunk)
+
+        if checksum.digest() != base64.b64decode(blob.crc32c):
+            raise DownloadIntegrityError(f"CRC32C mismatch for object {blob.name}")
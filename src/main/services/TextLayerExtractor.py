@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import unicodedata
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from ..logs.logger import setup_logger
+from ..utils.file_utils import FileContent, read_all
+from ..utils.process_pool import LazyProcessPoolExecutor
+
+# An embedded image at least this large on both sides is taken for a scanned page, whose text
+# layer (if any) is OCR output rather than the document's own text
+SCAN_MIN_IMAGE_SIDE = 1000
+# Extraction that runs words together yields tokens far longer than any real word or number
+MAX_TOKEN_CHARS = 40
+# Character categories that show up when a font has no usable Unicode mapping: unassigned,
+# private use, surrogates and control characters
+GARBAGE_CATEGORIES = ('Cn', 'Co', 'Cs', 'Cc')
+
+# Rejection reasons, also the keys of the fallback counters
+TOO_MANY_PAGES = 'too_many_pages'
+SCANNED = 'scanned'
+TOO_LITTLE_TEXT = 'too_little_text'
+LOW_QUALITY = 'low_quality'
+EXTRACTION_FAILED = 'extraction_failed'
+
+
+@dataclass
+class TextLayer:
+    pages: List[str]
+    # Share of characters and tokens that look like real text, between 0 and 1
+    quality: float
+
+    @property
+    def chars(self) -> int:
+        return sum(len(page) for page in self.pages)
+
+
+def text_quality(pages: List[str]) -> float:
+    """
+    The lower of the share of characters that are not mapping garbage and the share of tokens
+    short enough to be words, so both broken fonts and lost word spacing score low
+    """
+    text = '\n'.join(pages)
+    characters = [c for c in text if not c.isspace()]
+    if not characters:
+        return 0.0
+    garbage = sum(
+        1 for c in characters
+        if c == '\ufffd' or unicodedata.category(c) in GARBAGE_CATEGORIES
+    )
+    # pypdf writes a glyph it cannot map as (cid:123), about eight characters of garbage
+    garbage += 8 * text.count('(cid:')
+    tokens = text.split()
+    long_tokens = sum(1 for token in tokens if len(token) > MAX_TOKEN_CHARS)
+    return max(0.0, min(1 - garbage / len(characters), 1 - long_tokens / len(tokens)))
+
+
+def _has_page_sized_image(resources, depth: int = 0) -> bool:
+    """
+    Look for a scan among a page's image XObjects by their declared size, without decoding them
+    """
+    xobjects = resources.get('/XObject') if resources else None
+    if not xobjects or depth > 3:
+        return False
+    for reference in xobjects.get_object().values():
+        xobject = reference.get_object()
+        subtype = xobject.get('/Subtype')
+        if subtype == '/Image' and min(xobject.get('/Width', 0), xobject.get('/Height', 0)) >= SCAN_MIN_IMAGE_SIDE:
+            return True
+        if subtype == '/Form' and _has_page_sized_image(xobject.get('/Resources'), depth + 1):
+            return True
+    return False
+
+
+def extract_text_layer(
+        content: bytes,
+        max_pages: int,
+        min_chars_per_page: int,
+        layout: bool
+) -> Tuple[Optional[TextLayer], str]:
+    """
+    Extract the text of every page of a PDF and judge whether it can stand in for the document.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Returns:
+        Tuple of (the text layer, or None with the reason it cannot be used, the reason or 'ok')
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(content))
+    if len(reader.pages) > max_pages:
+        return None, TOO_MANY_PAGES
+
+    pages = []
+    for page in reader.pages:
+        if _has_page_sized_image(page.get('/Resources')):
+            return None, SCANNED
+        text = page.extract_text(extraction_mode='layout' if layout else 'plain') or ''
+        # Layout mode pads columns with spaces; the model needs the line structure, not the padding
+        lines = [line.rstrip() for line in text.splitlines()]
+        page_text = '\n'.join(line for line in lines if line)
+        # One page without text sends the whole document, so there is no use reading on
+        if len(page_text) < min_chars_per_page:
+            return None, TOO_LITTLE_TEXT
+        pages.append(page_text)
+
+    return TextLayer(pages, text_quality(pages)), 'ok'
+
+
+def format_text_layer(file_name: str, layer: TextLayer) -> str:
+    """
+    The text layer as the model sees it, one delimited block per page
+    """
+    pages = '\n'.join(
+        f'<page number="{number}">\n{text}\n</page>' for number, text in enumerate(layer.pages, start=1))
+    return (
+        f"The following is the text layer of {file_name}, extracted with its layout approximately "
+        f"preserved.\n<document>\n{pages}\n</document>"
+    )
+
+
+class TextLayerExtractor:
+    """
+    Decides whether a PDF is digitally generated with a clean text layer, in which case the
+    model is sent that text instead of the document. Text costs a fraction of the tokens and
+    latency of a document block; scans and PDFs with broken text fall back to the document.
+
+    Extraction runs in a process pool so it does not hold up request workers.
+    """
+
+    def __init__(
+            self,
+            min_quality: float = 0.95,
+            min_chars_per_page: int = 200,
+            max_pages: int = 20,
+            layout: bool = True,
+            max_workers: int = 2
+    ):
+        self.min_quality = min_quality
+        self.min_chars_per_page = min_chars_per_page
+        self.max_pages = max_pages
+        self.layout = layout
+        self.max_workers = max_workers
+        self.logger = setup_logger(__name__)
+        # Worker processes are only forked once a PDF arrives
+        self.executor = LazyProcessPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self.text_requests = 0
+        self.fallbacks: Dict[str, int] = {}
+        self.estimated_tokens_saved = 0
+
+    def _task_args(self, file_content: FileContent) -> tuple:
+        return read_all(file_content), self.max_pages, self.min_chars_per_page, self.layout
+
+    def _fallback(self, file_name: str, reason: str) -> None:
+        with self._lock:
+            self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+        self.logger.info(f"Sending {file_name} as a document, its text layer is not usable ({reason})")
+        return None
+
+    def _finalize(self, file_name: str, layer: Optional[TextLayer], reason: str) -> Optional[TextLayer]:
+        if layer is None:
+            return self._fallback(file_name, reason)
+        if layer.quality < self.min_quality:
+            self.logger.info(f"Text layer of {file_name} scored {layer.quality:.3f}, below {self.min_quality}")
+            return self._fallback(file_name, LOW_QUALITY)
+        return layer
+
+    def extract(self, file_name: str, file_content: FileContent) -> Optional[TextLayer]:
+        """
+        Returns:
+            The text layer of a PDF to send instead of the document, or None to send the document
+        """
+        try:
+            layer, reason = self.executor.submit(extract_text_layer, *self._task_args(file_content)).result()
+        except Exception as e:
+            self.logger.warning(f"Could not extract the text layer of {file_name}: {str(e)}")
+            return self._fallback(file_name, EXTRACTION_FAILED)
+        return self._finalize(file_name, layer, reason)
+
+    async def extract_async(self, file_name: str, file_content: FileContent) -> Optional[TextLayer]:
+        try:
+            layer, reason = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                extract_text_layer,
+                *self._task_args(file_content)
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not extract the text layer of {file_name}: {str(e)}")
+            return self._fallback(file_name, EXTRACTION_FAILED)
+        return self._finalize(file_name, layer, reason)
+
+    def record_savings(self, file_name: str, provider: str, document_tokens: int, text_tokens: int):
+        """
+        Report, per job, what sending the text layer saved over sending the document
+        """
+        saved = max(document_tokens - text_tokens, 0)
+        with self._lock:
+            self.text_requests += 1
+            self.estimated_tokens_saved += saved
+        self.logger.info(
+            f"Sent the text layer of {file_name} to {provider}: ~{text_tokens} input tokens instead of "
+            f"~{document_tokens}, saving ~{saved}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "text_requests": self.text_requests,
+                "document_fallbacks": dict(self.fallbacks),
+                "estimated_tokens_saved": self.estimated_tokens_saved
+            }
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from google.auth import credentials as auth_credentials
+from google.auth.transport import requests
+from google.cloud import storage
+from google.oauth2 import service_account
+
+from ..logs.logger import setup_logger
+
+
+class UrlSigner:
+    """
+    Issues V4 signed GET URLs for a bucket in bulk and reuses them while they still have most of
+    their lifetime left: at least min_remaining_fraction of the requested expiration, and never
+    less than min_remaining_seconds, so a caller is never handed a URL much shorter-lived than
+    it asked for.
+
+    With a service account key the URLs are signed locally. With metadata-server or other keyless
+    credentials every URL is an IAM signBlob call; those are issued in parallel with one shared
+    access token, since the IAM API has no batch form.
+    """
+
+    def __init__(
+            self,
+            bucket: storage.Bucket,
+            credentials: Optional[auth_credentials.Credentials],
+            cache_max_entries: int = 10000,
+            min_remaining_seconds: float = 300,
+            max_workers: int = 16,
+            min_remaining_fraction: float = 0.8
+    ):
+        self.bucket = bucket
+        self.credentials = credentials
+        self.cache_max_entries = cache_max_entries
+        self.min_remaining_seconds = min_remaining_seconds
+        self.min_remaining_fraction = min_remaining_fraction
+        self.logger = setup_logger(__name__)
+        self.signs_locally = isinstance(credentials, service_account.Credentials)
+        # (filename, expiration) -> (url, expires at in epoch seconds), least recently used first
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._executor = None if self.signs_locally else ThreadPoolExecutor(max_workers=max_workers)
+        self.hits = 0
+        self.signed = 0
+
+    def sign(self, filenames: List[str], expiration: int = 3600) -> List[str]:
+        """
+        Signed URLs for filenames, in the same order, each valid for up to expiration seconds
+        """
+        now = time.time()
+        min_remaining = max(self.min_remaining_seconds, self.min_remaining_fraction * expiration)
+        urls: Dict[str, str] = {}
+        with self._lock:
+            for filename in filenames:
+                cached = self._cache.get((filename, expiration))
+                if cached is not None and cached[1] - now >= min_remaining:
+                    self._cache.move_to_end((filename, expiration))
+                    urls[filename] = cached[0]
+                    self.hits += 1
+
+        missing = list(dict.fromkeys(filename for filename in filenames if filename not in urls))
+        if missing:
+            expires_at = time.time() + expiration
+            signed = self._sign_local(missing, expiration) if self.signs_locally else self._sign_remote(missing, expiration)
+            with self._lock:
+                for filename, url in zip(missing, signed):
+                    self._cache[(filename, expiration)] = (url, expires_at)
+                    self._cache.move_to_end((filename, expiration))
+                    urls[filename] = url
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+                self.signed += len(missing)
+
+        return [urls[filename] for filename in filenames]
+
+    def _sign_local(self, filenames: List[str], expiration: int) -> List[str]:
+        return [
+            self.bucket.blob(filename).generate_signed_url(
+                version="v4",
+                expiration=expiration,
+                method="GET",
+                credentials=self.credentials
+            )
+            for filename in filenames
+        ]
+
+    def _access_token(self) -> str:
+        with self._token_lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(requests.Request())
+            return self.credentials.token
+
+    def _sign_remote(self, filenames: List[str], expiration: int) -> List[str]:
+        # One token for the whole batch instead of a refresh check inside every signBlob call
+        access_token = self._access_token()
+        service_account_email = self.credentials.service_account_email
+
+        def sign_one(filename: str) -> str:
+            return self.bucket.blob(filename).generate_signed_url(
+                version="v4",
+                expiration=expiration,
+                method="GET",
+                service_account_email=service_account_email,
+                access_token=access_token
+            )
+
+        return list(self._executor.map(sign_one, filenames))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": "local" if self.signs_locally else "iam",
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "signed": self.signed
+            }
@@ -1,30 +1,389 @@
-from typing import Optional
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
-from .AnthropicClient import AnthropicClient
-from .GeminiClient import GeminiClient
+from .AsyncPipeline import AsyncPipeline
+from .BatchProcessor import BatchProcessor, CallbackSender
+from .BatchStore import BatchStore, InMemoryBatchStore, SQLiteBatchStore
+from .CallbackDispatcher import CallbackDispatcher, CallbackOutbox, InMemoryCallbackOutbox, SQLiteCallbackOutbox
+from .DocumentPacker import DocumentPacker
+from .DuplicateDetector import DuplicateDetector, SQLiteDuplicateIndex
+from .ImagePreprocessor import ImagePreprocessor
+from .JobScheduler import JobScheduler
+from .JobStore import JobRecord, JobRecovery, JobStore, SQLiteJobStore
+from .PdfChunkProcessor import PdfChunkProcessor
+from .ProviderRouter import ProviderRouter
+from .RateGovernor import RateGovernor
+from .ResultCache import CacheBackend, GCSCacheBackend, InMemoryCacheBackend, ResultCache
+from .ResultValidator import ResultValidator
 from .StorageService import StorageService
+from .TextLayerExtractor import TextLayerExtractor
 from ..logs.logger import setup_logger
+from ..utils.telemetry import telemetry
+
+if TYPE_CHECKING:
+    from .AnthropicClient import AnthropicClient
+    from .GeminiClient import GeminiClient
+
+# AnthropicClient.PROVIDER and GeminiClient.PROVIDER, named here so looking them up does not import the SDKs
+ANTHROPIC_PROVIDER = "anthropic"
+GEMINI_PROVIDER = "gemini"
 
 
 class ServiceRegistry:
 
     def __init__(self):
         self.storage_service: Optional[StorageService] = None
-        self.anthropic_client: Optional[AnthropicClient] = None
-        self.gemini_client: Optional[GeminiClient] = None
+        self.result_cache: Optional[ResultCache] = None
+        self.result_validator: Optional[ResultValidator] = None
+        self.duplicate_detector: Optional[DuplicateDetector] = None
+        self.job_scheduler: Optional[JobScheduler] = None
+        self.async_pipeline: Optional[AsyncPipeline] = None
+        self.pdf_chunk_processor = PdfChunkProcessor()
+        self.image_preprocessor: Optional[ImagePreprocessor] = None
+        self.text_layer_extractor: Optional[TextLayerExtractor] = None
+        self.document_packer: Optional[DocumentPacker] = None
+        self.batch_processor: Optional[BatchProcessor] = None
+        self.provider_router: Optional[ProviderRouter] = None
+        self.job_store: Optional[JobStore] = None
+        self.job_recovery: Optional[JobRecovery] = None
+        self.callback_dispatcher: Optional[CallbackDispatcher] = None
+        self.rate_governors: Dict[str, RateGovernor] = {}
+        # Model clients are built, and their SDKs imported, by the first request that needs them
+        self._client_factories: Dict[str, Callable[[], Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._clients_lock = threading.Lock()
         self.logger = setup_logger(__name__)
 
-    def init_storage_service(self, bucket_name: str):
-        self.storage_service = StorageService(bucket_name)
+    def client(self, provider: str) -> Any:
+        """
+        Return a provider's model client, constructing it on first use
+        """
+        client = self._clients.get(provider)
+        if client is not None:
+            return client
+
+        with self._clients_lock:
+            client = self._clients.get(provider)
+            if client is None:
+                factory = self._client_factories.get(provider)
+                if factory is None:
+                    return None
+                client = self._clients[provider] = factory()
+                self.logger.info(f"{provider} client constructed on first use.")
+        return client
+
+    def constructed_client(self, provider: str) -> Any:
+        """
+        Return a provider's model client if a request has already constructed it, else None
+        """
+        return self._clients.get(provider)
+
+    @property
+    def anthropic_client(self) -> Optional["AnthropicClient"]:
+        return self.client(ANTHROPIC_PROVIDER)
+
+    @property
+    def gemini_client(self) -> Optional["GeminiClient"]:
+        return self.client(GEMINI_PROVIDER)
+
+    def init_storage_service(
+            self,
+            bucket_name: str,
+            spool_threshold_bytes: int,
+            download_chunk_size: int,
+            download_max_workers: int,
+            download_timeout: Tuple[float, float],
+            upload_chunk_size: int,
+            composite_threshold_bytes: int,
+            composite_part_size: int,
+            upload_max_workers: int,
+            signed_url_options: Dict
+    ):
+        self.storage_service = StorageService(
+            bucket_name,
+            spool_threshold_bytes,
+            download_chunk_size,
+            download_max_workers,
+            download_timeout,
+            upload_chunk_size,
+            composite_threshold_bytes,
+            composite_part_size,
+            upload_max_workers,
+            signed_url_options.get('cache-max-entries', 10000),
+            signed_url_options.get('min-remaining-seconds', 300),
+            signed_url_options.get('max-workers', 16),
+            signed_url_options.get('min-remaining-fraction', 0.8)
+        )
         self.logger.info("Storage service initialized.")
 
-    def init_anthropic_client(self, api_key: str):
-        self.anthropic_client = AnthropicClient(api_key)
-        self.logger.info("Anthropic client initialized.")
+    def init_result_cache(
+            self,
+            max_entries: int,
+            ttl_seconds: int,
+            gcs_enabled: bool,
+            gcs_prefix: str,
+            max_bytes: int = 64 * 1024 * 1024
+    ):
+        backends: List[CacheBackend] = [InMemoryCacheBackend(max_entries, ttl_seconds, max_bytes)]
+        if gcs_enabled:
+            if self.storage_service is None:
+                raise RuntimeError("Storage service must be initialized before the GCS result cache tier")
+            backends.append(GCSCacheBackend(self.storage_service.bucket, gcs_prefix, ttl_seconds))
+        self.result_cache = ResultCache(backends)
+        self.logger.info(f"Result cache initialized with tiers: {[backend.name for backend in backends]}")
+
+    def init_result_validator(self, mode: str):
+        self.result_validator = ResultValidator(mode)
+        self.logger.info(f"Result schema validation initialized in {mode} mode.")
+
+    def init_duplicate_detector(self, options: Dict):
+        index_options = options.get('index', {})
+        index = SQLiteDuplicateIndex(
+            index_options.get('path', '/tmp/document-parser/duplicates.db'),
+            max_entries_per_tenant=index_options.get('max-entries-per-tenant', 10000),
+            ttl_seconds=index_options.get('ttl-days', 30) * 86400
+        )
+        self.duplicate_detector = DuplicateDetector(
+            index,
+            action=options.get('action', 'report'),
+            text_threshold=options.get('text-similarity', 0.95),
+            image_threshold=options.get('image-similarity', 0.9),
+            max_pages=options.get('max-pages', 10),
+            max_workers=options.get('max-workers', 2)
+        )
+        self.logger.info(f"Duplicate detector initialized in {self.duplicate_detector.action} mode.")
+
+    def init_job_scheduler(self, workers: int, max_queue_depth: int, retry_after_seconds: int):
+        self.job_scheduler = JobScheduler(workers, max_queue_depth, retry_after_seconds)
+        self.job_scheduler.start()
+        self._register_queue_gauges("scheduler", self.job_scheduler, workers)
+        self.logger.info("Job scheduler initialized.")
+
+    def init_async_pipeline(self, max_in_flight: int, max_queue_depth: int, retry_after_seconds: int):
+        self.async_pipeline = AsyncPipeline(max_in_flight, max_queue_depth, retry_after_seconds)
+        self.async_pipeline.start()
+        self._register_queue_gauges("pipeline", self.async_pipeline, max_in_flight)
+        self.logger.info("Async pipeline initialized.")
+
+    def _register_queue_gauges(self, executor: str, queue, capacity: int):
+        # Read at scrape time from the executor's own counters
+        stats = queue.stats
+        telemetry.register_gauge(
+            "queue_depth",
+            "Jobs waiting for a worker",
+            lambda: stats()["queue_depth"],
+            executor=executor
+        )
+        telemetry.register_gauge(
+            "jobs_in_flight",
+            "Jobs being processed",
+            lambda: stats()["in_flight"],
+            executor=executor
+        )
+        telemetry.register_gauge(
+            "worker_utilization",
+            "Share of job slots in use",
+            lambda: stats()["in_flight"] / capacity if capacity else 0.0,
+            executor=executor
+        )
+
+    def init_callback_dispatcher(
+            self,
+            options: Dict,
+            on_delivered: Optional[Callable[[str], None]] = None,
+            on_dead_lettered: Optional[Callable[[str, str], None]] = None
+    ):
+        outbox_options = options.get('outbox', {})
+        max_dead_entries = outbox_options.get('max-dead-entries', 10000)
+        outbox: CallbackOutbox = InMemoryCallbackOutbox(max_dead_entries)
+        if outbox_options.get('backend', 'sqlite') == 'sqlite':
+            outbox = SQLiteCallbackOutbox(
+                outbox_options.get('path', '/tmp/document-parser/callbacks.db'),
+                max_dead_entries=max_dead_entries,
+                dead_retention_seconds=outbox_options.get('dead-retention-days', 7) * 24 * 3600
+            )
+
+        batching = options.get('batching', {})
+        self.callback_dispatcher = CallbackDispatcher(
+            outbox,
+            pool_maxsize=options.get('pool-maxsize', 10),
+            delivery_workers=options.get('delivery-workers', 4),
+            max_attempts=options.get('max-attempts', 8),
+            initial_backoff_seconds=options.get('initial-backoff-seconds', 1),
+            max_backoff_seconds=options.get('max-backoff-seconds', 300),
+            batching=batching.get('enabled', False),
+            max_batch_size=batching.get('max-batch-size', 50),
+            max_batch_wait_seconds=batching.get('max-wait-ms', 200) / 1000,
+            batch_path_suffix=batching.get('path-suffix', '/batch'),
+            timeout=(options.get('connect-timeout-seconds', 5), options.get('read-timeout-seconds', 30)),
+            on_delivered=on_delivered,
+            on_dead_lettered=on_dead_lettered
+        )
+        self.logger.info(f"Callback dispatcher initialized with {outbox.name} outbox.")
+
+    def init_job_store(self, path: str):
+        self.job_store = SQLiteJobStore(path)
+        self.logger.info(f"Job store initialized at {path} for owner {self.job_store.owner}.")
+
+    def init_job_recovery(
+            self,
+            resubmit: Callable[[JobRecord], None],
+            abandon: Callable[[JobRecord], None],
+            options: Dict
+    ):
+        if self.job_store is None:
+            raise RuntimeError("Job store must be initialized before job recovery")
+
+        self.job_recovery = JobRecovery(
+            self.job_store,
+            resubmit,
+            abandon,
+            interval_seconds=options.get('interval-seconds', 30),
+            stale_after_seconds=options.get('stale-after-seconds', 120),
+            max_attempts=options.get('max-attempts', 3),
+            retention_seconds=options.get('retention-days', 7) * 24 * 3600
+        )
+        self.job_recovery.start()
+        self.logger.info("Job recovery started.")
+
+    def init_rate_governor(self, provider: str, limits: Dict, shared_directory: Optional[str] = None):
+        self.rate_governors[provider] = RateGovernor(
+            provider,
+            max_concurrency=limits.get('max-concurrency', 8),
+            requests_per_minute=limits.get('requests-per-minute', 50),
+            input_tokens_per_minute=limits.get('input-tokens-per-minute', 40000),
+            shared_directory=shared_directory
+        )
+        self.logger.info(f"Rate governor initialized for {provider}.")
+
+    def init_image_preprocessor(self, options: Dict):
+        self.image_preprocessor = ImagePreprocessor(
+            max_long_edge=options.get('max-long-edge', 1568),
+            output_format=options.get('format', 'JPEG'),
+            quality=options.get('quality', 85),
+            grayscale=options.get('grayscale', False),
+            deskew=options.get('deskew', False),
+            max_workers=options.get('max-workers', 2)
+        )
+        self.logger.info("Image preprocessor initialized.")
+
+    def init_text_layer_extractor(self, options: Dict):
+        self.text_layer_extractor = TextLayerExtractor(
+            min_quality=options.get('min-quality', 0.95),
+            min_chars_per_page=options.get('min-chars-per-page', 200),
+            max_pages=options.get('max-pages', 20),
+            layout=options.get('layout', True),
+            max_workers=options.get('max-workers', 2)
+        )
+        self.logger.info("Text layer extractor initialized.")
+
+    def init_document_packer(self, options: Dict):
+        self.document_packer = DocumentPacker(
+            max_documents=options.get('max-documents', 4),
+            max_document_bytes=options.get('max-document-bytes', 1048576),
+            max_pack_bytes=options.get('max-pack-bytes', 4194304),
+            max_wait_seconds=options.get('max-wait-ms', 50) / 1000
+        )
+        self.logger.info(f"Document packer initialized for up to {self.document_packer.max_documents} documents per request.")
+
+    def init_anthropic_client(
+            self,
+            api_key: str,
+            base_url: Optional[str] = None,
+            prompt_caching: bool = False,
+            streaming: bool = False,
+            stream_max_attempts: int = 3
+    ):
+        def build() -> "AnthropicClient":
+            from .AnthropicClient import AnthropicClient
+            return AnthropicClient(
+                api_key,
+                self.result_cache,
+                self.rate_governors.get(ANTHROPIC_PROVIDER),
+                self.image_preprocessor,
+                base_url,
+                prompt_caching,
+                streaming,
+                stream_max_attempts,
+                self.text_layer_extractor,
+                self.document_packer
+            )
+
+        self._client_factories[ANTHROPIC_PROVIDER] = build
+        self.logger.info("Anthropic client registered.")
+
+    def init_batch_processor(
+            self,
+            send_callback: CallbackSender,
+            max_requests_per_batch: int,
+            poll_interval_seconds: int,
+            embed_parsed_data: bool = False,
+            store_options: Optional[Dict] = None
+    ):
+        store_options = store_options or {}
+        store: BatchStore = InMemoryBatchStore()
+        if store_options.get('backend', 'sqlite') == 'sqlite':
+            store = SQLiteBatchStore(store_options.get('path', '/tmp/document-parser/batches.db'))
+
+        self.batch_processor = BatchProcessor(
+            lambda: self.anthropic_client,
+            self.storage_service,
+            send_callback,
+            store,
+            max_requests_per_batch=max_requests_per_batch,
+            poll_interval_seconds=poll_interval_seconds,
+            result_validator=self.result_validator,
+            embed_parsed_data=embed_parsed_data
+        )
+        self.logger.info(f"Batch processor initialized with {store.name} batch store.")
+
+    def init_gemini_client(
+            self,
+            api_key: str,
+            base_url: Optional[str] = None,
+            streaming: bool = False,
+            stream_max_attempts: int = 3
+    ):
+        def build() -> "GeminiClient":
+            from .GeminiClient import GeminiClient
+            return GeminiClient(
+                api_key,
+                self.result_cache,
+                self.rate_governors.get(GEMINI_PROVIDER),
+                self.image_preprocessor,
+                base_url,
+                streaming,
+                stream_max_attempts,
+                self.text_layer_extractor,
+                self.document_packer
+            )
+
+        self._client_factories[GEMINI_PROVIDER] = build
+        self.logger.info("Gemini client registered.")
+
+    def init_provider_router(self, options: Dict):
+        if ANTHROPIC_PROVIDER not in self._client_factories or GEMINI_PROVIDER not in self._client_factories:
+            raise RuntimeError("Model clients must be initialized before the provider router")
 
-    def init_gemini_client(self, api_key: str):
-        self.gemini_client = GeminiClient(api_key)
-        self.logger.info("Gemini client initialized.")
+        hedging = options.get('hedging', {})
+        self.provider_router = ProviderRouter(
+            {
+                ANTHROPIC_PROVIDER: lambda: self.anthropic_client,
+                GEMINI_PROVIDER: lambda: self.gemini_client
+            },
+            order=options.get('providers', [ANTHROPIC_PROVIDER, GEMINI_PROVIDER]),
+            failover=options.get('failover', True),
+            window_size=options.get('window-size', 100),
+            failure_threshold=options.get('failure-threshold', 5),
+            open_seconds=options.get('open-seconds', 60),
+            hedging=hedging.get('enabled', False),
+            hedge_quantile=hedging.get('quantile', 0.95),
+            hedge_min_samples=hedging.get('min-samples', 20),
+            hedge_default_delay_seconds=hedging.get('default-delay-seconds', 30),
+            hedge_min_delay_seconds=hedging.get('min-delay-seconds', 2),
+            hedge_workers=hedging.get('workers', 16)
+        )
+        self.logger.info(f"Provider router initialized with order {self.provider_router.order}.")
 
 
 services = ServiceRegistry()
@@ -0,0 +1,57 @@
+"""
+JSON decoding and encoding through the fastest engine installed: orjson, then msgspec, then the
+standard library. Both are optional; results are identical whichever one is used, including the
+error raised for invalid input.
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+ENGINE = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+
+if orjson is not None:
+    _FAST_DECODE_ERRORS = (orjson.JSONDecodeError,)
+    _FAST_ENCODE_ERRORS = (orjson.JSONEncodeError,)
+elif msgspec is not None:
+    _FAST_DECODE_ERRORS = (msgspec.DecodeError,)
+    _FAST_ENCODE_ERRORS = (msgspec.EncodeError, TypeError, OverflowError)
+    _msgspec_decoder = msgspec.json.Decoder()
+    _msgspec_encoder = msgspec.json.Encoder()
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse a JSON document
+
+    Raises:
+        json.JSONDecodeError: If the document is not valid JSON
+    """
+    if orjson is not None or msgspec is not None:
+        try:
+            return orjson.loads(data) if orjson is not None else _msgspec_decoder.decode(data)
+        except _FAST_DECODE_ERRORS:
+            # The fast engines reject a few things the standard library accepts (integers beyond
+            # 64 bits, NaN), so the standard library has the final say and raises the usual error
+            pass
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON
+    """
+    if orjson is not None or msgspec is not None:
+        try:
+            return orjson.dumps(value) if orjson is not None else _msgspec_encoder.encode(value)
+        except _FAST_ENCODE_ERRORS:
+            pass
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
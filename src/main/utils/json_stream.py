@@ -0,0 +1,252 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from . import json_codec
+
+NUMBER_PATTERN = re.compile(r'-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?')
+NUMBER_CHARS = frozenset('0123456789+-.eE')
+LITERALS = ('true', 'false', 'null')
+WHITESPACE = frozenset(' \t\r\n')
+HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+FENCE_PATTERN = re.compile(r'```(json)?[ \t]*\r?\n')
+
+# What the validator expects next, outside of a string/number/literal token
+VALUE = 'value'
+VALUE_OR_ARRAY_END = 'value-or-array-end'
+KEY = 'key'
+KEY_OR_OBJECT_END = 'key-or-object-end'
+COLON = 'colon'
+COMMA_OR_END = 'comma-or-end'
+DONE = 'done'
+
+
+class InvalidJsonStreamError(Exception):
+    """
+    Raised as soon as streamed model output can no longer become valid JSON
+    """
+    pass
+
+
+class JsonText(str):
+    """
+    A validated JSON document that also carries its parsed value, so callers never parse it twice
+    """
+
+    parsed: Any
+
+    def __new__(cls, text: str, parsed: Any):
+        instance = super().__new__(cls, text)
+        instance.parsed = parsed
+        return instance
+
+
+def as_json_text(text: str) -> JsonText:
+    """
+    The JsonText for a validated document, parsing it only if it lost its parsed value on the way
+    (a result read back from the GCS cache, or a payload restored from the job store)
+    """
+    if isinstance(text, JsonText):
+        return text
+    return JsonText(text, json_codec.loads(text))
+
+
+class IncrementalJsonValidator:
+    """
+    Checks, character by character, that streamed text is still a prefix of one JSON value.
+
+    Leading whitespace and a markdown ```json fence are tolerated, as is a closing fence.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._stack: List[str] = []
+        self._expect = VALUE
+        self._token: Optional[str] = None  # 'string', 'number', 'literal'
+        self._token_text = ''
+        self._escape_remaining = 0  # hex digits still expected after \u
+        self._escaped = False
+        self._preamble = ''
+        self._in_preamble = True
+        self.received = 0
+
+    def feed(self, text: str):
+        self._chunks.append(text)
+        for char in text:
+            self._consume(char)
+            self.received += 1
+
+    def _fail(self, reason: str):
+        raise InvalidJsonStreamError(f"{reason} at character {self.received}")
+
+    def _consume(self, char: str):
+        if self._in_preamble:
+            if not self._preamble and char in WHITESPACE:
+                return
+            if self._preamble or char == '`':
+                self._preamble += char
+                if FENCE_PATTERN.fullmatch(self._preamble):
+                    self._preamble = ''
+                    self._in_preamble = False
+                elif not '```json'.startswith(self._preamble[:7]) or len(self._preamble) > 16:
+                    self._fail("Unexpected text before JSON")
+                return
+            self._in_preamble = False
+
+        if self._token == 'string':
+            self._consume_string(char)
+            return
+
+        if self._token == 'number':
+            if char in NUMBER_CHARS:
+                self._token_text += char
+                return
+            self._end_number()
+
+        if self._token == 'literal':
+            self._token_text += char
+            if not any(literal.startswith(self._token_text) for literal in LITERALS):
+                self._fail(f"Invalid literal '{self._token_text}'")
+            if self._token_text in LITERALS:
+                self._token = None
+                self._end_value()
+            return
+
+        if char in WHITESPACE:
+            return
+
+        if self._expect == DONE:
+            if char != '`':
+                self._fail("Unexpected text after JSON")
+            return
+
+        if self._expect in (VALUE, VALUE_OR_ARRAY_END):
+            if char == ']' and self._expect == VALUE_OR_ARRAY_END:
+                self._close('array')
+            else:
+                self._start_value(char)
+        elif self._expect in (KEY, KEY_OR_OBJECT_END):
+            if char == '}' and self._expect == KEY_OR_OBJECT_END:
+                self._close('object')
+            elif char == '"':
+                self._token, self._token_text = 'string', ''
+            else:
+                self._fail(f"Expected object key, got '{char}'")
+        elif self._expect == COLON:
+            if char != ':':
+                self._fail(f"Expected ':', got '{char}'")
+            self._expect = VALUE
+        elif self._expect == COMMA_OR_END:
+            container = self._stack[-1]
+            if char == ',':
+                self._expect = KEY if container == 'object' else VALUE
+            elif (char == '}' and container == 'object') or (char == ']' and container == 'array'):
+                self._close(container)
+            else:
+                self._fail(f"Expected ',' or end of {container}, got '{char}'")
+
+    def _start_value(self, char: str):
+        if char == '{':
+            self._stack.append('object')
+            self._expect = KEY_OR_OBJECT_END
+        elif char == '[':
+            self._stack.append('array')
+            self._expect = VALUE_OR_ARRAY_END
+        elif char == '"':
+            self._token, self._token_text = 'string', ''
+        elif char == '-' or char.isdigit():
+            self._token, self._token_text = 'number', char
+        elif char in 'tfn':
+            self._token, self._token_text = 'literal', char
+        else:
+            self._fail(f"Unexpected '{char}' where a value was expected")
+
+    def _consume_string(self, char: str):
+        if self._escape_remaining:
+            if char not in HEX_DIGITS:
+                self._fail("Invalid unicode escape")
+            self._escape_remaining -= 1
+        elif self._escaped:
+            if char == 'u':
+                self._escape_remaining = 4
+            elif char not in '"\\/bfnrt':
+                self._fail(f"Invalid escape '\\{char}'")
+            self._escaped = False
+        elif char == '\\':
+            self._escaped = True
+        elif char == '"':
+            self._token = None
+            # A string is either an object key (followed by ':') or a value
+            if self._expect in (KEY, KEY_OR_OBJECT_END):
+                self._expect = COLON
+            else:
+                self._end_value()
+        elif ord(char) < 0x20:
+            self._fail("Unescaped control character in string")
+
+    def _end_number(self):
+        if not NUMBER_PATTERN.fullmatch(self._token_text):
+            self._fail(f"Invalid number '{self._token_text}'")
+        self._token = None
+        self._end_value()
+
+    def _end_value(self):
+        self._expect = COMMA_OR_END if self._stack else DONE
+
+    def _close(self, container: str):
+        self._stack.pop()
+        self._end_value()
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._chunks)
+
+    def finish(self) -> JsonText:
+        """
+        Check the stream ended on a complete value and parse it once
+
+        Raises:
+            InvalidJsonStreamError: If the output stopped before the JSON value was complete
+        """
+        if self._token == 'number':
+            self._end_number()
+        if self._expect != DONE or self._token is not None:
+            self._fail("Output ended before the JSON value was complete")
+
+        text = self.text.strip()
+        if text.startswith('```'):
+            text = text[text.index('\n') + 1:]
+        text = text.rstrip('`').strip()
+        return JsonText(text, json_codec.loads(text))
+
+
+class StreamStats:
+    """
+    Time-to-first-byte and abort counters for streamed model calls
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.aborts = 0
+        self._first_byte_seconds: List[float] = []
+
+    def record_first_byte(self, seconds: float):
+        with self._lock:
+            self.streams += 1
+            # Keep a bounded window so the stats stay cheap for long-lived workers
+            self._first_byte_seconds = self._first_byte_seconds[-999:] + [seconds]
+
+    def record_abort(self):
+        with self._lock:
+            self.aborts += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = sorted(self._first_byte_seconds)
+            return {
+                "streams": self.streams,
+                "aborts": self.aborts,
+                "ttfb_p50_seconds": samples[len(samples) // 2] if samples else None,
+                "ttfb_max_seconds": samples[-1] if samples else None
+            }
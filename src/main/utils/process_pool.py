@@ -0,0 +1,36 @@
+"""
+A process pool that forks its workers on first use, for the CPU-bound document helpers.
+"""
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+
+class LazyProcessPoolExecutor(Executor):
+    """
+    Creates its ProcessPoolExecutor on the first submit, so gunicorn workers that never see a
+    matching document never fork helpers, and concurrent first requests share one pool
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> ProcessPoolExecutor:
+        executor = self._executor
+        if executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                executor = self._executor
+        return executor
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self._get().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -1,12 +1,18 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
 import certifi
 import requests
 from requests import Session
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
-from google.cloud import secretmanager
+# One Secret Manager client per process, created on first use; building one costs a gRPC channel
+_secret_manager_client = None
+_secret_manager_lock = threading.Lock()
 
-def get_request_session() -> Session:
+def get_request_session(pool_maxsize: int = 10) -> Session:
     session = requests.Session()
     # Ensure the session uses Certifi's up-to-date certificate bundle
     session.verify = certifi.where()
@@ -16,11 +22,33 @@ def get_request_session() -> Session:
         backoff_factor=0.5,
         status_forcelist=[500, 502, 503, 504]
     )
-    session.mount('http://', HTTPAdapter(max_retries=retries))
-    session.mount('https://', HTTPAdapter(max_retries=retries))
+    session.mount('http://', HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize))
+    session.mount('https://', HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize))
     return session
 
 
+def _gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def get_secret_manager_client():
+    global _secret_manager_client
+    with _secret_manager_lock:
+        if _secret_manager_client is None:
+            # Imported here so processes that take their keys from the environment never load it
+            from google.cloud import secretmanager
+            if _gevent_patched():
+                # Without this gRPC calls block the gevent hub, serializing concurrent secret reads
+                from grpc.experimental import gevent as grpc_gevent
+                grpc_gevent.init_gevent()
+            _secret_manager_client = secretmanager.SecretManagerServiceClient()
+        return _secret_manager_client
+
+
 def access_secret_version(project_id, secret_id, version_id="latest"):
     """
     Access a secret version in Secret Manager.
@@ -33,8 +61,7 @@ def access_secret_version(project_id, secret_id, version_id="latest"):
     Returns:
         str: The payload of the secret.
     """
-    # Create the Secret Manager client
-    client = secretmanager.SecretManagerServiceClient()
+    client = get_secret_manager_client()
 
     # Build the resource name of the secret version
     name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
@@ -45,3 +72,19 @@ def access_secret_version(project_id, secret_id, version_id="latest"):
     # Return the decoded payload of the secret
     payload = response.payload.data.decode("UTF-8")
     return payload
+
+
+def access_secrets(project_id, secret_ids: List[str], version_id="latest") -> Dict[str, str]:
+    """
+    Access several secrets at once, concurrently over the shared client
+
+    Returns:
+        Dict of secret ID to payload
+    """
+    if not secret_ids:
+        return {}
+    # Create the client before fanning out so the calls share it
+    get_secret_manager_client()
+    with ThreadPoolExecutor(max_workers=len(secret_ids)) as executor:
+        payloads = executor.map(lambda secret_id: access_secret_version(project_id, secret_id, version_id), secret_ids)
+        return dict(zip(secret_ids, payloads))
@@ -0,0 +1,48 @@
+import contextlib
+import time
+from typing import Dict
+
+from ..logs.logger import setup_logger
+
+
+class StartupTimer:
+    """
+    Wall time of each phase of worker startup, from the first import of the app package until
+    create_app returns. Logged once startup finishes and exported as gauges on /metrics.
+    """
+
+    def __init__(self):
+        self.logger = setup_logger(__name__)
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self.phases: Dict[str, float] = {}
+        self.total_seconds = None
+
+    def mark(self, name: str):
+        """
+        Close a phase that ran from the previous mark (or the start) until now
+        """
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last_mark
+        self._last_mark = now
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        self.mark('other')
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    def finish(self) -> Dict[str, float]:
+        self.mark('other')
+        if not self.phases.get('other'):
+            self.phases.pop('other', None)
+        self.total_seconds = time.perf_counter() - self.started
+        breakdown = ', '.join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items())
+        self.logger.info(f"Startup finished in {self.total_seconds:.3f}s ({breakdown})")
+        return dict(self.phases)
+
+
+# Started when the app package is first imported
+startup_timer = StartupTimer()
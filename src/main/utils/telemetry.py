@@ -0,0 +1,511 @@
+"""
+Per-stage latency histograms, token counters and queue gauges in the Prometheus text format,
+with an OpenTelemetry span for every stage when tracing is configured.
+
+Each gunicorn worker records its own series; with telemetry.metrics.multiprocess-dir set, workers
+share them through files in that directory, so a scrape of /metrics answered by any worker sums
+the histograms and counters of all of them. Tracing needs opentelemetry-api; exporting spans over OTLP additionally needs
+opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http. Without them stages are still
+timed and counted, only no spans are exported.
+"""
+import atexit
+import bisect
+import contextlib
+import contextvars
+import fcntl
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+from . import json_codec
+from ..logs.logger import setup_logger
+
+METRIC_PREFIX = "document_parser"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# kind ("histograms", "counters" or "gauges") -> metric name -> label key -> value(s)
+Snapshot = Dict[str, Dict[str, Dict[LabelKey, Any]]]
+
+# Labels of the job running in the current thread, greenlet or asyncio task
+_job_labels: contextvars.ContextVar = contextvars.ContextVar('telemetry_job_labels', default={})
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, value if value is not None else '') for name, value in labels.items()))
+
+
+class Histogram:
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS_SECONDS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # label key -> per-bucket counts (the last one is +Inf) followed by the running sum
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Dict[str, str]):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self, snapshot: Optional[Dict[LabelKey, List[float]]] = None) -> Iterator[str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for key in sorted(snapshot):
+            series = snapshot[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, le=_format_value(float(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+class Counter:
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, labels: Dict[str, str]):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, snapshot: Optional[Dict[LabelKey, float]] = None) -> Iterator[str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        for key in sorted(snapshot):
+            yield f"{self.name}{_format_labels(key)} {_format_value(snapshot[key])}"
+
+
+class Gauge:
+    """
+    A gauge read from callbacks at scrape time, so it can never drift from the value it reports
+    """
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._sources: Dict[LabelKey, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def set_function(self, fn: Callable[[], float], labels: Dict[str, str]):
+        with self._lock:
+            self._sources[_label_key(labels)] = fn
+
+    def snapshot(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            sources = dict(self._sources)
+        values = {}
+        for key, fn in sources.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return values
+
+    def render(self, snapshot: Optional[Dict[LabelKey, float]] = None) -> Iterator[str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} gauge"
+        for key in sorted(snapshot):
+            yield f"{self.name}{_format_labels(key)} {_format_value(snapshot[key])}"
+
+
+def _empty_snapshot() -> Snapshot:
+    return {"histograms": {}, "counters": {}, "gauges": {}}
+
+
+def _merge_into(target: Snapshot, source: Snapshot, pid: Optional[int]):
+    """
+    Sum the histograms and counters of source into target; gauges are kept apart per worker under
+    a pid label, and dropped when pid is None (a worker that has exited)
+    """
+    for name, series in source["histograms"].items():
+        merged = target["histograms"].setdefault(name, {})
+        for key, values in series.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = list(values)
+            elif len(current) == len(values):
+                merged[key] = [a + b for a, b in zip(current, values)]
+    for name, series in source["counters"].items():
+        merged = target["counters"].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+    if pid is None:
+        return
+    for name, series in source["gauges"].items():
+        merged = target["gauges"].setdefault(name, {})
+        for key, value in series.items():
+            merged[tuple(sorted(key + (("pid", str(pid)),)))] = value
+
+
+def _encode_snapshot(snapshot: Snapshot) -> bytes:
+    return json_codec.dumps({
+        kind: {name: [[list(key), value] for key, value in series.items()] for name, series in metrics.items()}
+        for kind, metrics in snapshot.items()
+    })
+
+
+def _decode_snapshot(data: bytes) -> Snapshot:
+    parsed = json_codec.loads(data)
+    snapshot = _empty_snapshot()
+    for kind in snapshot:
+        for name, series in parsed.get(kind, {}).items():
+            snapshot[kind][name] = {tuple(tuple(pair) for pair in key): value for key, value in series}
+    return snapshot
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """
+    Metrics shared by the workers of one gunicorn master through files under
+    <directory>/<master pid>: every worker periodically writes its series to <pid>.json and a
+    scrape sums all of them. The files of workers that have exited (max_requests recycles them)
+    are folded into archive.json, so counters never go backwards and the directory stays small.
+    """
+
+    ARCHIVE = "archive.json"
+
+    def __init__(self, directory: str, flush_interval_seconds: float, snapshot: Callable[[], Snapshot]):
+        self.base_directory = directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self._snapshot = snapshot
+        self._flusher_pid: Optional[int] = None
+        self.logger = setup_logger(__name__)
+
+    @property
+    def directory(self) -> str:
+        # Workers share their master's pid, so servers started from the same directory stay apart
+        return os.path.join(self.base_directory, str(os.getppid()))
+
+    @contextlib.contextmanager
+    def _locked(self, operation: int):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, name: str, snapshot: Snapshot):
+        path = os.path.join(self.directory, name)
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(_encode_snapshot(snapshot))
+        os.replace(f"{path}.tmp", path)
+
+    def _read(self, name: str) -> Optional[Snapshot]:
+        try:
+            with open(os.path.join(self.directory, name), "rb") as file:
+                return _decode_snapshot(file.read())
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Skipping unreadable metrics file {name}: {str(e)}")
+            return None
+
+    def _worker_files(self) -> Iterator[Tuple[str, int]]:
+        for name in os.listdir(self.directory):
+            stem, extension = os.path.splitext(name)
+            if extension == ".json" and stem.isdigit():
+                yield name, int(stem)
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(f"{os.getpid()}.json", self._snapshot())
+
+    def _compact(self):
+        with self._locked(fcntl.LOCK_EX):
+            dead = [name for name, pid in self._worker_files() if not _process_alive(pid)]
+            if not dead:
+                return
+            archive = self._read(self.ARCHIVE) if os.path.exists(os.path.join(self.directory, self.ARCHIVE)) else None
+            archive = archive or _empty_snapshot()
+            for name in dead:
+                snapshot = self._read(name)
+                if snapshot is not None:
+                    _merge_into(archive, snapshot, None)
+            self._write(self.ARCHIVE, archive)
+            for name in dead:
+                os.remove(os.path.join(self.directory, name))
+
+    def collect(self) -> Snapshot:
+        """
+        This worker's live series plus the last ones written by every other worker
+        """
+        pid = os.getpid()
+        merged = _empty_snapshot()
+        _merge_into(merged, self._snapshot(), pid)
+        with self._locked(fcntl.LOCK_SH):
+            if os.path.exists(os.path.join(self.directory, self.ARCHIVE)):
+                archive = self._read(self.ARCHIVE)
+                if archive is not None:
+                    _merge_into(merged, archive, None)
+            for name, other in self._worker_files():
+                if other == pid:
+                    continue
+                snapshot = self._read(name)
+                if snapshot is not None:
+                    _merge_into(merged, snapshot, other if _process_alive(other) else None)
+        return merged
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval_seconds)
+            try:
+                self.flush()
+                self._compact()
+            except Exception as e:
+                self.logger.warning(f"Could not share this worker's metrics: {str(e)}")
+
+    def start(self):
+        """
+        Start flushing from this process; a no-op if it already does
+        """
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run, name="metrics-flusher", daemon=True).start()
+
+    def close(self):
+        # The last few seconds of a worker that is shutting down still count
+        if self._flusher_pid == os.getpid():
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.warning(f"Could not share this worker's final metrics: {str(e)}")
+
+
+class Telemetry:
+    """
+    Times the stages of a job (auth verify, token fetch, download, encode, provider call, JSON
+    validation, callback) into one histogram labelled by stage, tenant, provider and outcome,
+    and opens a span per stage under the job's span.
+    """
+
+    def __init__(self):
+        self.logger = setup_logger(__name__)
+        self.metrics_enabled = True
+        self.tenant_label = False
+        self.shared: Optional[SharedMetrics] = None
+        self.stage_seconds = Histogram(
+            f"{METRIC_PREFIX}_stage_duration_seconds",
+            "Time spent in each stage of a document job"
+        )
+        self.provider_tokens = Counter(
+            f"{METRIC_PREFIX}_provider_tokens_total",
+            "Tokens reported by the model APIs, by direction"
+        )
+        self.gauges: Dict[str, Gauge] = {}
+        self._gauges_lock = threading.Lock()
+        self._tracer = trace.get_tracer(__name__) if trace is not None else None
+
+    def configure(self, options: Dict):
+        metrics = options.get('metrics', {})
+        self.metrics_enabled = metrics.get('enabled', True)
+        self.tenant_label = metrics.get('tenant-label', False)
+        if metrics.get('buckets-seconds'):
+            self.stage_seconds = Histogram(
+                self.stage_seconds.name,
+                self.stage_seconds.description,
+                metrics['buckets-seconds']
+            )
+        if self.metrics_enabled and metrics.get('multiprocess-dir'):
+            self._configure_sharing(metrics['multiprocess-dir'], metrics.get('flush-interval-seconds', 5))
+
+        tracing = options.get('tracing', {})
+        if tracing.get('enabled', False):
+            self._configure_tracing(tracing)
+
+    def _configure_sharing(self, directory: str, flush_interval_seconds: float):
+        # create_app runs in every gunicorn worker (the service is not preloaded), so each starts its own flusher
+        first = self.shared is None
+        self.shared = SharedMetrics(directory, flush_interval_seconds, self._snapshot)
+        self.shared.start()
+        if first:
+            atexit.register(lambda: self.shared.close())
+
+    def _configure_tracing(self, options: Dict):
+        if trace is None:
+            self.logger.warning("Tracing is enabled but opentelemetry-api is not installed, no spans are recorded")
+            return
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError:
+            self.logger.warning(
+                "Tracing is enabled but opentelemetry-sdk or the OTLP exporter is not installed, spans are not exported")
+            return
+
+        endpoint = options.get('otlp-endpoint')
+        # Without an endpoint the exporter honours OTEL_EXPORTER_OTLP_TRACES_ENDPOINT and friends
+        exporter = OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": options.get('service-name', 'document-parser')})
+        )
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        self._tracer = trace.get_tracer(__name__)
+        self.logger.info(f"Exporting traces over OTLP to {endpoint or 'the environment-configured endpoint'}")
+
+    def _span(self, name: str, attributes: Dict[str, str]):
+        if self._tracer is None:
+            return contextlib.nullcontext()
+        return self._tracer.start_as_current_span(name, attributes=attributes)
+
+    def _labels(self, stage: str, provider: Optional[str]) -> Dict[str, str]:
+        labels = {"stage": stage, "provider": provider or ''}
+        if self.tenant_label:
+            labels["tenant"] = _job_labels.get().get('tenant', '')
+        return labels
+
+    @contextlib.contextmanager
+    def job(self, tenant_id: Optional[str], job_id: Optional[str]):
+        """
+        Attribute the stages run inside this block to a tenant and a job, under one job span
+        """
+        token = _job_labels.set({"tenant": tenant_id or '', "job": job_id or ''})
+        try:
+            with self.stage('job'):
+                yield
+        finally:
+            _job_labels.reset(token)
+
+    @staticmethod
+    def current_tenant() -> Optional[str]:
+        """
+        Tenant of the job running in the current thread, greenlet or task, None outside a job
+        """
+        return _job_labels.get().get('tenant') or None
+
+    @contextlib.contextmanager
+    def stage(self, name: str, provider: Optional[str] = None):
+        labels = self._labels(name, provider)
+        job_labels = _job_labels.get()
+        attributes = {**labels, "tenant": job_labels.get('tenant', ''), "job": job_labels.get('job', '')}
+        outcome = "ok"
+        start_time = time.perf_counter()
+        with self._span(name, attributes):
+            try:
+                yield
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                if self.metrics_enabled:
+                    self.stage_seconds.observe(time.perf_counter() - start_time, {**labels, "outcome": outcome})
+
+    def record_tokens(self, provider: str, input_tokens: Optional[int], output_tokens: Optional[int]):
+        tenant = _job_labels.get().get('tenant', '') if self.tenant_label else None
+        for direction, amount in (("input", input_tokens), ("output", output_tokens)):
+            if not amount:
+                continue
+            labels = {"provider": provider, "direction": direction}
+            if tenant is not None:
+                labels["tenant"] = tenant
+            if self.metrics_enabled:
+                self.provider_tokens.inc(amount, labels)
+
+        if trace is not None:
+            span = trace.get_current_span()
+            span.set_attribute(f"{provider}.input_tokens", input_tokens or 0)
+            span.set_attribute(f"{provider}.output_tokens", output_tokens or 0)
+
+    def register_gauge(self, name: str, description: str, fn: Callable[[], float], **labels: str):
+        """
+        Report fn() as METRIC_PREFIX_<name> on every scrape
+        """
+        with self._gauges_lock:
+            gauge = self.gauges.get(name)
+            if gauge is None:
+                gauge = self.gauges[name] = Gauge(f"{METRIC_PREFIX}_{name}", description)
+        gauge.set_function(fn, labels)
+
+    def _snapshot(self) -> Snapshot:
+        with self._gauges_lock:
+            gauges = list(self.gauges.values())
+        return {
+            "histograms": {self.stage_seconds.name: self.stage_seconds.snapshot()},
+            "counters": {self.provider_tokens.name: self.provider_tokens.snapshot()},
+            "gauges": {gauge.name: gauge.snapshot() for gauge in gauges}
+        }
+
+    def render(self) -> str:
+        snapshot = self.shared.collect() if self.shared is not None else self._snapshot()
+        lines = list(self.stage_seconds.render(snapshot["histograms"].get(self.stage_seconds.name, {})))
+        lines.extend(self.provider_tokens.render(snapshot["counters"].get(self.provider_tokens.name, {})))
+        with self._gauges_lock:
+            gauges = list(self.gauges.values())
+        for gauge in gauges:
+            lines.extend(gauge.render(snapshot["gauges"].get(gauge.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every service in the worker, like the OIDC token caches
+telemetry = Telemetry()
+
+
+def configure_telemetry(options: Dict):
+    telemetry.configure(options)
@@ -0,0 +1,10 @@
+import os
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Importing the service package loads its configuration from src/resources; keys in the
+# environment keep that from reaching Secret Manager
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.chdir(REPO_ROOT / "src")
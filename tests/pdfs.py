@@ -0,0 +1,100 @@
+"""
+Small hand-built PDFs for the tests, in the style of tools/benchmarks/documents.build_pdf.
+"""
+import zlib
+from typing import List
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def assemble_pdf(objects: List[bytes]) -> bytes:
+    """
+    Numbers the objects from 1, with object 1 the catalog, and writes the xref table
+    """
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(output)
+
+
+def _stream(dictionary: str, data: bytes) -> bytes:
+    return f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream"
+
+
+# Maps every printable ASCII code to the private use area, as fonts without a usable Unicode
+# mapping come out of extraction
+GARBAGE_TO_UNICODE = (
+    b"/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n"
+    b"1 begincodespacerange <00> <FF> endcodespacerange\n"
+    b"1 beginbfrange <20> <7E> <E000> endbfrange\n"
+    b"endcmap CMapName currentdict /CMap defineresource pop end end"
+)
+
+
+def text_pdf(pages: List[List[str]], garbage_font: bool = False) -> bytes:
+    """
+    One Letter page per entry, each line of it set in 10pt Helvetica; with garbage_font the font
+    maps every character to the private use area
+    """
+    font = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+    font += b" /ToUnicode 3 0 R >>" if garbage_font else b" >>"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(f"{5 + 2 * i} 0 R".encode() for i in range(len(pages)))
+        + f"] /Count {len(pages)} >>".encode(),
+        _stream("", GARBAGE_TO_UNICODE),
+        font
+    ]
+    for index, lines in enumerate(pages):
+        stream = b"BT /F1 10 Tf 12 TL 72 740 Td\n" + b"".join(
+            f"({_escape(line)}) Tj T*\n".encode('latin-1') for line in lines) + b"ET\n"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 4 0 R >> >> "
+            f"/Contents {6 + 2 * index} 0 R >>".encode()
+        )
+        objects.append(_stream("", stream))
+    return assemble_pdf(objects)
+
+
+def scanned_pdf(width: int, height: int, lines: List[str], in_form: bool = False) -> bytes:
+    """
+    One page showing a width x height grey image, with lines of text over it as an OCR layer;
+    with in_form the image is drawn through a form XObject
+    """
+    image = _stream(
+        f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+        f"/BitsPerComponent 8 /Filter /FlateDecode",
+        zlib.compress(bytes(width * height))
+    )
+    text = b"BT /F1 10 Tf 12 TL 72 740 Td\n" + b"".join(
+        f"({_escape(line)}) Tj T*\n".encode('latin-1') for line in lines) + b"ET\n"
+    if in_form:
+        drawing = _stream(
+            "/Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources << /XObject << /Im1 4 0 R >> >>",
+            b"q 612 0 0 792 0 0 cm /Im1 Do Q"
+        )
+        content = b"/Fm1 Do\n" + text
+        xobjects = "/Fm1 7 0 R"
+    else:
+        drawing = b"null"
+        content = b"q 612 0 0 792 0 0 cm /Im1 Do Q\n" + text
+        xobjects = "/Im1 4 0 R"
+    return assemble_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [5 0 R] /Count 1 >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        image,
+        (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+         f"/Resources << /Font << /F1 3 0 R >> /XObject << {xobjects} >> >> /Contents 6 0 R >>").encode(),
+        _stream("", content),
+        drawing
+    ])
@@ -0,0 +1,167 @@
+import contextlib
+import json
+import threading
+import time
+from io import BytesIO
+
+import pytest
+from flask import Flask
+
+from src.main.controllers.ProcessDocumentBatchController import process_document_batch_bp
+from src.main.models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+from src.main.services.BatchProcessor import BatchProcessor
+from src.main.services.BatchStore import BatchStore, InMemoryBatchStore, SQLiteBatchStore
+
+
+def make_request(document_id: str) -> ProcessDocumentRequest:
+    return ProcessDocumentRequest(
+        tenant_id="tenant-1",
+        collection_id="collection-1",
+        id=document_id,
+        prompt="Extract the invoice",
+        type="invoice",
+        file_type="pdf",
+        url=f"uploads/{document_id}.pdf",
+        name=f"{document_id}.pdf",
+        callback_url=f"https://example.com/callbacks/{document_id}"
+    )
+
+
+class FakeStorage:
+    @contextlib.contextmanager
+    def download(self, url: str):
+        if "missing" in url:
+            raise FileNotFoundError(url)
+        yield BytesIO(b"%PDF-1.4 document")
+
+
+class FakeAnthropicClient:
+    def __init__(self, status: str = 'ended'):
+        self.status = status
+        self.submitted = []
+
+    def build_batch_request(self, custom_id, file_name, file_content, prompt):
+        return {"custom_id": custom_id, "file_name": file_name}, "pdfs-2024-09-25"
+
+    def submit_batch(self, requests, betas):
+        self.submitted.append([request["custom_id"] for request in requests])
+        return f"batch-{len(self.submitted)}"
+
+    def get_batch_status(self, batch_id):
+        return self.status
+
+    def iter_batch_results(self, batch_id):
+        yield "doc-0", '{"total": 1}', None
+
+
+class Callbacks:
+    def __init__(self, expected: int):
+        self.received = {}
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, url, payload):
+        self.received[url.rsplit('/', 1)[-1]] = json.loads(payload)
+        if len(self.received) >= self.expected:
+            self.done.set()
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def processor(store: BatchStore, client: FakeAnthropicClient, callbacks, **kwargs) -> BatchProcessor:
+    return BatchProcessor(lambda: client, FakeStorage(), callbacks, store, poll_interval_seconds=3600, **kwargs)
+
+
+def test_the_store_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        BatchStore()
+
+
+def test_a_submission_is_claimed_by_one_worker_at_a_time(tmp_path):
+    first, second = SQLiteBatchStore(str(tmp_path / "batches.db")), SQLiteBatchStore(str(tmp_path / "batches.db"))
+    submission_id = first.add_submission([make_request("a"), make_request("b")])
+
+    claimed = first.claim_submission(60)
+
+    assert claimed[0] == submission_id
+    assert [(position, request.id) for position, request in claimed[1]] == [(0, "a"), (1, "b")]
+    assert second.claim_submission(60) is None
+
+
+@pytest.mark.parametrize("make_store", [lambda path: SQLiteBatchStore(str(path / "batches.db")), lambda path: InMemoryBatchStore()])
+def test_batched_documents_leave_their_submission(tmp_path, make_store):
+    store = make_store(tmp_path)
+    submission_id = store.add_submission([make_request("a"), make_request("b"), make_request("c")])
+    store.claim_submission(60)
+
+    store.add_batch("batch-1", {"doc-0": make_request("a")}, submission_id, [0])
+    store.drop_from_submission(submission_id, [1])
+
+    assert store.queued() == 1
+    assert store.pending() == {"batch-1": 1}
+    assert store.claim_batches(60) == ["batch-1"]
+    assert store.claim_batches(60) == []
+    store.answer("batch-1", "doc-0")
+    assert store.pending() == {"batch-1": 0}
+    store.remove_batch("batch-1")
+    assert store.pending() == {}
+
+
+def test_every_worker_reports_the_batches_of_the_instance(tmp_path):
+    client = FakeAnthropicClient(status='in_progress')
+    callbacks = Callbacks(expected=1)
+    submitting = processor(SQLiteBatchStore(str(tmp_path / "batches.db")), client, callbacks)
+    other = processor(SQLiteBatchStore(str(tmp_path / "batches.db")), client, callbacks)
+
+    batch_ids = submitting.enqueue([make_request("a"), make_request("missing"), make_request("c")]).result(5)
+
+    assert batch_ids == ["batch-1"]
+    assert client.submitted == [["doc-0", "doc-2"]]
+    assert other.pending_batches() == {"batch-1": 2}
+    assert other.queued_documents() == 0
+    assert callbacks.done.wait(5)
+    assert callbacks.received["missing"]["error"]
+
+
+def test_batches_left_by_an_earlier_worker_are_delivered_at_startup(tmp_path):
+    path = str(tmp_path / "batches.db")
+    store = SQLiteBatchStore(path)
+    submission_id = store.add_submission([make_request("a"), make_request("b")])
+    store.add_batch("batch-7", {"doc-0": make_request("a"), "doc-1": make_request("b")}, submission_id, [0, 1])
+    callbacks = Callbacks(expected=2)
+
+    restarted = processor(SQLiteBatchStore(path), FakeAnthropicClient(), callbacks)
+
+    assert callbacks.done.wait(5)
+    assert callbacks.received["a"]["parsed_data"] == '{"total": 1}'
+    assert "No result returned in batch batch-7" in callbacks.received["b"]["error"]
+    assert wait_for(lambda: restarted.pending_batches() == {})
+
+
+def test_documents_never_submitted_by_an_earlier_worker_are_submitted_at_startup(tmp_path):
+    path = str(tmp_path / "batches.db")
+    SQLiteBatchStore(path).add_submission([make_request("a")])
+    client = FakeAnthropicClient(status='in_progress')
+    callbacks = Callbacks(expected=1)
+
+    resumed = BatchProcessor(lambda: client, FakeStorage(), callbacks, SQLiteBatchStore(path), poll_interval_seconds=0.05)
+
+    assert wait_for(lambda: resumed.pending_batches() == {"batch-1": 1})
+    assert resumed.queued_documents() == 0
+    client.status = 'ended'
+    assert callbacks.done.wait(5)
+    assert client.submitted == [["doc-0"]]
+
+
+def test_listing_batches_needs_a_token():
+    app = Flask(__name__)
+    app.register_blueprint(process_document_batch_bp, url_prefix='/api/v1/process/batch')
+
+    assert app.test_client().get('/api/v1/process/batch').status_code == 401
@@ -0,0 +1,100 @@
+import pytest
+
+from src.main.services.CallbackDispatcher import SQLiteCallbackOutbox
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "callbacks.db")
+
+
+def add(outbox: SQLiteCallbackOutbox, job_id: str):
+    outbox.add("https://example.com/callbacks", "https://example.com", f'{{"id":"{job_id}"}}'.encode(), job_id)
+
+
+def test_claimed_entries_are_leased(path):
+    outbox = SQLiteCallbackOutbox(path)
+    add(outbox, "doc-1")
+
+    claimed = outbox.claim_due(limit=10, lease_seconds=60)
+
+    assert [(entry.job_id, entry.body, entry.attempts) for entry in claimed] == [("doc-1", b'{"id":"doc-1"}', 0)]
+    assert outbox.claim_due(limit=10, lease_seconds=60) == []
+    assert outbox.has_pending("doc-1")
+    assert 55 < outbox.next_due_in() <= 60
+
+
+def test_a_lease_is_shared_by_worker_processes(path):
+    worker_a = SQLiteCallbackOutbox(path)
+    worker_b = SQLiteCallbackOutbox(path)
+    for index in range(3):
+        add(worker_a, f"doc-{index}")
+
+    claimed_a = worker_a.claim_due(limit=2, lease_seconds=60)
+    claimed_b = worker_b.claim_due(limit=10, lease_seconds=60)
+
+    assert len(claimed_a) == 2
+    assert len(claimed_b) == 1
+    assert {entry.id for entry in claimed_a}.isdisjoint(entry.id for entry in claimed_b)
+
+
+def test_an_expired_lease_is_claimed_again(path):
+    outbox = SQLiteCallbackOutbox(path)
+    add(outbox, "doc-1")
+
+    first = outbox.claim_due(limit=10, lease_seconds=0)
+    second = outbox.claim_due(limit=10, lease_seconds=60)
+
+    assert [entry.id for entry in second] == [entry.id for entry in first]
+
+
+def test_reschedule_counts_the_attempt_and_delays_the_retry(path):
+    outbox = SQLiteCallbackOutbox(path)
+    add(outbox, "doc-1")
+    entry_id = outbox.claim_due(limit=10, lease_seconds=60)[0].id
+
+    outbox.reschedule([entry_id], delay_seconds=60, error="503")
+    assert outbox.claim_due(limit=10, lease_seconds=60) == []
+
+    outbox.reschedule([entry_id], delay_seconds=0, error="503")
+    assert [entry.attempts for entry in outbox.claim_due(limit=10, lease_seconds=60)] == [2]
+
+
+def test_dead_lettered_entries_are_no_longer_pending(path):
+    outbox = SQLiteCallbackOutbox(path)
+    add(outbox, "doc-1")
+    add(outbox, "doc-2")
+    entry_id = outbox.claim_due(limit=1, lease_seconds=60)[0].id
+
+    outbox.dead_letter([entry_id], error="404")
+
+    assert not outbox.has_pending("doc-1")
+    assert outbox.has_pending("doc-2")
+    assert outbox.stats() == {"pending": 1, "dead": 1}
+    assert [entry.job_id for entry in outbox.claim_due(limit=10, lease_seconds=0)] == ["doc-2"]
+
+
+def test_only_the_newest_dead_entries_are_kept(path):
+    outbox = SQLiteCallbackOutbox(path, max_dead_entries=2)
+    for index in range(5):
+        add(outbox, f"doc-{index}")
+    entries = outbox.claim_due(limit=4, lease_seconds=60)
+
+    outbox.dead_letter([entry.id for entry in entries], error="410")
+
+    assert outbox.stats() == {"pending": 1, "dead": 2}
+
+
+def test_old_dead_entries_are_purged_on_open(path):
+    outbox = SQLiteCallbackOutbox(path)
+    add(outbox, "doc-1")
+    outbox.dead_letter([entry.id for entry in outbox.claim_due(limit=1, lease_seconds=60)], error="410")
+
+    assert SQLiteCallbackOutbox(path, dead_retention_seconds=3600).stats() == {"pending": 0, "dead": 1}
+    assert SQLiteCallbackOutbox(path, dead_retention_seconds=-1).stats() == {"pending": 0, "dead": 0}
+
+
+def test_undelivered_entries_survive_a_restart(path):
+    add(SQLiteCallbackOutbox(path), "doc-1")
+
+    assert [entry.job_id for entry in SQLiteCallbackOutbox(path).claim_due(limit=10, lease_seconds=60)] == ["doc-1"]
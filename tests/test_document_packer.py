@@ -0,0 +1,131 @@
+import json
+import threading
+from typing import List
+
+import pytest
+
+from src.main.services.DocumentPacker import DocumentPacker, PackedDocument, PackingError, split_packed_result
+from src.main.utils.json_stream import JsonText
+from src.main.utils.telemetry import telemetry
+
+PDF = b"%PDF-1.4 small document"
+
+
+def packed_response(elements: List) -> JsonText:
+    text = json.dumps(elements)
+    return JsonText(text, json.loads(text))
+
+
+class Sender:
+    """Answers a packed request with one result per document, naming the document it is for"""
+
+    def __init__(self, response=None):
+        self.response = response
+        self.calls: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, documents: List[PackedDocument], prompt: str) -> JsonText:
+        with self._lock:
+            self.calls.append([document.file_name for document in documents])
+        if self.response is not None:
+            return self.response
+        return packed_response([
+            {"index": index, "result": {"file": document.file_name}} for index, document in enumerate(documents, start=1)
+        ])
+
+
+def process_in_jobs(packer: DocumentPacker, send: Sender, jobs: List) -> dict:
+    """Process one document per (tenant, file name) concurrently, each inside its own job"""
+    results = {}
+
+    def run(tenant_id, file_name):
+        with telemetry.job(tenant_id, file_name):
+            results[file_name] = packer.process(
+                "anthropic", file_name, [(PDF, "application/pdf")], "Extract", "application/pdf", send
+            )
+
+    threads = [threading.Thread(target=run, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_split_packed_result():
+    results = split_packed_result(
+        packed_response([{"index": 1, "result": {"total": 1}}, {"index": 2, "result": []}]), 2
+    )
+
+    assert [result.parsed for result in results] == [{"total": 1}, []]
+    assert json.loads(results[0]) == {"total": 1}
+
+
+@pytest.mark.parametrize("elements, count", [
+    ({"index": 1, "result": {}}, 1),
+    ([{"index": 1, "result": {}}], 2),
+    ([{"index": 2, "result": {}}, {"index": 1, "result": {}}], 2),
+    ([{"index": True, "result": {}}], 1),
+    ([{"index": 1, "result": None}], 1),
+    ([{"total": 1}], 1),
+    ([[1]], 1)
+])
+def test_split_packed_result_rejects_what_it_cannot_map(elements, count):
+    with pytest.raises(PackingError):
+        split_packed_result(packed_response(elements), count)
+
+
+def test_the_sender_hands_each_follower_its_own_result():
+    packer = DocumentPacker(max_documents=3, max_wait_seconds=5)
+    send = Sender()
+
+    results = process_in_jobs(packer, send, [("tenant-1", f"doc-{index}.pdf") for index in range(3)])
+
+    assert len(send.calls) == 1
+    assert sorted(send.calls[0]) == ["doc-0.pdf", "doc-1.pdf", "doc-2.pdf"]
+    assert {name: result.parsed for name, result in results.items()} == {
+        f"doc-{index}.pdf": {"file": f"doc-{index}.pdf"} for index in range(3)
+    }
+    assert packer.stats()["packed_documents"] == 3
+
+
+def test_documents_of_different_tenants_are_not_packed():
+    packer = DocumentPacker(max_documents=2, max_wait_seconds=0.05)
+    send = Sender()
+
+    results = process_in_jobs(packer, send, [("tenant-1", "a.pdf"), ("tenant-2", "b.pdf")])
+
+    assert send.calls == []
+    assert results == {"a.pdf": None, "b.pdf": None}
+    assert packer.stats()["sent_alone"] == 2
+
+
+def test_documents_outside_a_job_are_not_packed():
+    packer = DocumentPacker(max_documents=2, max_wait_seconds=0.05)
+    send = Sender()
+
+    assert packer.process("anthropic", "a.pdf", [(PDF, "application/pdf")], "Extract", "application/pdf", send) is None
+    assert send.calls == []
+
+
+def test_every_document_falls_back_when_the_pack_cannot_be_split():
+    packer = DocumentPacker(max_documents=2, max_wait_seconds=5)
+    send = Sender(packed_response([{"index": 2, "result": {}}, {"index": 1, "result": {}}]))
+
+    results = process_in_jobs(packer, send, [("tenant-1", "a.pdf"), ("tenant-1", "b.pdf")])
+
+    assert len(send.calls) == 1
+    assert results == {"a.pdf": None, "b.pdf": None}
+    assert packer.stats()["split_failures"] == 1
+
+
+def test_every_document_falls_back_when_the_request_fails():
+    packer = DocumentPacker(max_documents=2, max_wait_seconds=5)
+
+    def send(documents, prompt):
+        raise RuntimeError("overloaded")
+
+    results = process_in_jobs(packer, send, [("tenant-1", "a.pdf"), ("tenant-1", "b.pdf")])
+
+    assert results == {"a.pdf": None, "b.pdf": None}
+    assert packer.stats()["request_failures"] == 1
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pytest
+
+from src.main.services.DuplicateDetector import (
+    DuplicateDetector, DuplicateIndex, Fingerprint, SQLiteDuplicateIndex, compute_fingerprint, key_digest, minhash
+)
+from tests.pdfs import text_pdf
+
+TERMS = [
+    "Payment is due within thirty days of the invoice date unless agreed otherwise in writing.",
+    "Late payments accrue interest at the statutory rate from the day after the due date.",
+    "Goods remain the property of the seller until the invoice has been paid in full.",
+    "Complaints about delivered goods must be raised in writing within fourteen days.",
+    "The courts at the seller's registered office have exclusive jurisdiction over disputes.",
+    "These terms and conditions apply to every delivery unless a separate contract says otherwise.",
+] * 4
+
+
+def invoice(number: str, total: str):
+    return [[f"Invoice {number}", f"Total due EUR {total}", "Issued 2024-03-01"], TERMS]
+
+
+def fingerprint(number: str, total: str) -> Fingerprint:
+    return compute_fingerprint(text_pdf(invoice(number, total)), 'application/pdf', 10)
+
+
+def candidate(document_id: str, fp: Fingerprint, result: str = '{"total": 1}'):
+    return {
+        "document_id": document_id,
+        "page_hashes": fp.page_hashes,
+        "minhash": fp.minhash,
+        "key_digest": fp.key_digest,
+        "result": result
+    }
+
+
+def test_the_index_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        DuplicateIndex()
+
+
+def test_key_digest_ignores_order_and_case_but_not_numbers():
+    words = "word " * 20
+    assert key_digest(words + "INV-001 total 12.50") == key_digest("total 12.50 inv-001 " + words)
+    assert key_digest(words + "INV-001 total 12.50") != key_digest(words + "INV-002 total 12.50")
+    assert key_digest("too short 1") is None
+
+
+def test_invoices_sharing_their_terms_look_alike_but_keep_different_keys():
+    first, second = fingerprint("2024-0042", "1,250.00"), fingerprint("2024-0043", "980.00")
+
+    assert first.page_count == 2
+    assert first.minhash is not None and first.key_digest is not None
+    assert first.minhash != minhash("unrelated " * 30)
+    assert first.key_digest != second.key_digest
+
+
+def test_a_matching_text_layer_with_different_numbers_is_not_reused():
+    detector = DuplicateDetector(SQLiteDuplicateIndex(':memory:'), action='reuse', text_threshold=0.8)
+    first, second = fingerprint("2024-0042", "1,250.00"), fingerprint("2024-0043", "980.00")
+
+    match = detector._compare(second, candidate("first", first))
+
+    assert match is not None and match.text_similarity >= 0.8
+    assert not match.keys_match
+    assert detector._on_lookup("second", second, match) is False
+    assert detector.stats()["key_mismatches"] == 1
+
+
+def test_a_document_with_the_same_numbers_is_reused_only_in_reuse_mode():
+    first, again = fingerprint("2024-0042", "1,250.00"), fingerprint("2024-0042", "1,250.00")
+    reusing = DuplicateDetector(SQLiteDuplicateIndex(':memory:'), action='reuse')
+    reporting = DuplicateDetector(SQLiteDuplicateIndex(':memory:'))
+
+    match = reusing._compare(again, candidate("first", first))
+
+    assert match.text_similarity == 1.0 and match.keys_match
+    assert reusing._on_lookup("again", again, match) is True
+    assert reporting.action == 'report'
+    assert reporting._on_lookup("again", again, match) is False
+
+
+def test_dissimilar_text_is_no_match():
+    detector = DuplicateDetector(SQLiteDuplicateIndex(':memory:'))
+    other = compute_fingerprint(text_pdf([["Delivery note 7 " * 30]]), 'application/pdf', 10)
+
+    assert detector._compare(other, candidate("first", fingerprint("1", "2"))) is None
+
+
+def test_the_index_returns_stored_key_digests(tmp_path):
+    detector = DuplicateDetector(SQLiteDuplicateIndex(str(tmp_path / 'duplicates.db')), action='reuse')
+    first = fingerprint("2024-0042", "1,250.00")
+    detector._record("tenant", "prompt", "first", first, '{"total": 1}')
+
+    assert detector._find("other-tenant", "prompt", first) is None
+    match = detector._find("tenant", "prompt", fingerprint("2024-0042", "1,250.00"))
+    assert match.document_id == "first" and match.keys_match
+    assert match.result == '{"total": 1}'
+
+
+def test_an_index_without_key_digests_is_migrated(tmp_path):
+    path = str(tmp_path / 'duplicates.db')
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE fingerprints (id INTEGER PRIMARY KEY AUTOINCREMENT, tenant_id TEXT NOT NULL, "
+        "prompt_key TEXT NOT NULL, document_id TEXT NOT NULL, page_count INTEGER NOT NULL, "
+        "page_hashes TEXT NOT NULL, minhash BLOB, result TEXT NOT NULL, created_at REAL NOT NULL)")
+    connection.close()
+
+    detector = DuplicateDetector(SQLiteDuplicateIndex(path), action='reuse')
+    detector._record("tenant", "prompt", "first", fingerprint("1", "2"), '{}')
+
+    assert detector._find("tenant", "prompt", fingerprint("1", "2")).keys_match
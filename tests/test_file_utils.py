@@ -0,0 +1,16 @@
+import base64
+import io
+import os
+
+import pytest
+
+from src.main.utils.file_utils import ENCODE_CHUNK_SIZE, b64encode_stream
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, ENCODE_CHUNK_SIZE - 1, ENCODE_CHUNK_SIZE, 2 * ENCODE_CHUNK_SIZE + 1])
+def test_b64encode_stream_matches_b64encode(size):
+    data = os.urandom(size)
+    expected = base64.b64encode(data).decode('ascii')
+
+    assert b64encode_stream(data) == expected
+    assert b64encode_stream(io.BytesIO(data)) == expected
@@ -0,0 +1,33 @@
+from io import BytesIO
+
+from PIL import Image
+
+from src.main.services.ImagePreprocessor import ImagePreprocessor, preprocess_image
+
+
+def png(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_large_images_are_downscaled_and_reencoded():
+    pages = preprocess_image(png(3000, 2000), 1000, 'JPEG', 85, False, False)
+
+    assert len(pages) == 1
+    content, mime_type = pages[0]
+    assert mime_type == 'image/jpeg'
+    with Image.open(BytesIO(content)) as image:
+        assert image.size == (1000, 667)
+
+
+def test_undecodable_images_are_sent_as_they_are():
+    preprocessor = ImagePreprocessor(max_workers=1)
+    try:
+        images = preprocessor.preprocess("broken.png", b"not an image", 'image/png')
+        shrunk = preprocessor.preprocess("large.png", png(3000, 2000), 'image/png')
+    finally:
+        preprocessor.executor.shutdown()
+
+    assert [(image.content, image.mime_type) for image in images] == [(b"not an image", 'image/png')]
+    assert shrunk[0].mime_type == 'image/jpeg'
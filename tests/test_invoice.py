@@ -0,0 +1,37 @@
+import pytest
+
+from src.main.models.dto.response.Invoice import Invoice, InvoiceLineItem, ResultSchemaError
+
+
+def test_known_fields_are_read_and_others_ignored():
+    invoice = Invoice.from_dict({
+        "invoice_number": 1234,
+        "currency": "EUR",
+        "total": "1.234,50",
+        "tax": 19.5,
+        "line_items": [{"description": "Paper", "quantity": 2, "amount": 10}],
+        "notes": ["anything"]
+    })
+
+    assert invoice.invoice_number == 1234
+    assert invoice.total == "1.234,50"
+    assert invoice.line_items == [InvoiceLineItem(description="Paper", quantity=2, amount=10)]
+
+
+def test_missing_and_null_fields_are_none():
+    invoice = Invoice.from_dict({"line_items": None})
+
+    assert invoice == Invoice()
+
+
+@pytest.mark.parametrize("value, message", [
+    ([], "result should be an object"),
+    ({"total": True}, "total should be float or int or str or null, not bool"),
+    ({"vendor_name": 1.5}, "vendor_name should be int or str or null, not float"),
+    ({"line_items": {"amount": 1}}, "line_items should be a list or null, not dict"),
+    ({"line_items": [{"amount": 1}, "Paper"]}, "line_items[1]: line item should be an object"),
+    ({"line_items": [{"quantity": [1]}]}, "line_items[0]: quantity should be")
+])
+def test_wrong_types_are_rejected(value, message):
+    with pytest.raises(ResultSchemaError, match=message.replace("[", "\\[").replace("]", "\\]")):
+        Invoice.from_dict(value)
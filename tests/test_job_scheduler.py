@@ -0,0 +1,103 @@
+import sys
+import threading
+
+import pytest
+from flask import Flask
+
+from src.main.controllers.ProcessDocumentControllerAsync import process_document_bp
+from src.main.services import services
+from src.main.services.JobScheduler import JobScheduler, QueueFullError, SchedulerUnavailableError
+
+controller_module = sys.modules[process_document_bp.import_name]
+
+
+def test_tenants_take_turns():
+    scheduler = JobScheduler(workers=1, max_queue_depth=10)
+    scheduler.start()
+    blocked, release, done = threading.Event(), threading.Event(), threading.Event()
+    order = []
+
+    def block():
+        blocked.set()
+        release.wait(5)
+
+    def record(name):
+        order.append(name)
+        if len(order) == 5:
+            done.set()
+
+    scheduler.submit("other", block)
+    assert blocked.wait(5)
+    for name in ("a1", "a2", "a3"):
+        scheduler.submit("a", record, name)
+    for name in ("b1", "b2"):
+        scheduler.submit("b", record, name)
+    assert scheduler.stats()["tenants_waiting"] == 2
+
+    release.set()
+    assert done.wait(5)
+    scheduler.shutdown()
+
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_a_failing_job_does_not_stop_its_worker():
+    scheduler = JobScheduler(workers=1)
+    scheduler.start()
+    done = threading.Event()
+
+    scheduler.submit("a", lambda: 1 / 0)
+    scheduler.submit("a", done.set)
+
+    assert done.wait(5)
+    scheduler.shutdown()
+
+
+def test_submissions_beyond_the_queue_depth_are_rejected():
+    scheduler = JobScheduler(workers=1, max_queue_depth=2, retry_after_seconds=7)
+    with pytest.raises(SchedulerUnavailableError):
+        scheduler.submit("a", print)
+
+    # Running without workers, so nothing leaves the queue
+    scheduler._running = True
+    scheduler.submit("a", print)
+    scheduler.submit("b", print)
+    with pytest.raises(QueueFullError) as error:
+        scheduler.submit("c", print)
+
+    assert error.value.retry_after == 7
+    assert scheduler.queue_depth == 2
+
+
+class FakeJobStore:
+    def __init__(self):
+        self.discarded = []
+
+    def accept(self, process_document_request, ai_type):
+        return True
+
+    def discard(self, job_id):
+        self.discarded.append(job_id)
+
+
+def test_a_full_queue_answers_429_and_forgets_the_job(monkeypatch):
+    scheduler = JobScheduler(max_queue_depth=0, retry_after_seconds=7)
+    scheduler._running = True
+    job_store = FakeJobStore()
+    monkeypatch.setattr(services, 'job_scheduler', scheduler, raising=False)
+    monkeypatch.setattr(services, 'async_pipeline', None, raising=False)
+    monkeypatch.setattr(services, 'job_store', job_store, raising=False)
+    monkeypatch.setattr(controller_module, 'verify_oidc_token', lambda request: {"sub": "caller"})
+    app = Flask(__name__)
+    app.config['CONFIGURATION'] = None
+    app.register_blueprint(process_document_bp, url_prefix='/api/v1/process')
+
+    response = app.test_client().post('/api/v1/process', json={
+        "id": "doc-1", "name": "a.pdf", "type": "invoice", "url": "https://example.com/a.pdf",
+        "prompt": "Extract", "file_type": "pdf", "tenant_id": "tenant", "collection_id": "c",
+        "callback_url": "https://example.com/callback"
+    })
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+    assert job_store.discarded == ["doc-1"]
@@ -0,0 +1,164 @@
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+from src.main.controllers.ProcessDocumentControllerAsync import process_document_bp
+from src.main.models.dto.request.ProcessDocumentRequest import ProcessDocumentRequest
+from src.main.models.enum.JobState import JobState
+from src.main.services import services
+from src.main.services.JobStore import JobRecovery, SQLiteJobStore
+
+
+def make_request(document_id: str = "doc-1") -> ProcessDocumentRequest:
+    return ProcessDocumentRequest(
+        tenant_id="tenant-1",
+        collection_id="collection-1",
+        id=document_id,
+        prompt="Extract the invoice",
+        type="invoice",
+        file_type="pdf",
+        url="uploads/doc-1.pdf",
+        name="doc-1.pdf",
+        callback_url="https://example.com/callbacks"
+    )
+
+
+def lose_worker(store: SQLiteJobStore, seconds_ago: float = 600):
+    """Backdate a store's heartbeat, as if its worker process had died that long ago"""
+    store._connection.execute(
+        "UPDATE workers SET heartbeat_at = ? WHERE owner = ?", (time.time() - seconds_ago, store.owner)
+    )
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def test_accept_rejects_a_document_already_in_progress(path):
+    store = SQLiteJobStore(path, owner="worker-a")
+
+    assert store.accept(make_request(), "anthropic")
+    assert not store.accept(make_request(), "anthropic")
+
+    store.transition("doc-1", JobState.DONE)
+    assert store.accept(make_request(), "gemini")
+    record = store.get("doc-1")
+    assert record.state == JobState.ACCEPTED
+    assert record.ai_type == "gemini"
+    assert record.attempts == 1
+
+
+def test_transition_keeps_the_callback_payload(path):
+    store = SQLiteJobStore(path, owner="worker-a")
+    store.accept(make_request(), None)
+
+    store.transition("doc-1", JobState.CALLBACK_PENDING, b'{"id":"doc-1","error":null}')
+    store.transition("doc-1", JobState.CALLBACK_PENDING)
+
+    record = store.get("doc-1")
+    assert record.callback_payload == {"id": "doc-1", "error": None}
+    assert record.request == make_request()
+
+
+def test_live_workers_keep_their_jobs(path):
+    worker_a = SQLiteJobStore(path, owner="worker-a")
+    worker_b = SQLiteJobStore(path, owner="worker-b")
+    worker_a.accept(make_request(), None)
+    worker_a.transition("doc-1", JobState.PARSING)
+
+    assert worker_b.claim_orphans(stale_after_seconds=120) == []
+
+
+def test_jobs_of_a_lost_worker_are_claimed_once(path):
+    worker_a = SQLiteJobStore(path, owner="worker-a")
+    worker_b = SQLiteJobStore(path, owner="worker-b")
+    worker_c = SQLiteJobStore(path, owner="worker-c")
+    worker_a.accept(make_request(), "anthropic")
+    worker_a.transition("doc-1", JobState.PARSING)
+    lose_worker(worker_a)
+
+    claimed = worker_b.claim_orphans(stale_after_seconds=120)
+
+    assert [(record.id, record.state, record.attempts) for record in claimed] == [("doc-1", JobState.PARSING, 2)]
+    assert claimed[0].ai_type == "anthropic"
+    assert worker_c.claim_orphans(stale_after_seconds=120) == []
+    assert worker_b.get("doc-1").attempts == 2
+
+
+@pytest.mark.parametrize("state", [JobState.DONE, JobState.FAILED])
+def test_finished_jobs_are_not_claimed(path, state):
+    worker_a = SQLiteJobStore(path, owner="worker-a")
+    worker_b = SQLiteJobStore(path, owner="worker-b")
+    worker_a.accept(make_request(), None)
+    worker_a.transition("doc-1", state)
+    lose_worker(worker_a)
+
+    assert worker_b.claim_orphans(stale_after_seconds=120) == []
+
+
+def test_purge_finished_only_removes_old_finished_jobs(path):
+    store = SQLiteJobStore(path, owner="worker-a")
+    store.accept(make_request("doc-1"), None)
+    store.accept(make_request("doc-2"), None)
+    store.transition("doc-1", JobState.DONE)
+
+    assert store.purge_finished(older_than_seconds=3600) == 0
+    assert store.purge_finished(older_than_seconds=-1) == 1
+    assert store.get("doc-1") is None
+    assert store.get("doc-2") is not None
+
+
+def test_recovery_resubmits_orphans_and_abandons_exhausted_ones(path):
+    worker_a = SQLiteJobStore(path, owner="worker-a")
+    worker_b = SQLiteJobStore(path, owner="worker-b")
+    worker_a.accept(make_request("doc-1"), None)
+    worker_a.accept(make_request("doc-2"), None)
+    # doc-2 has already been re-driven twice by workers that died in turn
+    worker_a._connection.execute("UPDATE jobs SET attempts = 3 WHERE id = 'doc-2'")
+    lose_worker(worker_a)
+
+    resubmitted, abandoned = [], []
+    recovery = JobRecovery(worker_b, resubmitted.append, abandoned.append, stale_after_seconds=120, max_attempts=3)
+    recovery.recover()
+
+    assert [record.id for record in resubmitted] == ["doc-1"]
+    assert [(record.id, record.attempts) for record in abandoned] == [("doc-2", 4)]
+    assert recovery.stats()["recovered"] == 1
+    assert recovery.stats()["abandoned"] == 1
+
+
+def test_recovery_releases_a_job_it_could_not_resume(path):
+    worker_a = SQLiteJobStore(path, owner="worker-a")
+    worker_b = SQLiteJobStore(path, owner="worker-b")
+    worker_c = SQLiteJobStore(path, owner="worker-c")
+    worker_a.accept(make_request(), None)
+    lose_worker(worker_a)
+
+    def fail(record):
+        raise RuntimeError("queue full")
+
+    JobRecovery(worker_b, fail, fail, stale_after_seconds=120).recover()
+
+    # Released without using up an attempt, for the next pass in any process
+    claimed = worker_c.claim_orphans(stale_after_seconds=120)
+    assert [(record.id, record.attempts) for record in claimed] == [("doc-1", 2)]
+
+
+def test_job_status_needs_a_token(tmp_path, monkeypatch):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    store.accept(make_request(), None)
+    monkeypatch.setattr(services, 'job_store', store, raising=False)
+    app = Flask(__name__)
+    app.register_blueprint(process_document_bp, url_prefix='/api/v1/process')
+    client = app.test_client()
+
+    assert client.get('/api/v1/process/jobs/doc-1').status_code == 401
+
+    controller = sys.modules[process_document_bp.import_name]
+    monkeypatch.setattr(controller, 'verify_oidc_token', lambda request: {"sub": "caller"})
+    response = client.get('/api/v1/process/jobs/doc-1')
+    assert response.status_code == 200
+    assert response.get_json()["id"] == "doc-1"
@@ -0,0 +1,55 @@
+import pytest
+
+from src.main.utils.json_stream import IncrementalJsonValidator, InvalidJsonStreamError
+
+
+def validate(*chunks: str):
+    validator = IncrementalJsonValidator()
+    for chunk in chunks:
+        validator.feed(chunk)
+    return validator.finish()
+
+
+def test_a_value_split_anywhere_is_parsed_once_complete():
+    text = '{"invoice_number": "INV-1", "total": -12.5e2, "paid": false, "items": [1, {"a": null}], "note": "\\u00e9\\"x"}'
+
+    result = validate(*text)
+
+    assert result == text
+    assert result.parsed["total"] == -1250.0
+    assert result.parsed["note"] == 'é"x'
+
+
+def test_a_markdown_fence_is_stripped():
+    result = validate("  ```json\n", '{"a": [1, 2]}', "\n```")
+
+    assert result.parsed == {"a": [1, 2]}
+    assert result == '{"a": [1, 2]}'
+
+
+def test_a_top_level_number_ends_with_the_stream():
+    assert validate("4", "2").parsed == 42
+
+
+@pytest.mark.parametrize("text", [
+    'Here is the JSON: {}',
+    '{"a": 1,,',
+    '{"a" 1}',
+    '{1: 2}',
+    '[1, 2}',
+    '{"a": tru3}',
+    '{"a": "\\uZZZZ"}',
+    '{} trailing'
+])
+def test_invalid_output_fails_as_soon_as_it_is_fed(text):
+    validator = IncrementalJsonValidator()
+    with pytest.raises(InvalidJsonStreamError):
+        validator.feed(text)
+
+
+@pytest.mark.parametrize("text", ['{"a": [1, 2]', '{"a": "unterminated', '[tr', ''])
+def test_truncated_output_fails_on_finish(text):
+    validator = IncrementalJsonValidator()
+    validator.feed(text)
+    with pytest.raises(InvalidJsonStreamError):
+        validator.finish()
@@ -0,0 +1,49 @@
+from src.main.services.PdfChunkProcessor import merge_chunk_results
+
+
+def test_a_single_result_is_returned_as_it_is():
+    result = {"invoice_number": "INV-1", "line_items": [{"amount": 1}]}
+
+    assert merge_chunk_results([result]) is result
+
+
+def test_lists_are_concatenated_in_page_order():
+    merged = merge_chunk_results([
+        {"line_items": [{"amount": 1}]},
+        {"line_items": [{"amount": 2}]},
+        {"line_items": [{"amount": 3}]}
+    ])
+
+    assert merged == {"line_items": [{"amount": 1}, {"amount": 2}, {"amount": 3}]}
+
+
+def test_header_fields_take_the_first_non_empty_value():
+    merged = merge_chunk_results([
+        {"invoice_number": None, "currency": "EUR", "total": ""},
+        {"invoice_number": "INV-1", "currency": "USD", "total": 100},
+        {"due_date": "2024-03-31"}
+    ])
+
+    assert merged == {"invoice_number": "INV-1", "currency": "EUR", "total": 100, "due_date": "2024-03-31"}
+
+
+def test_nested_objects_are_merged_recursively():
+    merged = merge_chunk_results([
+        {"vendor": {"name": "Acme", "address": {}}},
+        {"vendor": {"address": {"city": "Berlin"}, "vat_id": "DE1"}}
+    ])
+
+    assert merged == {"vendor": {"name": "Acme", "address": {"city": "Berlin"}, "vat_id": "DE1"}}
+
+
+def test_conflicts_keep_the_earlier_value_and_are_logged():
+    warnings = []
+
+    class Logger:
+        def warning(self, message):
+            warnings.append(message)
+
+    merged = merge_chunk_results([{"vendor": {"name": "Acme"}}, {"vendor": {"name": "Other"}}], Logger())
+
+    assert merged == {"vendor": {"name": "Acme"}}
+    assert len(warnings) == 1 and "vendor.name" in warnings[0]
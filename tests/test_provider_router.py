@@ -0,0 +1,75 @@
+import sys
+
+import pytest
+
+from src.main.services.ProviderRouter import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # The services package re-exports the ProviderRouter class under the module's name
+    monkeypatch.setattr(sys.modules[CircuitBreaker.__module__], "time", clock)
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_opens_after_the_open_period(clock):
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=60)
+    breaker.record_failure()
+
+    clock.now += 59
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_a_success_while_half_open_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=60)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 60
+    breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.allow()
+
+
+def test_a_failure_while_half_open_reopens_for_another_period(clock):
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=60)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 60
+    breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    clock.now += 59
+    assert not breaker.allow()
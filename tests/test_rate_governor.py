@@ -0,0 +1,200 @@
+import asyncio
+import os
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from src.main.services.RateGovernor import RateGovernor, SharedTokenBucket, TokenBucket, retry_after_seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_delay_seconds():
+    assert retry_after_seconds({"retry-after": "30"}) == 30.0
+    assert retry_after_seconds({"retry-after": "1.5"}) == 1.5
+
+
+def test_http_date():
+    in_a_minute = formatdate(time.time() + 60, usegmt=True)
+
+    assert 58 <= retry_after_seconds({"retry-after": in_a_minute}) <= 60
+
+
+def test_http_date_with_a_numeric_zone():
+    in_a_minute = formatdate(time.time() + 60)
+
+    assert 58 <= retry_after_seconds({"retry-after": in_a_minute}) <= 60
+
+
+def test_http_date_in_the_past_means_now():
+    assert retry_after_seconds({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+
+
+@pytest.mark.parametrize("headers", [None, {}, {"retry-after": "soon"}, {"retry-after": "2015-10-21T07:28:00Z"}])
+def test_missing_or_unparseable(headers):
+    assert retry_after_seconds(headers) is None
+
+
+def test_bucket_consumes_until_empty_then_reports_the_wait(clock):
+    bucket = TokenBucket(60)
+
+    assert bucket.try_consume(59) == 0
+    assert bucket.try_consume(3) == pytest.approx(2.0)
+    assert bucket.level() == pytest.approx(1.0)
+
+
+def test_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.try_consume(60)
+
+    clock[0] += 30
+    assert bucket.level() == pytest.approx(30.0)
+    clock[0] += 300
+    assert bucket.level() == pytest.approx(60.0)
+
+
+def test_bucket_admits_requests_larger_than_its_capacity(clock):
+    bucket = TokenBucket(60)
+
+    assert bucket.try_consume(500) == 0
+    assert bucket.level() == 0
+
+
+def test_bucket_adjust_returns_and_charges_tokens(clock):
+    bucket = TokenBucket(60)
+    bucket.try_consume(40)
+
+    bucket.adjust(10)
+    assert bucket.level() == pytest.approx(30.0)
+    bucket.adjust(-50)
+    assert bucket.level() == pytest.approx(-20.0)
+    bucket.adjust(1000)
+    assert bucket.level() == pytest.approx(60.0)
+
+
+def test_bucket_sync_follows_the_provider(clock):
+    bucket = TokenBucket(60)
+
+    bucket.sync(120, 10)
+    assert bucket.capacity == 120
+    assert bucket.level() == pytest.approx(10.0)
+
+    bucket.sync(None, 500)
+    assert bucket.capacity == 120
+    assert bucket.level() == pytest.approx(10.0)
+
+
+def test_bucket_drain_for_pauses_admissions(clock):
+    bucket = TokenBucket(60)
+
+    bucket.drain_for(10)
+    assert bucket.try_consume(1) == pytest.approx(11.0)
+    clock[0] += 11
+    assert bucket.try_consume(1) == 0
+
+
+def test_shared_buckets_draw_on_one_budget(tmp_path, clock):
+    path = str(tmp_path / "workers" / "anthropic-requests.bucket")
+    first, second = SharedTokenBucket(path, 60), SharedTokenBucket(path, 60)
+
+    assert first.try_consume(50) == 0
+    assert second.try_consume(20) == pytest.approx(10.0)
+    assert second.try_consume(10) == 0
+    assert first.level() == pytest.approx(0.0)
+
+    clock[0] += 30
+    assert second.level() == pytest.approx(30.0)
+
+
+def test_shared_bucket_carries_a_penalty_to_every_worker(tmp_path, clock):
+    path = str(tmp_path / "anthropic-requests.bucket")
+    first, second = SharedTokenBucket(path, 60), SharedTokenBucket(path, 60)
+
+    first.drain_for(5)
+    assert second.try_consume(1) == pytest.approx(6.0)
+
+
+def test_governor_shares_budgets_between_workers_of_one_server(tmp_path):
+    first = RateGovernor("anthropic", requests_per_minute=2, shared_directory=str(tmp_path))
+    second = RateGovernor("anthropic", requests_per_minute=2, shared_directory=str(tmp_path))
+
+    assert first._try_budget(1) == 0
+    assert second._try_budget(1) == 0
+    assert first._try_budget(1) > 0
+    assert os.listdir(tmp_path) == [str(os.getppid())]
+
+
+def test_governor_without_a_shared_directory_keeps_its_own_budgets():
+    governor = RateGovernor("anthropic")
+
+    assert type(governor.requests) is TokenBucket
+
+
+def drained_governor() -> RateGovernor:
+    # One slot, and a request budget that only admits the next request in about 0.3s
+    governor = RateGovernor("anthropic", max_concurrency=1, requests_per_minute=600)
+    governor.requests.drain_for(0.2)
+    return governor
+
+
+def slot_is_free(governor: RateGovernor) -> bool:
+    if not governor._slots.acquire(blocking=False):
+        return False
+    governor._slots.release()
+    return True
+
+
+def test_acquire_waits_on_the_budget_without_holding_a_slot():
+    governor = drained_governor()
+    admitted = threading.Event()
+
+    def request():
+        with governor.acquire(1):
+            admitted.set()
+
+    worker = threading.Thread(target=request)
+    worker.start()
+    time.sleep(0.1)
+    assert not admitted.is_set()
+    assert slot_is_free(governor)
+
+    worker.join(timeout=5)
+    assert admitted.is_set()
+    assert governor.throttled_seconds > 0
+    assert governor.in_flight == 0
+
+
+def test_acquire_async_waits_on_the_budget_without_holding_a_slot():
+    governor = drained_governor()
+
+    async def scenario():
+        admitted = asyncio.Event()
+
+        async def request():
+            async with governor.acquire_async(1):
+                admitted.set()
+
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.1)
+        assert not admitted.is_set()
+        assert slot_is_free(governor)
+        await asyncio.wait_for(task, timeout=5)
+        assert admitted.is_set()
+
+    asyncio.run(scenario())
+
+
+def test_acquire_holds_the_slot_while_the_request_runs():
+    governor = RateGovernor("anthropic", max_concurrency=1)
+
+    with governor.acquire(1):
+        assert governor.in_flight == 1
+        assert not slot_is_free(governor)
+    assert slot_is_free(governor)
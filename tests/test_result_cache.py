@@ -0,0 +1,70 @@
+import pytest
+
+from src.main.services.ResultCache import CacheBackend, InMemoryCacheBackend, ResultCache
+
+
+def test_the_backend_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_least_recently_used_results_are_evicted_over_the_byte_budget():
+    backend = InMemoryCacheBackend(max_entries=100, max_bytes=10)
+    backend.set("a", "aaaa")
+    backend.set("b", "bbbb")
+    backend.get("a")
+
+    backend.set("c", "cccc")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == "aaaa"
+    assert backend.get("c") == "cccc"
+    assert backend.size_bytes == 8
+
+
+def test_values_are_measured_in_utf8_bytes():
+    backend = InMemoryCacheBackend(max_entries=100, max_bytes=6)
+    backend.set("a", "€")
+    backend.set("b", "éé")
+
+    assert backend.get("a") is None
+    assert backend.size_bytes == 4
+
+
+def test_replacing_a_value_releases_its_bytes():
+    backend = InMemoryCacheBackend(max_entries=100, max_bytes=10)
+    backend.set("a", "aaaaaaaa")
+    backend.set("a", "aa")
+    backend.set("b", "bbbbbbbb")
+
+    assert backend.get("a") == "aa"
+    assert backend.size_bytes == 10
+
+
+def test_a_value_over_the_whole_budget_is_not_cached():
+    backend = InMemoryCacheBackend(max_entries=100, max_bytes=10)
+    backend.set("a", "aaaa")
+
+    backend.set("b", "b" * 11)
+
+    assert backend.get("b") is None
+    assert backend.get("a") == "aaaa"
+
+
+def test_the_entry_count_still_applies():
+    backend = InMemoryCacheBackend(max_entries=1, max_bytes=100)
+    backend.set("a", "aaaa")
+    backend.set("b", "bbbb")
+
+    assert len(backend) == 1
+    assert backend.size_bytes == 4
+
+
+def test_a_slower_tier_hit_is_written_back():
+    fast, slow = InMemoryCacheBackend(), InMemoryCacheBackend()
+    slow.set("key", "{}")
+    cache = ResultCache([fast, slow])
+
+    assert cache.get("key") == "{}"
+    assert fast.get("key") == "{}"
+    assert cache.stats()["tier_hits"] == {"memory": 1}
@@ -0,0 +1,63 @@
+import sys
+import types
+
+import pytest
+from flask import Flask
+
+from src.main.controllers.ProcessDocumentControllerAsync import process_document_bp
+from src.main.controllers.StatsController import stats_bp
+from src.main.services import ServiceRegistry, services
+from src.main.services.JobScheduler import JobScheduler
+from src.main.services.ResultValidator import ResultValidator
+
+stats_module = sys.modules[stats_bp.import_name]
+
+PATHS = ["cache", "stream", "routing", "text-layer", "packing", "queue", "jobs", "callbacks", "results", "duplicates"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    registry = ServiceRegistry()
+    registry.result_validator = ResultValidator()
+    registry.job_scheduler = JobScheduler()
+    registry.provider_router = types.SimpleNamespace(stats=lambda: {"providers": []})
+    registry.callback_dispatcher = types.SimpleNamespace(stats=lambda: {"pending": 0})
+
+    def never_built():
+        raise AssertionError("a stats route constructed a model client")
+
+    registry.init_anthropic_client("key")
+    registry._client_factories = {name: never_built for name in registry._client_factories}
+    for name in vars(registry):
+        monkeypatch.setattr(services, name, getattr(registry, name))
+
+    app = Flask(__name__)
+    app.config['CONFIGURATION'] = types.SimpleNamespace(streaming_enabled=True)
+    app.register_blueprint(stats_bp, url_prefix='/api/v1/process')
+    app.register_blueprint(process_document_bp, url_prefix='/api/v1/process')
+    return app.test_client()
+
+
+@pytest.mark.parametrize("name", PATHS)
+def test_stats_need_a_token(client, name):
+    assert client.get(f'/api/v1/process/{name}/stats').status_code == 401
+
+
+@pytest.mark.parametrize("name", PATHS)
+def test_stats_do_not_construct_model_clients(client, monkeypatch, name):
+    monkeypatch.setattr(stats_module, 'verify_oidc_token', lambda request: {"sub": "caller"})
+
+    response = client.get(f'/api/v1/process/{name}/stats')
+
+    assert response.status_code == 200
+
+
+def test_clients_are_reported_once_constructed(client, monkeypatch):
+    monkeypatch.setattr(stats_module, 'verify_oidc_token', lambda request: {"sub": "caller"})
+    stream = types.SimpleNamespace(stream_stats=types.SimpleNamespace(stats=lambda: {"streams": 3}))
+    monkeypatch.setitem(services._clients, "gemini", stream)
+
+    body = client.get('/api/v1/process/stream/stats').get_json()
+
+    assert body == {"enabled": True, "anthropic": None, "gemini": {"streams": 3}}
+    assert client.get('/api/v1/process/jobs/stats').get_json() == {"enabled": False}
@@ -0,0 +1,145 @@
+import base64
+import sys
+import threading
+import time
+from io import BytesIO
+
+import google_crc32c
+import pytest
+
+from src.main.services.StorageService import Crc32cReader, StorageService, UploadIntegrityError
+
+# The services package re-exports the class under the module's name
+storage_module = sys.modules[StorageService.__module__]
+
+
+def crc32c(data: bytes) -> str:
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode('ascii')
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def crc32c(self):
+        return crc32c(self.bucket.objects[self.name])
+
+    def upload_from_string(self, data: bytes, checksum=None, retry=None):
+        self.bucket.on_part(self.name)
+        self.bucket.objects[self.name] = data
+
+    def upload_from_file(self, stream, size=None, checksum=None, retry=None):
+        self.bucket.objects[self.name] = stream.read(size)
+
+    def compose(self, sources, retry=None):
+        self.bucket.composed.append(len(sources))
+        self.bucket.objects[self.name] = b''.join(self.bucket.objects[source.name] for source in sources)
+
+    def delete(self):
+        self.bucket.objects.pop(self.name, None)
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.composed = []
+        self.deleted = []
+        self.in_flight_at_delete = None
+        self.on_part = lambda name: None
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+    def delete_blobs(self, blobs, on_error=None):
+        self.deleted.extend(blob.name for blob in blobs)
+        for blob in blobs:
+            self.objects.pop(blob.name, None)
+
+
+class FakeClient:
+    _credentials = None
+
+    def __init__(self):
+        self.fake_bucket = FakeBucket()
+
+    def bucket(self, name):
+        return self.fake_bucket
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(storage_module.storage, 'Client', FakeClient)
+    return StorageService('bucket', composite_threshold_bytes=100, composite_part_size=10, upload_max_workers=3)
+
+
+def test_large_files_are_composed_from_parts_in_several_rounds(service, monkeypatch):
+    monkeypatch.setattr(storage_module, 'MAX_COMPOSE_SOURCES', 4)
+    data = bytes(range(256)) * 2
+
+    path = service.upload_file('big file.pdf', 'tenant', data)
+
+    bucket = service.bucket
+    assert path == 'tenant/big_file.pdf'
+    assert bucket.objects == {'tenant/big_file.pdf': data}
+    assert max(bucket.composed) <= 4 and len(bucket.composed) > 1
+    assert all(name.startswith('_uploads/') for name in bucket.deleted)
+
+
+def test_the_composed_checksum_is_checked_against_the_sender(service):
+    data = b'x' * 250
+
+    service.upload_file('a.pdf', 'tenant', data, expected_crc32c=crc32c(data))
+    with pytest.raises(UploadIntegrityError):
+        service.upload_file('b.pdf', 'tenant', data, expected_crc32c=crc32c(b'y'))
+
+    assert 'tenant/a.pdf' in service.bucket.objects
+    assert 'tenant/b.pdf' not in service.bucket.objects
+
+
+def test_parts_are_only_deleted_once_no_upload_is_running(service):
+    running = []
+    lock = threading.Lock()
+
+    def on_part(name):
+        with lock:
+            running.append(name)
+        try:
+            if name.endswith('part-00000'):
+                raise RuntimeError("part failed")
+            time.sleep(0.05)
+        finally:
+            with lock:
+                running.remove(name)
+
+    service.bucket.on_part = on_part
+    original = service.bucket.delete_blobs
+
+    def delete_blobs(blobs, on_error=None):
+        service.bucket.in_flight_at_delete = list(running)
+        original(blobs, on_error)
+
+    service.bucket.delete_blobs = delete_blobs
+
+    with pytest.raises(RuntimeError):
+        service.upload_file('c.pdf', 'tenant', b'z' * 250)
+
+    assert service.bucket.in_flight_at_delete == []
+    assert not any(name.startswith('_uploads/') for name in service.bucket.objects)
+
+
+def test_small_files_use_one_resumable_upload(service):
+    service.upload_file('small.pdf', 'tenant', b'small')
+
+    assert service.bucket.objects == {'tenant/small.pdf': b'small'}
+    assert service.bucket.composed == []
+
+
+def test_reread_bytes_are_hashed_once():
+    reader = Crc32cReader(BytesIO(b'0123456789'))
+    reader.read(6)
+    reader.seek(2)
+    reader.read()
+
+    assert reader.crc32c == crc32c(b'0123456789')
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+
+from src.main.utils.telemetry import (
+    Counter, Histogram, SharedMetrics, _decode_snapshot, _empty_snapshot, _encode_snapshot, _merge_into
+)
+
+STAGE = (("stage", "download"),)
+
+
+def snapshot(bucket_counts, total, tokens, queue_depth=None) -> dict:
+    result = _empty_snapshot()
+    result["histograms"]["latency"] = {STAGE: list(bucket_counts) + [total]}
+    result["counters"]["tokens"] = {(("direction", "input"),): tokens}
+    if queue_depth is not None:
+        result["gauges"]["queue_depth"] = {(): queue_depth}
+    return result
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_histogram_buckets_are_cumulative_with_an_inf_bucket():
+    histogram = Histogram("latency", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, {"stage": "download"})
+
+    lines = list(histogram.render())
+
+    assert lines == [
+        "# HELP latency Latency",
+        "# TYPE latency histogram",
+        'latency_bucket{stage="download",le="0.1"} 2',
+        'latency_bucket{stage="download",le="1.0"} 3',
+        'latency_bucket{stage="download",le="+Inf"} 4',
+        'latency_sum{stage="download"} 3.65',
+        'latency_count{stage="download"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("tokens", "Tokens")
+    counter.inc(2, {"tenant": 'a"b\\c'})
+
+    assert list(counter.render())[-1] == 'tokens{tenant="a\\"b\\\\c"} 2'
+
+
+def test_merging_sums_histograms_and_counters_and_labels_gauges_by_worker():
+    merged = _empty_snapshot()
+
+    _merge_into(merged, snapshot([1, 0, 2], 4.0, 10, queue_depth=3), 101)
+    _merge_into(merged, snapshot([0, 1, 1], 1.5, 5, queue_depth=7), 102)
+    _merge_into(merged, snapshot([1, 1, 1], 2.0, 1, queue_depth=9), None)
+
+    assert merged["histograms"]["latency"][STAGE] == [2, 2, 4, 7.5]
+    assert merged["counters"]["tokens"][(("direction", "input"),)] == 16
+    assert merged["gauges"]["queue_depth"] == {(("pid", "101"),): 3, (("pid", "102"),): 7}
+
+
+def test_histograms_with_other_buckets_are_not_mixed():
+    merged = _empty_snapshot()
+    _merge_into(merged, snapshot([1, 0, 2], 4.0, 0), 1)
+    _merge_into(merged, snapshot([5, 5], 1.0, 0), 2)
+
+    assert merged["histograms"]["latency"][STAGE] == [1, 0, 2, 4.0]
+
+
+def test_snapshots_survive_encoding():
+    original = snapshot([1, 0, 2], 4.5, 10, queue_depth=3)
+
+    assert _decode_snapshot(_encode_snapshot(original)) == original
+
+
+def test_collect_adds_other_workers_and_compaction_keeps_the_totals(tmp_path):
+    live = SharedMetrics(str(tmp_path), 60, lambda: snapshot([1, 0, 0], 0.5, 1, queue_depth=1))
+    other, dead = os.getppid(), exited_pid()
+    os.makedirs(live.directory)
+    live._write(f"{other}.json", snapshot([0, 1, 0], 1.0, 2, queue_depth=4))
+    live._write(f"{dead}.json", snapshot([0, 0, 1], 2.0, 4, queue_depth=8))
+
+    before = live.collect()
+    live._compact()
+    after = live.collect()
+
+    assert before == after
+    assert after["histograms"]["latency"][STAGE] == [1, 1, 1, 3.5]
+    assert after["counters"]["tokens"][(("direction", "input"),)] == 7
+    assert after["gauges"]["queue_depth"] == {(("pid", str(os.getpid())),): 1, (("pid", str(other)),): 4}
+    assert sorted(os.listdir(live.directory)) == sorted([".lock", "archive.json", f"{other}.json"])
+
+
+def test_compaction_adds_to_the_existing_archive(tmp_path):
+    shared = SharedMetrics(str(tmp_path), 60, _empty_snapshot)
+    os.makedirs(shared.directory)
+    shared._write(SharedMetrics.ARCHIVE, snapshot([1, 0, 0], 1.0, 1))
+    shared._write(f"{exited_pid()}.json", snapshot([0, 0, 1], 2.0, 2))
+
+    shared._compact()
+
+    archive = shared._read(SharedMetrics.ARCHIVE)
+    assert archive["histograms"]["latency"][STAGE] == [1, 0, 1, 3.0]
+    assert archive["counters"]["tokens"][(("direction", "input"),)] == 3
+
+
+def test_flush_writes_this_workers_file(tmp_path):
+    shared = SharedMetrics(str(tmp_path), 60, lambda: snapshot([1, 0, 0], 0.5, 1))
+
+    shared.flush()
+
+    assert shared._read(f"{os.getpid()}.json") == snapshot([1, 0, 0], 0.5, 1)
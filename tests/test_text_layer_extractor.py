@@ -0,0 +1,82 @@
+import pytest
+
+from src.main.services.TextLayerExtractor import (
+    LOW_QUALITY, SCANNED, TOO_LITTLE_TEXT, TOO_MANY_PAGES, TextLayerExtractor, extract_text_layer, text_quality
+)
+from tests.pdfs import scanned_pdf, text_pdf
+
+LINES = [
+    "Invoice 2024-0042 issued on 1 March 2024 to Example Trading GmbH, Hauptstrasse 5, Berlin.",
+    "Item 1: consulting services for February, 12 hours at EUR 95.00 per hour, EUR 1,140.00.",
+    "Item 2: travel expenses as agreed, EUR 110.00. VAT 19 percent, EUR 237.50.",
+    "Total due within thirty days: EUR 1,487.50. Bank transfer to the account below.",
+]
+
+
+def test_clean_text_scores_one():
+    assert text_quality(["Invoice 42", "Total due EUR 12.50"]) == 1.0
+
+
+def test_unmapped_glyphs_lower_the_score():
+    assert text_quality(["\ue000\ue001\ue002\ufffd ok words here"]) == pytest.approx(11 / 15)
+    assert text_quality(["(cid:12)(cid:13)(cid:14) word"]) < 0.2
+    assert text_quality(["", "  "]) == 0.0
+
+
+def test_words_run_together_lower_the_score():
+    assert text_quality(["short words " + "x" * 60]) == pytest.approx(2 / 3)
+
+
+def test_a_generated_pdf_yields_its_text_layer():
+    layer, reason = extract_text_layer(text_pdf([LINES, LINES]), 20, 200, True)
+
+    assert reason == 'ok'
+    assert len(layer.pages) == 2
+    assert "Invoice 2024-0042" in layer.pages[0]
+    assert layer.quality == 1.0
+
+
+def test_a_scanned_page_is_detected_from_its_image_size():
+    layer, reason = extract_text_layer(scanned_pdf(1240, 1754, LINES), 20, 200, True)
+
+    assert (layer, reason) == (None, SCANNED)
+
+
+def test_a_scan_drawn_through_a_form_is_detected():
+    assert extract_text_layer(scanned_pdf(1240, 1754, LINES, in_form=True), 20, 200, True) == (None, SCANNED)
+
+
+def test_small_images_are_not_taken_for_scans():
+    layer, reason = extract_text_layer(scanned_pdf(200, 80, LINES), 20, 200, True)
+
+    assert reason == 'ok'
+    assert "Total due" in layer.pages[0]
+
+
+def test_documents_without_enough_text_or_too_many_pages_are_rejected():
+    assert extract_text_layer(text_pdf([LINES, ["Page 2"]]), 20, 200, True) == (None, TOO_LITTLE_TEXT)
+    assert extract_text_layer(text_pdf([LINES] * 3), 2, 200, True) == (None, TOO_MANY_PAGES)
+
+
+def test_a_garbage_font_falls_back_to_the_document():
+    extractor = TextLayerExtractor(max_workers=1)
+    pdf = text_pdf([LINES], garbage_font=True)
+
+    layer, reason = extract_text_layer(pdf, 20, 200, False)
+    assert reason == 'ok' and layer.quality < 0.1
+
+    try:
+        assert extractor.extract("garbage.pdf", pdf) is None
+        assert extractor.extract("clean.pdf", text_pdf([LINES])).pages[0].startswith("Invoice")
+    finally:
+        extractor.executor.shutdown()
+    assert extractor.stats()["document_fallbacks"] == {LOW_QUALITY: 1}
+
+
+def test_unreadable_pdfs_are_counted_as_failed_extractions():
+    extractor = TextLayerExtractor(max_workers=1)
+    try:
+        assert extractor.extract("broken.pdf", b"not a pdf") is None
+    finally:
+        extractor.executor.shutdown()
+    assert extractor.stats()["document_fallbacks"] == {"extraction_failed": 1}
@@ -0,0 +1,105 @@
+import sys
+import types
+
+import pytest
+
+from src.main.services.UrlSigner import UrlSigner
+
+# The services package re-exports the class under the module's name
+url_signer_module = sys.modules[UrlSigner.__module__]
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    def generate_signed_url(self, version, expiration, method, **kwargs):
+        self.bucket.signed.append((self.name, kwargs.get('access_token')))
+        return f"https://signed/{self.name}?n={len(self.bucket.signed)}&expires={expiration}"
+
+
+class FakeBucket:
+    def __init__(self):
+        self.signed = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+class FakeCredentials:
+    service_account_email = "service@example.iam.gserviceaccount.com"
+
+    def __init__(self):
+        self.valid = False
+        self.token = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.valid = True
+        self.token = f"token-{self.refreshes}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(url_signer_module, 'time', types.SimpleNamespace(time=lambda: fake.now))
+    return fake
+
+
+@pytest.fixture
+def signer():
+    return UrlSigner(FakeBucket(), FakeCredentials(), min_remaining_seconds=300, max_workers=4)
+
+
+def test_urls_are_reused_while_most_of_their_lifetime_is_left(signer, clock):
+    first = signer.sign(["a.pdf"], expiration=3600)
+
+    clock.now += 0.2 * 3600 - 1
+    assert signer.sign(["a.pdf"], expiration=3600) == first
+
+    clock.now += 2
+    assert signer.sign(["a.pdf"], expiration=3600) != first
+    assert signer.stats()["hits"] == 1
+    assert signer.stats()["signed"] == 2
+
+
+def test_reuse_never_leaves_less_than_the_minimum_remaining_seconds(clock):
+    signer = UrlSigner(FakeBucket(), FakeCredentials(), min_remaining_seconds=300, min_remaining_fraction=0.1)
+    first = signer.sign(["a.pdf"], expiration=600)
+
+    clock.now += 299
+    assert signer.sign(["a.pdf"], expiration=600) == first
+    clock.now += 2
+    assert signer.sign(["a.pdf"], expiration=600) != first
+
+
+def test_each_expiration_is_cached_separately(signer, clock):
+    short, long = signer.sign(["a.pdf"], expiration=600), signer.sign(["a.pdf"], expiration=3600)
+
+    assert short != long
+    assert long[0].endswith("expires=3600")
+
+
+def test_a_batch_signs_each_missing_file_once_with_one_token(signer, clock):
+    signer.sign(["a.pdf"])
+
+    urls = signer.sign(["b.pdf", "a.pdf", "b.pdf", "c.pdf"])
+
+    assert urls[1] == signer.sign(["a.pdf"])[0]
+    assert urls[0] == urls[2]
+    assert [name for name, _ in signer.bucket.signed] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert {token for _, token in signer.bucket.signed} == {"token-1"}
+    assert signer.stats()["mode"] == "iam"
+
+
+def test_least_recently_used_urls_are_evicted(clock):
+    signer = UrlSigner(FakeBucket(), FakeCredentials(), cache_max_entries=2)
+    signer.sign(["a.pdf", "b.pdf"])
+    signer.sign(["a.pdf"])
+    signer.sign(["c.pdf"])
+
+    signer.sign(["a.pdf", "b.pdf"])
+
+    assert [name for name, _ in signer.bucket.signed] == ["a.pdf", "b.pdf", "c.pdf", "b.pdf"]
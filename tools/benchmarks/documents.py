@@ -0,0 +1,75 @@
+"""
+Deterministic benchmark documents: valid PDFs of a chosen size that carry a BENCHDOC marker,
+so the fakes can attribute every download, model call and callback to its document.
+"""
+import random
+from typing import List, Tuple
+
+PAGE_FILLER_BYTES = 256 * 1024
+UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 * 1024, 'mb': 1024 * 1024}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    digits = text.rstrip('kmb')
+    return int(float(digits) * UNITS[text[len(digits):]])
+
+
+def parse_size_mix(text: str) -> List[Tuple[int, float]]:
+    """
+    "100k:0.6,1m:0.3,10m:0.1" -> [(102400, 0.6), (1048576, 0.3), (10485760, 0.1)]
+    """
+    mix = []
+    for entry in text.split(','):
+        size, _, weight = entry.partition(':')
+        mix.append((parse_size(size), float(weight or 1)))
+    return mix
+
+
+def pick_sizes(mix: List[Tuple[int, float]], count: int, seed: int) -> List[int]:
+    generator = random.Random(seed)
+    sizes, weights = zip(*mix)
+    return generator.choices(sizes, weights=weights, k=count)
+
+
+def build_pdf(document_id: str, size_bytes: int, seed: int = 0) -> bytes:
+    """
+    A PDF of roughly size_bytes with one page per PAGE_FILLER_BYTES of filler. The filler is
+    random hex in PDF comments, so it is not compressible and does not change the rendered page.
+    """
+    generator = random.Random(f"{seed}:{document_id}")
+    page_count = max(1, size_bytes // PAGE_FILLER_BYTES)
+    filler_per_page = max(size_bytes // page_count - 600, 0)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(f"{4 + 2 * i} 0 R".encode() for i in range(page_count))
+        + f"] /Count {page_count} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for page in range(page_count):
+        text = f"BT /F1 12 Tf 72 720 Td (BENCHDOC:{document_id} page {page + 1}) Tj ET\n".encode()
+        lines = []
+        remaining = filler_per_page
+        while remaining > 0:
+            width = min(remaining, 128)
+            lines.append(b"%" + generator.randbytes((width + 1) // 2).hex().encode()[:max(width - 2, 0)] + b"\n")
+            remaining -= width
+        stream = text + b"".join(lines)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {5 + 2 * page} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(output)
@@ -0,0 +1,138 @@
+"""
+Encode/decode cost of a model result on its way from the provider response to the document
+store, for a synthetic invoice with --line-items line items.
+
+The baseline is the old path: the client validates the text with json.loads and throws the
+value away, the callback carries the text as a string inside a json.dumps body, and the
+receiver parses the body and then the string. The new path parses once with json_codec
+(ENGINE in the report), checks the invoice schema, and encodes the body once, with
+parsed_data as a string or embedded as an object. Receiver cost is always the standard
+library, since the document store is not ours.
+
+    python -m tools.benchmarks.json_codec --line-items 200 --iterations 2000
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+LAUNCH_DIRECTORY = os.getcwd()
+
+# Importing the service package loads its configuration from src/resources; keys in the
+# environment keep that from reaching Secret Manager
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.chdir(REPO_ROOT / "src")
+
+from src.main.models.dto.response.Invoice import Invoice  # noqa: E402
+from src.main.models.dto.response.ProcessDocumentCallbackRequest import ProcessDocumentCallbackRequest  # noqa: E402
+from src.main.utils import json_codec  # noqa: E402
+from src.main.utils.json_stream import JsonText  # noqa: E402
+
+
+def model_output(line_items: int) -> str:
+    return json.dumps({
+        "invoice_number": "INV-2024-000123",
+        "invoice_date": "2024-03-01",
+        "due_date": "2024-03-31",
+        "currency": "EUR",
+        "vendor_name": "Acme Supplies GmbH",
+        "customer_name": "Example Logistics B.V.",
+        "subtotal": 12345.67,
+        "tax": 2592.59,
+        "total": 14938.26,
+        "line_items": [
+            {
+                "description": f"Pallet of item #{index} – standard grade",
+                "quantity": index % 7 + 1,
+                "unit_price": 12.5 + index,
+                "amount": (index % 7 + 1) * (12.5 + index)
+            }
+            for index in range(line_items)
+        ]
+    }, indent=2)
+
+
+def callback(parsed_data) -> ProcessDocumentCallbackRequest:
+    return ProcessDocumentCallbackRequest(
+        id="document-000123",
+        name="invoice.pdf",
+        type="invoice",
+        parsed_data=parsed_data,
+        metadata={},
+        error=None
+    )
+
+
+def measure(run: Callable[[], None], iterations: int) -> Dict:
+    run()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        run()
+    elapsed = time.perf_counter() - start
+    return {"microseconds_per_document": round(elapsed / iterations * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--line-items', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    text = model_output(args.line_items)
+
+    def baseline_service():
+        json.loads(text)
+        return json.dumps(callback(text).to_dict()).encode('utf-8')
+
+    def new_service(embed: bool):
+        parsed = JsonText(text, json_codec.loads(text))
+        Invoice.from_dict(parsed.parsed)
+        return callback(parsed).to_json(embed)
+
+    def parse_string_body(body: bytes):
+        json.loads(json.loads(body)['parsed_data'])
+
+    def parse_embedded_body(body: bytes):
+        json.loads(body)
+
+    baseline_body = baseline_service()
+    string_body = new_service(False)
+    embedded_body = new_service(True)
+    assert json.loads(json.loads(string_body)['parsed_data']) == json.loads(embedded_body)['parsed_data']
+
+    report = {
+        "engine": json_codec.ENGINE,
+        "line_items": args.line_items,
+        "model_output_bytes": len(text.encode('utf-8')),
+        "baseline": {
+            "body_bytes": len(baseline_body),
+            "service": measure(baseline_service, args.iterations),
+            "receiver": measure(lambda: parse_string_body(baseline_body), args.iterations)
+        },
+        "string_parsed_data": {
+            "body_bytes": len(string_body),
+            "service": measure(lambda: new_service(False), args.iterations),
+            "receiver": measure(lambda: parse_string_body(string_body), args.iterations)
+        },
+        "embedded_parsed_data": {
+            "body_bytes": len(embedded_body),
+            "service": measure(lambda: new_service(True), args.iterations),
+            "receiver": measure(lambda: parse_embedded_body(embedded_body), args.iterations)
+        },
+        "schema_validation_only": measure(lambda: Invoice.from_dict(json_codec.loads(text)), args.iterations)
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(os.path.join(LAUNCH_DIRECTORY, args.output), 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,599 @@
+"""
+End-to-end benchmark of the service against local fakes, with no network access and no tokens spent.
+
+Starts the fake Anthropic, Gemini, GCS, Google auth and callback servers in this process, runs
+the service under gunicorn with a generated `benchmark` profile pointing at them, and drives
+/api/v1/process (sync, async or asyncio mode) or /api/v1/upload at a fixed concurrency with a
+seeded mix of document sizes. Every document carries a marker the fakes record, so the report
+breaks each request down into download, model, callback and upload stages as well as giving
+throughput, end-to-end p50/p95/p99 and the peak RSS of the gunicorn process tree.
+
+    python -m tools.benchmarks.service --workload process --mode async --requests 200 --concurrency 16 \\
+        --size-mix 100k:0.7,1m:0.25,5m:0.05 --latency-ms 800 --jitter-ms 400 --rate-limit-rate 0.02 \\
+        --output results/process-async.json
+
+The report is JSON (stdout, and --output) so runs can be diffed and tracked for regressions.
+Client, fakes and recording share this process, so keep --concurrency within what one Python
+process can drive; the service itself runs in its own processes.
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+import yaml
+from deepmerge import always_merger
+
+from tools.benchmarks.documents import build_pdf, parse_size_mix, pick_sizes
+from tools.fakes import anthropic_server, callback_sink, gcs_server, gemini_server, google_auth_server
+from tools.fakes.anthropic_server import DEFAULT_RESPONSE
+from tools.fakes.common import LatencyModel
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+BUCKET = "benchmark-bucket"
+# Stands in for the document store: the audience of callback ID tokens
+DOCUMENT_STORE_URL = "https://document-store.benchmark.local"
+PROMPT = "Extract the invoice header and line items as JSON."
+MAX_RETRY_AFTER_SECONDS = 5
+
+
+@dataclass
+class RequestResult:
+    document_id: str
+    size: int
+    sent: float
+    responded: Optional[float] = None
+    status: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+def percentiles(values: List[float]) -> Optional[Dict]:
+    """
+    Nearest-rank percentiles of values given in seconds, reported in milliseconds
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2)
+    }
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the RSS of a process and its descendants from /proc; Linux only, reports None elsewhere
+    """
+
+    def __init__(self, pid: int, interval_seconds: float = 0.25):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.pid = pid
+        self.interval_seconds = interval_seconds
+        self.peak_total_bytes: Optional[int] = None
+        self.peak_process_bytes: Optional[int] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _descendants(pid: int) -> List[int]:
+        pids = [pid]
+        for children in glob.glob(f"/proc/{pid}/task/*/children"):
+            try:
+                with open(children) as file:
+                    for child in file.read().split():
+                        pids.extend(MemorySampler._descendants(int(child)))
+            except OSError:
+                continue
+        return pids
+
+    @staticmethod
+    def _status_kb(pid: int, field: str) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as file:
+                for line in file:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def sample(self):
+        if not os.path.exists(f"/proc/{self.pid}"):
+            return
+        pids = self._descendants(self.pid)
+        total = sum(self._status_kb(pid, 'VmRSS:') for pid in pids) * 1024
+        largest = max(self._status_kb(pid, 'VmHWM:') for pid in pids) * 1024
+        self.peak_total_bytes = max(self.peak_total_bytes or 0, total)
+        self.peak_process_bytes = max(self.peak_process_bytes or 0, largest)
+
+    def run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.sample()
+
+    def stop(self):
+        self.sample()
+        self._stop.set()
+
+
+class Fakes:
+    def __init__(self, args):
+        response = json.dumps(DEFAULT_RESPONSE)
+        self.auth = google_auth_server.serve(0)
+        self.gcs = gcs_server.serve(0, LatencyModel(args.gcs_latency_ms, seed=args.seed))
+        self.anthropic = anthropic_server.serve(
+            0,
+            batch_latency=5,
+            response_text=response,
+            latency=LatencyModel(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.seed),
+            retry_after_seconds=args.retry_after
+        )
+        self.gemini = gemini_server.serve(
+            0, response, LatencyModel(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.seed + 1)
+        )
+        self.callbacks = callback_sink.serve(
+            0, LatencyModel(args.callback_latency_ms, error_rate=args.callback_failure_rate, seed=args.seed + 2)
+        )
+
+    def servers(self):
+        return [self.auth, self.gcs, self.anthropic, self.gemini, self.callbacks]
+
+    def shutdown(self):
+        for server in self.servers():
+            server.shutdown()
+
+
+def write_workdir(args, fakes: Fakes) -> Path:
+    """
+    A working directory for gunicorn: the repo's resources plus a benchmark profile pointing at
+    the fakes, and the fake service account key
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="document-parser-benchmark-"))
+    shutil.copytree(REPO_ROOT / "src" / "resources", workdir / "resources")
+
+    unlimited = {"max-concurrency": args.provider_concurrency, "requests-per-minute": 10 ** 6, "input-tokens-per-minute": 10 ** 10}
+    providers = ["gemini", "anthropic"] if args.provider == "gemini" else ["anthropic", "gemini"]
+    profile = {
+        "storage": {"bucket": BUCKET},
+        "document-store": {"url": DOCUMENT_STORE_URL},
+        "anthropic": {"base-url": fakes.anthropic.url},
+        "gemini": {"base-url": fakes.gemini.url},
+        "security": {"oidc": {"certs-url": f"{fakes.auth.url}/oauth2/v1/certs"}},
+        "processing": {"mode": args.mode},
+        "callbacks": {"outbox": {"path": str(workdir / "callbacks.db")}},
+        "jobs": {"store": {"enabled": True, "path": str(workdir / "jobs.db")}},
+        "batch": {"enabled": False},
+        "streaming": {"enabled": args.streaming},
+        "rate-limits": {"anthropic": unlimited, "gemini": unlimited},
+        "routing": {"providers": providers},
+        # Other workers' series reach the final scrape within a flush
+        "telemetry": {"metrics": {"multiprocess-dir": str(workdir / "metrics"), "flush-interval-seconds": 0.5}}
+    }
+    if args.config_override:
+        with open(args.config_override) as file:
+            profile = always_merger.merge(profile, yaml.safe_load(file) or {})
+    with open(workdir / "resources" / "application-benchmark.yaml", "w") as file:
+        yaml.safe_dump(profile, file)
+
+    with open(workdir / "service-account.json", "w") as file:
+        json.dump(fakes.auth.state.service_account_info(f"{fakes.auth.url}/token"), file)
+    return workdir
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(args, fakes: Fakes, workdir: Path):
+    port = free_port()
+    env = dict(
+        os.environ,
+        ENV="benchmark",
+        PROCESSING_MODE=args.mode,
+        STORAGE_EMULATOR_HOST=fakes.gcs.url,
+        GOOGLE_APPLICATION_CREDENTIALS=str(workdir / "service-account.json"),
+        GOOGLE_CLOUD_PROJECT="fake-project",
+        ANTHROPIC_API_KEY="fake-anthropic-key",
+        GEMINI_API_KEY="fake-gemini-key",
+        NO_PROXY="127.0.0.1,localhost"
+    )
+    worker_class = args.worker_class or ('gthread' if args.mode == 'asyncio' else 'gevent')
+    command = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--chdir", str(workdir),
+        "--pythonpath", str(REPO_ROOT / "src"),
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--worker-class", worker_class,
+        "--threads", str(args.threads),
+        "--timeout", "300",
+        "--graceful-timeout", "10"
+    ]
+    log = open(workdir / "server.log", "wb")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT, cwd=workdir)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited during startup, see {workdir / 'server.log'}")
+        try:
+            if requests.get(f"{url}/api/v1/upload/health", timeout=1).status_code == 200:
+                return process, url, time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Service not ready after {args.startup_timeout}s, see {workdir / 'server.log'}")
+
+
+def stop_service(process: subprocess.Popen):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class Driver:
+    def __init__(self, args, fakes: Fakes, service_url: str):
+        self.args = args
+        self.fakes = fakes
+        self.service_url = service_url
+        self.token = fakes.auth.state.mint_id_token(service_url)
+        self._local = threading.local()
+        self.rejections = 0
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers["Authorization"] = f"Bearer {self.token}"
+        return self._local.session
+
+    def _metadata(self, document_id: str, size: int) -> Dict:
+        return {
+            "upload_path": "benchmark/uploads",
+            "file_name": f"{document_id}.pdf",
+            "collection_id": "benchmark-collection",
+            "document_id": document_id,
+            "tenant_id": "benchmark-tenant",
+            "user_id": "benchmark-user",
+            "file_type": "pdf",
+            "file_size": size,
+            "callback_url": f"{self.fakes.callbacks.url}/callbacks/upload"
+        }
+
+    def _post(self, result: RequestResult, send) -> RequestResult:
+        # Rejections from a full queue are retried after the advertised Retry-After, like a real client
+        while True:
+            result.attempts += 1
+            try:
+                response = send()
+            except requests.RequestException as e:
+                result.error = str(e)
+                result.responded = time.time()
+                return result
+            if response.status_code in (429, 503) and result.attempts < self.args.max_attempts:
+                with self._lock:
+                    self.rejections += 1
+                time.sleep(min(float(response.headers.get('Retry-After') or 1), MAX_RETRY_AFTER_SECONDS))
+                continue
+            result.status = response.status_code
+            result.responded = time.time()
+            if response.status_code >= 300:
+                result.error = response.text[:200]
+            return result
+
+    def process(self, document_id: str, size: int) -> RequestResult:
+        body = {
+            "id": document_id,
+            "name": f"{document_id}.pdf",
+            "type": "invoice",
+            "url": f"{self.fakes.gcs.url}/signed/{BUCKET}/benchmark/{document_id}.pdf?X-Goog-Signature=benchmark",
+            "prompt": PROMPT,
+            "file_type": "pdf",
+            "tenant_id": "benchmark-tenant",
+            "collection_id": "benchmark-collection",
+            "callback_url": f"{self.fakes.callbacks.url}/callbacks/process"
+        }
+        params = {"ai": self.args.provider.upper()} if self.args.provider else None
+        result = RequestResult(document_id, size, time.time())
+        return self._post(result, lambda: self._session().post(
+            f"{self.service_url}/api/v1/process", json=body, params=params, timeout=self.args.request_timeout
+        ))
+
+    def upload(self, document_id: str, size: int, content: bytes) -> RequestResult:
+        metadata = self._metadata(document_id, size)
+        result = RequestResult(document_id, size, time.time())
+        session = self._session()
+        url = f"{self.service_url}/api/v1/upload"
+        timeout = self.args.request_timeout
+
+        if self.args.upload_endpoint == "json":
+            body = dict(metadata, file=base64.b64encode(content).decode('ascii'))
+            return self._post(result, lambda: session.post(url, json=body, timeout=timeout))
+        if self.args.upload_endpoint == "multipart":
+            return self._post(result, lambda: session.post(
+                f"{url}/stream", data=metadata, files={"file": (metadata["file_name"], content, "application/pdf")},
+                timeout=timeout
+            ))
+        return self._post(result, lambda: session.post(
+            f"{url}/stream", params=metadata, data=content, headers={"Content-Type": "application/pdf"},
+            timeout=timeout
+        ))
+
+
+def wait_for_callbacks(fakes: Fakes, document_ids: List[str], timeout_seconds: float):
+    expected = set(document_ids)
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        delivered = {event.document_id for event in fakes.callbacks.state.events.events("callback") if event.status == 200}
+        if expected <= delivered:
+            return
+        time.sleep(0.1)
+
+
+def first_events(events, kind: str, successful: bool = True) -> Dict:
+    by_document = {}
+    for event in sorted(events, key=lambda event: event.started):
+        if event.kind == kind and (event.status == 200 or not successful):
+            by_document.setdefault(event.document_id, event)
+    return by_document
+
+
+def stage_report(args, fakes: Fakes, results: List[RequestResult]) -> Dict:
+    downloads = first_events(fakes.gcs.state.events.events("download"), "download")
+    # Large uploads arrive as parts and finish with a compose of the final object
+    uploads = {
+        **first_events(fakes.gcs.state.events.events("upload"), "upload"),
+        **first_events(fakes.gcs.state.events.events("compose"), "compose")
+    }
+    callbacks = first_events(fakes.callbacks.state.events.events("callback"), "callback")
+    model_events: Dict[str, List] = {}
+    for event in fakes.anthropic.state.events.events("model") + fakes.gemini.state.events.events("model"):
+        model_events.setdefault(event.document_id, []).append(event)
+
+    stages: Dict[str, List[float]] = {}
+
+    def add(stage: str, start: Optional[float], end: Optional[float]):
+        if start is not None and end is not None:
+            stages.setdefault(stage, []).append(end - start)
+
+    end_to_end = []
+    for result in results:
+        callback = callbacks.get(result.document_id)
+        if args.workload == "process":
+            download = downloads.get(result.document_id)
+            calls = model_events.get(result.document_id, [])
+            model_start = min((event.started for event in calls), default=None)
+            model_end = max((event.finished for event in calls if event.status == 200), default=None)
+            add("request_to_download", result.sent, download.started if download else None)
+            add("download", download.started if download else None, download.finished if download else None)
+            add("download_to_model", download.finished if download else None, model_start)
+            add("model", model_start, model_end)
+            add("model_to_callback", model_end, callback.started if callback else None)
+            if args.mode == "sync":
+                add("response", result.sent, result.responded if result.status == 200 else None)
+        else:
+            upload = uploads.get(result.document_id)
+            add("request_to_gcs", result.sent, upload.started if upload else None)
+            add("gcs_upload", upload.started if upload else None, upload.finished if upload else None)
+            add("gcs_to_callback", upload.finished if upload else None, callback.started if callback else None)
+
+        # Sync requests complete with their response, async ones with their callback
+        if args.workload == "process" and args.mode != "sync":
+            completed = callback.started if callback else None
+        else:
+            completed = result.responded if result.status == 200 else None
+        if completed is not None:
+            end_to_end.append((result.sent, completed))
+
+    return {
+        "end_to_end": end_to_end,
+        "stages_ms": {stage: percentiles(values) for stage, values in stages.items()}
+    }
+
+
+def scrape_service_stats(service_url: str, mode: str, token: str) -> Dict:
+    paths = [
+        "/api/v1/process/routing/stats", "/api/v1/process/stream/stats", "/api/v1/process/cache/stats",
+        "/api/v1/process/text-layer/stats", "/api/v1/process/packing/stats"
+    ]
+    if mode != "sync":
+        paths += ["/api/v1/process/queue/stats", "/api/v1/process/jobs/stats", "/api/v1/process/callbacks/stats",
+                  "/api/v1/process/results/stats", "/api/v1/process/duplicates/stats"]
+    stats = {}
+    for path in paths:
+        try:
+            response = requests.get(f"{service_url}{path}", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+            if response.ok:
+                stats[path.rsplit('/', 2)[-2]] = response.json()
+        except (requests.RequestException, ValueError):
+            continue
+    return stats
+
+
+STAGE_SERIES = re.compile(r'^document_parser_stage_duration_seconds_(sum|count)\{([^}]*)\} (\S+)$')
+
+
+def scrape_stage_metrics(service_url: str, token: str) -> Dict:
+    """
+    Mean seconds per stage from the service's /metrics histograms, summed over workers, tenants,
+    providers and outcomes
+    """
+    try:
+        response = requests.get(f"{service_url}/metrics", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+        if not response.ok:
+            return {}
+    except requests.RequestException:
+        return {}
+
+    totals: Dict[str, Dict[str, float]] = {}
+    for line in response.text.splitlines():
+        match = STAGE_SERIES.match(line)
+        if match is None:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        stage = totals.setdefault(labels.get('stage', ''), {"sum": 0.0, "count": 0.0})
+        stage[match.group(1)] += float(match.group(3))
+    return {
+        stage: {"count": int(values["count"]), "mean_ms": round(values["sum"] / values["count"] * 1000, 2)}
+        for stage, values in totals.items() if values["count"]
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict:
+    fakes = Fakes(args)
+    workdir = write_workdir(args, fakes)
+    process = None
+    try:
+        sizes = pick_sizes(parse_size_mix(args.size_mix), args.requests, args.seed)
+        document_ids = [f"doc-{index:05d}" for index in range(args.requests)]
+        documents = {document_id: build_pdf(document_id, size, args.seed) for document_id, size in zip(document_ids, sizes)}
+        if args.workload == "process":
+            for document_id, content in documents.items():
+                fakes.gcs.state.put(BUCKET, f"benchmark/{document_id}.pdf", content, "application/pdf")
+
+        process, service_url, startup_seconds = start_service(args, fakes, workdir)
+        sampler = MemorySampler(process.pid)
+        sampler.start()
+        driver = Driver(args, fakes, service_url)
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            if args.workload == "process":
+                futures = [executor.submit(driver.process, document_id, len(documents[document_id])) for document_id in document_ids]
+            else:
+                futures = [
+                    executor.submit(driver.upload, document_id, len(documents[document_id]), documents[document_id])
+                    for document_id in document_ids
+                ]
+            results = [future.result() for future in futures]
+
+        if args.workload == "process" and args.mode != "sync":
+            wait_for_callbacks(fakes, [result.document_id for result in results if result.status == 202], args.drain_timeout)
+        sampler.stop()
+
+        report = stage_report(args, fakes, results)
+        completions = report.pop("end_to_end")
+        finished = max((completed for _, completed in completions), default=started)
+        wall_seconds = finished - started
+        model_events = fakes.anthropic.state.events.events("model") + fakes.gemini.state.events.events("model")
+
+        return {
+            "benchmark": "service",
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started)),
+            "git_commit": git_commit(),
+            "settings": vars(args),
+            "startup_seconds": round(startup_seconds, 3),
+            "requests": {
+                "sent": len(results),
+                "completed": len(completions),
+                "failed": sum(1 for result in results if result.status is None or result.status >= 300),
+                "rejected_and_retried": driver.rejections,
+                "errors": sorted({result.error for result in results if result.error})[:10]
+            },
+            "bytes_sent": sum(result.size for result in results),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_per_second": round(len(completions) / wall_seconds, 3) if wall_seconds > 0 else None,
+            "latency_ms": percentiles([completed - sent for sent, completed in completions]),
+            "stages_ms": report["stages_ms"],
+            "peak_rss_bytes": {"total": sampler.peak_total_bytes, "largest_process": sampler.peak_process_bytes},
+            "fakes": {
+                # A packed request records one event per document, all with the request's start time
+                "model_calls": len({(event.details.get("provider"), event.started) for event in model_events}),
+                "model_documents": sum(1 for event in model_events if event.status == 200),
+                "model_rate_limited": sum(1 for event in model_events if event.status == 429),
+                "callbacks": len(fakes.callbacks.state.events.events("callback")),
+                "callbacks_unauthenticated": fakes.callbacks.state.unauthenticated,
+                "token_requests": fakes.auth.state.token_requests,
+                "cert_requests": fakes.auth.state.cert_requests
+            },
+            "service_stats": scrape_service_stats(service_url, args.mode, driver.token) if args.workload == "process" else {},
+            "service_stages": scrape_stage_metrics(service_url, driver.token)
+        }
+    finally:
+        if process is not None:
+            stop_service(process)
+        fakes.shutdown()
+        if args.keep_workdir:
+            print(f"Service workdir and log kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workload', choices=['process', 'upload'], default='process')
+    parser.add_argument('--mode', choices=['sync', 'async', 'asyncio'], default='sync', help="Processing mode of the service")
+    parser.add_argument('--upload-endpoint', choices=['json', 'stream', 'multipart'], default='json')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--size-mix', default='100k:0.7,1m:0.25,5m:0.05', help="size:weight pairs, e.g. 100k:0.7,1m:0.3")
+    parser.add_argument('--provider', choices=['anthropic', 'gemini'], default='anthropic')
+    parser.add_argument('--streaming', action='store_true', help="Enable streamed model responses in the service")
+    parser.add_argument('--latency-ms', type=float, default=800, help="Fake model base latency")
+    parser.add_argument('--jitter-ms', type=float, default=400, help="Fake model extra latency, uniform up to this")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of model calls answered 429")
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--provider-concurrency', type=int, default=32, help="Service rate-governor concurrency per provider")
+    parser.add_argument('--gcs-latency-ms', type=float, default=20, help="Fake signed-URL time to first byte")
+    parser.add_argument('--callback-latency-ms', type=float, default=10)
+    parser.add_argument('--callback-failure-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--worker-class', help="gunicorn worker class; defaults to what the Dockerfile uses for the mode")
+    parser.add_argument('--max-attempts', type=int, default=20, help="Client attempts per request when rejected with 429/503")
+    parser.add_argument('--request-timeout', type=float, default=300)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--drain-timeout', type=float, default=300, help="How long to wait for async callbacks")
+    parser.add_argument('--config-override', help="YAML merged over the generated benchmark profile")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep-workdir', action='store_true')
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            file.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Throughput of StorageService signed-URL generation, without touching GCS.
+
+Signs with a throwaway service account key, so local signing is real. The keyless path is
+simulated by adding --iam-latency-ms to every signature, standing in for the IAM signBlob
+round trip. Each mode is compared with the old one-URL-at-a-time loop, and the warm-cache
+pass repeats the same listing.
+
+    python -m tools.benchmarks.signed_urls --files 2000 --iam-latency-ms 40
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from google.oauth2 import service_account
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+LAUNCH_DIRECTORY = os.getcwd()
+
+# Importing the service package loads its configuration from src/resources; keys in the
+# environment keep that from reaching Secret Manager
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.chdir(REPO_ROOT / "src")
+
+from src.main.services.UrlSigner import UrlSigner  # noqa: E402
+
+
+def throwaway_credentials() -> service_account.Credentials:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('ascii')
+    return service_account.Credentials.from_service_account_info({
+        "type": "service_account",
+        "client_email": "benchmark@example.iam.gserviceaccount.com",
+        "private_key": pem,
+        "private_key_id": "benchmark",
+        "token_uri": "https://oauth2.googleapis.com/token"
+    })
+
+
+class SimulatedIamSigner(UrlSigner):
+    """
+    Takes the keyless code path, but signs locally after sleeping for the signBlob round trip
+    """
+
+    def __init__(self, bucket, credentials, iam_latency_seconds: float, max_workers: int):
+        super().__init__(bucket, AnonymousCredentials(), max_workers=max_workers)
+        self.signing_credentials = credentials
+        self.iam_latency_seconds = iam_latency_seconds
+
+    def _sign_remote(self, filenames: List[str], expiration: int) -> List[str]:
+        def sign_one(filename: str) -> str:
+            time.sleep(self.iam_latency_seconds)
+            return self.bucket.blob(filename).generate_signed_url(
+                version="v4", expiration=expiration, method="GET", credentials=self.signing_credentials
+            )
+
+        return list(self._executor.map(sign_one, filenames))
+
+
+def measure(sign: Callable[[List[str]], List[str]], filenames: List[str]) -> Dict:
+    start = time.perf_counter()
+    urls = sign(filenames)
+    elapsed = time.perf_counter() - start
+    assert len(urls) == len(filenames)
+    return {"seconds": round(elapsed, 4), "urls_per_second": round(len(filenames) / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--iam-latency-ms', type=float, default=40)
+    parser.add_argument('--iam-workers', type=int, default=16)
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    credentials = throwaway_credentials()
+    bucket = storage.Client(project="benchmark", credentials=credentials).bucket("benchmark-bucket")
+    filenames = [f"tenant/collection/document-{index:06d}.pdf" for index in range(args.files)]
+    latency = args.iam_latency_ms / 1000
+
+    def sequential_local(names: List[str]) -> List[str]:
+        return [bucket.blob(name).generate_signed_url(version="v4", expiration=3600, method="GET") for name in names]
+
+    def sequential_iam(names: List[str]) -> List[str]:
+        result = []
+        for name in names:
+            time.sleep(latency)
+            result.append(bucket.blob(name).generate_signed_url(version="v4", expiration=3600, method="GET"))
+        return result
+
+    local = UrlSigner(bucket, credentials)
+    iam = SimulatedIamSigner(bucket, credentials, latency, args.iam_workers)
+
+    # The full sequential keyless run takes files * latency, so time a sample and scale it up
+    sample = filenames[:max(args.files // 20, 1)]
+    sampled = measure(sequential_iam, sample)
+    baseline_iam = {
+        "seconds": round(sampled["seconds"] * args.files / len(sample), 4),
+        "urls_per_second": sampled["urls_per_second"]
+    }
+
+    report = {
+        "files": args.files,
+        "iam_latency_ms": args.iam_latency_ms,
+        "local": {
+            "sequential_baseline": measure(sequential_local, filenames),
+            "bulk_cold": measure(local.sign, filenames),
+            "bulk_warm": measure(local.sign, filenames)
+        },
+        "iam": {
+            "sequential_baseline_estimated": baseline_iam,
+            "bulk_cold": measure(iam.sign, filenames),
+            "bulk_warm": measure(iam.sign, filenames)
+        }
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(os.path.join(LAUNCH_DIRECTORY, args.output), 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
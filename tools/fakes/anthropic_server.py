@@ -0,0 +1,272 @@
+"""
+Local stand-in for the Anthropic Messages and Message Batches APIs.
+
+Point the service at it with `anthropic.base-url: http://localhost:8089` (or ANTHROPIC_BASE_URL).
+/v1/messages answers after --latency-ms (plus up to --jitter-ms), streams when asked to, and
+rejects --rate-limit-rate of calls with a 429. A request carrying several benchmark documents
+(a packed request) is answered with a JSON array holding one extraction per document. Batches submitted through /api/v1/process/batch
+end after --batch-latency seconds. Every response is a canned JSON extraction, tagged with the
+benchmark document it was for.
+
+    python -m tools.fakes.anthropic_server --port 8089 --latency-ms 800 --rate-limit-rate 0.02
+"""
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from .common import EventLog, FakeHandler, LatencyModel, find_document_id, serve as serve_fake
+
+DEFAULT_RESPONSE = {"invoice_number": "FAKE-0001", "line_items": [], "total": 0}
+
+BATCH_PATH = re.compile(r'^/v1/messages/batches/(?P<batch_id>[^/]+)(?P<results>/results)?$')
+
+# Generous advertised limits so the service's rate governor is driven by the 429s alone
+RATE_LIMIT_HEADERS = {
+    "anthropic-ratelimit-requests-limit": "100000",
+    "anthropic-ratelimit-requests-remaining": "100000",
+    "anthropic-ratelimit-input-tokens-limit": "100000000",
+    "anthropic-ratelimit-input-tokens-remaining": "100000000"
+}
+
+STREAM_CHUNK_CHARS = 24
+
+
+def build_message(model: str, text: str, input_tokens: int = 1000, output_tokens: int = 100) -> Dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+    }
+
+
+def find_request_document_ids(body: Dict) -> List[str]:
+    document_ids = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        for block in content if isinstance(content, list) else []:
+            source = block.get("source") or {}
+            if source.get("type") == "base64":
+                document_id = find_document_id(base64.b64decode(source.get("data", "")))
+                if document_id:
+                    document_ids.append(document_id)
+    return document_ids
+
+
+class FakeAnthropicState:
+    def __init__(
+            self,
+            batch_latency: float,
+            response_text: str,
+            latency: Optional[LatencyModel] = None,
+            retry_after_seconds: float = 1,
+            ttft_fraction: float = 0.3
+    ):
+        self.batch_latency = batch_latency
+        self.response_text = response_text
+        self.latency = latency or LatencyModel()
+        self.retry_after_seconds = retry_after_seconds
+        self.ttft_fraction = ttft_fraction
+        self.events = EventLog()
+        self.batches: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def response_for(self, document_ids: List[str]) -> str:
+        if not document_ids:
+            return self.response_text
+        responses = [{**json.loads(self.response_text), "document_id": document_id} for document_id in document_ids]
+        if len(responses) == 1:
+            return json.dumps(responses[0])
+        # Packed requests ask for each result wrapped with the index of its document
+        return json.dumps([{"index": index, "result": response} for index, response in enumerate(responses, start=1)])
+
+    def create_batch(self, requests) -> Dict:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.batches[batch_id] = {"created": time.time(), "requests": requests}
+        return self.batch_view(batch_id, None)
+
+    def batch_view(self, batch_id: str, base_url: Optional[str]) -> Optional[Dict]:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+
+        ended = time.time() - batch["created"] >= self.batch_latency
+        count = len(batch["requests"])
+        created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(batch["created"]))
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0
+            },
+            "created_at": created_at,
+            "expires_at": created_at,
+            "ended_at": created_at if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended and base_url else None
+        }
+
+    def batch_results(self, batch_id: str):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+        for request in batch["requests"]:
+            yield {
+                "custom_id": request["custom_id"],
+                "result": {
+                    "type": "succeeded",
+                    "message": build_message(request["params"].get("model", "fake-model"), self.response_text)
+                }
+            }
+
+
+class FakeAnthropicHandler(FakeHandler):
+    state: FakeAnthropicState = None
+
+    def _send_error(self, status: int, error_type: str, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send_json(status, {"type": "error", "error": {"type": error_type, "message": message}}, headers)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == '/v1/messages/batches':
+            self._send_json(200, self.state.create_batch(self._read_json()["requests"]))
+            return
+        if path == '/v1/messages':
+            self._create_message(self._read_body())
+            return
+        self._send_error(404, "not_found_error", path)
+
+    def _create_message(self, raw_body: bytes):
+        started = time.time()
+        body = json.loads(raw_body)
+        document_ids = find_request_document_ids(body)
+
+        if self.state.latency.should_fail():
+            for document_id in document_ids or [None]:
+                self.state.events.record("model", document_id, started, 429, provider="anthropic")
+            self._send_error(429, "rate_limit_error", "Fake rate limit", {
+                **RATE_LIMIT_HEADERS,
+                "anthropic-ratelimit-requests-remaining": "0",
+                "retry-after": str(self.state.retry_after_seconds)
+            })
+            return
+
+        delay = self.state.latency.delay_seconds()
+        text = self.state.response_for(document_ids)
+        # Roughly four bytes of request per input token
+        input_tokens = max(len(raw_body) // 4, 1)
+        message = build_message(body.get("model", "fake-model"), text, input_tokens, max(len(text) // 4, 1))
+
+        if body.get("stream"):
+            self._stream_message(message, text, delay)
+        else:
+            time.sleep(delay)
+            self._send_json(200, message, RATE_LIMIT_HEADERS)
+        for document_id in document_ids or [None]:
+            self.state.events.record(
+                "model", document_id, started, 200, provider="anthropic", bytes=len(raw_body), packed=len(document_ids))
+
+    def _stream_message(self, message: Dict, text: str, delay: float):
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        first_token_delay = delay * self.state.ttft_fraction
+        chunk_delay = (delay - first_token_delay) / len(chunks)
+
+        self._start_event_stream(RATE_LIMIT_HEADERS)
+        time.sleep(first_token_delay)
+        start = dict(message, content=[], stop_reason=None, usage={**message["usage"], "output_tokens": 1})
+        self._send_event({"type": "message_start", "message": start}, "message_start")
+        self._send_event(
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            "content_block_start"
+        )
+        for chunk in chunks:
+            self._send_event(
+                {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}},
+                "content_block_delta"
+            )
+            time.sleep(chunk_delay)
+        self._send_event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        self._send_event(
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": message["usage"]["output_tokens"]}
+            },
+            "message_delta"
+        )
+        self._send_event({"type": "message_stop"}, "message_stop")
+
+    def do_GET(self):
+        match = BATCH_PATH.match(urlparse(self.path).path)
+        view = self.state.batch_view(match.group('batch_id'), self._base_url()) if match else None
+        if view is None:
+            self._send_error(404, "not_found_error", self.path)
+            return
+
+        if not match.group('results'):
+            self._send_json(200, view)
+            return
+
+        lines = b''.join(json.dumps(line).encode() + b'\n' for line in self.state.batch_results(view["id"]))
+        self._send_bytes(200, lines, 'application/binary')
+
+
+def serve(
+        port: int,
+        batch_latency: float,
+        response_text: str,
+        latency: Optional[LatencyModel] = None,
+        retry_after_seconds: float = 1
+):
+    """
+    Start the fake server on a background thread and return it; call shutdown() to stop it
+    """
+    state = FakeAnthropicState(batch_latency, response_text, latency, retry_after_seconds)
+    return serve_fake(FakeAnthropicHandler, state, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--batch-latency', type=float, default=5.0, help="Seconds until a batch reports 'ended'")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Base /v1/messages response time")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Uniform extra response time, up to this")
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help="Fraction of /v1/messages calls answered 429")
+    parser.add_argument('--retry-after', type=float, default=1, help="retry-after sent with every 429")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--response-file', help="JSON file returned as every model response")
+    args = parser.parse_args()
+
+    response = DEFAULT_RESPONSE
+    if args.response_file:
+        with open(args.response_file) as file:
+            response = json.load(file)
+
+    latency = LatencyModel(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.seed)
+    server = serve(args.port, args.batch_latency, json.dumps(response), latency, args.retry_after)
+    print(f"Fake Anthropic API listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
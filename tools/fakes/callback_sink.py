@@ -0,0 +1,75 @@
+"""
+Local stand-in for the document store's callback endpoints.
+
+Accepts any POST, answers 200 after --latency-ms (or 503 for --failure-rate of calls) and records
+which document each callback was for, including the entries of batched {"results": [...]} posts.
+
+    python -m tools.fakes.callback_sink --port 8092 --failure-rate 0.05
+"""
+import argparse
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .common import EventLog, FakeHandler, LatencyModel, serve as serve_fake
+
+
+def callback_document_ids(body: Dict) -> List[Optional[str]]:
+    entries = body["results"] if isinstance(body.get("results"), list) else [body]
+    # Processing callbacks carry "id", upload callbacks "documentId"
+    return [entry.get("id") or entry.get("documentId") for entry in entries]
+
+
+class CallbackSinkState:
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self.latency = latency or LatencyModel()
+        self.events = EventLog()
+        self.unauthenticated = 0
+        self.lock = threading.Lock()
+
+
+class CallbackSinkHandler(FakeHandler):
+    state: CallbackSinkState = None
+
+    def do_POST(self):
+        started = time.time()
+        body = self._read_json()
+        if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            with self.state.lock:
+                self.state.unauthenticated += 1
+
+        time.sleep(self.state.latency.delay_seconds())
+        status = 503 if self.state.latency.should_fail() else 200
+        for document_id in callback_document_ids(body):
+            self.state.events.record("callback", document_id, started, status, path=self.path)
+        self._send_json(status, {"received": status == 200})
+
+
+def serve(port: int, latency: Optional[LatencyModel] = None):
+    """
+    Start the fake server on a background thread and return it; call shutdown() to stop it
+    """
+    return serve_fake(CallbackSinkHandler, CallbackSinkState(latency), port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(args.port, LatencyModel(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed))
+    print(f"Callback sink listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.state.events.to_list(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
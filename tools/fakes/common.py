@@ -0,0 +1,150 @@
+"""
+Pieces shared by the local fake servers: a JSON-speaking handler base, a seeded latency and
+error model, and a per-document event log the benchmarks read stage timings from.
+"""
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Type
+
+# Benchmark documents carry this marker in plain text so every fake can tell which document a call is for
+DOCUMENT_MARKER = re.compile(rb'BENCHDOC:([A-Za-z0-9_.-]+)')
+
+
+def find_document_id(data: bytes) -> Optional[str]:
+    match = DOCUMENT_MARKER.search(data)
+    return match.group(1).decode('ascii') if match else None
+
+
+class LatencyModel:
+    """
+    Response delay of latency_ms plus up to jitter_ms, and a failure rate, drawn from one seeded
+    generator so a run with the same settings sees the same distribution
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay_seconds(self) -> float:
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+@dataclass
+class Event:
+    kind: str
+    document_id: Optional[str]
+    started: float
+    finished: float
+    status: int = 200
+    details: Dict = field(default_factory=dict)
+
+
+class EventLog:
+    def __init__(self):
+        self._events: List[Event] = []
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, document_id: Optional[str], started: float, status: int = 200, **details) -> Event:
+        event = Event(kind, document_id, started, time.time(), status, details)
+        with self._lock:
+            self._events.append(event)
+        return event
+
+    def events(self, kind: Optional[str] = None) -> List[Event]:
+        with self._lock:
+            return [event for event in self._events if kind is None or event.kind == kind]
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def to_list(self) -> List[Dict]:
+        return [asdict(event) for event in self.events()]
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs; every non-streamed response carries a Content-Length
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def _send_bytes(self, status: int, payload: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def _send_json(self, status: int, body, headers: Optional[Dict[str, str]] = None):
+        self._send_bytes(status, json.dumps(body).encode(), 'application/json', headers)
+
+    def _start_event_stream(self, headers: Optional[Dict[str, str]] = None):
+        # Streamed bodies end when the connection closes
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send_event(self, data: Dict, event: Optional[str] = None):
+        lines = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{lines}data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _read_json(self) -> Dict:
+        return json.loads(self._read_body() or b'{}')
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 256
+    state = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(handler: Type[FakeHandler], state, port: int = 0) -> FakeServer:
+    """
+    Start a fake on a background thread and return it; port 0 picks a free port (see server.url),
+    server.state is the fake's state and shutdown() stops it
+    """
+    bound = type(f'Bound{handler.__name__}', (handler,), {'state': state})
+    server = FakeServer(('127.0.0.1', port), bound)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,324 @@
+"""
+Local stand-in for the parts of the GCS JSON API the service uses, plus signed-URL downloads.
+
+Point the storage client at it with STORAGE_EMULATOR_HOST=http://localhost:8091. It handles
+object metadata, media and ranged downloads, multipart and resumable uploads, compose and delete.
+Objects live in memory. Files put into the fake are also served as "signed URLs" from
+/signed/<bucket>/<name>, with --latency-ms (plus up to --jitter-ms) before the first byte.
+
+    python -m tools.fakes.gcs_server --port 8091
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import google_crc32c
+
+from .common import EventLog, FakeHandler, LatencyModel, serve as serve_fake
+
+OBJECT_PATH = re.compile(r'^/(?:download/)?storage/v1/b/(?P<bucket>[^/]+)/o/(?P<name>[^/]+)(?P<compose>/compose)?$')
+UPLOAD_PATH = re.compile(r'^/upload/storage/v1/b/(?P<bucket>[^/]+)/o$')
+SIGNED_PATH = re.compile(r'^/signed/(?P<bucket>[^/]+)/(?P<name>.+)$')
+CONTENT_RANGE = re.compile(r'^bytes (?:(?P<first>\d+)-(?P<last>\d+)|\*)/(?P<total>\d+|\*)$')
+RANGE = re.compile(r'^bytes=(?P<first>\d+)-(?P<last>\d*)$')
+
+SIGNED_CHUNK_SIZE = 64 * 1024
+
+
+def document_id_for(name: str) -> str:
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+@dataclass
+class StoredObject:
+    data: bytes
+    content_type: str
+    generation: int
+    crc32c: str
+    md5: str
+    updated: float
+    # When the bytes started arriving; composed objects inherit their earliest source's
+    upload_started: float
+
+
+@dataclass
+class UploadSession:
+    bucket: str
+    name: str
+    content_type: str
+    started: float
+    data: bytearray
+
+
+class FakeGcsState:
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self.latency = latency or LatencyModel()
+        self.events = EventLog()
+        self.objects: Dict[Tuple[str, str], StoredObject] = {}
+        self.uploads: Dict[str, UploadSession] = {}
+        self.lock = threading.Lock()
+        self._generation = int(time.time() * 1000)
+
+    def put(
+            self,
+            bucket: str,
+            name: str,
+            data: bytes,
+            content_type: str = 'application/octet-stream',
+            upload_started: Optional[float] = None
+    ) -> StoredObject:
+        with self.lock:
+            self._generation += 1
+            stored = StoredObject(
+                data=bytes(data),
+                content_type=content_type,
+                generation=self._generation,
+                crc32c=base64.b64encode(google_crc32c.Checksum(data).digest()).decode('ascii'),
+                md5=base64.b64encode(hashlib.md5(data).digest()).decode('ascii'),
+                updated=time.time(),
+                upload_started=upload_started or time.time()
+            )
+            self.objects[(bucket, name)] = stored
+        return stored
+
+    def get(self, bucket: str, name: str) -> Optional[StoredObject]:
+        with self.lock:
+            return self.objects.get((bucket, name))
+
+    def delete(self, bucket: str, name: str) -> bool:
+        with self.lock:
+            return self.objects.pop((bucket, name), None) is not None
+
+
+def object_resource(base_url: str, bucket: str, name: str, stored: StoredObject) -> Dict:
+    updated = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(stored.updated))
+    return {
+        "kind": "storage#object",
+        "id": f"{bucket}/{name}/{stored.generation}",
+        "name": name,
+        "bucket": bucket,
+        "generation": str(stored.generation),
+        "metageneration": "1",
+        "contentType": stored.content_type,
+        "size": str(len(stored.data)),
+        "crc32c": stored.crc32c,
+        "md5Hash": stored.md5,
+        "timeCreated": updated,
+        "updated": updated,
+        "storageClass": "STANDARD",
+        "mediaLink": f"{base_url}/download/storage/v1/b/{bucket}/o/{quote(name, safe='')}?generation={stored.generation}&alt=media"
+    }
+
+
+def parse_multipart_related(body: bytes, content_type: str) -> Tuple[Dict, bytes, str]:
+    """
+    Split a multipart/related upload into its JSON metadata, media bytes and media content type
+    """
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    parts = [part for part in body.split(b'--' + boundary) if part not in (b'', b'--', b'--\r\n', b'\r\n')]
+    sections = []
+    for part in parts[:2]:
+        headers, _, content = part.lstrip(b'\r\n').partition(b'\r\n\r\n')
+        media_type = re.search(rb'(?i)content-type:\s*([^\r\n]+)', headers)
+        sections.append((content[:-2] if content.endswith(b'\r\n') else content, media_type.group(1).decode() if media_type else None))
+    metadata = json.loads(sections[0][0])
+    return metadata, sections[1][0], sections[1][1] or metadata.get('contentType') or 'application/octet-stream'
+
+
+class FakeGcsHandler(FakeHandler):
+    state: FakeGcsState = None
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {"error": {"code": status, "message": message, "errors": [{"message": message}]}})
+
+    def _query(self) -> Dict[str, str]:
+        return {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        signed = SIGNED_PATH.match(path)
+        if signed:
+            self._serve_signed(signed.group('bucket'), unquote(signed.group('name')))
+            return
+
+        match = OBJECT_PATH.match(path)
+        if match is None or match.group('compose'):
+            self._send_error(404, path)
+            return
+        bucket, name = match.group('bucket'), unquote(match.group('name'))
+        stored = self.state.get(bucket, name)
+        if stored is None:
+            self._send_error(404, f"No such object: {bucket}/{name}")
+            return
+        if self._query().get('alt') == 'media':
+            self._send_media(stored)
+            return
+        self._send_json(200, object_resource(self._base_url(), bucket, name, stored))
+
+    def _send_media(self, stored: StoredObject):
+        headers = {
+            "x-goog-hash": f"crc32c={stored.crc32c},md5={stored.md5}",
+            "x-goog-generation": str(stored.generation),
+            "x-goog-stored-content-length": str(len(stored.data)),
+            "Accept-Ranges": "bytes"
+        }
+        requested = RANGE.match(self.headers.get('Range') or '')
+        if requested is None:
+            self._send_bytes(200, stored.data, stored.content_type, headers)
+            return
+
+        first = int(requested.group('first'))
+        last = min(int(requested.group('last') or len(stored.data) - 1), len(stored.data) - 1)
+        headers["Content-Range"] = f"bytes {first}-{last}/{len(stored.data)}"
+        self._send_bytes(206, stored.data[first:last + 1], stored.content_type, headers)
+
+    def _serve_signed(self, bucket: str, name: str):
+        started = time.time()
+        stored = self.state.get(bucket, name)
+        if stored is None:
+            self._send_bytes(404, b'<Error><Code>NoSuchKey</Code></Error>', 'application/xml')
+            return
+
+        time.sleep(self.state.latency.delay_seconds())
+        self.send_response(200)
+        self.send_header('Content-Type', stored.content_type)
+        self.send_header('Content-Length', str(len(stored.data)))
+        self.send_header('x-goog-hash', f"crc32c={stored.crc32c},md5={stored.md5}")
+        self.end_headers()
+        view = memoryview(stored.data)
+        for offset in range(0, len(view), SIGNED_CHUNK_SIZE):
+            self.wfile.write(view[offset:offset + SIGNED_CHUNK_SIZE])
+        self.state.events.record("download", document_id_for(name), started, 200, bytes=len(stored.data))
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        upload = UPLOAD_PATH.match(path)
+        if upload:
+            self._start_upload(upload.group('bucket'))
+            return
+
+        match = OBJECT_PATH.match(path)
+        if match and match.group('compose'):
+            self._compose(match.group('bucket'), unquote(match.group('name')))
+            return
+        self._send_error(404, path)
+
+    def _start_upload(self, bucket: str):
+        started = time.time()
+        query = self._query()
+        upload_type = query.get('uploadType')
+        body = self._read_body()
+
+        if upload_type == 'multipart':
+            metadata, data, content_type = parse_multipart_related(body, self.headers.get('Content-Type', ''))
+            self._finish_upload(bucket, metadata.get('name') or query['name'], data, content_type, started, upload_type)
+            return
+        if upload_type == 'media':
+            content_type = self.headers.get('Content-Type', 'application/octet-stream')
+            self._finish_upload(bucket, query['name'], body, content_type, started, upload_type)
+            return
+        if upload_type == 'resumable':
+            metadata = json.loads(body) if body else {}
+            upload_id = uuid.uuid4().hex
+            content_type = self.headers.get('X-Upload-Content-Type') or metadata.get('contentType') or 'application/octet-stream'
+            with self.state.lock:
+                self.state.uploads[upload_id] = UploadSession(
+                    bucket, metadata.get('name') or query['name'], content_type, started, bytearray()
+                )
+            location = f"{self._base_url()}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={upload_id}"
+            self._send_bytes(200, b'', 'text/plain', {"Location": location, "X-GUploader-UploadID": upload_id})
+            return
+        self._send_error(400, f"Unsupported uploadType {upload_type}")
+
+    def _finish_upload(self, bucket: str, name: str, data: bytes, content_type: str, started: float, upload_type: str):
+        stored = self.state.put(bucket, name, data, content_type, started)
+        self.state.events.record("upload", document_id_for(name), started, 200, bytes=len(data), upload_type=upload_type)
+        self._send_json(200, object_resource(self._base_url(), bucket, name, stored))
+
+    def do_PUT(self):
+        upload_id = self._query().get('upload_id')
+        with self.state.lock:
+            session = self.state.uploads.get(upload_id)
+        body = self._read_body()
+        if session is None:
+            self._send_error(404, f"No such upload {upload_id}")
+            return
+
+        content_range = CONTENT_RANGE.match(self.headers.get('Content-Range') or f"bytes */{len(body)}")
+        if content_range is None:
+            self._send_error(400, "Bad Content-Range")
+            return
+        if content_range.group('first') is not None:
+            first = int(content_range.group('first'))
+            # A resent chunk overwrites what was received from its offset on
+            del session.data[first:]
+            session.data.extend(body)
+
+        total = content_range.group('total')
+        if total != '*' and len(session.data) >= int(total):
+            with self.state.lock:
+                self.state.uploads.pop(upload_id, None)
+            self._finish_upload(session.bucket, session.name, bytes(session.data), session.content_type, session.started, 'resumable')
+            return
+
+        headers = {"Range": f"bytes=0-{len(session.data) - 1}"} if session.data else {}
+        self._send_bytes(308, b'', 'text/plain', headers)
+
+    def _compose(self, bucket: str, name: str):
+        body = self._read_json()
+        sources = [self.state.get(bucket, source['name']) for source in body.get('sourceObjects', [])]
+        if any(source is None for source in sources):
+            self._send_error(404, "Compose source not found")
+            return
+        content_type = (body.get('destination') or {}).get('contentType') or sources[0].content_type
+        data = b''.join(source.data for source in sources)
+        # The event spans the whole parallel upload, from the first part's bytes to the composed object
+        started = min(source.upload_started for source in sources)
+        stored = self.state.put(bucket, name, data, content_type, started)
+        self.state.events.record("compose", document_id_for(name), started, 200, bytes=len(data), sources=len(sources))
+        self._send_json(200, object_resource(self._base_url(), bucket, name, stored))
+
+    def do_DELETE(self):
+        match = OBJECT_PATH.match(urlparse(self.path).path)
+        if match is None or not self.state.delete(match.group('bucket'), unquote(match.group('name'))):
+            self._send_error(404, self.path)
+            return
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def serve(port: int, latency: Optional[LatencyModel] = None):
+    """
+    Start the fake server on a background thread and return it; call shutdown() to stop it
+    """
+    return serve_fake(FakeGcsHandler, FakeGcsState(latency), port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay before a signed-URL download starts")
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(args.port, LatencyModel(args.latency_ms, args.jitter_ms, seed=args.seed))
+    print(f"Fake GCS listening on {server.url} (STORAGE_EMULATOR_HOST={server.url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Local stand-in for the Gemini generateContent API.
+
+Point the service at it with `gemini.base-url: http://localhost:8090`. generateContent and
+streamGenerateContent answer after --latency-ms (plus up to --jitter-ms) with a canned JSON
+extraction tagged with the benchmark document it was for (a JSON array of them for a packed
+request carrying several documents), and --rate-limit-rate of calls get a 429 RESOURCE_EXHAUSTED.
+
+    python -m tools.fakes.gemini_server --port 8090 --latency-ms 600
+"""
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from .anthropic_server import DEFAULT_RESPONSE
+from .common import EventLog, FakeHandler, LatencyModel, find_document_id, serve as serve_fake
+
+MODEL_PATH = re.compile(r'^/(?P<version>v1[a-z0-9]*)/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$')
+
+STREAM_CHUNK_CHARS = 32
+
+
+def find_request_document_ids(body: Dict) -> List[str]:
+    document_ids = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            inline = part.get("inlineData") or part.get("inline_data") or {}
+            if inline.get("data"):
+                # The genai SDK sends inline data URL-safe encoded
+                document_id = find_document_id(base64.b64decode(inline["data"], altchars=b'-_'))
+                if document_id:
+                    document_ids.append(document_id)
+    return document_ids
+
+
+def build_response(model: str, text: str, prompt_tokens: int, finished: bool = True) -> Dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    output_tokens = max(len(text) // 4, 1)
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens
+        },
+        "modelVersion": model
+    }
+
+
+class FakeGeminiState:
+    def __init__(
+            self,
+            response_text: str,
+            latency: Optional[LatencyModel] = None,
+            ttft_fraction: float = 0.3
+    ):
+        self.response_text = response_text
+        self.latency = latency or LatencyModel()
+        self.ttft_fraction = ttft_fraction
+        self.events = EventLog()
+
+    def response_for(self, document_ids: List[str]) -> str:
+        if not document_ids:
+            return self.response_text
+        responses = [{**json.loads(self.response_text), "document_id": document_id} for document_id in document_ids]
+        if len(responses) == 1:
+            return json.dumps(responses[0])
+        # Packed requests ask for each result wrapped with the index of its document
+        return json.dumps([{"index": index, "result": response} for index, response in enumerate(responses, start=1)])
+
+
+class FakeGeminiHandler(FakeHandler):
+    state: FakeGeminiState = None
+
+    def _send_error(self, status: int, error_status: str, message: str):
+        self._send_json(status, {"error": {"code": status, "message": message, "status": error_status}})
+
+    def do_POST(self):
+        match = MODEL_PATH.match(urlparse(self.path).path)
+        if match is None:
+            self._send_error(404, "NOT_FOUND", self.path)
+            return
+
+        started = time.time()
+        raw_body = self._read_body()
+        body = json.loads(raw_body or b'{}')
+        document_ids = find_request_document_ids(body)
+
+        if self.state.latency.should_fail():
+            for document_id in document_ids or [None]:
+                self.state.events.record("model", document_id, started, 429, provider="gemini")
+            self._send_error(429, "RESOURCE_EXHAUSTED", "Fake quota exhausted")
+            return
+
+        delay = self.state.latency.delay_seconds()
+        text = self.state.response_for(document_ids)
+        prompt_tokens = max(len(raw_body) // 4, 1)
+        model = match.group('model')
+
+        if match.group('method') == 'streamGenerateContent':
+            self._stream(model, text, prompt_tokens, delay)
+        else:
+            time.sleep(delay)
+            self._send_json(200, build_response(model, text, prompt_tokens))
+        for document_id in document_ids or [None]:
+            self.state.events.record(
+                "model", document_id, started, 200, provider="gemini", bytes=len(raw_body), packed=len(document_ids))
+
+    def _stream(self, model: str, text: str, prompt_tokens: int, delay: float):
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        first_token_delay = delay * self.state.ttft_fraction
+        chunk_delay = (delay - first_token_delay) / len(chunks)
+
+        self._start_event_stream()
+        time.sleep(first_token_delay)
+        for index, chunk in enumerate(chunks):
+            self._send_event(build_response(model, chunk, prompt_tokens, finished=index == len(chunks) - 1))
+            time.sleep(chunk_delay)
+
+
+def serve(port: int, response_text: str, latency: Optional[LatencyModel] = None):
+    """
+    Start the fake server on a background thread and return it; call shutdown() to stop it
+    """
+    return serve_fake(FakeGeminiHandler, FakeGeminiState(response_text, latency), port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--response-file', help="JSON file returned as every model response")
+    args = parser.parse_args()
+
+    response = DEFAULT_RESPONSE
+    if args.response_file:
+        with open(args.response_file) as file:
+            response = json.load(file)
+
+    latency = LatencyModel(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.seed)
+    server = serve(args.port, json.dumps(response), latency)
+    print(f"Fake Gemini API listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
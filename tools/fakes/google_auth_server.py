@@ -0,0 +1,137 @@
+"""
+Local stand-in for Google's OAuth2 token and signing-cert endpoints, so the service can run
+with authentication switched on and no network access.
+
+It holds a throwaway RSA key. service_account_info() describes a service account whose
+token_uri points here; with GOOGLE_APPLICATION_CREDENTIALS set to it, access-token and ID-token
+requests (callbacks, the storage client) are answered locally. mint_id_token() creates inbound
+bearer tokens that the service accepts when `security.oidc.certs-url` points at /oauth2/v1/certs.
+
+    python -m tools.fakes.google_auth_server --port 8093
+"""
+import argparse
+import base64
+import json
+import threading
+import time
+import uuid
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+import rsa
+from google.auth import crypt, jwt
+
+from .common import FakeHandler, serve as serve_fake
+
+SERVICE_ACCOUNT_EMAIL = "benchmark@fake-project.iam.gserviceaccount.com"
+CERTS_MAX_AGE_SECONDS = 3600
+TOKEN_LIFETIME_SECONDS = 3600
+
+
+def _unverified_claims(assertion: str) -> Dict:
+    payload = assertion.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+
+
+class FakeGoogleAuthState:
+    def __init__(self):
+        public_key, private_key = rsa.newkeys(2048)
+        self.key_id = uuid.uuid4().hex
+        self.private_key_pem = private_key.save_pkcs1().decode('ascii')
+        self.public_key_pem = public_key.save_pkcs1().decode('ascii')
+        self.signer = crypt.RSASigner.from_string(self.private_key_pem, self.key_id)
+        self.token_requests = 0
+        self.cert_requests = 0
+        self.lock = threading.Lock()
+
+    def mint_id_token(self, audience: str, lifetime_seconds: int = TOKEN_LIFETIME_SECONDS) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": audience,
+            "azp": SERVICE_ACCOUNT_EMAIL,
+            "sub": "100000000000000000000",
+            "email": SERVICE_ACCOUNT_EMAIL,
+            "email_verified": True,
+            "iat": now - 1,
+            "exp": now + lifetime_seconds
+        }
+        return jwt.encode(self.signer, payload).decode('ascii')
+
+    def service_account_info(self, token_uri: str) -> Dict:
+        return {
+            "type": "service_account",
+            "project_id": "fake-project",
+            "private_key_id": self.key_id,
+            "private_key": self.private_key_pem,
+            "client_email": SERVICE_ACCOUNT_EMAIL,
+            "client_id": "100000000000000000000",
+            "token_uri": token_uri
+        }
+
+
+class FakeGoogleAuthHandler(FakeHandler):
+    state: FakeGoogleAuthState = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/oauth2/v1/certs':
+            self._send_json(404, {"error": "not_found"})
+            return
+        with self.state.lock:
+            self.state.cert_requests += 1
+        self._send_json(
+            200,
+            {self.state.key_id: self.state.public_key_pem},
+            {"Cache-Control": f"public, max-age={CERTS_MAX_AGE_SECONDS}"}
+        )
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/token':
+            self._send_json(404, {"error": "not_found"})
+            return
+
+        form = {key: values[0] for key, values in parse_qs(self._read_body().decode()).items()}
+        with self.state.lock:
+            self.state.token_requests += 1
+        claims = _unverified_claims(form.get('assertion', '..'))
+
+        # Service account credentials ask for an ID token by putting target_audience in the assertion
+        if claims.get('target_audience'):
+            self._send_json(200, {"id_token": self.state.mint_id_token(claims['target_audience'])})
+            return
+        self._send_json(200, {
+            "access_token": f"fake-access-{uuid.uuid4().hex}",
+            "expires_in": TOKEN_LIFETIME_SECONDS,
+            "token_type": "Bearer"
+        })
+
+
+def serve(port: int):
+    """
+    Start the fake server on a background thread and return it; call shutdown() to stop it
+    """
+    return serve_fake(FakeGoogleAuthHandler, FakeGoogleAuthState(), port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8093)
+    parser.add_argument('--credentials-file', help="Write the fake service account key here")
+    parser.add_argument('--audience', help="Print an inbound ID token for this audience")
+    args = parser.parse_args()
+
+    server = serve(args.port)
+    if args.credentials_file:
+        with open(args.credentials_file, 'w') as file:
+            json.dump(server.state.service_account_info(f"{server.url}/token"), file)
+    if args.audience:
+        print(server.state.mint_id_token(args.audience))
+    print(f"Fake Google auth listening on {server.url} (certs at {server.url}/oauth2/v1/certs)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()